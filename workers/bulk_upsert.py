@@ -0,0 +1,304 @@
+import hashlib
+import os
+import sys
+import time
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+try:
+    import libsql_client
+except ImportError:
+    libsql_client = None
+
+# Limite de placeholders por statement multi-linha (SQLite antigo aceita 999).
+MULTI_ROW_MAX_VARIABLES = max(24, int(os.getenv("DB_MULTI_ROW_MAX_VARIABLES", "900")))
+
+DIALECT_SQLITE = "sqlite"
+DIALECT_MYSQL = "mysql"
+DIALECT_TURSO = "turso"
+
+
+class UpsertSpec:
+    """Tabela + colunas + chave de conflito + colunas atualizadas quando a chave ja existe."""
+
+    __slots__ = ("table", "columns", "key", "update_columns")
+
+    def __init__(self, table: str, columns: Sequence[str], key: Sequence[str], update_columns: Sequence[str]):
+        self.table = table
+        self.columns = tuple(columns)
+        self.key = tuple(key)
+        self.update_columns = tuple(update_columns)
+
+
+def db_dialect(db) -> str:
+    if getattr(db, "use_mysql", False):
+        return DIALECT_MYSQL
+    if getattr(db, "use_turso", False):
+        return DIALECT_TURSO
+    return DIALECT_SQLITE
+
+
+def frame_to_rows(df: pd.DataFrame, columns: Sequence[str]) -> List[Tuple[Any, ...]]:
+    """Converte colunas inteiras (NaN/NA -> None, escalares numpy -> Python) e monta as tuplas por zip."""
+    if df is None or df.empty:
+        return []
+    values = []
+    for col in columns:
+        series = df[col] if col in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+        values.append(series.astype(object).where(series.notna(), None).tolist())
+    return list(zip(*values))
+
+
+def build_upsert_statements(
+    spec: UpsertSpec,
+    rows: Sequence[Sequence[Any]],
+    dialect: str,
+    max_variables: int = MULTI_ROW_MAX_VARIABLES,
+) -> List[Tuple[str, Tuple[Any, ...]]]:
+    """INSERT multi-linha em blocos que respeitam o limite de placeholders.
+    SQLite/Turso: `ON CONFLICT(key) DO UPDATE SET c = excluded.c`; MySQL: `ON DUPLICATE KEY UPDATE c = VALUES(c)`."""
+    if not rows:
+        return []
+    width = len(spec.columns)
+    chunk_rows = max(1, int(max_variables) // width)
+    row_placeholder = "(" + ", ".join("?" for _ in spec.columns) + ")"
+    if dialect == DIALECT_MYSQL:
+        conflict = "ON DUPLICATE KEY UPDATE " + ", ".join(f"{col} = VALUES({col})" for col in spec.update_columns)
+    else:
+        conflict = (
+            f"ON CONFLICT({', '.join(spec.key)}) DO UPDATE SET "
+            + ", ".join(f"{col} = excluded.{col}" for col in spec.update_columns)
+        )
+    head = f"INSERT INTO {spec.table} ({', '.join(spec.columns)}) VALUES "
+    statements = []
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        sql = head + ", ".join(row_placeholder for _ in chunk) + " " + conflict
+        statements.append((sql, tuple(value for row in chunk for value in row)))
+    return statements
+
+
+def _collapse_duplicates(spec: UpsertSpec, rows: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+    # Mesma chave repetida no lote: reproduz o loop linha a linha (primeira linha insere,
+    # as seguintes so sobrescrevem as colunas de update).
+    key_idx = [spec.columns.index(col) for col in spec.key]
+    update_idx = [spec.columns.index(col) for col in spec.update_columns if col in spec.columns]
+    merged = {}
+    for row in rows:
+        key = tuple(row[i] for i in key_idx)
+        current = merged.get(key)
+        if current is None:
+            merged[key] = row
+            continue
+        current = list(current)
+        for i in update_idx:
+            current[i] = row[i]
+        merged[key] = tuple(current)
+    return list(merged.values()) if len(merged) != len(rows) else rows
+
+
+def bulk_upsert(db, spec: UpsertSpec, data, max_variables: int = MULTI_ROW_MAX_VARIABLES) -> int:
+    """Grava um DataFrame (ou lista de tuplas na ordem de `spec.columns`) numa unica transacao.
+    SQLite/MySQL: statements multi-linha + commit; Turso: um `batch` atomico. Erros sobem ao chamador."""
+    rows = frame_to_rows(data, spec.columns) if isinstance(data, pd.DataFrame) else [tuple(row) for row in data or []]
+    if not rows:
+        return 0
+    rows = _collapse_duplicates(spec, rows)
+    statements = build_upsert_statements(spec, rows, db_dialect(db), max_variables=max_variables)
+    run_statements(db, statements)
+    return len(rows)
+
+
+def run_statements(db, statements: Sequence[Tuple[str, Tuple[Any, ...]]]) -> None:
+    """Executa `(sql, params)` numa unica transacao (Turso: um `batch` atomico). Erros sobem ao chamador."""
+    if not statements:
+        return
+    conn = db.get_connection()
+    try:
+        if db_dialect(db) == DIALECT_TURSO:
+            conn.batch([libsql_client.Statement(sql, params) for sql, params in statements])
+        else:
+            try:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+                conn.commit()
+            except Exception:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                raise
+    finally:
+        conn.close()
+
+
+class _RoundTripConnection:
+    """Simula a latencia de rede de MySQL/Turso: cada execute/batch custa `delay_sec`."""
+
+    def __init__(self, conn, delay_sec: float):
+        self._conn = conn
+        self._delay = delay_sec
+
+    def execute(self, sql, params=()):
+        time.sleep(self._delay)
+        return self._conn.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _legacy_medicos_rows(df: pd.DataFrame, agora: str) -> List[Tuple[Any, ...]]:
+    # Conversao antiga do salvar_dados_medicos (iterrows + int() por linha), so para o benchmark.
+    rows = []
+    for _, row in df.iterrows():
+        hash_id = str(row.get("hash_id") or "").strip()
+        if not hash_id:
+            raw_id = f"{row.get('UNIDADE')}-{row.get('PACIENTE')}-{row.get('CHEGADA')}"
+            hash_id = hashlib.md5(raw_id.encode()).hexdigest()
+        try:
+            espera = int(row.get("ESPERA_MINUTOS"))
+        except Exception:
+            espera = None
+        rows.append((
+            hash_id, row.get("UNIDADE"), row.get("PACIENTE"), row.get("CHEGADA"), espera,
+            row.get("STATUS_DETECTADO"), row.get("PROFISSIONAL"), agora,
+        ))
+    return rows
+
+
+def _legacy_upsert_rows(db, spec: UpsertSpec, rows: Iterable[Sequence[Any]]) -> int:
+    # Caminho antigo (um execute por linha) mantido so para comparacao no benchmark.
+    sql = build_upsert_statements(spec, [tuple(range(len(spec.columns)))], db_dialect(db))[0][0]
+    conn = db.get_connection()
+    count = 0
+    try:
+        for row in rows:
+            conn.execute(sql, tuple(row))
+            count += 1
+        if not db.use_turso:
+            conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def run_bulk_upsert_benchmark(
+    sizes: Sequence[int] = (1000, 10000),
+    round_trip_ms: float = 0.0,
+    db_path: Optional[str] = None,
+):
+    """Micro-benchmark em SQLite temporario: salvar_dados_medicos/salvar_dados_recepcao (multi-linha)
+    contra o caminho antigo linha a linha. `round_trip_ms` soma uma latencia por statement para
+    aproximar MySQL/Turso, onde o ganho real vem do numero de round trips."""
+    import tempfile
+
+    import database_manager
+
+    tmp_dir = None
+    if not db_path:
+        tmp_dir = tempfile.mkdtemp(prefix="bulk_upsert_bench_")
+        db_path = os.path.join(tmp_dir, "bench.db")
+    original_path = database_manager.LOCAL_DB_PATH
+    original_env = {name: os.environ.get(name) for name in ("DB_PROVIDER", "TURSO_URL")}
+    os.environ["DB_PROVIDER"] = "sqlite"
+    os.environ.pop("TURSO_URL", None)
+    database_manager.LOCAL_DB_PATH = db_path
+    results = []
+    try:
+        db = database_manager.DatabaseManager()
+        if round_trip_ms > 0:
+            raw_get_connection = db.get_connection
+            db.get_connection = lambda: _RoundTripConnection(raw_get_connection(), round_trip_ms / 1000.0)
+        agora = "2026-01-01 08:00:00"
+        unit_names = db.get_unit_names()
+        for size in sizes:
+            for label, make_payload, spec, save, legacy_rows_fn in (
+                (
+                    "espera_medica",
+                    _bench_medicos_frame,
+                    database_manager.ESPERA_MEDICA_UPSERT,
+                    db.salvar_dados_medicos,
+                    lambda payload: _legacy_medicos_rows(payload, agora),
+                ),
+                (
+                    "recepcao_historico",
+                    _bench_recepcao_items,
+                    database_manager.RECEPCAO_HISTORICO_UPSERT,
+                    db.salvar_dados_recepcao,
+                    lambda payload: frame_to_rows(
+                        database_manager.recepcao_historico_frame(payload, agora, unit_names),
+                        database_manager.RECEPCAO_HISTORICO_UPSERT.columns,
+                    ),
+                ),
+            ):
+                payload = make_payload(size, "bulk")
+                database_manager._clear_espera_cache()
+                database_manager._clear_recepcao_cache()
+                started = time.perf_counter()
+                save(payload)
+                bulk_sec = time.perf_counter() - started
+
+                legacy_payload = make_payload(size, "legacy")
+                started = time.perf_counter()
+                _legacy_upsert_rows(db, spec, legacy_rows_fn(legacy_payload))
+                legacy_sec = time.perf_counter() - started
+                results.append({
+                    "table": label,
+                    "rows": size,
+                    "bulk_sec": round(bulk_sec, 4),
+                    "legacy_sec": round(legacy_sec, 4),
+                    "speedup": round(legacy_sec / bulk_sec, 2) if bulk_sec else None,
+                })
+    finally:
+        database_manager.LOCAL_DB_PATH = original_path
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        if tmp_dir:
+            import shutil
+
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    for item in results:
+        print(
+            f"[bulk_upsert] {item['table']:<20} rows={item['rows']:>6} rtt={round_trip_ms}ms "
+            f"bulk={item['bulk_sec']:.4f}s legacy={item['legacy_sec']:.4f}s speedup={item['speedup']}x"
+        )
+    return results
+
+
+def _bench_medicos_frame(size: int, tag: str) -> pd.DataFrame:
+    return pd.DataFrame({
+        "UNIDADE": ["Ouro Verde", "Centro Cambui", "Campinas Shopping"] * (size // 3) + ["Ouro Verde"] * (size % 3),
+        "PACIENTE": [f"Paciente {tag} {i}" for i in range(size)],
+        "CHEGADA": [f"{8 + (i % 10):02d}:{i % 60:02d}" for i in range(size)],
+        "ESPERA_MINUTOS": [i % 90 for i in range(size)],
+        "STATUS_DETECTADO": ["Espera" if i % 4 else "Em Atendimento" for i in range(size)],
+        "PROFISSIONAL": [f"Dr {i % 25}" for i in range(size)],
+    })
+
+
+def _bench_recepcao_items(size: int, tag: str) -> List[dict]:
+    units = (2, 3, 12)
+    return [
+        {
+            "id": f"{tag}{i}",
+            "UnidadeID": units[i % 3],
+            "PacienteNome": f"Paciente {i}",
+            "DataChegada": f"2026-01-01T08:{i % 60:02d}:00",
+            "StatusNome": "Aguardando" if i % 3 else "Atendido",
+        }
+        for i in range(size)
+    ]
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    cli_sizes = [int(arg) for arg in sys.argv[1:] if arg.isdigit()] or [1000, 10000]
+    cli_rtt = 0.0
+    for arg in sys.argv[1:]:
+        if arg.startswith("--rtt-ms="):
+            cli_rtt = float(arg.split("=", 1)[1] or 0)
+    run_bulk_upsert_benchmark(cli_sizes, round_trip_ms=cli_rtt)
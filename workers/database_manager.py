@@ -9,11 +9,19 @@ import json
 import pytz
 import time
 import threading
-import re
 from urllib.parse import urlparse, parse_qs, unquote
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
+try:
+    from db_pool import DB_POOL_ENABLED, ensure_schema_once, get_pool
+    from sql_dialect import translate_sql_for_mysql
+    from bulk_upsert import MULTI_ROW_MAX_VARIABLES, UpsertSpec, bulk_upsert, run_statements
+except ImportError:
+    from .db_pool import DB_POOL_ENABLED, ensure_schema_once, get_pool
+    from .sql_dialect import translate_sql_for_mysql
+    from .bulk_upsert import MULTI_ROW_MAX_VARIABLES, UpsertSpec, bulk_upsert, run_statements
+
 tz = pytz.timezone("America/Sao_Paulo")
 
 # Tenta importar o cliente Turso (HTTP)
@@ -68,8 +76,9 @@ _recepcao_lock = threading.Lock()
 
 
 class MySQLResultAdapter:
-    def __init__(self, rows=None):
+    def __init__(self, rows=None, rowcount=-1):
         self._rows = rows or []
+        self.rowcount = rowcount
 
     @property
     def rows(self):
@@ -96,7 +105,8 @@ class MySQLConnectionAdapter:
         with self._conn.cursor() as cursor:
             cursor.execute(translated, final_params)
             rows = cursor.fetchall() if cursor.description else []
-        return MySQLResultAdapter(rows)
+            rowcount = cursor.rowcount
+        return MySQLResultAdapter(rows, rowcount)
 
     def executemany(self, sql, seq_of_params):
         translated, _ = self._translator(sql, ())
@@ -107,12 +117,75 @@ class MySQLConnectionAdapter:
     def commit(self):
         self._conn.commit()
 
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self):
+        self._conn.ping(reconnect=False)
+
     def close(self):
         self._conn.close()
 
     def cursor(self):
         return self._conn.cursor()
 
+MONITOR_CYCLE_LOG_COLUMNS = (
+    'id', 'cycle_id', 'cycle_started_at', 'unit_name', 'unit_id',
+    'session_was_active', 'login_performed', 'login_success',
+    'queue_fetch_status', 'queue_fetch_meta_json', 'parse_status',
+    'patients_detected_count', 'hashes_detected_count',
+    'coleta_confiavel', 'coleta_vazia', 'active_rows_before_count',
+    'missing_candidates_count', 'absence_tracking_count',
+    'finalized_absence_count', 'finalized_hard_stale_count',
+    'cycle_result', 'message', 'created_at', 'updated_at',
+)
+MONITOR_CYCLE_LOG_UPDATABLE_COLUMNS = frozenset(MONITOR_CYCLE_LOG_COLUMNS) - {
+    'id', 'cycle_id', 'cycle_started_at', 'unit_name', 'unit_id', 'created_at', 'updated_at',
+}
+MONITOR_CYCLE_LOG_BOOL_COLUMNS = frozenset({
+    'session_was_active', 'login_performed', 'login_success', 'coleta_confiavel', 'coleta_vazia',
+})
+MONITOR_CYCLE_LOG_INT_COLUMNS = frozenset({
+    'patients_detected_count', 'hashes_detected_count', 'active_rows_before_count',
+    'missing_candidates_count', 'absence_tracking_count', 'finalized_absence_count',
+    'finalized_hard_stale_count',
+})
+MONITOR_EVENT_LOG_COLUMNS = (
+    'id', 'cycle_id', 'unit_name', 'unit_id', 'event_type', 'severity',
+    'patient_hash_id', 'patient_name', 'payload_json', 'created_at',
+)
+MONITOR_CYCLE_LOG_UPSERT = UpsertSpec(
+    'monitor_medico_cycle_log',
+    MONITOR_CYCLE_LOG_COLUMNS,
+    ('id',),
+    [col for col in MONITOR_CYCLE_LOG_COLUMNS if col not in ('id', 'created_at')],
+)
+# Reenvio do mesmo id (replay do spool) nao duplica evento.
+MONITOR_EVENT_LOG_UPSERT = UpsertSpec('monitor_medico_event_log', MONITOR_EVENT_LOG_COLUMNS, ('id',), ('cycle_id',))
+ESPERA_MEDICA_UPSERT = UpsertSpec(
+    'espera_medica',
+    ('hash_id', 'unidade', 'paciente', 'chegada', 'espera_minutos', 'status', 'profissional', 'updated_at'),
+    ('hash_id',),
+    ('espera_minutos', 'status', 'profissional', 'updated_at'),
+)
+# dt_atendimento fica fora do UPDATE para que finalizar_ausentes_recepcao tenha prioridade sobre ele.
+RECEPCAO_HISTORICO_UPSERT = UpsertSpec(
+    'recepcao_historico',
+    (
+        'hash_id', 'id_externo', 'unidade_id', 'unidade_nome', 'paciente_nome',
+        'dt_chegada', 'dt_atendimento', 'status', 'dia_referencia', 'updated_at',
+    ),
+    ('hash_id',),
+    ('status', 'updated_at'),
+)
+
+# Nomes das unidades Feegow (tabela feegow_unidades); o seed cobre as unidades monitoradas.
+FEEGOW_UNIDADES_SEED = ((2, "Ouro Verde"), (3, "Centro Cambui"), (12, "Campinas Shopping"))
+UNIT_NAMES_CACHE_SEC = max(0, int(os.getenv("UNIT_NAMES_CACHE_SEC", "600")))
+_unit_names_cache = {"loaded_at": 0.0, "names": None}
+_unit_names_lock = threading.Lock()
+
+
 def _should_write_heartbeat(service_name, status, details):
     if HEARTBEAT_MIN_INTERVAL_SEC <= 0:
         return True
@@ -182,6 +255,24 @@ def _clear_espera_cache_hashes(hash_ids):
         for h in hash_ids:
             _espera_cache.pop(str(h), None)
 
+# (nome, colunas SQLite/Turso, colunas MySQL com prefixo para colunas TEXT)
+ESPERA_MEDICA_INDEXES = (
+    ("idx_espera_medica_unidade_updated", "unidade, updated_at", "unidade(80), updated_at(19)"),
+    ("idx_espera_medica_updated", "updated_at", "updated_at(19)"),
+)
+
+def _affected_rows(result):
+    """Linhas afetadas pelo statement: sqlite3/pymysql `rowcount`, libsql `rows_affected`."""
+    for attr in ("rowcount", "rows_affected"):
+        value = getattr(result, attr, None)
+        if isinstance(value, int) and value >= 0:
+            return value
+    return 0
+
+def _day_start(dt):
+    # Limite inferior do intervalo semiaberto [dia 00:00:00, ...) comparavel com updated_at TEXT.
+    return dt.strftime('%Y-%m-%d 00:00:00')
+
 def _should_upsert_recepcao(hash_id, status, dt_atendimento):
     if RECEPCAO_UPSERT_MIN_INTERVAL_SEC <= 0:
         return True
@@ -211,9 +302,106 @@ def _should_upsert_recepcao(hash_id, status, dt_atendimento):
             return True
         return False
 
+def _clear_recepcao_cache():
+    with _recepcao_lock:
+        _recepcao_cache.clear()
+
 def gerar_hash(raw_id):
     return hashlib.md5(raw_id.encode()).hexdigest()
 
+def _table_columns(conn, table_name):
+    try:
+        pragma = conn.execute(f"PRAGMA table_info({table_name})")
+        rows = pragma.fetchall() if hasattr(pragma, 'fetchall') else list(pragma)
+    except Exception:
+        return set()
+    cols = set()
+    for row in rows:
+        if isinstance(row, dict):
+            col_name = row.get('name')
+        elif hasattr(row, '__getitem__'):
+            col_name = row[1] if len(row) > 1 else row[0]
+        else:
+            col_name = None
+        if col_name:
+            cols.add(col_name)
+    return cols
+
+def _first_truthy(df, names, default=None):
+    """Equivalente vetorial de `item.get(a) or item.get(b) or ... or default`."""
+    result = pd.Series([default] * len(df), index=df.index, dtype=object)
+    for name in reversed(names):
+        if name not in df.columns:
+            continue
+        col = df[name]
+        mask = col.notna() & col.astype(bool)
+        result = col.where(mask, result)
+    return result
+
+def espera_medica_frame(df, agora):
+    """DataFrame do parse_html -> linhas de espera_medica (colunas de ESPERA_MEDICA_UPSERT)."""
+    out = pd.DataFrame(index=df.index)
+    unidade = df['UNIDADE'] if 'UNIDADE' in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+    paciente = df['PACIENTE'] if 'PACIENTE' in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+    chegada = df['CHEGADA'] if 'CHEGADA' in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+    if 'hash_id' in df.columns:
+        hash_id = df['hash_id'].where(df['hash_id'].notna(), '').map(str).str.strip()
+    else:
+        hash_id = pd.Series([''] * len(df), index=df.index, dtype=object)
+    missing = hash_id == ''
+    if missing.any():
+        raw_ids = unidade[missing].map(str) + '-' + paciente[missing].map(str) + '-' + chegada[missing].map(str)
+        hash_id = hash_id.copy()
+        hash_id[missing] = [gerar_hash(raw) for raw in raw_ids]
+    out['hash_id'] = hash_id
+    out['unidade'] = unidade
+    out['paciente'] = paciente
+    out['chegada'] = chegada
+    espera_raw = df['ESPERA_MINUTOS'] if 'ESPERA_MINUTOS' in df.columns else pd.Series([None] * len(df), index=df.index)
+    out['espera_minutos'] = pd.Series(
+        [None if pd.isna(v) else int(v) for v in pd.to_numeric(espera_raw, errors='coerce')],
+        index=df.index,
+        dtype=object,
+    )
+    out['status'] = df['STATUS_DETECTADO'] if 'STATUS_DETECTADO' in df.columns else None
+    out['profissional'] = df['PROFISSIONAL'] if 'PROFISSIONAL' in df.columns else None
+    out['updated_at'] = agora
+    return out
+
+def recepcao_historico_frame(dados_brutos, agora, unit_names):
+    """Itens da API de recepcao -> linhas de recepcao_historico (colunas de RECEPCAO_HISTORICO_UPSERT)."""
+    now_local = datetime.now(tz)
+    horario_atual = now_local.strftime('%H:%M:%S')
+    dia_ref = now_local.strftime('%Y-%m-%d')
+    raw = pd.DataFrame(list(dados_brutos), dtype=object)
+    raw = raw.where(raw.notna(), None)
+
+    out = pd.DataFrame(index=raw.index)
+    id_ext = raw['id'] if 'id' in raw.columns else pd.Series([None] * len(raw), index=raw.index, dtype=object)
+    uid = _first_truthy(raw, ['UnidadeID', 'UnidadeID_Coleta'])
+    uid_num = pd.to_numeric(uid, errors='coerce')
+    out['hash_id'] = 'REC_' + id_ext.map(str) + '_' + uid.map(str)
+    out['id_externo'] = id_ext
+    out['unidade_id'] = uid
+    out['unidade_nome'] = uid_num.map(lambda v: unit_names.get(int(v)) if pd.notna(v) else None).fillna('Desconhecida')
+    out['paciente_nome'] = _first_truthy(
+        raw, ['PacienteNome', 'Paciente', 'NomePaciente', 'patient_name', 'name'], 'Desconhecido'
+    )
+
+    chegada = _first_truthy(raw, ['DataChegada', 'Chegada', 'DataEntrada', 'arrived_at'], dia_ref).map(str).str.strip()
+    # Se veio apenas data (YYYY-MM-DD), anexa hora atual para manter datetime.
+    only_date = (chegada.str.len() <= 10) & ~chegada.str.contains(' ', regex=False) & ~chegada.str.contains('T', regex=False)
+    out['dt_chegada'] = chegada.where(~only_date, chegada + ' ' + horario_atual).str.replace('T', ' ', regex=False)
+
+    atend = _first_truthy(raw, ['DataAtendimento', 'Atendimento', 'DataFinalizacao', 'finished_at'])
+    out['dt_atendimento'] = atend.where(
+        atend.isna(), atend.map(str).str.strip().str.replace('T', ' ', regex=False)
+    )
+    out['status'] = _first_truthy(raw, ['StatusNome', 'Status', 'status'], 'Indefinido')
+    out['dia_referencia'] = dia_ref
+    out['updated_at'] = agora
+    return out
+
 class DatabaseManager:
     def __init__(self):
         self.db_provider = str(os.getenv("DB_PROVIDER", "")).strip().lower()
@@ -268,7 +456,8 @@ class DatabaseManager:
         else:
             _log_once("☁️ [DB] Usando NUVEM (Turso HTTPS)", "db_provider:turso")
 
-        self._init_db()
+        # DDL base roda uma vez por processo/backend; as proximas instancias so reaproveitam o pool.
+        ensure_schema_once(("database_manager",) + self._pool_key(), self._init_db)
 
     def _parse_mysql_url(self, raw_url):
         parsed = urlparse(raw_url)
@@ -324,51 +513,59 @@ class DatabaseManager:
         return internal
 
     def _translate_sql_for_mysql(self, sql, params=()):
-        if not sql:
-            return sql, params
-        translated = str(sql)
-
-        pragma_match = re.match(r"^\s*PRAGMA\s+table_info\((.+)\)\s*;?\s*$", translated, flags=re.IGNORECASE)
-        if pragma_match:
-            raw_table = str(pragma_match.group(1) or "").strip()
-            table_name = raw_table.strip("`'\"")
-            translated = """
-                SELECT COLUMN_NAME as name
-                FROM information_schema.columns
-                WHERE table_schema = DATABASE() AND table_name = %s
-                ORDER BY ORDINAL_POSITION
-            """
-            return translated, (table_name,)
-
-        translated = re.sub(r"datetime\('now'\)", "NOW()", translated, flags=re.IGNORECASE)
-        translated = re.sub(r"date\('now'\)", "CURDATE()", translated, flags=re.IGNORECASE)
-        translated = re.sub(r"INSERT\s+OR\s+REPLACE\s+INTO", "REPLACE INTO", translated, flags=re.IGNORECASE)
-        if re.search(r"ON\s+CONFLICT\s*\(", translated, flags=re.IGNORECASE):
-            translated = re.sub(
-                r"ON\s+CONFLICT\s*\([^)]+\)\s*DO\s+UPDATE\s+SET",
-                "ON DUPLICATE KEY UPDATE",
-                translated,
-                flags=re.IGNORECASE
-            )
-            translated = re.sub(r"\bexcluded\.([A-Za-z0-9_]+)", r"VALUES(\1)", translated, flags=re.IGNORECASE)
-        translated = translated.replace("?", "%s")
-        # Escapa percentuais literais para evitar erro de formatting do PyMySQL
-        translated = re.sub(r"%(?!s|%)", "%%", translated)
-        return translated, params
+        # Pipeline compilado + cache LRU por texto SQL (ver sql_dialect.py).
+        return translate_sql_for_mysql(sql, params)
 
-    def get_connection(self):
-        """Retorna conexão apropriada (Objeto Turso ou SQLite Connection)"""
+    def _pool_key(self):
+        if self.use_mysql:
+            cfg = self.mysql_config or {}
+            return ("mysql", cfg.get("host"), cfg.get("port"), cfg.get("user"), cfg.get("database"))
+        if self.use_turso:
+            return ("turso", self.turso_url)
+        return ("sqlite", self.db_path)
+
+    def ensure_schema(self, name, init_fn):
+        """DDL/migracoes de um worker uma unica vez por processo e por banco."""
+        return ensure_schema_once((name,) + self._pool_key(), init_fn)
+
+    def _open_raw_connection(self):
         if self.use_mysql:
             raw_conn = pymysql.connect(**self.mysql_config)
             return MySQLConnectionAdapter(raw_conn, self._translate_sql_for_mysql)
         if self.use_turso:
             # Usa 'auth_token' (snake_case) para o Python
             return libsql_client.create_client_sync(url=self.turso_url, auth_token=self.turso_token)
+        # Conexoes do pool circulam entre threads (sempre com um unico dono por vez).
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def _healthcheck_connection(self, raw_conn):
+        if self.use_mysql:
+            raw_conn.ping()
         else:
-            return sqlite3.connect(self.db_path)
+            raw_conn.execute("SELECT 1")
+
+    def _reset_connection(self, raw_conn):
+        # Turso (HTTP) nao mantem transacao aberta entre chamadas.
+        if not self.use_turso:
+            raw_conn.rollback()
+
+    def get_connection(self):
+        """Retorna conexão apropriada (Objeto Turso ou SQLite Connection).
+        Com DB_POOL_ENABLED a conexão vem do pool do processo e `close()` a devolve."""
+        if not DB_POOL_ENABLED:
+            return self._open_raw_connection()
+        key = self._pool_key()
+        pool = get_pool(
+            key,
+            self._open_raw_connection,
+            healthcheck=self._healthcheck_connection,
+            reset=self._reset_connection,
+            label=key[0],
+        )
+        return pool.acquire()
 
     def _init_db(self):
-        """Cria as tabelas necessárias"""
+        """Cria as tabelas necessárias. Retorna False em falha para permitir nova tentativa."""
         conn = self.get_connection()
         try:
             queries = [
@@ -449,6 +646,12 @@ class DatabaseManager:
                     patient_name TEXT,
                     payload_json LONGTEXT,
                     created_at TEXT NOT NULL
+                )""",
+                # Lookup de nomes das unidades (usado por salvar_dados_recepcao)
+                """CREATE TABLE IF NOT EXISTS feegow_unidades (
+                    unit_id INTEGER PRIMARY KEY,
+                    nome VARCHAR(120) NOT NULL,
+                    updated_at TEXT
                 )"""
             ]
 
@@ -463,9 +666,36 @@ class DatabaseManager:
                 cursor.execute("PRAGMA journal_mode=WAL;")
                 for q in queries: cursor.execute(q)
                 conn.commit()
-                
+
+            # Bancos locais antigos foram criados com `espera`; o upsert grava espera_minutos.
+            if 'espera_minutos' not in _table_columns(conn, 'espera_medica'):
+                conn.execute("ALTER TABLE espera_medica ADD COLUMN espera_minutos INTEGER")
+            # Indices das finalizacoes por faixa de updated_at (unidade + intervalo semiaberto).
+            for index_name, columns_sql, mysql_columns_sql in ESPERA_MEDICA_INDEXES:
+                try:
+                    if self.use_mysql:
+                        conn.execute(f"CREATE INDEX {index_name} ON espera_medica ({mysql_columns_sql})")
+                    else:
+                        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON espera_medica ({columns_sql})")
+                except Exception:
+                    # Indice ja existe (MySQL nao suporta IF NOT EXISTS em CREATE INDEX).
+                    pass
+            # Seed sem sobrescrever nomes ja editados no banco.
+            agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
+            for unit_id, nome in FEEGOW_UNIDADES_SEED:
+                conn.execute(
+                    """
+                    INSERT INTO feegow_unidades (unit_id, nome, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(unit_id) DO UPDATE SET unit_id = excluded.unit_id
+                    """,
+                    (unit_id, nome, agora),
+                )
+            if not self.use_turso:
+                conn.commit()
+            return True
         except Exception as e:
             print(f"⚠️ Erro _init_db: {e}")
+            return False
         finally:
             conn.close()
 
@@ -522,98 +752,55 @@ class DatabaseManager:
     # --- LÓGICA MÉDICA ---
     def salvar_dados_medicos(self, df):
         if df.empty: return
-        conn = self.get_connection()
         try:
             agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
-
-            for _, row in df.iterrows():
-                hash_id = str(row.get('hash_id') or '').strip()
-                if not hash_id:
-                    raw_id = f"{row.get('UNIDADE')}-{row.get('PACIENTE')}-{row.get('CHEGADA')}"
-                    hash_id = gerar_hash(raw_id)
-
-                espera_raw = row.get('ESPERA_MINUTOS')
-                try:
-                    espera = int(espera_raw)
-                except:
-                    espera = None
-
-                sql = """
-                    INSERT INTO espera_medica 
-                    (hash_id, unidade, paciente, chegada, espera_minutos, status, profissional, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(hash_id) DO UPDATE SET
-                        espera_minutos = excluded.espera_minutos,
-                        status = excluded.status,
-                        profissional = excluded.profissional,
-                        updated_at = excluded.updated_at
-                """
-                params = (
-                    hash_id, row.get('UNIDADE'), row.get('PACIENTE'),
-                    row.get('CHEGADA'), espera,
-                    row.get('STATUS_DETECTADO'), row.get('PROFISSIONAL'), agora
+            rows = espera_medica_frame(df, agora)
+            keep = [
+                _should_upsert_espera(hash_id, status, espera, profissional)
+                for hash_id, status, espera, profissional in zip(
+                    rows['hash_id'], rows['status'], rows['espera_minutos'], rows['profissional']
                 )
-
-                if _should_upsert_espera(
-                    hash_id,
-                    row.get('STATUS_DETECTADO'),
-                    espera,
-                    row.get('PROFISSIONAL')
-                ):
-                    conn.execute(sql, params)
-
-            if not self.use_turso:
-                conn.commit()
-
+            ]
+            bulk_upsert(self, ESPERA_MEDICA_UPSERT, rows[keep])
         except Exception as e:
             print(f"Erro salvar médicos: {e}")
-        finally:
-            conn.close()
-
 
     def finalizar_expirados_medicos(self, nome_unidade, minutos=60):
+        """Fecha ativos sem atualizacao ha `minutos` e apaga os de mais de 72h.
+        Sem COUNT previo: o total vem do rowcount do DELETE + UPDATE (mesma transacao)."""
         conn = self.get_connection()
         try:
-            agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
-            limite = (datetime.now(tz) - timedelta(minutes=minutos)).strftime('%Y-%m-%d %H:%M:%S')
-            limite_delete = (datetime.now(tz) - timedelta(hours=72)).strftime('%Y-%m-%d %H:%M:%S')
-
-            sql_count = """
-                SELECT COUNT(*)
-                FROM espera_medica
-                WHERE unidade = ?
-                AND (status IS NULL OR status NOT LIKE ?)
-                AND updated_at < ?
-            """
-            count_rs = conn.execute(sql_count, (nome_unidade, "Finalizado%", limite))
-            count_row = count_rs.fetchone() if hasattr(count_rs, "fetchone") else None
-            total_to_finalize = int(count_row[0]) if count_row and count_row[0] is not None else 0
+            agora_dt = datetime.now(tz)
+            agora = agora_dt.strftime('%Y-%m-%d %H:%M:%S')
+            limite = (agora_dt - timedelta(minutes=minutos)).strftime('%Y-%m-%d %H:%M:%S')
+            limite_delete = (agora_dt - timedelta(hours=72)).strftime('%Y-%m-%d %H:%M:%S')
 
             # Remove registros ativos muito antigos (ruido de sessoes passadas).
             sql_delete = """
                 DELETE FROM espera_medica
                 WHERE unidade = ?
-                AND (status IS NULL OR status NOT LIKE ?)
                 AND updated_at < ?
+                AND (status IS NULL OR status NOT LIKE ?)
             """
-            conn.execute(sql_delete, (nome_unidade, "Finalizado%", limite_delete))
+            deleted = _affected_rows(conn.execute(sql_delete, (nome_unidade, limite_delete, "Finalizado%")))
 
             sql = """
                 UPDATE espera_medica
                 SET status = 'Finalizado (Saiu)', updated_at = ?
                 WHERE unidade = ?
-                AND (status IS NULL OR status NOT LIKE ?)
                 AND updated_at < ?
+                AND (status IS NULL OR status NOT LIKE ?)
             """
-
-            conn.execute(sql, (agora, nome_unidade, "Finalizado%", limite))
+            finalized = _affected_rows(conn.execute(sql, (agora, nome_unidade, limite, "Finalizado%")))
 
             if not self.use_turso:
                 conn.commit()
 
-            # Sem invalidar esse cache, pacientes podem ficar presos como finalizados.
-            _clear_espera_cache()
-            return total_to_finalize
+            total = deleted + finalized
+            if total:
+                # Sem invalidar esse cache, pacientes podem ficar presos como finalizados.
+                _clear_espera_cache()
+            return total
 
         except Exception as e:
             print(f"Erro finalizar expirados medicos: {e}")
@@ -622,129 +809,91 @@ class DatabaseManager:
             conn.close()
 
     # --- LÓGICA RECEPÇÃO ---
+    def get_unit_names(self):
+        """{unit_id: nome} da tabela feegow_unidades, com cache por processo (UNIT_NAMES_CACHE_SEC)."""
+        with _unit_names_lock:
+            cached = _unit_names_cache["names"]
+            if cached is not None and (time.time() - _unit_names_cache["loaded_at"]) < UNIT_NAMES_CACHE_SEC:
+                return cached
+        names = dict(FEEGOW_UNIDADES_SEED)
+        rows = self.execute_query("SELECT unit_id, nome FROM feegow_unidades")
+        for row in rows or []:
+            try:
+                names[int(row[0])] = str(row[1])
+            except (TypeError, ValueError):
+                continue
+        with _unit_names_lock:
+            _unit_names_cache["names"] = names
+            _unit_names_cache["loaded_at"] = time.time()
+        return names
+
     def salvar_dados_recepcao(self, dados_brutos):
         if not dados_brutos: return
-        conn = self.get_connection()
         try:
             agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
-            horario_atual = datetime.now(tz).strftime('%H:%M:%S') # Captura apenas a hora
-            dia_ref = datetime.now(tz).strftime('%Y-%m-%d')
-
-            for item in dados_brutos:
-                id_ext = item.get('id')
-                uid = item.get('UnidadeID') or item.get('UnidadeID_Coleta')
-                unidade_nome = "Desconhecida"
-                if uid == 2: unidade_nome = "Ouro Verde"
-                elif uid == 3: unidade_nome = "Centro Cambui"
-                elif uid == 12: unidade_nome = "Campinas Shopping"
-
-                paciente = (
-                    item.get('PacienteNome')
-                    or item.get('Paciente')
-                    or item.get('NomePaciente')
-                    or item.get('patient_name')
-                    or item.get('name')
-                    or 'Desconhecido'
-                )
-
-                dt_chegada_raw = (
-                    item.get('DataChegada')
-                    or item.get('Chegada')
-                    or item.get('DataEntrada')
-                    or item.get('arrived_at')
-                    or dia_ref
-                )
-                dt_chegada_raw = str(dt_chegada_raw).strip()
-                # Se veio apenas data (YYYY-MM-DD), anexa hora atual para manter datetime.
-                if len(dt_chegada_raw) <= 10 and ' ' not in dt_chegada_raw and 'T' not in dt_chegada_raw:
-                    dt_chegada = f"{dt_chegada_raw} {horario_atual}"
-                else:
-                    dt_chegada = dt_chegada_raw.replace('T', ' ')
-
-                dt_atend = (
-                    item.get('DataAtendimento')
-                    or item.get('Atendimento')
-                    or item.get('DataFinalizacao')
-                    or item.get('finished_at')
-                )
-                if dt_atend is not None:
-                    dt_atend = str(dt_atend).strip().replace('T', ' ')
-
-                status = (
-                    item.get('StatusNome')
-                    or item.get('Status')
-                    or item.get('status')
-                    or 'Indefinido'
-                )
-
-
-                hash_id = f"REC_{id_ext}_{uid}"
-
-                sql = """
-                    INSERT INTO recepcao_historico (
-                        hash_id, id_externo, unidade_id, unidade_nome, paciente_nome,
-                        dt_chegada, dt_atendimento, status, dia_referencia, updated_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(hash_id) DO UPDATE SET
-                        status = excluded.status,
-                        updated_at = excluded.updated_at
-                """
-                # Removido dt_atendimento do UPDATE para que o finalizar_ausentes tenha prioridade sobre ele
-                
-                params = (hash_id, id_ext, uid, unidade_nome, paciente, dt_chegada, dt_atend, status, dia_ref, agora)
-
-                if _should_upsert_recepcao(hash_id, status, dt_atend):
-                    conn.execute(sql, params)
-
-            if not self.use_turso: conn.commit()
+            rows = recepcao_historico_frame(dados_brutos, agora, self.get_unit_names())
+            keep = [
+                _should_upsert_recepcao(hash_id, status, dt_atend)
+                for hash_id, status, dt_atend in zip(rows['hash_id'], rows['status'], rows['dt_atendimento'])
+            ]
+            bulk_upsert(self, RECEPCAO_HISTORICO_UPSERT, rows[keep])
         except Exception as e:
             print(f"Erro salvar recepção: {e}")
-        finally:
-            conn.close()
 
     def finalizar_ausentes_recepcao(self, unidade_id, ids_ativos):
-        """Marca como finalizado quem sumiu da lista da API"""
+        """Marca como finalizado quem sumiu da lista da API.
+        Um unico UPDATE anti-join (`id_externo NOT IN (ativos)`); retorna o rowcount."""
+        return self.finalizar_ausentes_recepcao_unidades({unidade_id: ids_ativos}).get(unidade_id, 0)
+
+    def finalizar_ausentes_recepcao_unidades(self, ids_por_unidade):
+        """Reconcilia varias unidades numa unica transacao (Turso: um `batch`), um UPDATE anti-join
+        por unidade. `ids_por_unidade`: {unidade_id: ids ativos}; retorna {unidade_id: rowcount}."""
+        if not ids_por_unidade:
+            return {}
         conn = self.get_connection()
         try:
             agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
             hoje = datetime.now(tz).date().isoformat()
-            
-            # Converte IDs ativos para string
-            ativos_str = [str(i) for i in ids_ativos]
-            placeholder = ','.join(['?'] * len(ativos_str))
-            
-            # REMOVIDO: status = 'Aguardando' (substituído por NOT LIKE 'Finalizado')
-            # Isso garante que mesmo que o status venha vazio do Feegow, ele seja atualizado
-            if ativos_str:
-                sql = f'''
-                    UPDATE recepcao_historico 
-                    SET status = 'Finalizado (Saiu)', 
-                        dt_atendimento = ?, 
-                        updated_at = ?
-                    WHERE unidade_id = ? 
-                    AND dia_referencia = ?
-                    AND status NOT LIKE ?
-                    AND id_externo NOT IN ({placeholder})
-                '''
-                params = [agora, agora, str(unidade_id), hoje, "Finalizado%"] + ativos_str
-            else:
-                sql = '''
-                    UPDATE recepcao_historico 
-                    SET status = 'Finalizado (Saiu)', 
-                        dt_atendimento = ?, 
+
+            statements = []
+            for unidade_id, ids_ativos in ids_por_unidade.items():
+                # IDs ativos como string, sem repeticao (a lista vira o VALUES do NOT IN)
+                ativos_str = list(dict.fromkeys(str(i) for i in ids_ativos))
+
+                # REMOVIDO: status = 'Aguardando' (substituído por NOT LIKE 'Finalizado')
+                # Isso garante que mesmo que o status venha vazio do Feegow, ele seja atualizado
+                sql = """
+                    UPDATE recepcao_historico
+                    SET status = 'Finalizado (Saiu)',
+                        dt_atendimento = ?,
                         updated_at = ?
-                    WHERE unidade_id = ? 
+                    WHERE unidade_id = ?
                     AND dia_referencia = ?
                     AND status NOT LIKE ?
-                '''
+                """
                 params = [agora, agora, str(unidade_id), hoje, "Finalizado%"]
-            
-            if self.use_turso: conn.execute(sql, params)
-            else: conn.execute(sql, params)
-            
-            if not self.use_turso: conn.commit()
+                if ativos_str:
+                    sql += f"AND id_externo NOT IN ({', '.join('?' for _ in ativos_str)})"
+                    params += ativos_str
+                statements.append((unidade_id, sql, params))
+
+            if self.use_turso:
+                results = conn.batch([libsql_client.Statement(sql, params) for _, sql, params in statements])
+                return {unidade_id: _affected_rows(result) for (unidade_id, _, _), result in zip(statements, results)}
+
+            try:
+                totais = {
+                    unidade_id: _affected_rows(conn.execute(sql, params))
+                    for unidade_id, sql, params in statements
+                }
+                conn.commit()
+                return totais
+            except Exception:
+                conn.rollback()
+                raise
         except Exception as e:
             print(f"Erro finalizar recepção: {e}")
+            return {}
         finally:
             conn.close()
 
@@ -762,27 +911,33 @@ class DatabaseManager:
             conn.close()
 
     def finalizar_medicos_por_hash(self, nome_unidade, hash_ids, motivo="Ausencia Confirmada"):
-        if not hash_ids:
+        """Fecha os hashes informados num UPDATE por lote (`hash_id IN (...)`); retorna o rowcount."""
+        hashes = list(dict.fromkeys(str(h) for h in (hash_ids or []) if h is not None and str(h)))
+        if not hashes:
             return 0
         conn = self.get_connection()
         try:
             agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
             status_final = f"Finalizado ({motivo})"
-            sql = """
-                UPDATE espera_medica
-                SET status = ?, updated_at = ?
-                WHERE hash_id = ?
-                  AND unidade = ?
-                  AND (status IS NULL OR status NOT LIKE ?)
-            """
-            for hash_id in hash_ids:
-                conn.execute(sql, (status_final, agora, str(hash_id), nome_unidade, "Finalizado%"))
+            chunk_size = max(1, MULTI_ROW_MAX_VARIABLES - 4)
+            total = 0
+            for start in range(0, len(hashes), chunk_size):
+                chunk = hashes[start:start + chunk_size]
+                sql = f"""
+                    UPDATE espera_medica
+                    SET status = ?, updated_at = ?
+                    WHERE unidade = ?
+                      AND hash_id IN ({', '.join('?' for _ in chunk)})
+                      AND (status IS NULL OR status NOT LIKE ?)
+                """
+                params = [status_final, agora, nome_unidade] + chunk + ["Finalizado%"]
+                total += _affected_rows(conn.execute(sql, params))
 
             if not self.use_turso:
                 conn.commit()
 
-            self.clear_espera_cache(hash_ids)
-            return len(hash_ids)
+            self.clear_espera_cache(hashes)
+            return total
         except Exception as e:
             print(f"Erro finalizar medicos por hash: {e}")
             return 0
@@ -790,34 +945,25 @@ class DatabaseManager:
             conn.close()
 
     def finalizar_medicos_dia_anterior(self):
+        """Virada do dia: `updated_at < hoje 00:00:00` (intervalo semiaberto, usa o indice em vez de DATE())."""
         conn = self.get_connection()
         try:
-            hoje = datetime.now(tz).strftime('%Y-%m-%d')
-            agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
-
-            sql_count = """
-                SELECT COUNT(*)
-                FROM espera_medica
-                WHERE (status IS NULL OR status NOT LIKE ?)
-                  AND DATE(updated_at) < ?
-            """
-            count_rs = conn.execute(sql_count, ("Finalizado%", hoje))
-            row = count_rs.fetchone() if hasattr(count_rs, "fetchone") else None
-            total = int(row[0]) if row and row[0] is not None else 0
-            if total <= 0:
-                return 0
+            agora_dt = datetime.now(tz)
+            agora = agora_dt.strftime('%Y-%m-%d %H:%M:%S')
+            inicio_hoje = _day_start(agora_dt)
 
             sql_update = """
                 UPDATE espera_medica
                 SET status = 'Finalizado (Virada do Dia)', updated_at = ?
-                WHERE (status IS NULL OR status NOT LIKE ?)
-                  AND DATE(updated_at) < ?
+                WHERE updated_at < ?
+                  AND (status IS NULL OR status NOT LIKE ?)
             """
-            conn.execute(sql_update, (agora, "Finalizado%", hoje))
+            total = _affected_rows(conn.execute(sql_update, (agora, inicio_hoje, "Finalizado%")))
             if not self.use_turso:
                 conn.commit()
 
-            _clear_espera_cache()
+            if total:
+                _clear_espera_cache()
             return total
         except Exception as e:
             print(f"Erro finalizar medicos dia anterior: {e}")
@@ -843,49 +989,53 @@ class DatabaseManager:
         except Exception:
             return json.dumps({"raw": str(payload)}, ensure_ascii=False, default=str, separators=(',', ':'))
 
+    def _monitor_cycle_log_value(self, key, value):
+        if key == 'queue_fetch_meta_json':
+            return self._json_dumps(value)
+        if key in MONITOR_CYCLE_LOG_BOOL_COLUMNS:
+            return 1 if value else 0
+        if key in MONITOR_CYCLE_LOG_INT_COLUMNS:
+            return int(value or 0)
+        return value
+
+    def _monitor_cycle_log_params(self, payload):
+        agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
+        defaults = {
+            'id': str(payload.get('id') or ''),
+            'cycle_id': str(payload.get('cycle_id') or ''),
+            'cycle_started_at': str(payload.get('cycle_started_at') or agora),
+            'unit_name': str(payload.get('unit_name') or ''),
+            'created_at': str(payload.get('created_at') or agora),
+            'updated_at': str(payload.get('updated_at') or agora),
+        }
+        return tuple(
+            defaults[col] if col in defaults else self._monitor_cycle_log_value(col, payload.get(col))
+            for col in MONITOR_CYCLE_LOG_COLUMNS
+        )
+
+    def _monitor_event_log_params(self, payload):
+        agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
+        return (
+            str(payload.get('id') or ''),
+            str(payload.get('cycle_id') or ''),
+            payload.get('unit_name'),
+            payload.get('unit_id'),
+            payload.get('event_type'),
+            payload.get('severity') or 'info',
+            payload.get('patient_hash_id'),
+            payload.get('patient_name'),
+            self._json_dumps(payload.get('payload_json')),
+            str(payload.get('created_at') or agora),
+        )
+
     def create_monitor_medico_cycle_log(self, payload):
         conn = self.get_connection()
         try:
-            agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
-            sql = """
-                INSERT INTO monitor_medico_cycle_log (
-                    id, cycle_id, cycle_started_at, unit_name, unit_id,
-                    session_was_active, login_performed, login_success,
-                    queue_fetch_status, queue_fetch_meta_json, parse_status,
-                    patients_detected_count, hashes_detected_count,
-                    coleta_confiavel, coleta_vazia, active_rows_before_count,
-                    missing_candidates_count, absence_tracking_count,
-                    finalized_absence_count, finalized_hard_stale_count,
-                    cycle_result, message, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            sql = f"""
+                INSERT INTO monitor_medico_cycle_log ({', '.join(MONITOR_CYCLE_LOG_COLUMNS)})
+                VALUES ({', '.join('?' for _ in MONITOR_CYCLE_LOG_COLUMNS)})
             """
-            params = (
-                str(payload.get('id') or ''),
-                str(payload.get('cycle_id') or ''),
-                str(payload.get('cycle_started_at') or agora),
-                str(payload.get('unit_name') or ''),
-                payload.get('unit_id'),
-                1 if payload.get('session_was_active') else 0,
-                1 if payload.get('login_performed') else 0,
-                1 if payload.get('login_success') else 0,
-                payload.get('queue_fetch_status'),
-                self._json_dumps(payload.get('queue_fetch_meta_json')),
-                payload.get('parse_status'),
-                int(payload.get('patients_detected_count') or 0),
-                int(payload.get('hashes_detected_count') or 0),
-                1 if payload.get('coleta_confiavel') else 0,
-                1 if payload.get('coleta_vazia') else 0,
-                int(payload.get('active_rows_before_count') or 0),
-                int(payload.get('missing_candidates_count') or 0),
-                int(payload.get('absence_tracking_count') or 0),
-                int(payload.get('finalized_absence_count') or 0),
-                int(payload.get('finalized_hard_stale_count') or 0),
-                payload.get('cycle_result'),
-                payload.get('message'),
-                str(payload.get('created_at') or agora),
-                str(payload.get('updated_at') or agora),
-            )
-            conn.execute(sql, params)
+            conn.execute(sql, self._monitor_cycle_log_params(payload))
             if not self.use_turso:
                 conn.commit()
         except Exception as e:
@@ -893,72 +1043,38 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def update_monitor_medico_cycle_log(self, log_id, updates):
+    def _monitor_cycle_log_update_statement(self, log_id, updates):
         if not log_id or not updates:
+            return None
+        set_parts = []
+        params = []
+        for key, value in updates.items():
+            if key not in MONITOR_CYCLE_LOG_UPDATABLE_COLUMNS:
+                continue
+            set_parts.append(f"{key} = ?")
+            params.append(self._monitor_cycle_log_value(key, value))
+
+        if not set_parts:
+            return None
+
+        set_parts.append("updated_at = ?")
+        params.append(datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S'))
+        params.append(str(log_id))
+
+        sql = f"""
+            UPDATE monitor_medico_cycle_log
+            SET {', '.join(set_parts)}
+            WHERE id = ?
+        """
+        return sql, tuple(params)
+
+    def update_monitor_medico_cycle_log(self, log_id, updates):
+        statement = self._monitor_cycle_log_update_statement(log_id, updates)
+        if statement is None:
             return
         conn = self.get_connection()
         try:
-            allowed = {
-                'session_was_active',
-                'login_performed',
-                'login_success',
-                'queue_fetch_status',
-                'queue_fetch_meta_json',
-                'parse_status',
-                'patients_detected_count',
-                'hashes_detected_count',
-                'coleta_confiavel',
-                'coleta_vazia',
-                'active_rows_before_count',
-                'missing_candidates_count',
-                'absence_tracking_count',
-                'finalized_absence_count',
-                'finalized_hard_stale_count',
-                'cycle_result',
-                'message',
-            }
-            set_parts = []
-            params = []
-            for key, value in updates.items():
-                if key not in allowed:
-                    continue
-                if key == 'queue_fetch_meta_json':
-                    value = self._json_dumps(value)
-                elif key in {
-                    'session_was_active',
-                    'login_performed',
-                    'login_success',
-                    'coleta_confiavel',
-                    'coleta_vazia',
-                }:
-                    value = 1 if value else 0
-                elif key in {
-                    'patients_detected_count',
-                    'hashes_detected_count',
-                    'active_rows_before_count',
-                    'missing_candidates_count',
-                    'absence_tracking_count',
-                    'finalized_absence_count',
-                    'finalized_hard_stale_count',
-                }:
-                    value = int(value or 0)
-
-                set_parts.append(f"{key} = ?")
-                params.append(value)
-
-            if not set_parts:
-                return
-
-            set_parts.append("updated_at = ?")
-            params.append(datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S'))
-            params.append(str(log_id))
-
-            sql = f"""
-                UPDATE monitor_medico_cycle_log
-                SET {', '.join(set_parts)}
-                WHERE id = ?
-            """
-            conn.execute(sql, tuple(params))
+            conn.execute(*statement)
             if not self.use_turso:
                 conn.commit()
         except Exception as e:
@@ -966,29 +1082,25 @@ class DatabaseManager:
         finally:
             conn.close()
 
+    def update_monitor_medico_cycle_logs(self, payloads):
+        """UPDATE parcial de varias linhas de ciclo (`id` + colunas alteradas) numa unica transacao.
+        Diferente de `update_monitor_medico_cycle_log`, erros sobem ao chamador."""
+        statements = []
+        for payload in payloads or []:
+            statement = self._monitor_cycle_log_update_statement(payload.get('id'), payload)
+            if statement is not None:
+                statements.append(statement)
+        run_statements(self, statements)
+        return len(statements)
+
     def insert_monitor_medico_event_log(self, payload):
         conn = self.get_connection()
         try:
-            agora = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
-            sql = """
-                INSERT INTO monitor_medico_event_log (
-                    id, cycle_id, unit_name, unit_id, event_type, severity,
-                    patient_hash_id, patient_name, payload_json, created_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            sql = f"""
+                INSERT INTO monitor_medico_event_log ({', '.join(MONITOR_EVENT_LOG_COLUMNS)})
+                VALUES ({', '.join('?' for _ in MONITOR_EVENT_LOG_COLUMNS)})
             """
-            params = (
-                str(payload.get('id') or ''),
-                str(payload.get('cycle_id') or ''),
-                payload.get('unit_name'),
-                payload.get('unit_id'),
-                payload.get('event_type'),
-                payload.get('severity') or 'info',
-                payload.get('patient_hash_id'),
-                payload.get('patient_name'),
-                self._json_dumps(payload.get('payload_json')),
-                str(payload.get('created_at') or agora),
-            )
-            conn.execute(sql, params)
+            conn.execute(sql, self._monitor_event_log_params(payload))
             if not self.use_turso:
                 conn.commit()
         except Exception as e:
@@ -996,6 +1108,16 @@ class DatabaseManager:
         finally:
             conn.close()
 
+    def upsert_monitor_medico_cycle_logs(self, payloads):
+        """Grava o estado completo de varias linhas de ciclo num unico round trip (insert ou update)."""
+        rows_params = [self._monitor_cycle_log_params(payload) for payload in payloads or []]
+        return bulk_upsert(self, MONITOR_CYCLE_LOG_UPSERT, rows_params)
+
+    def insert_monitor_medico_event_logs(self, payloads):
+        """Insere eventos em lote; reenvio do mesmo id (replay do spool) nao duplica."""
+        rows_params = [self._monitor_event_log_params(payload) for payload in payloads or []]
+        return bulk_upsert(self, MONITOR_EVENT_LOG_UPSERT, rows_params)
+
     def limpar_logs_monitor_medico(self, cycle_retention_days=30, event_retention_days=60):
         conn = self.get_connection()
         try:
@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+DB_POOL_ENABLED = str(os.getenv("DB_POOL_ENABLED", "1")).strip().lower() in ("1", "true", "yes", "on")
+DB_POOL_MAX_SIZE = max(1, int(os.getenv("DB_POOL_MAX_SIZE", "16")))
+DB_POOL_CHECKOUT_TIMEOUT_SEC = max(1.0, float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT_SEC", "30")))
+# Conexoes ociosas alem deste tempo passam por health-check antes de voltar ao uso.
+DB_POOL_HEALTHCHECK_IDLE_SEC = max(0.0, float(os.getenv("DB_POOL_HEALTHCHECK_IDLE_SEC", "30")))
+# Conexoes ociosas alem deste tempo sao descartadas (evita wait_timeout do MySQL/proxies).
+DB_POOL_MAX_IDLE_SEC = max(1.0, float(os.getenv("DB_POOL_MAX_IDLE_SEC", "300")))
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+_SCHEMA_READY = set()
+_SCHEMA_LOCKS = {}
+_SCHEMA_LOCKS_GUARD = threading.Lock()
+
+
+class PoolTimeoutError(RuntimeError):
+    pass
+
+
+def _safe_close(raw_conn):
+    try:
+        raw_conn.close()
+    except Exception:
+        pass
+
+
+class PooledConnection:
+    """Proxy de conexao emprestada do pool.
+    `close()` devolve a conexao ao pool em vez de fechar o socket/arquivo."""
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._raw = raw_conn
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            raise RuntimeError(f"Conexao do pool {self._pool.label} ja foi devolvida.")
+        return self._raw
+
+    def execute(self, *args, **kwargs):
+        return self.raw.execute(*args, **kwargs)
+
+    # executemany/commit/cursor nao sao definidos aqui: o ClientSync do libsql nao os tem e
+    # `hasattr(conn, "executemany")` precisa continuar refletindo a conexao real.
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.raw, name)
+
+    def discard(self):
+        """Fecha de fato a conexao (ex.: apos erro de rede) sem devolve-la ao pool."""
+        raw_conn, self._raw = self._raw, None
+        if raw_conn is not None:
+            self._pool.release(raw_conn, broken=True)
+
+    def close(self):
+        raw_conn, self._raw = self._raw, None
+        if raw_conn is not None:
+            self._pool.release(raw_conn)
+
+    def __del__(self):
+        # Rede de seguranca para chamadores que esquecem o close(): libera o slot.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, key, factory, *, max_size=None, healthcheck=None, reset=None, label=None):
+        self.key = key
+        self.label = label or str(key[0] if isinstance(key, tuple) else key)
+        self._factory = factory
+        self._healthcheck = healthcheck
+        self._reset = reset
+        self.max_size = max(1, int(max_size or DB_POOL_MAX_SIZE))
+        self._idle = deque()
+        self._leased = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "discarded": 0,
+            "healthcheck_failed": 0,
+            "waits": 0,
+            "timeouts": 0,
+        }
+
+    def _total(self):
+        return self._leased + len(self._idle)
+
+    def _checkout_idle(self):
+        """Retorna uma conexao ociosa valida ou None. Deve ser chamado sem segurar o lock."""
+        while True:
+            with self._cond:
+                if not self._idle:
+                    return None
+                raw_conn, idle_since = self._idle.pop()
+                self._leased += 1
+
+            idle_for = time.monotonic() - idle_since
+            healthy = idle_for < DB_POOL_MAX_IDLE_SEC
+            if healthy and self._healthcheck and idle_for >= DB_POOL_HEALTHCHECK_IDLE_SEC:
+                try:
+                    self._healthcheck(raw_conn)
+                except Exception:
+                    healthy = False
+                    with self._cond:
+                        self._stats["healthcheck_failed"] += 1
+
+            if healthy:
+                with self._cond:
+                    self._stats["reused"] += 1
+                return raw_conn
+
+            _safe_close(raw_conn)
+            with self._cond:
+                self._leased -= 1
+                self._stats["discarded"] += 1
+                self._cond.notify()
+
+    def acquire(self, timeout=None):
+        deadline = time.monotonic() + (DB_POOL_CHECKOUT_TIMEOUT_SEC if timeout is None else float(timeout))
+        waited = False
+        while True:
+            raw_conn = self._checkout_idle()
+            if raw_conn is not None:
+                return PooledConnection(self, raw_conn)
+
+            with self._cond:
+                if self._idle:
+                    continue
+                if self._total() < self.max_size:
+                    self._leased += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"Pool {self.label} esgotado ({self.max_size} conexoes em uso) "
+                        f"apos {DB_POOL_CHECKOUT_TIMEOUT_SEC if timeout is None else timeout}s."
+                    )
+                if not waited:
+                    self._stats["waits"] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+        try:
+            raw_conn = self._factory()
+        except Exception:
+            with self._cond:
+                self._leased -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return PooledConnection(self, raw_conn)
+
+    def release(self, raw_conn, broken=False):
+        if not broken and self._reset:
+            try:
+                # Descarta transacao/snapshot pendente antes de emprestar de novo.
+                self._reset(raw_conn)
+            except Exception:
+                broken = True
+
+        if broken:
+            _safe_close(raw_conn)
+
+        with self._cond:
+            self._leased = max(0, self._leased - 1)
+            if broken:
+                self._stats["discarded"] += 1
+            else:
+                self._idle.append((raw_conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_idle(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for raw_conn, _ in idle:
+            _safe_close(raw_conn)
+        return len(idle)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "label": self.label,
+                "maxSize": self.max_size,
+                "leased": self._leased,
+                "idle": len(self._idle),
+                **self._stats,
+            }
+
+
+def get_pool(key, factory, *, healthcheck=None, reset=None, label=None, max_size=None):
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                key,
+                factory,
+                max_size=max_size,
+                healthcheck=healthcheck,
+                reset=reset,
+                label=label,
+            )
+            _POOLS[key] = pool
+        return pool
+
+
+def pool_stats():
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_all_pools():
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return sum(pool.close_idle() for pool in pools)
+
+
+def ensure_schema_once(key, init_fn) -> bool:
+    """Executa `init_fn` uma unica vez por processo para `key`.
+    So marca como pronto quando `init_fn` nao levanta excecao e nao retorna False,
+    permitindo nova tentativa na proxima construcao apos falha transitoria."""
+    if key in _SCHEMA_READY:
+        return False
+    with _SCHEMA_LOCKS_GUARD:
+        lock = _SCHEMA_LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        if key in _SCHEMA_READY:
+            return False
+        ok = init_fn()
+        if ok is not False:
+            _SCHEMA_READY.add(key)
+        return True
+
+
+def reset_schema_registry(key=None):
+    with _SCHEMA_LOCKS_GUARD:
+        if key is None:
+            _SCHEMA_READY.clear()
+        else:
+            _SCHEMA_READY.discard(key)
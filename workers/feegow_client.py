@@ -1,9 +1,10 @@
-import requests
 import pandas as pd
 import os
 import json
 from dotenv import load_dotenv
 from database_manager import DatabaseManager
+from feegow_http import get_feegow_http_client
+from feegow_reference_cache import get_reference_index, get_reference_rows
 
 # --- CARREGA AMBIENTE ---
 env_path = os.path.join(os.path.dirname(__file__), '../.env')
@@ -22,6 +23,16 @@ def get_api_headers_env():
     }
 
 def get_headers():
+    # Cache do cliente HTTP compartilhado: o fallback abaixo monta DatabaseManager e nao pode
+    # rodar a cada requisicao. 401/403 invalidam o cache (ver FeegowHttpClient.request).
+    headers, _ = get_feegow_http_client().auth_headers(_resolve_headers)
+    return headers
+
+def invalidate_headers():
+    """Descarta os cabecalhos em cache (ex.: token trocado no .env ou no banco)."""
+    get_feegow_http_client().invalidate_auth()
+
+def _resolve_headers():
     # APIs v1 da Feegow usam token de API (env), não o token unitário capturado no totem.
     try:
         return get_api_headers_env()
@@ -49,19 +60,19 @@ def get_headers():
 
 def request_endpoint(endpoint, method="GET", json_body=None):
     url = f"{BASE_URL}/{endpoint}"
-    headers = get_headers()
-    if not headers:
+    if not get_headers():
         return {}
 
     try:
         is_get = str(method).strip().upper() == "GET"
-        response = requests.request(
-            method=method,
-            url=url,
-            headers=headers,
+        # Sessao keep-alive compartilhada por host, com retry/jitter em 429/5xx e cabecalhos em cache.
+        response = get_feegow_http_client().request(
+            method,
+            url,
+            endpoint=endpoint,
+            headers_resolver=_resolve_headers,
             params=(json_body if is_get else None),
             json=(None if is_get else json_body),
-            timeout=60
         )
         response.raise_for_status()
         return response.json()
@@ -75,9 +86,24 @@ def normalize_content(data):
     return []
 
 # --- LISTAGENS AUXILIARES ---
+# Listas de referencia vem do cache compartilhado (TTL + revalidacao + disco);
+# falhas seguem o contrato antigo de request_endpoint: loga e devolve vazio.
+def _reference_rows(name):
+    try:
+        return get_reference_rows(name, get_headers)
+    except Exception as e:
+        print(f"[Feegow API Error] {name}: {e}")
+        return []
+
+def _reference_index(name):
+    try:
+        return get_reference_index(name, get_headers)
+    except Exception as e:
+        print(f"[Feegow API Error] {name}: {e}")
+        return {}
+
 def list_profissionals():
-    data = request_endpoint("professional/list", method="GET")
-    df = pd.DataFrame(normalize_content(data))
+    df = pd.DataFrame(_reference_rows("professionals"))
     if not df.empty and 'profissional_id' in df.columns:
         # Garante ID numérico para merge seguro
         df['profissional_id'] = pd.to_numeric(df['profissional_id'], errors='coerce').fillna(0).astype(int)
@@ -85,16 +111,14 @@ def list_profissionals():
     return df
 
 def list_especialidades():
-    data = request_endpoint("specialties/list", method="GET")
-    df = pd.DataFrame(normalize_content(data))
+    df = pd.DataFrame(_reference_rows("specialties"))
     if not df.empty and 'especialidade_id' in df.columns:
         df['especialidade_id'] = pd.to_numeric(df['especialidade_id'], errors='coerce').fillna(0).astype(int)
         return df[['especialidade_id', 'nome']]
     return df
 
 def list_procedures():
-    data = request_endpoint("procedures/list", method="GET")
-    df = pd.DataFrame(normalize_content(data))
+    df = pd.DataFrame(_reference_rows("procedures"))
     if df.empty: return df
 
     id_col = next((c for c in ['id', 'ID', 'procedimento_id'] if c in df.columns), None)
@@ -125,8 +149,7 @@ def fetch_procedures_catalog(extra_params=None):
     return pd.DataFrame(normalize_content(data))
 
 def list_procedure_groups():
-    data = request_endpoint("procedures/groups", method="GET")
-    df = pd.DataFrame(normalize_content(data))
+    df = pd.DataFrame(_reference_rows("procedure_groups"))
     if df.empty: return df
 
     id_col = next((c for c in ['id', 'ID', 'grupo_id'] if c in df.columns), None)
@@ -155,84 +178,65 @@ def fetch_financial_data(start_date, end_date):
     if df.empty:
         return pd.DataFrame()
 
-    # 2. Busca Auxiliares
-    df_prof = list_profissionals()
-    df_esp = list_especialidades()
-    df_procs = list_procedures()      
-    df_grupos = list_procedure_groups() 
-    
-    # 3. MERGES (CRUZAMENTOS)
-    
-    # --- Merge Profissional ---
-    if not df_prof.empty and "profissional_id" in df.columns:
-        df_prof = df_prof.rename(columns={'nome': 'nome_profissional_ref'})
-        df = df.merge(df_prof, on='profissional_id', how='left')
-        if 'nome_profissional_ref' in df.columns:
-            df['nome_profissional'] = df['nome_profissional_ref'].fillna('Desconhecido')
+    # 2. Busca Auxiliares (dicts indexados por ID, vindos do cache de referencia)
+    prof_by_id = _reference_index("professionals")
+    esp_by_id = _reference_index("specialties")
+    procs_by_id = _reference_index("procedures")
+    grupos_by_id = _reference_index("procedure_groups")
+
+    # 3. LOOKUPS (CRUZAMENTOS) por dict em vez de pd.merge
+
+    # --- Profissional ---
+    if prof_by_id and "profissional_id" in df.columns:
+        prof_ids = pd.to_numeric(df['profissional_id'], errors='coerce').fillna(0).astype(int)
+        df['nome_profissional'] = prof_ids.map(prof_by_id).fillna('Desconhecido')
     else:
         df['nome_profissional'] = 'N/A'
 
-    # --- Merge Especialidade ---
-    if not df_esp.empty and "especialidade_id" in df.columns:
-        df_esp = df_esp.rename(columns={'nome': 'nome_especialidade_ref'})
+    # --- Especialidade ---
+    if esp_by_id and "especialidade_id" in df.columns:
         try:
             df['especialidade_id'] = df['especialidade_id'].fillna(0).astype(int)
-            df_esp['especialidade_id'] = df_esp['especialidade_id'].astype(int)
         except: pass
-
-        df = df.merge(df_esp, on='especialidade_id', how='left')
-        if 'nome_especialidade_ref' in df.columns:
-            df['especialidade'] = df['nome_especialidade_ref'].fillna('Geral')
+        esp_ids = pd.to_numeric(df['especialidade_id'], errors='coerce').fillna(0).astype(int)
+        df['especialidade'] = esp_ids.map(esp_by_id).fillna('Geral')
     else:
         df['especialidade'] = 'Geral'
 
-    # --- Merge Grupo de Procedimento (PONTE DUPLA) ---
-    # Passo A: Agendamento -> Procedimento
-    if not df_procs.empty and "procedimento_id" in df.columns:
-        # Verifica se temos a coluna chave de referência antes de tentar o merge
-        if 'proc_ref_id' in df_procs.columns:
-            try:
-                df['procedimento_id'] = df['procedimento_id'].fillna(0).astype(int)
-                df_procs['proc_ref_id'] = df_procs['proc_ref_id'].fillna(0).astype(int)
-                
-                # Merge 1: Descobrir o ID do Grupo
-                df = df.merge(df_procs, left_on='procedimento_id', right_on='proc_ref_id', how='left')
-                if 'procedure_name_ref' in df.columns:
-                    df['procedure_name'] = df['procedure_name_ref'].fillna('N/A')
-            except Exception as e:
-                print(f"Erro merge procedimentos: {e}")
-        else:
-            print("AVISO: Tabela de procedimentos baixada mas sem coluna 'proc_ref_id'. Merge ignorado.")
+    # --- Grupo de Procedimento (PONTE DUPLA) ---
+    # Passo A: Agendamento -> Procedimento (nome + ID do grupo)
+    if procs_by_id and "procedimento_id" in df.columns:
+        try:
+            df['procedimento_id'] = df['procedimento_id'].fillna(0).astype(int)
+            proc_refs = df['procedimento_id'].map(procs_by_id)
+            df['procedure_name'] = proc_refs.map(lambda ref: ref.get('name') if isinstance(ref, dict) else None).fillna('N/A')
+            has_group_ref = any(ref.get('group_id') is not None for ref in procs_by_id.values())
+            if has_group_ref and 'grupo_procedimento_id' not in df.columns:
+                df['grupo_procedimento_id'] = proc_refs.map(lambda ref: ref.get('group_id') if isinstance(ref, dict) else None)
+        except Exception as e:
+            print(f"Erro lookup procedimentos: {e}")
     if 'procedure_name' not in df.columns:
         df['procedure_name'] = 'N/A'
 
     # Passo B: Procedimento -> Grupo
-    if not df_grupos.empty and "grupo_procedimento_id" in df.columns:
-        if 'grupo_ref_id' in df_grupos.columns:
-            try:
-                df['grupo_procedimento_id'] = df['grupo_procedimento_id'].fillna(0).astype(int)
-                df_grupos['grupo_ref_id'] = df_grupos['grupo_ref_id'].fillna(0).astype(int)
-                
-                # Merge 2: Descobrir o Nome do Grupo
-                df = df.merge(df_grupos, left_on='grupo_procedimento_id', right_on='grupo_ref_id', how='left')
-                
-                if 'nome_grupo' in df.columns:
-                    df['procedure_group'] = df['nome_grupo'].fillna('Outros')
-            except Exception as e:
-                print(f"Erro merge grupos: {e}")
-                df['procedure_group'] = 'Geral'
-        else:
-             df['procedure_group'] = 'Geral'
+    if grupos_by_id and "grupo_procedimento_id" in df.columns:
+        try:
+            df['grupo_procedimento_id'] = df['grupo_procedimento_id'].fillna(0).astype(int)
+            df['procedure_group'] = df['grupo_procedimento_id'].map(grupos_by_id).fillna('Outros')
+        except Exception as e:
+            print(f"Erro lookup grupos: {e}")
+            df['procedure_group'] = 'Geral'
     else:
         # Se falhou a cadeia, marca como Geral
         df['procedure_group'] = 'Geral'
 
     return df
 
-def fetch_proposals(start_date, end_date):
+def fetch_proposals(start_date, end_date, strict=False):
     """
     Busca propostas comerciais no período.
     Endpoint: /proposal/list
+    Com strict=True, falha da API levanta erro em vez de virar DataFrame vazio.
     """
     payload = {
         "data_inicio": start_date,
@@ -242,6 +246,8 @@ def fetch_proposals(start_date, end_date):
     # Nota: A documentação da Feegow às vezes varia os nomes dos parâmetros.
     # Se der erro, verifique se é 'date_start' ou 'data_inicio'.
     data = request_endpoint("proposal/list", method="GET", json_body=payload)
+    if strict and not data:
+        raise RuntimeError(f"proposal/list sem resposta para {start_date} a {end_date}")
     return pd.DataFrame(normalize_content(data))
 
 def fetch_patients_page(limit=100, offset=0, extra_params=None):
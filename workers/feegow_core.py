@@ -1,14 +1,9 @@
-import pytz
 import requests
 import pandas as pd
 import os
 import time
-import html
 import re
 import sys
-import pytz
-import hashlib
-from io import StringIO
 from datetime import datetime
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
@@ -20,23 +15,27 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from database_manager import DatabaseManager
+    from feegow_queue_parser import ParseDeadlineExceeded, parse_queue_html
     from feegow_web_auth import (
         APP4_BASE_URL,
+        feegow_storage_key,
         hydrate_requests_session_from_context,
         login_feegow_app4,
         switch_feegow_unit,
     )
 except ImportError:
     from .database_manager import DatabaseManager
+    from .feegow_queue_parser import ParseDeadlineExceeded, parse_queue_html
     from .feegow_web_auth import (
         APP4_BASE_URL,
+        feegow_storage_key,
         hydrate_requests_session_from_context,
         login_feegow_app4,
         switch_feegow_unit,
     )
-    from .playwright_runtime import chromium_session
+    from .playwright_runtime import browser_lease
 else:
-    from playwright_runtime import chromium_session
+    from playwright_runtime import browser_lease
 
 def get_feegow_config_from_db():
     """Busca credenciais no banco de dados (Híbrido)"""
@@ -154,18 +153,17 @@ class FeegowSystem:
         headless = str(os.getenv("PLAYWRIGHT_HEADLESS", "1")).strip().lower() in ("1", "true", "yes")
         try:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] Tentando login via app4...")
-            with chromium_session(headless=headless) as browser:
-                context = browser.new_context(ignore_https_errors=True)
-                page = context.new_page()
-                try:
+            # Navegador quente + storage_state salvo: com sessao valida o login nem abre o formulario.
+            with browser_lease(
+                headless=headless,
+                storage_key=feegow_storage_key(user, 0, scope="fila"),
+                context_options={"ignore_https_errors": True},
+            ) as lease:
+                page = lease.context.new_page()
+                with lease.timed("login"):
                     login_feegow_app4(page, user, password, logger=print)
                     switch_feegow_unit(page, 0, logger=print)
-                    hydrate_requests_session_from_context(context, self.session, logger=print)
-                finally:
-                    try:
-                        context.close()
-                    except Exception:
-                        pass
+                hydrate_requests_session_from_context(lease.context, self.session, logger=print)
 
             cookies = self.session.cookies.get_dict()
             if cookies:
@@ -232,63 +230,17 @@ class FeegowSystem:
     def _login_app_specific(self):
         return self.login()
 
-    def parse_html(self, html_content, nome_unidade):
-        if not html_content or "<table" not in html_content:
-            return pd.DataFrame()
-
+    def parse_html(self, html_content, nome_unidade, deadline=None):
+        """Fila do app4 -> DataFrame (ver feegow_queue_parser). `deadline` (time.monotonic) e conferido
+        durante o parse; ao estourar levanta ParseDeadlineExceeded em vez de devolver vazio."""
         try:
-            html_content = html.unescape(html_content)
-            dfs = pd.read_html(StringIO(html_content))
-            df = dfs[0].iloc[:, :7].copy()
-            df.columns = ['HORA', 'CHEGADA', 'PACIENTE', 'IDADE', 'PROFISSIONAL', 'COMPROMISSO', 'TEMPO_TEXTO']
-            df['PACIENTE'] = df['PACIENTE'].astype(str).str.strip()
-            df['CHEGADA'] = df['CHEGADA'].astype(str).str.strip().str[:5]
-            df['PROFISSIONAL'] = df['PROFISSIONAL'].astype(str).str.strip()
-
-            tz = pytz.timezone("America/Sao_Paulo")
-            agora = datetime.now(tz)
-
-            def calcular_espera_minutos(hora_chegada):
-                try:
-                    hoje = agora.strftime("%Y-%m-%d")
-                    chegada = datetime.strptime(f"{hoje} {hora_chegada}", "%Y-%m-%d %H:%M")
-                    chegada = tz.localize(chegada)
-                    diff = int((agora - chegada).total_seconds() / 60)
-                    return max(diff, 0)
-                except:
-                    return None
-
-            def processar_linha(row):
-                texto = str(row['TEMPO_TEXTO']).lower()
-                chegada = str(row['CHEGADA']).strip()
-
-                # Status
-                if "atendimento" in texto:
-                    status = "Em Atendimento"
-                else:
-                    status = "Espera"
-
-                espera = calcular_espera_minutos(chegada)
-                return pd.Series([status, espera])
-
-            df[['STATUS_DETECTADO', 'ESPERA_MINUTOS']] = df.apply(processar_linha, axis=1)
-            df['UNIDADE'] = nome_unidade
-            df['hash_id'] = df.apply(
-                lambda r: hashlib.md5(
-                    f"{nome_unidade}-{str(r.get('PACIENTE', '')).strip()}-{str(r.get('CHEGADA', '')).strip()}".encode()
-                ).hexdigest(),
-                axis=1
-            )
-
-            # Opcional: remover TEMPO_TEXTO
-            # df = df.drop(columns=['TEMPO_TEXTO'])
-
-            return df
-
+            return parse_queue_html(html_content, nome_unidade, deadline=deadline)
+        except ParseDeadlineExceeded:
+            raise
         except Exception as e:
             print(f"Erro parse: {e}")
             return pd.DataFrame()
-        
+
     def obter_dados_recepcao_core(self, unidade_id):
         """
         Busca dados da fila de recepção no sistema CORE.
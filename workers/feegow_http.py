@@ -0,0 +1,288 @@
+import importlib.util
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+FEEGOW_HTTP_TIMEOUT_SEC = max(5.0, float(os.getenv("FEEGOW_HTTP_TIMEOUT_SEC", "60") or "60"))
+FEEGOW_HTTP_POOL_SIZE = max(1, int(os.getenv("FEEGOW_HTTP_POOL_SIZE", "16") or "16"))
+FEEGOW_HTTP_RETRIES = max(0, int(os.getenv("FEEGOW_HTTP_RETRIES", "3") or "3"))
+FEEGOW_HTTP_BACKOFF_SEC = max(0.0, float(os.getenv("FEEGOW_HTTP_BACKOFF_SEC", "0.5") or "0.5"))
+FEEGOW_HTTP_BACKOFF_JITTER_SEC = max(0.0, float(os.getenv("FEEGOW_HTTP_BACKOFF_JITTER_SEC", "0.5") or "0.5"))
+FEEGOW_HTTP_COMPRESSION = str(os.getenv("FEEGOW_HTTP_COMPRESSION", "1")).strip().lower() in ("1", "true", "yes", "on")
+FEEGOW_AUTH_HEADERS_TTL_SEC = max(0.0, float(os.getenv("FEEGOW_AUTH_HEADERS_TTL_SEC", "300") or "300"))
+# Sem token: evita montar DatabaseManager a cada requisicao, mas tenta de novo logo.
+FEEGOW_AUTH_HEADERS_EMPTY_TTL_SEC = 30.0
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+AUTH_FAILURE_STATUS_CODES = (401, 403)
+# Limites superiores (ms) dos buckets do histograma de latencia; o ultimo e +inf.
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# `br` so e anunciado se o urllib3 consegue decodificar (precisa do pacote brotli instalado).
+_ACCEPT_ENCODING = "gzip, deflate, br" if importlib.util.find_spec("brotli") is not None else "gzip, deflate"
+
+
+class JitteredRetry(Retry):
+    """Backoff exponencial do urllib3 mais um jitter aleatorio: workers que bateram no mesmo 429/5xx
+    nao voltam todos no mesmo instante."""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        if backoff <= 0 or FEEGOW_HTTP_BACKOFF_JITTER_SEC <= 0:
+            return backoff
+        return backoff + random.uniform(0.0, FEEGOW_HTTP_BACKOFF_JITTER_SEC)
+
+
+class LatencyHistogram:
+    """Histograma de latencia por endpoint (buckets fixos em ms), com contagem de status e erros."""
+
+    __slots__ = ("counts", "total", "sum_ms", "max_ms", "errors", "statuses", "bytes")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.errors = 0
+        self.statuses: Dict[int, int] = {}
+        self.bytes = 0
+
+    def observe(self, elapsed_ms: float, status: Optional[int] = None, size: int = 0):
+        idx = len(LATENCY_BUCKETS_MS)
+        for pos, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                idx = pos
+                break
+        self.counts[idx] += 1
+        self.total += 1
+        self.sum_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.bytes += int(size or 0)
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def quantile_ms(self, q: float) -> Optional[float]:
+        """Limite superior do bucket que contem o quantil (o ultimo bucket devolve o maximo visto)."""
+        if not self.total:
+            return None
+        target = max(1, int(round(q * self.total + 0.4999)))
+        seen = 0
+        for pos, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return float(LATENCY_BUCKETS_MS[pos]) if pos < len(LATENCY_BUCKETS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.total,
+            "errors": self.errors,
+            "avg_ms": round(self.sum_ms / self.total, 1) if self.total else None,
+            "p50_ms": self.quantile_ms(0.5),
+            "p95_ms": self.quantile_ms(0.95),
+            "max_ms": round(self.max_ms, 1),
+            "bytes": self.bytes,
+            "statuses": dict(self.statuses),
+            "buckets": {
+                (f"le_{bound}" if pos < len(LATENCY_BUCKETS_MS) else "inf"): self.counts[pos]
+                for pos, bound in enumerate(tuple(LATENCY_BUCKETS_MS) + (None,))
+            },
+        }
+
+
+def make_pooled_session(
+    pool_size: int = FEEGOW_HTTP_POOL_SIZE,
+    retries: int = FEEGOW_HTTP_RETRIES,
+    backoff_sec: float = FEEGOW_HTTP_BACKOFF_SEC,
+    compression: bool = FEEGOW_HTTP_COMPRESSION,
+) -> requests.Session:
+    session = requests.Session()
+    retry = JitteredRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_sec,
+        status_forcelist=list(RETRY_STATUS_CODES),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=max(1, int(pool_size)), pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = _ACCEPT_ENCODING if compression else "identity"
+    return session
+
+
+class FeegowHttpClient:
+    """Cliente HTTP compartilhado do processo para a API da Feegow.
+
+    - uma `requests.Session` por host, com pool de conexoes keep-alive (TCP/TLS reaproveitados)
+      e `Retry` do urllib3 com backoff + jitter em 429/5xx (respeitando Retry-After);
+    - cabecalhos de autenticacao em cache (TTL) com invalidacao explicita e automatica em 401/403;
+    - histograma de latencia por endpoint (`stats`).
+    A sessao so carrega cabecalhos por requisicao (sem cookies), entao e compartilhada entre threads.
+    """
+
+    def __init__(
+        self,
+        timeout_sec: float = FEEGOW_HTTP_TIMEOUT_SEC,
+        auth_ttl_sec: float = FEEGOW_AUTH_HEADERS_TTL_SEC,
+        session_factory: Callable[[], requests.Session] = make_pooled_session,
+    ):
+        self.timeout_sec = timeout_sec
+        self.auth_ttl_sec = auth_ttl_sec
+        self._session_factory = session_factory
+        self._sessions: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+        self._auth_lock = threading.Lock()
+        self._auth_headers: Optional[Dict[str, str]] = None
+        self._auth_expires_at = 0.0
+        self._auth_generation = 0
+        self._stats_lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self.auth_refreshes = 0
+        self.auth_invalidations = 0
+
+    # --- sessoes ---
+    def session_for(self, url: str) -> requests.Session:
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}".lower()
+        session = self._sessions.get(host)
+        if session is not None:
+            return session
+        with self._sessions_lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._session_factory()
+                self._sessions[host] = session
+            return session
+
+    def close(self):
+        with self._sessions_lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    # --- autenticacao ---
+    def auth_headers(self, resolver: Callable[[], Dict[str, str]]) -> Tuple[Dict[str, str], int]:
+        """Cabecalhos em cache ate o TTL; `resolver` so roda na primeira chamada ou apos invalidar.
+        Retorna (headers, geracao) para o chamador invalidar apenas a versao que usou."""
+        now = time.time()
+        with self._auth_lock:
+            if self._auth_headers is not None and now < self._auth_expires_at:
+                return dict(self._auth_headers), self._auth_generation
+            headers = dict(resolver() or {})
+            ttl = self.auth_ttl_sec if headers else min(self.auth_ttl_sec, FEEGOW_AUTH_HEADERS_EMPTY_TTL_SEC)
+            self._auth_headers = headers
+            self._auth_expires_at = now + ttl
+            self._auth_generation += 1
+            self.auth_refreshes += 1
+            return dict(headers), self._auth_generation
+
+    def invalidate_auth(self, generation: Optional[int] = None):
+        with self._auth_lock:
+            if generation is not None and generation != self._auth_generation:
+                return
+            self._auth_headers = None
+            self._auth_expires_at = 0.0
+            self.auth_invalidations += 1
+
+    # --- requisicoes ---
+    def _observe(self, endpoint: str, elapsed_ms: float, status: Optional[int], size: int = 0):
+        with self._stats_lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None:
+                histogram = LatencyHistogram()
+                self._histograms[endpoint] = histogram
+            histogram.observe(elapsed_ms, status, size)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        endpoint: str = "",
+        headers_resolver: Optional[Callable[[], Dict[str, str]]] = None,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """Requisicao pela sessao do host. Com `headers_resolver`, usa os cabecalhos em cache e, se a
+        resposta for 401/403, invalida o cache e repete uma vez com cabecalhos novos."""
+        session = self.session_for(url)
+        label = endpoint or urlsplit(url).path
+        extra_headers = dict(kwargs.pop("headers", None) or {})
+        attempts = 2 if headers_resolver is not None else 1
+        response = None
+        for attempt in range(attempts):
+            headers = dict(extra_headers)
+            generation = None
+            if headers_resolver is not None:
+                auth, generation = self.auth_headers(headers_resolver)
+                headers.update(auth)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, headers=headers, timeout=timeout or self.timeout_sec, **kwargs)
+            except Exception:
+                self._observe(label, (time.perf_counter() - started) * 1000.0, None)
+                raise
+            self._observe(
+                label,
+                (time.perf_counter() - started) * 1000.0,
+                response.status_code,
+                len(response.content or b""),
+            )
+            if response.status_code in AUTH_FAILURE_STATUS_CODES and attempt + 1 < attempts:
+                self.invalidate_auth(generation)
+                continue
+            break
+        return response
+
+    def stats(self, reset: bool = False) -> Dict[str, Any]:
+        with self._stats_lock:
+            snapshot = {endpoint: hist.snapshot() for endpoint, hist in sorted(self._histograms.items())}
+            if reset:
+                self._histograms = {}
+        return {
+            "endpoints": snapshot,
+            "hosts": sorted(self._sessions.keys()),
+            "auth_refreshes": self.auth_refreshes,
+            "auth_invalidations": self.auth_invalidations,
+        }
+
+    def latency_report(self) -> str:
+        lines = []
+        for endpoint, item in self.stats()["endpoints"].items():
+            lines.append(
+                f"{endpoint}: n={item['count']} erros={item['errors']} media={item['avg_ms']}ms "
+                f"p50<={item['p50_ms']}ms p95<={item['p95_ms']}ms max={item['max_ms']}ms status={item['statuses']}"
+            )
+        return "\n".join(lines)
+
+
+_DEFAULT_CLIENT: Optional[FeegowHttpClient] = None
+_DEFAULT_CLIENT_LOCK = threading.Lock()
+
+
+def get_feegow_http_client() -> FeegowHttpClient:
+    global _DEFAULT_CLIENT
+    if _DEFAULT_CLIENT is None:
+        with _DEFAULT_CLIENT_LOCK:
+            if _DEFAULT_CLIENT is None:
+                _DEFAULT_CLIENT = FeegowHttpClient()
+    return _DEFAULT_CLIENT
+
+
+def feegow_http_stats(reset: bool = False) -> Dict[str, Any]:
+    return get_feegow_http_client().stats(reset=reset)
@@ -0,0 +1,596 @@
+import hashlib
+import html as html_lib
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from functools import lru_cache
+from io import StringIO
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pytz
+
+try:
+    from lxml import etree
+
+    # Mesmo `text_content()` do lxml.html, sem a classe HtmlElement (o lookup em Python pesa por elemento).
+    _text_content = etree.XPath("string()", smart_strings=False)
+except ImportError:  # pragma: no cover - sem lxml o parse volta ao pd.read_html
+    etree = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    from pandas._libs.parsers import STR_NA_VALUES as _PANDAS_NA_VALUES
+except ImportError:  # pragma: no cover - API interna do pandas
+    _PANDAS_NA_VALUES = {
+        "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+        "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+    }
+
+TZ = pytz.timezone("America/Sao_Paulo")
+# Celula vazia/NA depois do `astype(str)` do fluxo antigo: "nan" ate o pandas 2, NaN no pandas 3.
+_NA_CELL = pd.Series([float("nan")], dtype=object).astype(str).iloc[0]
+
+# Colunas da tabela de fila (ordem da pagina). So as usadas pelo monitor sao extraidas por padrao.
+QUEUE_COLUMNS = ("HORA", "CHEGADA", "PACIENTE", "IDADE", "PROFISSIONAL", "COMPROMISSO", "TEMPO_TEXTO")
+QUEUE_REQUIRED_COLUMNS = ("CHEGADA", "PACIENTE", "PROFISSIONAL", "TEMPO_TEXTO")
+QUEUE_OUTPUT_COLUMNS = ("CHEGADA", "PACIENTE", "PROFISSIONAL", "STATUS_DETECTADO", "ESPERA_MINUTOS", "UNIDADE", "hash_id")
+
+QUEUE_PARSE_CACHE_SIZE = max(0, int(os.getenv("MEDICO_PARSE_CACHE_SIZE", "32") or "32"))
+QUEUE_PARSE_FEED_CHUNK = 64 * 1024
+# A cada quantas linhas o parse confere o prazo cooperativo.
+QUEUE_PARSE_DEADLINE_EVERY = 64
+# Folga alem do prazo antes de considerar a thread travada (parse nao cooperativo).
+QUEUE_PARSE_WORKER_GRACE_SEC = 1.0
+
+_RE_WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")
+_RE_TABLE_TEXT = re.compile(r".+")
+
+
+class ParseDeadlineExceeded(FutureTimeoutError):
+    """O parse passou do prazo e parou no proximo ponto de verificacao."""
+
+
+def _check_deadline(deadline: Optional[float]):
+    if deadline is not None and time.monotonic() > deadline:
+        raise ParseDeadlineExceeded("parse da fila excedeu o prazo")
+
+
+# --- hashes ---
+@lru_cache(maxsize=8192)
+def queue_hash_id(nome_unidade: str, paciente: str, chegada: str) -> str:
+    """hash_id persistido em espera_medica: MD5 de "unidade-paciente-chegada" (mesma chave de sempre).
+    Em cache: a mesma fila e reparseada a cada ciclo e quase todas as chaves se repetem."""
+    return hashlib.md5(f"{nome_unidade}-{paciente}-{chegada}".encode()).hexdigest()
+
+
+def fast_digest(data) -> str:
+    """Digest rapido nao criptografico (xxh3 se o xxhash estiver instalado, senao blake2b de 8 bytes).
+    Serve so para identificar paginas repetidas em memoria; nunca e persistido."""
+    if isinstance(data, str):
+        data = data.encode("utf-8", errors="surrogatepass")
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+# --- extracao da tabela ---
+_CELL_TAGS = ("td", "th")
+
+
+def _cell_text(td) -> str:
+    # Mesmo texto do pd.read_html (lxml): text_content com espacos/quebras colapsados.
+    return _RE_WHITESPACE.sub(" ", _text_content(td).strip())
+
+
+def _drop_tree(element):
+    # HtmlElement.drop_tree: remove o elemento e devolve o tail ao irmao anterior (ou ao pai).
+    parent = element.getparent()
+    if parent is None:
+        return
+    if element.tail:
+        previous = element.getprevious()
+        if previous is None:
+            parent.text = (parent.text or "") + element.tail
+        else:
+            previous.tail = (previous.tail or "") + element.tail
+    parent.remove(element)
+
+
+def _is_hidden(element) -> bool:
+    return "display:none" in (element.get("style") or "").replace(" ", "")
+
+
+def _row_cells(row):
+    return [child for child in row if child.tag in _CELL_TAGS]
+
+
+def _table_rows(table):
+    """(cabecalho, corpo, rodape) com as mesmas regras do pd.read_html."""
+    header_rows = []
+    for thead in table.xpath(".//thead"):
+        header_rows.extend(thead.xpath("./tr"))
+        if _row_cells(thead):
+            header_rows.append(thead)
+    body_rows = table.xpath(".//tbody//tr") + table.xpath("./tr")
+    footer_rows = table.xpath(".//tfoot//tr")
+    if not header_rows:
+        while body_rows and all(cell.tag == "th" for cell in _row_cells(body_rows[0])):
+            header_rows.append(body_rows.pop(0))
+    return header_rows, body_rows, footer_rows
+
+
+def _expand_rows(rows, remainder, overflow, deadline):
+    """Expande colspan/rowspan como o pd.read_html, mas guardando o elemento da celula: o texto so e
+    extraido depois, para as colunas pedidas."""
+    out = []
+    for count, tr in enumerate(rows):
+        if count % QUEUE_PARSE_DEADLINE_EVERY == 0:
+            _check_deadline(deadline)
+        tds = _row_cells(tr)
+        if not remainder and not any(td.get("rowspan") or td.get("colspan") for td in tds):
+            out.append(tds)
+            continue
+        cells = []
+        next_remainder = []
+        index = 0
+        for td in tds:
+            while remainder and remainder[0][0] <= index:
+                prev_i, prev_cell, prev_rowspan = remainder.pop(0)
+                cells.append(prev_cell)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_cell, prev_rowspan - 1))
+                index += 1
+            cell = td
+            rowspan = int(td.get("rowspan") or 1)
+            colspan = int(td.get("colspan") or 1)
+            for _ in range(colspan):
+                cells.append(cell)
+                if rowspan > 1:
+                    next_remainder.append((index, cell, rowspan - 1))
+                index += 1
+        for prev_i, prev_cell, prev_rowspan in remainder:
+            cells.append(prev_cell)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_cell, prev_rowspan - 1))
+        out.append(cells)
+        remainder = next_remainder
+
+    if not overflow:
+        while remainder:
+            next_remainder = []
+            cells = []
+            for prev_i, prev_cell, prev_rowspan in remainder:
+                cells.append(prev_cell)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_cell, prev_rowspan - 1))
+            out.append(cells)
+            remainder = next_remainder
+    return out, remainder
+
+
+def _table_cells(table, deadline) -> Optional[Tuple[List[list], int]]:
+    """(linhas de dados, largura) da tabela; None se ela nao gera linhas (o read_html a ignora)."""
+    header_rows, body_rows, footer_rows = _table_rows(table)
+    header, rem = _expand_rows(header_rows, [], True, deadline)
+    body, rem = _expand_rows(body_rows, rem, bool(footer_rows), deadline)
+    footer, _ = _expand_rows(footer_rows, rem, False, deadline)
+    if not (header or body or footer):
+        return None
+    width = max(len(row) for row in header + body + footer)
+    return body + footer, width
+
+
+def _candidate_tables(top_table):
+    """Tabelas com texto em ordem de documento (a externa antes das internas), sem as ocultas; aplica a
+    remocao de <style> e elementos display:none de todas antes de ler, como o read_html."""
+    tables = [
+        table
+        for table in [top_table] + list(top_table.iterdescendants("table"))
+        if any(_RE_TABLE_TEXT.search(text) for text in table.itertext())
+    ]
+    tables = [table for table in tables if not _is_hidden(table)]
+    for br in top_table.iter("br"):
+        br.tail = "\n" + (br.tail or "")
+    for table in tables:
+        for element in table.xpath(".//style"):
+            _drop_tree(element)
+        for element in table.xpath(".//*[@style]"):
+            if _is_hidden(element):
+                _drop_tree(element)
+    return tables
+
+
+def _iter_top_tables(html_content: str, deadline: Optional[float]):
+    """Le o documento em blocos com o parser incremental do lxml e entrega cada <table> de primeiro nivel
+    assim que ela fecha; o chamador para de alimentar o parser quando acha a tabela da fila."""
+    parser = etree.HTMLPullParser(events=("start", "end"), tag="table")
+    chunks = range(0, len(html_content), QUEUE_PARSE_FEED_CHUNK)
+    depth = 0
+    for offset in list(chunks) + [None]:
+        _check_deadline(deadline)
+        if offset is None:
+            parser.close()
+        else:
+            parser.feed(html_content[offset:offset + QUEUE_PARSE_FEED_CHUNK])
+        for event, element in parser.read_events():
+            depth += 1 if event == "start" else -1
+            if event == "end" and depth == 0:
+                yield element
+
+
+def extract_queue_rows(
+    html_content: str,
+    columns: Sequence[str] = QUEUE_REQUIRED_COLUMNS,
+    deadline: Optional[float] = None,
+) -> Optional[Dict[str, List[str]]]:
+    """Extrai so as `columns` pedidas da primeira tabela com linhas do HTML (ja sem entidades).
+
+    Os valores saem como o `astype(str)` do fluxo antigo com pd.read_html: texto com espacos colapsados e
+    celulas vazias/NA como `_NA_CELL`. Retorna None quando a tabela nao tem as 7 colunas da fila.
+    """
+    wanted = [(name, QUEUE_COLUMNS.index(name)) for name in columns]
+    for top_table in _iter_top_tables(html_content, deadline):
+        for table in _candidate_tables(top_table):
+            parsed = _table_cells(table, deadline)
+            if parsed is None:
+                continue
+            rows, width = parsed
+            if width < len(QUEUE_COLUMNS):
+                return None
+            data = {name: [] for name, _ in wanted}
+            for count, cells in enumerate(rows):
+                if count % QUEUE_PARSE_DEADLINE_EVERY == 0:
+                    _check_deadline(deadline)
+                for name, idx in wanted:
+                    value = _cell_text(cells[idx]) if idx < len(cells) else ""
+                    data[name].append(_NA_CELL if value in _PANDAS_NA_VALUES else value)
+            return data
+    return None
+
+
+# --- montagem do DataFrame ---
+def _espera_minutos_factory(agora):
+    hoje = agora.strftime("%Y-%m-%d")
+    cache = {}
+
+    def _espera(chegada):
+        if chegada in cache:
+            return cache[chegada]
+        try:
+            inicio = TZ.localize(datetime.strptime(f"{hoje} {chegada}", "%Y-%m-%d %H:%M"))
+            value = max(int((agora - inicio).total_seconds() / 60), 0)
+        except Exception:
+            value = None
+        cache[chegada] = value
+        return value
+
+    return _espera
+
+
+def _strip_cell(value, limit=None):
+    if not isinstance(value, str):
+        return value
+    return value.strip()[:limit] if limit else value.strip()
+
+
+def build_queue_frame(rows: Dict[str, List[str]], nome_unidade: str, agora=None) -> pd.DataFrame:
+    chegadas = [_strip_cell(value, 5) for value in rows["CHEGADA"]]
+    pacientes = [_strip_cell(value) for value in rows["PACIENTE"]]
+    profissionais = [_strip_cell(value) for value in rows["PROFISSIONAL"]]
+    espera = _espera_minutos_factory(agora or datetime.now(TZ))
+    data = {
+        "CHEGADA": chegadas,
+        "PACIENTE": pacientes,
+        "PROFISSIONAL": profissionais,
+        "STATUS_DETECTADO": [
+            "Em Atendimento" if "atendimento" in str(value).lower() else "Espera" for value in rows["TEMPO_TEXTO"]
+        ],
+        "ESPERA_MINUTOS": pd.Series([espera(str(value)) for value in chegadas], dtype=object),
+        "UNIDADE": nome_unidade,
+        "hash_id": [queue_hash_id(nome_unidade, str(p), str(c)) for p, c in zip(pacientes, chegadas)],
+    }
+    for name, values in rows.items():
+        if name not in data:
+            data[name] = values
+    return pd.DataFrame(data)
+
+
+class QueueParseCache:
+    """Linhas extraidas por (unidade, digest da pagina). A fila costuma voltar identica entre ciclos de
+    15s; so a espera (que depende do relogio) e recalculada."""
+
+    def __init__(self, max_items: int = QUEUE_PARSE_CACHE_SIZE):
+        self.max_items = max(0, int(max_items))
+        self._items: "OrderedDict[Tuple[str, str, Tuple[str, ...]], Optional[Dict[str, List[str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return True, self._items[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, rows):
+        if not self.max_items:
+            return
+        with self._lock:
+            self._items[key] = rows
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+_PARSE_CACHE = QueueParseCache()
+
+
+def parse_queue_html(
+    html_content: str,
+    nome_unidade: str,
+    deadline: Optional[float] = None,
+    extra_columns: Sequence[str] = (),
+    cache: Optional[QueueParseCache] = _PARSE_CACHE,
+    agora=None,
+) -> pd.DataFrame:
+    """HTML da fila -> DataFrame com QUEUE_OUTPUT_COLUMNS (+ `extra_columns` crus, se pedidos).
+
+    Levanta ParseDeadlineExceeded se passar do `deadline` (time.monotonic); demais erros de parse
+    ficam com o chamador.
+    """
+    if not html_content or "<table" not in html_content:
+        return pd.DataFrame()
+    if etree is None:
+        return parse_queue_html_read_html(html_content, nome_unidade)
+
+    columns = tuple(QUEUE_REQUIRED_COLUMNS) + tuple(c for c in extra_columns if c not in QUEUE_REQUIRED_COLUMNS)
+    key = (nome_unidade, fast_digest(html_content), columns) if cache is not None else None
+    found, rows = cache.get(key) if key else (False, None)
+    if not found:
+        rows = extract_queue_rows(html_lib.unescape(html_content), columns, deadline)
+        if key:
+            cache.put(key, rows)
+    if not rows:
+        return pd.DataFrame()
+    _check_deadline(deadline)
+    return build_queue_frame(rows, nome_unidade, agora=agora)
+
+
+def parse_queue_html_read_html(html_content: str, nome_unidade: str, agora=None) -> pd.DataFrame:
+    """Caminho antigo (pd.read_html na pagina inteira). Fica como referencia do benchmark e como
+    alternativa quando o lxml nao esta disponivel."""
+    if not html_content or "<table" not in html_content:
+        return pd.DataFrame()
+    html_content = html_lib.unescape(html_content)
+    df = pd.read_html(StringIO(html_content))[0].iloc[:, :7].copy()
+    df.columns = list(QUEUE_COLUMNS)
+    df["PACIENTE"] = df["PACIENTE"].astype(str).str.strip()
+    df["CHEGADA"] = df["CHEGADA"].astype(str).str.strip().str[:5]
+    df["PROFISSIONAL"] = df["PROFISSIONAL"].astype(str).str.strip()
+    espera = _espera_minutos_factory(agora or datetime.now(TZ))
+    df["STATUS_DETECTADO"] = [
+        "Em Atendimento" if "atendimento" in str(value).lower() else "Espera" for value in df["TEMPO_TEXTO"]
+    ]
+    df["ESPERA_MINUTOS"] = pd.Series([espera(str(value).strip()) for value in df["CHEGADA"]], index=df.index, dtype=object)
+    df["UNIDADE"] = nome_unidade
+    df["hash_id"] = [
+        hashlib.md5(f"{nome_unidade}-{str(p).strip()}-{str(c).strip()}".encode()).hexdigest()
+        for p, c in zip(df["PACIENTE"], df["CHEGADA"])
+    ]
+    return df
+
+
+# --- worker persistente ---
+class ParserWorker:
+    """Thread persistente que executa os parses em fila, com prazo cooperativo.
+
+    `run(fn, ..., timeout_sec=...)` chama `fn(*args, deadline=..., **kwargs)` na thread do worker; o
+    parse confere o prazo entre blocos/linhas e sai sozinho com ParseDeadlineExceeded. Se o worker
+    nao voltar nem com a folga (trecho nao cooperativo), ele e aposentado e o proximo job abre outra
+    thread, sem que o chamador fique preso.
+    """
+
+    def __init__(self, name: str = "feegow-queue-parser", grace_sec: float = QUEUE_PARSE_WORKER_GRACE_SEC):
+        self.name = name
+        self.grace_sec = max(0.0, float(grace_sec))
+        self._lock = threading.Lock()
+        self._jobs: Optional["queue.Queue"] = None
+        self._thread: Optional[threading.Thread] = None
+        self.jobs_done = 0
+        self.timeouts = 0
+        self.threads_started = 0
+
+    def _loop(self, jobs: "queue.Queue"):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            fn, args, kwargs, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                _check_deadline(kwargs.get("deadline"))
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+    def _queue_for_job(self) -> "queue.Queue":
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._jobs = queue.Queue()
+                self.threads_started += 1
+                self._thread = threading.Thread(
+                    target=self._loop,
+                    args=(self._jobs,),
+                    name=f"{self.name}-{self.threads_started}",
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._jobs
+
+    def _retire(self, jobs: "queue.Queue"):
+        with self._lock:
+            if self._jobs is jobs:
+                jobs.put(None)
+                self._jobs = None
+                self._thread = None
+
+    def run(self, fn: Callable, *args, timeout_sec: float, **kwargs):
+        deadline = time.monotonic() + max(0.0, float(timeout_sec))
+        future: Future = Future()
+        jobs = self._queue_for_job()
+        jobs.put((fn, args, dict(kwargs, deadline=deadline), future))
+        try:
+            result = future.result(timeout=max(0.0, float(timeout_sec)) + self.grace_sec)
+        except ParseDeadlineExceeded:
+            self.timeouts += 1
+            raise
+        except FutureTimeoutError:
+            self.timeouts += 1
+            if not future.cancel():
+                self._retire(jobs)
+            raise FutureTimeoutError(f"parse excedeu {timeout_sec}s")
+        self.jobs_done += 1
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._jobs is not None:
+                self._jobs.put(None)
+            self._jobs = None
+            self._thread = None
+
+
+# --- benchmark ---
+def build_queue_fixture(rows: int, seed: int = 7, padding_kb: int = 40) -> str:
+    """Pagina de fila sintetica no formato do app4 (tabela de 7+ colunas, <br>, celulas vazias,
+    linha oculta, scripts depois da tabela) com `rows` pacientes."""
+    import random
+
+    rnd = random.Random(seed + rows)
+    nomes = ("Maria", "Jose", "Ana", "Joao", "Francisca", "Antonio", "Lucia", "Carlos", "Beatriz", "Paulo")
+    sobrenomes = ("Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Ferreira", "Costa", "Gomes")
+    medicos = ("Dra. Helena Prado", "Dr. Marcos Tavares", "Dra. Renata Alves", "Dr. Felipe Rocha", "")
+    body = []
+    for idx in range(rows):
+        hora = f"{7 + idx // 12 % 12:02d}:{(idx * 5) % 60:02d}"
+        chegada = f"{7 + idx // 10 % 12:02d}:{(idx * 7) % 60:02d}"
+        paciente = f"{rnd.choice(nomes)} {rnd.choice(sobrenomes)} &amp; {rnd.choice(sobrenomes)}"
+        if idx % 17 == 0:
+            paciente = f"{rnd.choice(nomes)}<br>{rnd.choice(sobrenomes)}  JUNIOR"
+        tempo = rnd.choice(("Aguardando 12 min", "Em atendimento", "Em Atendimento (sala 3)", "-"))
+        extra = '<span style="display: none">oculto</span>' if idx % 9 == 0 else ""
+        body.append(
+            f"<tr><td>{hora}</td><td> {chegada}:00 </td><td>{paciente}{extra}</td><td>{rnd.randint(1, 95)}</td>"
+            f"<td>{rnd.choice(medicos)}</td><td>Consulta &eacute; retorno</td><td>{tempo}</td>"
+            f'<td><a href="#" onclick="chamar({idx})">Chamar</a></td></tr>'
+        )
+    padding = "<script>var x = '" + ("a" * 1024) + "';</script>\n"
+    return (
+        "<html><head><title>Fila</title><style>td{padding:2px}</style></head><body>"
+        '<div class="topo"><span>Fila de espera</span></div>'
+        '<table class="table table-striped"><thead><tr>'
+        "<th>Hora</th><th>Chegada</th><th>Paciente</th><th>Idade</th><th>Profissional</th>"
+        "<th>Compromisso</th><th>Tempo</th><th></th></tr></thead><tbody>"
+        + "".join(body)
+        + "</tbody></table>"
+        + padding * max(0, int(padding_kb))
+        + "</body></html>"
+    )
+
+
+def _load_fixture_pages(fixtures_dir: str) -> List[Tuple[str, str]]:
+    pages = []
+    for name in sorted(os.listdir(fixtures_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(fixtures_dir, name), "rb") as fh:
+                pages.append((name, fh.read().decode("iso-8859-1", errors="ignore")))
+    return pages
+
+
+def _frames_match(legacy: pd.DataFrame, fast: pd.DataFrame) -> bool:
+    if legacy.empty or fast.empty:
+        return legacy.empty == fast.empty
+    cols = [c for c in QUEUE_OUTPUT_COLUMNS if c in legacy.columns]
+    left = legacy[cols].reset_index(drop=True).astype(object).where(legacy[cols].notna().reset_index(drop=True), None)
+    right = fast[cols].reset_index(drop=True).astype(object).where(fast[cols].notna().reset_index(drop=True), None)
+    return left.values.tolist() == right.values.tolist()
+
+
+def run_parse_benchmark(
+    sizes: Sequence[int] = (10, 100, 1000),
+    repeats: int = 5,
+    fixtures_dir: Optional[str] = None,
+) -> Dict:
+    """Compara o parse antigo (pd.read_html) com o extrator incremental em paginas sinteticas de varios
+    tamanhos e, se houver, nas capturas gravadas em `fixtures_dir` (ex.: MEDICO_QUEUE_CAPTURE_DIR).
+    Confere que as colunas usadas pelo monitor saem iguais nos dois caminhos."""
+    import json
+
+    pages = [(f"sintetica_{n}", build_queue_fixture(n)) for n in sizes]
+    if fixtures_dir:
+        pages.extend(_load_fixture_pages(fixtures_dir))
+
+    agora = datetime.now(TZ)
+    results = []
+    for label, page in pages:
+        timings = {}
+        frames = {}
+        bench_cache = QueueParseCache(max_items=4)
+        for mode, fn in (
+            ("read_html", lambda: parse_queue_html_read_html(page, "Bench", agora=agora)),
+            ("stream", lambda: parse_queue_html(page, "Bench", cache=None, agora=agora)),
+            ("stream_cache", lambda: parse_queue_html(page, "Bench", cache=bench_cache, agora=agora)),
+        ):
+            best = None
+            for _ in range(max(1, int(repeats))):
+                started = time.perf_counter()
+                frames[mode] = fn()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[mode] = round(best * 1000.0, 3)
+        results.append(
+            {
+                "page": label,
+                "kb": round(len(page) / 1024.0, 1),
+                "rows": len(frames["stream"]),
+                "ms": timings,
+                "speedup": round(timings["read_html"] / timings["stream"], 2) if timings["stream"] else None,
+                "match": _frames_match(frames["read_html"], frames["stream"]),
+            }
+        )
+    summary = {"repeats": repeats, "hash": "xxh3" if xxhash is not None else "blake2b", "pages": results}
+    print(f"[feegow_queue_parser] benchmark {json.dumps(summary, ensure_ascii=False)}")
+    return summary
+
+
+if __name__ == "__main__":
+    import sys
+
+    args = sys.argv[1:]
+    sizes_arg = (10, 100, 1000)
+    repeats_arg = 5
+    fixtures_arg = None
+    for i, token in enumerate(args):
+        if token.startswith("--sizes="):
+            sizes_arg = tuple(int(part) for part in token.split("=", 1)[1].split(",") if part.strip())
+        elif token.startswith("--repeats="):
+            repeats_arg = int(token.split("=", 1)[1].strip() or 5)
+        elif token.startswith("--fixtures="):
+            fixtures_arg = token.split("=", 1)[1].strip() or None
+        elif token == "--fixtures" and i + 1 < len(args):
+            fixtures_arg = str(args[i + 1] or "").strip() or None
+    run_parse_benchmark(sizes=sizes_arg, repeats=repeats_arg, fixtures_dir=fixtures_arg)
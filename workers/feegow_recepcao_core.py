@@ -4,15 +4,40 @@ import logging
 import time
 import os
 from datetime import datetime
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
 from database_manager import DatabaseManager
+from http_fanout import fan_out
+
+TOTEM_QUEUE_URL = (
+    os.getenv("FEEGOW_TOTEM_QUEUE_URL")
+    or "https://core.feegow.com/totem-queue/admin/get-queue-by-filter"
+).strip()
+TOTEM_TIMEOUT_SEC = 10
+RECEPCAO_UNIDADES = [2, 3, 12]
+NOMES_UNIDADES = {2: "Ouro Verde", 3: "Cambui", 12: "Shop. Campinas"}
+
+
+def _nova_sessao_unidade():
+    # Sessao keep-alive por unidade; cookies da resposta nunca sao guardados, para o header
+    # Cookie de cada requisicao continuar sendo exatamente o da unidade (sem heranca).
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
 
 class FeegowRecepcaoSystem:
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db=None, paralelo=True):
+        self.db = db or DatabaseManager()
         self.SESSOES = {}
         self._last_tokens_load = 0
         self._token_cache_sec = int(os.getenv("FEEGOW_TOKEN_CACHE_SEC", "300"))
-        
+        self.paralelo = paralelo
+        self._http = {}
+
         self._reload_tokens(force=True)
 
     def _reload_tokens(self, force=False):
@@ -34,61 +59,266 @@ class FeegowRecepcaoSystem:
             self.SESSOES = {}
         self._last_tokens_load = now
 
+    def invalidar_tokens(self):
+        """Forca reler os tokens do banco no proximo ciclo (ex.: 401/403 de alguma unidade)."""
+        self._last_tokens_load = 0
+
+    def _sessao_http(self, unidade_id):
+        session = self._http.get(unidade_id)
+        if session is None:
+            session = _nova_sessao_unidade()
+            self._http[unidade_id] = session
+        return session
+
+    def _buscar_unidade(self, unidade_id, sessao):
+        # 🟢 HEADER LIMPO: Sem herança de sessões anteriores
+        headers = {
+            "accept": "application/json",
+            "x-access-token": sessao["x-access-token"],
+            "Cookie": sessao["cookie"]
+        }
+
+        # Forçamos o unit_id na URL para redundância
+        url_final = f"{TOTEM_QUEUE_URL}?filter=&unit_id={unidade_id}"
+
+        response = self._sessao_http(unidade_id).get(url_final, headers=headers, timeout=TOTEM_TIMEOUT_SEC)
+        if response.status_code != 200:
+            if response.status_code in (401, 403):
+                self.invalidar_tokens()
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+        ctype = str(response.headers.get("content-type") or "").lower()
+        if "json" not in ctype:
+            raise RuntimeError("resposta nao-json")
+
+        data = response.json()
+        if not isinstance(data, list):
+            raise RuntimeError("payload invalido")
+
+        # 🟢 FILTRO DE SEGURANÇA: Só aceita se a UnidadeID no JSON for a correta
+        dados_filtrados = [
+            item for item in data
+            if str(item.get('UnidadeID')) == str(unidade_id)
+        ]
+
+        for item in dados_filtrados:
+            item['UnidadeID_Coleta'] = unidade_id
+        return dados_filtrados
+
     def obter_dados_brutos(self, unidades=[3, 2, 12]):
         todos_pacientes = []
         erros = []
-        url_base = "https://core.feegow.com/totem-queue/admin/get-queue-by-filter?filter="
-        
+
         # 🟢 RECARREGA DO BANCO (com cache): Garante tokens novos sem ler a cada ciclo
         self._reload_tokens()
 
+        tarefas = []
         for unidade_id in unidades:
             sessao = self.SESSOES.get(str(unidade_id))
             if not sessao:
                 erros.append(f"unidade {unidade_id}: sem sessao")
                 continue
+            tarefas.append((unidade_id, lambda u=unidade_id, s=sessao: self._buscar_unidade(u, s)))
 
-            # 🟢 HEADER LIMPO: Sem herança de sessões anteriores
-            headers = {
-                "accept": "application/json",
-                "x-access-token": sessao["x-access-token"],
-                "Cookie": sessao["cookie"] 
-            }
+        # Unidades em paralelo (cada uma na sua conexao keep-alive); resultados na ordem de entrada.
+        for resultado in fan_out(tarefas, max_workers=len(tarefas) if self.paralelo else 1):
+            unidade_id = resultado.key
+            if not resultado.ok:
+                if not isinstance(resultado.error, RuntimeError):
+                    print(f"   Erro Unidade {unidade_id}: {resultado.error}")
+                erros.append(f"unidade {unidade_id}: {resultado.error}")
+                continue
+            todos_pacientes.extend(resultado.value)
+            print(f"   Unidade {unidade_id}: {len(resultado.value)} registros.")
 
-            try:
-                # Forçamos o unit_id na URL para redundância
-                url_final = f"{url_base}&unit_id={unidade_id}"
-                
-                # Usamos requests.get direto (sem usar self.session global)
-                response = requests.get(url_final, headers=headers, timeout=10)
-                if response.status_code != 200:
-                    erros.append(f"unidade {unidade_id}: HTTP {response.status_code}")
-                    continue
-
-                ctype = str(response.headers.get("content-type") or "").lower()
-                if "json" not in ctype:
-                    erros.append(f"unidade {unidade_id}: resposta nao-json")
-                    continue
-
-                data = response.json()
-                if not isinstance(data, list):
-                    erros.append(f"unidade {unidade_id}: payload invalido")
-                    continue
-
-                # 🟢 FILTRO DE SEGURANÇA: Só aceita se a UnidadeID no JSON for a correta
-                dados_filtrados = [
-                    item for item in data
-                    if str(item.get('UnidadeID')) == str(unidade_id)
-                ]
-
-                for item in dados_filtrados:
-                    item['UnidadeID_Coleta'] = unidade_id
-
-                todos_pacientes.extend(dados_filtrados)
-                print(f"   Unidade {unidade_id}: {len(dados_filtrados)} registros.")
-            except Exception as e:
-                print(f"   Erro Unidade {unidade_id}: {e}")
-                erros.append(f"unidade {unidade_id}: {e}")
         if erros:
             return todos_pacientes, " | ".join(erros)
         return todos_pacientes, "OK"
+
+    def close(self):
+        sessions, self._http = list(self._http.values()), {}
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+
+class RecepcaoPoller:
+    """Ciclo do monitor da recepcao com estado entre loops: um DatabaseManager, um
+    FeegowRecepcaoSystem (tokens em cache por FEEGOW_TOKEN_CACHE_SEC e conexoes keep-alive por
+    unidade), coleta das unidades em paralelo e finalizacao de todas as unidades numa transacao."""
+
+    def __init__(self, unidades=None, db=None, sistema=None, service_name="monitor_recepcao"):
+        self.unidades = list(unidades or RECEPCAO_UNIDADES)
+        self.db = db or DatabaseManager()
+        self.sistema = sistema or FeegowRecepcaoSystem(db=self.db)
+        self.service_name = service_name
+        self.last_cycle_sec = 0.0
+
+    def poll_once(self):
+        """Um ciclo completo (coleta + gravacao + finalizacao + heartbeat); retorna o status gravado."""
+        started = time.perf_counter()
+        db = self.db
+        db.update_heartbeat(self.service_name, "RUNNING", "Buscando dados...")
+
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        dados_brutos, msg_erro = self.sistema.obter_dados_brutos(unidades=self.unidades)
+
+        if "Cookie Expirou" in msg_erro or "403" in msg_erro:
+            err_msg = "TOKEN EXPIROU"
+            print(f"\n[{timestamp}] {err_msg}")
+            status = "ERROR"
+            db.update_heartbeat(self.service_name, status, err_msg)
+
+        elif msg_erro != "OK" and not dados_brutos:
+            print(f"[{timestamp}] Erro tecnico: {msg_erro}")
+            status = "WARNING"
+            db.update_heartbeat(self.service_name, status, f"Falha API: {msg_erro}")
+
+        elif msg_erro != "OK" and dados_brutos:
+            # Evita finalizar pacientes durante coleta parcial da API.
+            print(f"[{timestamp}] Aviso API parcial: {msg_erro}")
+            db.salvar_dados_recepcao(dados_brutos)
+            status_msg = f"Fila parcial: {len(dados_brutos)} (finalizacao pausada)"
+            status = "WARNING"
+            db.update_heartbeat(self.service_name, status, status_msg)
+
+        else:
+            if dados_brutos:
+                db.salvar_dados_recepcao(dados_brutos)
+
+            ids_por_unidade = {uid: [] for uid in self.unidades}
+            for item in dados_brutos:
+                uid = item.get("UnidadeID_Coleta")
+                if uid in ids_por_unidade:
+                    ids_por_unidade[uid].append(item["id"])
+            db.finalizar_ausentes_recepcao_unidades(ids_por_unidade)
+
+            resumo_unidades = [
+                f"{NOMES_UNIDADES.get(uid, uid)}: {len(ids_por_unidade[uid])}" for uid in self.unidades
+            ]
+            string_unidades = " | ".join(resumo_unidades)
+            status_msg = f"Fila: {len(dados_brutos)} ({string_unidades})"
+
+            print(f"[{timestamp}] OK {status_msg}")
+            status = "ONLINE"
+            db.update_heartbeat(self.service_name, status, status_msg)
+
+        self.last_cycle_sec = time.perf_counter() - started
+        return status
+
+    def close(self):
+        self.sistema.close()
+
+
+def _legacy_poll_once(db, unidades):
+    # Ciclo antigo (sistema novo a cada loop, unidades em serie, finalizacao por unidade), so para o benchmark.
+    sistema = FeegowRecepcaoSystem(db=db, paralelo=False)
+    try:
+        dados_brutos, msg_erro = sistema.obter_dados_brutos(unidades=unidades)
+        if msg_erro == "OK":
+            if dados_brutos:
+                db.salvar_dados_recepcao(dados_brutos)
+            for uid in unidades:
+                ids = [item["id"] for item in dados_brutos if str(item.get("UnidadeID_Coleta")) == str(uid)]
+                db.finalizar_ausentes_recepcao(uid, ids)
+        db.update_heartbeat("monitor_recepcao_bench", "ONLINE", msg_erro)
+    finally:
+        sistema.close()
+
+
+def run_totem_stub_benchmark(loops=5, latency_ms=300.0, patients_per_unit=25, unidades=None):
+    """Latencia ponta a ponta do ciclo do monitor contra um stub local do totem-queue, em SQLite
+    temporario: ciclo antigo (por loop: sistema novo, tokens relidos, unidades em serie,
+    finalizacao por unidade) contra o `RecepcaoPoller`."""
+    global TOTEM_QUEUE_URL
+    import shutil
+    import tempfile
+
+    import database_manager
+    from http_stub import FixtureStubServer
+
+    unidades = list(unidades or RECEPCAO_UNIDADES)
+
+    def _handler(method, path, params, raw_body, headers):
+        if not path.endswith("/get-queue-by-filter"):
+            return None
+        uid = int(params.get("unit_id") or 0)
+        if headers.get("x-access-token") != f"token-{uid}":
+            return 403, {"error": "forbidden"}
+        return 200, [
+            {
+                "id": f"{uid}-{i}",
+                "UnidadeID": uid,
+                "PacienteNome": f"Paciente {uid}-{i}",
+                "DataChegada": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+                "StatusNome": "Aguardando",
+            }
+            for i in range(int(patients_per_unit))
+        ]
+
+    tmp_dir = tempfile.mkdtemp(prefix="recepcao_bench_")
+    original_path = database_manager.LOCAL_DB_PATH
+    original_url = TOTEM_QUEUE_URL
+    original_env = {name: os.environ.get(name) for name in ("DB_PROVIDER", "TURSO_URL")}
+    os.environ["DB_PROVIDER"] = "sqlite"
+    os.environ.pop("TURSO_URL", None)
+    database_manager.LOCAL_DB_PATH = os.path.join(tmp_dir, "bench.db")
+    timings = {}
+    try:
+        with FixtureStubServer(latency_sec=latency_ms / 1000.0, handler=_handler) as stub:
+            TOTEM_QUEUE_URL = stub.base_url + "/totem-queue/admin/get-queue-by-filter"
+            db = DatabaseManager()
+            for uid in unidades:
+                db.salvar_unidade_feegow(uid, {"x-access-token": f"token-{uid}", "cookie": f"c={uid}"})
+
+            legacy = []
+            for _ in range(max(1, int(loops))):
+                started = time.perf_counter()
+                _legacy_poll_once(db, unidades)
+                legacy.append(time.perf_counter() - started)
+
+            poller = RecepcaoPoller(unidades=unidades, db=db, service_name="monitor_recepcao_bench")
+            pooled = []
+            try:
+                for _ in range(max(1, int(loops))):
+                    poller.poll_once()
+                    pooled.append(poller.last_cycle_sec)
+            finally:
+                poller.close()
+            timings = {
+                "legacy_avg_sec": round(sum(legacy) / len(legacy), 3),
+                "poller_avg_sec": round(sum(pooled) / len(pooled), 3),
+                "poller_first_sec": round(pooled[0], 3),
+                "requests": stub.requests_served,
+                "peak_in_flight": stub.max_in_flight,
+            }
+    finally:
+        TOTEM_QUEUE_URL = original_url
+        database_manager.LOCAL_DB_PATH = original_path
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    timings["speedup"] = (
+        round(timings["legacy_avg_sec"] / timings["poller_avg_sec"], 2) if timings.get("poller_avg_sec") else None
+    )
+    print(f"[recepcao] benchmark {json.dumps(timings, ensure_ascii=False)}")
+    return timings
+
+
+if __name__ == "__main__":
+    import sys
+
+    cli_loops = 5
+    cli_latency = 300.0
+    for arg in sys.argv[1:]:
+        if arg.startswith("--loops="):
+            cli_loops = int(arg.split("=", 1)[1] or 5)
+        elif arg.startswith("--latency-ms="):
+            cli_latency = float(arg.split("=", 1)[1] or 0)
+    run_totem_stub_benchmark(loops=cli_loops, latency_ms=cli_latency)
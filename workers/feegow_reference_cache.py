@@ -0,0 +1,322 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from feegow_http import get_feegow_http_client
+except ImportError:
+    from .feegow_http import get_feegow_http_client
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - fallback para ambientes sem fcntl
+    fcntl = None
+
+
+FEEGOW_API_BASE_URL = "https://api.feegow.com/v1/api"
+REFERENCE_CACHE_TTL_SEC = max(0, int(os.getenv("FEEGOW_REFERENCE_CACHE_TTL_SEC", "21600")))
+REFERENCE_CACHE_DIR = str(os.getenv("FEEGOW_REFERENCE_CACHE_DIR", "/tmp/consultare_feegow_reference")).strip()
+REFERENCE_HTTP_TIMEOUT_SEC = max(5, int(os.getenv("FEEGOW_REFERENCE_TIMEOUT_SEC", "120")))
+
+# Listas auxiliares que mudam raramente e sao usadas para enriquecer agendamentos.
+REFERENCE_ENDPOINTS = {
+    "professionals": "professional/list",
+    "specialties": "specialties/list",
+    "procedures": "procedures/list",
+    "procedure_groups": "procedures/groups",
+}
+
+
+def _to_int(value) -> int:
+    try:
+        return int(float(value))
+    except Exception:
+        return 0
+
+
+def _first_key(row: Dict[str, Any], keys) -> Optional[str]:
+    return next((key for key in keys if key in row), None)
+
+
+def _index_professionals(rows: List[Dict[str, Any]]) -> Dict[int, str]:
+    index = {}
+    for row in rows:
+        if "profissional_id" not in row:
+            continue
+        index[_to_int(row.get("profissional_id"))] = row.get("nome")
+    return index
+
+
+def _index_specialties(rows: List[Dict[str, Any]]) -> Dict[int, str]:
+    index = {}
+    for row in rows:
+        if "especialidade_id" not in row:
+            continue
+        index[_to_int(row.get("especialidade_id"))] = row.get("nome")
+    return index
+
+
+def _index_procedures(rows: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    index = {}
+    for row in rows:
+        id_key = _first_key(row, ("id", "ID", "procedimento_id"))
+        if not id_key:
+            continue
+        grp_key = _first_key(row, ("grupo_procedimento_id", "grupo_id"))
+        name_key = _first_key(row, ("nome", "Nome", "nome_procedimento"))
+        index[_to_int(row.get(id_key))] = {
+            "name": row.get(name_key) if name_key else None,
+            "group_id": _to_int(row.get(grp_key)) if grp_key else None,
+        }
+    return index
+
+
+def _index_procedure_groups(rows: List[Dict[str, Any]]) -> Dict[int, str]:
+    index = {}
+    for row in rows:
+        id_key = _first_key(row, ("id", "ID", "grupo_id"))
+        name_key = _first_key(row, ("NomeGrupo", "nome", "Nome"))
+        if not id_key or not name_key:
+            continue
+        index[_to_int(row.get(id_key))] = row.get(name_key)
+    return index
+
+
+_INDEXERS = {
+    "professionals": _index_professionals,
+    "specialties": _index_specialties,
+    "procedures": _index_procedures,
+    "procedure_groups": _index_procedure_groups,
+}
+
+
+def _content_hash(rows) -> str:
+    raw = json.dumps(rows, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Lock entre processos: varios workers no mesmo host nao disparam o mesmo download."""
+    fd = None
+    try:
+        if fcntl is not None:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o666)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fd is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except Exception:
+                pass
+            try:
+                os.close(fd)
+            except Exception:
+                pass
+
+
+class ReferenceDataCache:
+    """Cache das listas de referencia da Feegow com TTL, revalidacao e persistencia em disco.
+
+    - Dentro do TTL a lista vem da memoria (ou do arquivo, se outro processo ja baixou).
+    - Expirado o TTL, revalida com `If-None-Match` quando a API devolveu ETag; sem ETag,
+      baixa de novo e so reindexa se o hash do conteudo mudou.
+    - Um lock por lista (thread + arquivo) garante um unico download simultaneo.
+    - Em falha de rede, serve a ultima copia conhecida mesmo vencida.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = REFERENCE_CACHE_DIR,
+        ttl_sec: int = REFERENCE_CACHE_TTL_SEC,
+        base_url: str = FEEGOW_API_BASE_URL,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl_sec = max(0, int(ttl_sec))
+        self.base_url = base_url.rstrip("/")
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "downloads": 0,
+            "not_modified": 0,
+            "unchanged": 0,
+            "stale_served": 0,
+            "errors": 0,
+        }
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _path(self, name: str, suffix: str = ".json") -> str:
+        return os.path.join(self.cache_dir, f"{name}{suffix}")
+
+    def _is_fresh(self, entry: Optional[Dict[str, Any]]) -> bool:
+        return bool(entry) and (time.time() - float(entry.get("fetched_at") or 0)) < self.ttl_sec
+
+    def _read_disk(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(name), "r", encoding="utf-8") as fh:
+                stored = json.load(fh)
+        except Exception:
+            return None
+        rows = stored.get("rows")
+        if not isinstance(rows, list) or _content_hash(rows) != stored.get("content_hash"):
+            return None
+        return stored
+
+    def _write_disk(self, name: str, entry: Dict[str, Any]):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._path(name, f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(
+                    {key: entry.get(key) for key in ("rows", "content_hash", "etag", "fetched_at")},
+                    fh,
+                    ensure_ascii=False,
+                )
+            os.replace(tmp_path, self._path(name))
+        except Exception as exc:
+            print(f"[FeegowRefCache] Falha ao persistir {name}: {exc}")
+
+    def _build_entry(self, name: str, stored: Dict[str, Any]) -> Dict[str, Any]:
+        rows = stored.get("rows") or []
+        return {
+            "rows": rows,
+            "content_hash": stored.get("content_hash") or _content_hash(rows),
+            "etag": stored.get("etag"),
+            "fetched_at": float(stored.get("fetched_at") or 0),
+            "index": _INDEXERS[name](rows),
+        }
+
+    def _download(self, name: str, headers: Dict[str, str], etag: Optional[str]):
+        """Retorna (status, rows, etag). status 304 => rows None."""
+        request_headers = dict(headers or {})
+        if etag:
+            request_headers["If-None-Match"] = etag
+        # Mesmo pool keep-alive (e retry) das demais chamadas a API da Feegow.
+        response = get_feegow_http_client().request(
+            "GET",
+            f"{self.base_url}/{REFERENCE_ENDPOINTS[name]}",
+            endpoint=REFERENCE_ENDPOINTS[name],
+            headers=request_headers,
+            timeout=REFERENCE_HTTP_TIMEOUT_SEC,
+        )
+        if response.status_code == 304:
+            return 304, None, etag
+        response.raise_for_status()
+        body = response.json()
+        if isinstance(body, dict) and body.get("success") is False:
+            raise RuntimeError(f"API success=false em {REFERENCE_ENDPOINTS[name]}")
+        rows = body.get("content") if isinstance(body, dict) else None
+        if not isinstance(rows, list):
+            raise RuntimeError(f"Resposta sem 'content' em {REFERENCE_ENDPOINTS[name]}")
+        return response.status_code, rows, response.headers.get("ETag")
+
+    def get(self, name: str, headers_fn: Callable[[], Dict[str, str]]) -> Dict[str, Any]:
+        if name not in REFERENCE_ENDPOINTS:
+            raise KeyError(f"Lista de referencia desconhecida: {name}")
+
+        entry = self._entries.get(name)
+        if self._is_fresh(entry):
+            self._stats["memory_hits"] += 1
+            return entry
+
+        with self._lock_for(name):
+            entry = self._entries.get(name)
+            if self._is_fresh(entry):
+                self._stats["memory_hits"] += 1
+                return entry
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with _file_lock(self._path(name, ".lock")):
+                stored = self._read_disk(name)
+                if stored and (entry is None or stored.get("content_hash") != entry.get("content_hash")):
+                    entry = self._build_entry(name, stored)
+                elif stored and entry is not None:
+                    entry["fetched_at"] = max(entry["fetched_at"], float(stored.get("fetched_at") or 0))
+                if self._is_fresh(entry):
+                    self._stats["disk_hits"] += 1
+                    self._entries[name] = entry
+                    return entry
+
+                try:
+                    status, rows, etag = self._download(name, headers_fn() or {}, (entry or {}).get("etag"))
+                except Exception as exc:
+                    self._stats["errors"] += 1
+                    if entry is None:
+                        raise
+                    self._stats["stale_served"] += 1
+                    print(f"[FeegowRefCache] Falha ao revalidar {name}; usando copia anterior: {exc}")
+                    self._entries[name] = entry
+                    return entry
+
+                now = time.time()
+                if status == 304 and entry is not None:
+                    self._stats["not_modified"] += 1
+                    entry = {**entry, "fetched_at": now}
+                else:
+                    self._stats["downloads"] += 1
+                    new_hash = _content_hash(rows)
+                    if entry is not None and entry.get("content_hash") == new_hash:
+                        self._stats["unchanged"] += 1
+                        entry = {**entry, "fetched_at": now, "etag": etag}
+                    else:
+                        entry = self._build_entry(
+                            name,
+                            {"rows": rows, "content_hash": new_hash, "etag": etag, "fetched_at": now},
+                        )
+                self._write_disk(name, entry)
+                self._entries[name] = entry
+                return entry
+
+    def invalidate(self, name: Optional[str] = None):
+        names = [name] if name else list(REFERENCE_ENDPOINTS.keys())
+        for item in names:
+            with self._lock_for(item):
+                self._entries.pop(item, None)
+                try:
+                    os.remove(self._path(item))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "entries": {
+                name: {
+                    "rows": len(entry.get("rows") or []),
+                    "ageSec": round(time.time() - float(entry.get("fetched_at") or 0), 1),
+                    "etag": bool(entry.get("etag")),
+                }
+                for name, entry in list(self._entries.items())
+            },
+        }
+
+
+_DEFAULT_CACHE = ReferenceDataCache()
+
+
+def get_reference_index(name: str, headers_fn: Callable[[], Dict[str, str]]) -> Dict[int, Any]:
+    """Dict pre-indexado por ID inteiro (ver `_index_*`) para lookup direto via `Series.map`."""
+    return _DEFAULT_CACHE.get(name, headers_fn)["index"]
+
+
+def get_reference_rows(name: str, headers_fn: Callable[[], Dict[str, str]]) -> List[Dict[str, Any]]:
+    return _DEFAULT_CACHE.get(name, headers_fn)["rows"]
+
+
+def invalidate_reference_cache(name: Optional[str] = None):
+    _DEFAULT_CACHE.invalidate(name)
+
+
+def reference_cache_stats() -> Dict[str, Any]:
+    return _DEFAULT_CACHE.stats()
@@ -1,3 +1,4 @@
+import hashlib
 import time
 from typing import Callable, Optional
 
@@ -7,6 +8,13 @@ APP4_BASE_URL = "https://app4.feegow.com"
 LOGIN_URL = f"{APP4_BASE_URL}/main/?P=Login"
 
 
+def feegow_storage_key(user: str, unit_id: int = 0, scope: str = "default") -> str:
+    """Chave do storage_state salvo (conta + unidade + consumidor), sem expor o e-mail no nome do arquivo.
+    O consumidor entra na chave porque a unidade ativa fica na sessao do servidor."""
+    digest = hashlib.sha1(str(user or "").strip().lower().encode("utf-8")).hexdigest()[:12]
+    return f"feegow_{scope}_{digest}_u{int(unit_id)}"
+
+
 def _emit(logger: Optional[Callable[[str], None]], message: str) -> None:
     if logger:
         logger(message)
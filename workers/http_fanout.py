@@ -0,0 +1,161 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class TokenBucket:
+    """Limitador token-bucket thread-safe: `rate_per_sec` tokens/s com rajada de `burst`."""
+
+    def __init__(self, rate_per_sec: float, burst: Optional[float] = None):
+        self.rate = max(0.0, float(rate_per_sec or 0.0))
+        self.capacity = max(1.0, float(burst if burst is not None else max(1.0, self.rate)))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_sec = 0.0
+        self.acquired = 0
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        if self.rate <= 0:
+            with self._lock:
+                self.acquired += 1
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.acquired += 1
+                    self.waited_sec += waited
+                    return waited
+                sleep_for = (tokens - self._tokens) / self.rate
+            time.sleep(sleep_for)
+            waited += sleep_for
+
+
+_HOST_LIMITERS = {}
+_HOST_LIMITERS_LOCK = threading.Lock()
+
+
+def get_host_limiter(host: str, rate_per_sec: float, burst: Optional[float] = None) -> TokenBucket:
+    """Um bucket por host no processo: workers concorrentes dividem o mesmo limite."""
+    key = str(host or "").strip().lower()
+    with _HOST_LIMITERS_LOCK:
+        limiter = _HOST_LIMITERS.get(key)
+        if limiter is None:
+            limiter = TokenBucket(rate_per_sec, burst)
+            _HOST_LIMITERS[key] = limiter
+        return limiter
+
+
+def make_retrying_session(
+    *,
+    total: int = 3,
+    backoff_factor: float = 0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET",),
+    pool_maxsize: int = 10,
+    raise_on_status: bool = True,
+) -> requests.Session:
+    session = requests.Session()
+    retry = Retry(
+        total=total,
+        backoff_factor=backoff_factor,
+        status_forcelist=list(status_forcelist),
+        allowed_methods=list(allowed_methods),
+        raise_on_status=raise_on_status,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=max(1, int(pool_maxsize)))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class ThreadLocalSessions:
+    """Uma `requests.Session` por thread do pool (keep-alive sem compartilhar estado entre threads)."""
+
+    def __init__(self, factory: Callable[[], requests.Session]):
+        self._factory = factory
+        self._local = threading.local()
+        self._all: List[requests.Session] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._factory()
+            self._local.session = session
+            with self._lock:
+                self._all.append(session)
+        return session
+
+    def close(self):
+        with self._lock:
+            sessions, self._all = self._all, []
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+
+class FetchResult:
+    __slots__ = ("key", "value", "error", "elapsed_sec")
+
+    def __init__(self, key, value=None, error: Optional[BaseException] = None, elapsed_sec: float = 0.0):
+        self.key = key
+        self.value = value
+        self.error = error
+        self.elapsed_sec = elapsed_sec
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def fan_out(
+    tasks: Iterable[Tuple[Any, Callable[[], Any]]],
+    max_workers: int,
+    on_done: Optional[Callable[[FetchResult, int, int], None]] = None,
+) -> List[FetchResult]:
+    """Executa `(key, fn)` em paralelo limitado e devolve os resultados na ordem de entrada.
+    Excecoes viram `FetchResult.error`; a ordem de conclusao nunca afeta o merge do chamador."""
+    task_list = list(tasks)
+    total = len(task_list)
+    results: List[Optional[FetchResult]] = [None] * total
+    if not task_list:
+        return []
+
+    done_lock = threading.Lock()
+    done_count = [0]
+
+    def _run(idx: int, key, fn):
+        started = time.monotonic()
+        try:
+            result = FetchResult(key, value=fn(), elapsed_sec=time.monotonic() - started)
+        except Exception as exc:
+            result = FetchResult(key, error=exc, elapsed_sec=time.monotonic() - started)
+        results[idx] = result
+        if on_done:
+            with done_lock:
+                done_count[0] += 1
+                on_done(result, done_count[0], total)
+
+    workers = max(1, min(int(max_workers or 1), total))
+    if workers == 1:
+        for idx, (key, fn) in enumerate(task_list):
+            _run(idx, key, fn)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for idx, (key, fn) in enumerate(task_list):
+                executor.submit(_run, idx, key, fn)
+    return [r for r in results if r is not None]
+
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlparse
+
+# Parametros que variam por execucao/credencial e nao devem influenciar a chave da fixture.
+_IGNORED_PARAMS = {"token", "access_token", "x-access-token"}
+
+
+def fixture_key(method: str, path: str, params: Optional[Dict[str, Any]] = None, body: Any = None) -> str:
+    norm_params = sorted(
+        (str(k), str(v))
+        for k, v in (params or {}).items()
+        if str(k).lower() not in _IGNORED_PARAMS and v is not None
+    )
+    payload = {
+        "method": str(method or "GET").upper(),
+        "path": "/" + str(path or "").strip("/"),
+        "params": norm_params,
+        "body": body if body is None or isinstance(body, (str, int, float, bool)) else json.dumps(body, sort_keys=True, default=str),
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def record_fixture(
+    fixtures_dir: str,
+    method: str,
+    path: str,
+    params: Optional[Dict[str, Any]],
+    status: int,
+    response_body: Any,
+    body: Any = None,
+):
+    """Grava uma resposta real para replay offline pelo `FixtureStubServer`."""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    key = fixture_key(method, path, params, body)
+    record = {
+        "method": str(method or "GET").upper(),
+        "path": "/" + str(path or "").strip("/"),
+        "params": {str(k): str(v) for k, v in (params or {}).items() if str(k).lower() not in _IGNORED_PARAMS},
+        "request_body": body,
+        "status": int(status),
+        "body": response_body,
+    }
+    tmp_path = os.path.join(fixtures_dir, f".{key}.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(record, fh, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(fixtures_dir, f"{key}.json"))
+
+
+def _load_fixtures(fixtures_dir: str) -> Dict[str, Dict[str, Any]]:
+    fixtures: Dict[str, Dict[str, Any]] = {}
+    if not fixtures_dir or not os.path.isdir(fixtures_dir):
+        return fixtures
+    for name in os.listdir(fixtures_dir):
+        if not name.endswith(".json") or name.startswith("."):
+            continue
+        try:
+            with open(os.path.join(fixtures_dir, name), "r", encoding="utf-8") as fh:
+                record = json.load(fh)
+        except Exception:
+            continue
+        key = fixture_key(record.get("method"), record.get("path"), record.get("params"), record.get("request_body"))
+        fixtures[key] = record
+    return fixtures
+
+
+class FixtureStubServer:
+    """Servidor HTTP local que devolve respostas gravadas com latencia artificial.
+    Serve para medir ganhos de concorrencia sem depender das APIs reais."""
+
+    def __init__(
+        self,
+        fixtures_dir: Optional[str] = None,
+        latency_sec: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        handler=None,
+    ):
+        self.fixtures = _load_fixtures(fixtures_dir) if fixtures_dir else {}
+        self.latency_sec = max(0.0, float(latency_sec or 0.0))
+        self.dynamic_handler = handler
+        self.requests_served = 0
+        self.misses = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, int(port)), self._build_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _build_handler(self):
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self, method: str):
+                parsed = urlparse(self.path)
+                params = dict(parse_qsl(parsed.query, keep_blank_values=True))
+                length = int(self.headers.get("Content-Length") or 0)
+                raw_body = self.rfile.read(length) if length > 0 else b""
+
+                with stub._lock:
+                    stub._in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub._in_flight)
+                try:
+                    if stub.latency_sec > 0:
+                        time.sleep(stub.latency_sec)
+
+                    status, payload = 404, {"success": False, "error": "fixture_not_found"}
+                    content_type = "application/json; charset=utf-8"
+                    extra_headers = {}
+                    if stub.dynamic_handler is not None:
+                        # handler(method, path, params, body, headers) -> (status, payload[, content_type[, headers]]) | None
+                        handled = stub.dynamic_handler(method, parsed.path, params, raw_body, dict(self.headers))
+                        if handled is not None:
+                            status, payload = handled[0], handled[1]
+                            if len(handled) > 2 and handled[2]:
+                                content_type = handled[2]
+                            if len(handled) > 3 and handled[3]:
+                                extra_headers = dict(handled[3])
+                    else:
+                        record = stub.fixtures.get(fixture_key(method, parsed.path, params))
+                        if record is not None:
+                            status, payload = int(record.get("status") or 200), record.get("body")
+
+                    with stub._lock:
+                        stub.requests_served += 1
+                        if status == 404:
+                            stub.misses += 1
+
+                    if isinstance(payload, (bytes, bytearray)):
+                        body = bytes(payload)
+                    elif isinstance(payload, str) and not content_type.startswith("application/json"):
+                        body = payload.encode("utf-8")
+                    else:
+                        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    for header_name, header_value in extra_headers.items():
+                        self.send_header(header_name, header_value)
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with stub._lock:
+                        stub._in_flight -= 1
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, format, *args):
+                return
+
+        return _Handler
+
+    def start(self) -> "FixtureStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="HttpStub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
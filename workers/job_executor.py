@@ -0,0 +1,287 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Classes de concorrencia: Playwright e exclusivo (um navegador por vez), jobs de API
+# dividem poucos slots e jobs pesados de banco ficam limitados para nao esgotar o pool.
+CLASS_PLAYWRIGHT = "playwright"
+CLASS_API = "api"
+CLASS_DB = "db"
+CLASS_BATCH = "batch"
+
+EXECUTOR_MAX_WORKERS = max(1, int(os.getenv("EXECUTOR_MAX_WORKERS", "6")))
+EXECUTOR_MAX_QUEUED_PER_CLASS = max(1, int(os.getenv("EXECUTOR_MAX_QUEUED_PER_CLASS", "50")))
+EXECUTOR_DEFAULT_TIMEOUT_SEC = max(0, int(os.getenv("EXECUTOR_JOB_TIMEOUT_SEC", "7200")))
+EXECUTOR_CLASS_LIMITS = {
+    CLASS_PLAYWRIGHT: 1,
+    CLASS_API: max(1, int(os.getenv("EXECUTOR_API_SLOTS", "3"))),
+    CLASS_DB: max(1, int(os.getenv("EXECUTOR_DB_SLOTS", "2"))),
+    CLASS_BATCH: max(1, int(os.getenv("EXECUTOR_BATCH_SLOTS", "1"))),
+}
+
+_CURRENT = threading.local()
+
+
+class JobCancelled(RuntimeError):
+    pass
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = ""
+
+    def cancel(self, reason: str = "cancelado"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled(self.reason or "cancelado")
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    return getattr(_CURRENT, "token", None)
+
+
+def cancellation_requested() -> bool:
+    """Checagem cooperativa para loops longos (ex.: drenagem de jobs) dentro de um job do executor."""
+    token = current_cancel_token()
+    return bool(token and token.cancelled)
+
+
+def raise_if_cancelled():
+    token = current_cancel_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+class Job:
+    __slots__ = (
+        "id", "name", "job_class", "fn", "timeout_sec", "on_timeout", "token",
+        "submitted_at", "started_at", "finished_at", "status", "error", "done",
+    )
+
+    def __init__(self, name: str, job_class: str, fn: Callable[[], Any], timeout_sec: int, on_timeout=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.job_class = job_class
+        self.fn = fn
+        self.timeout_sec = timeout_sec
+        self.on_timeout = on_timeout
+        self.token = CancelToken()
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.status = "QUEUED"
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+
+
+class JobExecutor:
+    """Pool limitado de threads com filas por classe de concorrencia.
+
+    - `submit` nunca executa o job na thread chamadora (listener/scheduler so enfileiram).
+    - Admissao: rejeita nome ja enfileirado/em execucao e fila cheia por classe.
+    - Timeout por job: sinaliza o CancelToken e chama `on_timeout`; o slot so e liberado
+      quando a funcao retorna (threads Python nao podem ser interrompidas a forca).
+    """
+
+    def __init__(
+        self,
+        class_limits: Optional[Dict[str, int]] = None,
+        max_workers: int = EXECUTOR_MAX_WORKERS,
+        max_queued_per_class: int = EXECUTOR_MAX_QUEUED_PER_CLASS,
+        name: str = "Executor",
+    ):
+        self.class_limits = dict(class_limits or EXECUTOR_CLASS_LIMITS)
+        self.max_workers = max(1, int(max_workers))
+        self.max_queued_per_class = max(1, int(max_queued_per_class))
+        self.name = name
+        self._queues: Dict[str, deque] = {job_class: deque() for job_class in self.class_limits}
+        self._running: Dict[str, Job] = {}
+        self._running_by_class: Dict[str, int] = {job_class: 0 for job_class in self.class_limits}
+        self._names: Dict[str, Job] = {}
+        self._cond = threading.Condition(threading.Lock())
+        self._threads: List[threading.Thread] = []
+        self._started = False
+        self._stats = {
+            "submitted": 0,
+            "rejected_duplicate": 0,
+            "rejected_full": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "timed_out": 0,
+        }
+
+    def start(self) -> "JobExecutor":
+        with self._cond:
+            if self._started:
+                return self
+            self._started = True
+        for idx in range(self.max_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"{self.name}-{idx + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._timeout_loop, name=f"{self.name}-Timeouts", daemon=True).start()
+        return self
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[[], Any],
+        job_class: str = CLASS_API,
+        timeout_sec: Optional[int] = None,
+        on_timeout: Optional[Callable[[Job], None]] = None,
+    ) -> Optional[Job]:
+        if job_class not in self.class_limits:
+            job_class = CLASS_API
+        job = Job(name, job_class, fn, EXECUTOR_DEFAULT_TIMEOUT_SEC if timeout_sec is None else int(timeout_sec), on_timeout)
+        with self._cond:
+            if name in self._names:
+                self._stats["rejected_duplicate"] += 1
+                return None
+            if len(self._queues[job_class]) >= self.max_queued_per_class:
+                self._stats["rejected_full"] += 1
+                return None
+            self._queues[job_class].append(job)
+            self._names[name] = job
+            self._stats["submitted"] += 1
+            self._cond.notify_all()
+        self.start()
+        return job
+
+    def is_active(self, name: str) -> bool:
+        with self._cond:
+            return name in self._names
+
+    def cancel(self, name: str, reason: str = "cancelado manualmente") -> bool:
+        with self._cond:
+            job = self._names.get(name)
+            if job is None:
+                return False
+            if job.status == "QUEUED":
+                try:
+                    self._queues[job.job_class].remove(job)
+                except ValueError:
+                    pass
+                self._names.pop(name, None)
+                job.status = "CANCELLED"
+                job.error = reason
+                job.finished_at = time.time()
+                self._stats["cancelled"] += 1
+                job.done.set()
+                return True
+        job.token.cancel(reason)
+        return True
+
+    def _next_job_locked(self) -> Optional[Job]:
+        # Entre as classes com slot livre, pega o job mais antigo (FIFO global).
+        candidate = None
+        for job_class, queue in self._queues.items():
+            if not queue or self._running_by_class[job_class] >= self.class_limits[job_class]:
+                continue
+            if candidate is None or queue[0].submitted_at < candidate.submitted_at:
+                candidate = queue[0]
+        if candidate is not None:
+            self._queues[candidate.job_class].popleft()
+            self._running_by_class[candidate.job_class] += 1
+            self._running[candidate.id] = candidate
+            candidate.status = "RUNNING"
+            candidate.started_at = time.time()
+        return candidate
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job_locked()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job_locked()
+
+            _CURRENT.token = job.token
+            try:
+                job.fn()
+                if job.token.cancelled:
+                    job.status = "CANCELLED"
+                    job.error = job.token.reason
+                else:
+                    job.status = "COMPLETED"
+            except JobCancelled as exc:
+                job.status = "CANCELLED"
+                job.error = str(exc)
+            except Exception as exc:
+                job.status = "FAILED"
+                job.error = f"{type(exc).__name__}: {exc}"
+                print(f"❌ [{self.name}] job {job.name} falhou: {job.error}")
+            finally:
+                _CURRENT.token = None
+                job.finished_at = time.time()
+                with self._cond:
+                    self._running.pop(job.id, None)
+                    self._running_by_class[job.job_class] -= 1
+                    if self._names.get(job.name) is job:
+                        self._names.pop(job.name, None)
+                    stat_key = {"COMPLETED": "completed", "CANCELLED": "cancelled"}.get(job.status, "failed")
+                    self._stats[stat_key] += 1
+                    self._cond.notify_all()
+                job.done.set()
+
+    def _timeout_loop(self):
+        while True:
+            time.sleep(1.0)
+            now = time.time()
+            expired = []
+            with self._cond:
+                for job in self._running.values():
+                    if job.timeout_sec and not job.token.cancelled and job.started_at and now - job.started_at > job.timeout_sec:
+                        expired.append(job)
+                for job in expired:
+                    self._stats["timed_out"] += 1
+            for job in expired:
+                job.token.cancel(f"timeout apos {job.timeout_sec}s")
+                print(f"⏱️ [{self.name}] job {job.name} excedeu {job.timeout_sec}s; cancelamento solicitado.")
+                if job.on_timeout:
+                    try:
+                        job.on_timeout(job)
+                    except Exception as exc:
+                        print(f"⚠️ [{self.name}] on_timeout de {job.name} falhou: {exc}")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._cond:
+            return {
+                "maxWorkers": self.max_workers,
+                "classes": {
+                    job_class: {
+                        "limit": limit,
+                        "running": self._running_by_class[job_class],
+                        "queued": len(self._queues[job_class]),
+                    }
+                    for job_class, limit in self.class_limits.items()
+                },
+                "running": [
+                    {
+                        "name": job.name,
+                        "class": job.job_class,
+                        "elapsedSec": round(now - (job.started_at or now), 1),
+                        "timeoutSec": job.timeout_sec,
+                        "cancelRequested": job.token.cancelled,
+                    }
+                    for job in self._running.values()
+                ],
+                **self._stats,
+            }
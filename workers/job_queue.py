@@ -0,0 +1,459 @@
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from database_manager import DatabaseManager
+except ImportError:
+    DatabaseManager = None
+
+
+QUEUE_TABLE = "worker_job_queue"
+QUEUE_DEFAULT_VISIBILITY_SEC = max(30, int(os.getenv("JOB_QUEUE_VISIBILITY_SEC", "900")))
+QUEUE_DEFAULT_MAX_ATTEMPTS = max(1, int(os.getenv("JOB_QUEUE_MAX_ATTEMPTS", "5")))
+QUEUE_RETRY_BASE_SEC = max(1, int(os.getenv("JOB_QUEUE_RETRY_BASE_SEC", "30")))
+# Com um publicador local ativo (sweeper/enqueue no mesmo processo) os consumidores so
+# acordam por sinal; o timeout vira apenas rede de seguranca.
+WAKEUP_IDLE_FALLBACK_SEC = max(5, int(os.getenv("JOB_WAKEUP_IDLE_FALLBACK_SEC", "300")))
+
+STATUS_QUEUED = "QUEUED"
+STATUS_LEASED = "LEASED"
+STATUS_DONE = "DONE"
+STATUS_DEAD = "DEAD"
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _row_value(row, key: str, index: int):
+    if isinstance(row, (tuple, list)):
+        return row[index] if index < len(row) else None
+    if hasattr(row, key):
+        return getattr(row, key)
+    try:
+        return row.get(key)
+    except Exception:
+        return None
+
+
+class WakeupChannel:
+    """Canal de sinalizacao em processo (Condition) por topico.
+
+    `notify(topic)` acorda quem espera nesse topico; `wait(topic, poll_sec)` devolve True ao
+    receber sinal. Quando ha um publicador registrado (ex.: o sweeper do orquestrador), o
+    timeout sobe para WAKEUP_IDLE_FALLBACK_SEC: nao e preciso consultar o banco a cada poll.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._versions: Dict[str, int] = {}
+        self._publishers = set()
+        self.notifications = 0
+
+    def register_publisher(self, topic: str):
+        with self._cond:
+            self._publishers.add(topic)
+
+    def has_publisher(self, topic: str) -> bool:
+        with self._cond:
+            return topic in self._publishers
+
+    def notify(self, topic: str):
+        with self._cond:
+            self._versions[topic] = self._versions.get(topic, 0) + 1
+            self.notifications += 1
+            self._cond.notify_all()
+
+    def wait(self, topic: str, poll_sec: float) -> bool:
+        with self._cond:
+            timeout = max(float(poll_sec), WAKEUP_IDLE_FALLBACK_SEC) if topic in self._publishers else float(poll_sec)
+            start_version = self._versions.get(topic, 0)
+            deadline = time.monotonic() + timeout
+            while self._versions.get(topic, 0) == start_version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+
+WAKEUP = WakeupChannel()
+
+
+def wait_for_work(topic: str, poll_sec: float) -> bool:
+    return WAKEUP.wait(topic, poll_sec)
+
+
+def signal_work(topic: str):
+    WAKEUP.notify(topic)
+
+
+def _ensure_queue_table(db: "DatabaseManager"):
+    conn = db.get_connection()
+    try:
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {QUEUE_TABLE} (
+              id VARCHAR(64) PRIMARY KEY,
+              topic VARCHAR(64) NOT NULL,
+              payload_json LONGTEXT NULL,
+              priority INTEGER NOT NULL DEFAULT 0,
+              status VARCHAR(20) NOT NULL,
+              dedupe_key VARCHAR(191) NULL UNIQUE,
+              idempotency_key VARCHAR(191) NULL,
+              attempts INTEGER NOT NULL DEFAULT 0,
+              max_attempts INTEGER NOT NULL DEFAULT 5,
+              available_at_ms BIGINT NOT NULL,
+              lease_owner VARCHAR(64) NULL,
+              lease_expires_at_ms BIGINT NULL,
+              last_error LONGTEXT NULL,
+              created_at_ms BIGINT NOT NULL,
+              updated_at_ms BIGINT NOT NULL,
+              finished_at_ms BIGINT NULL
+            )
+            """
+        )
+        if not db.use_turso:
+            conn.commit()
+        try:
+            conn.execute(f"CREATE INDEX idx_{QUEUE_TABLE}_claim ON {QUEUE_TABLE} (topic, status, available_at_ms)")
+            if not db.use_turso:
+                conn.commit()
+        except Exception:
+            # Indice ja existe (MySQL nao suporta IF NOT EXISTS em CREATE INDEX).
+            pass
+    finally:
+        conn.close()
+
+
+class DurableJobQueue:
+    """Fila duravel em tabela unica com lease, visibility timeout, tentativas, prioridade e
+    chave de idempotencia.
+
+    - `dedupe_key` recebe a chave de idempotencia enquanto o job esta ativo (QUEUED/LEASED) e
+      volta a NULL ao terminar: a UNIQUE impede duplicatas ativas sem bloquear reexecucoes.
+    - O claim e um compare-and-set (UPDATE ... WHERE status/lease + leitura do dono), portavel
+      entre SQLite, Turso e MySQL sem SELECT ... FOR UPDATE.
+    - Lease vencido (processo morto/reiniciado) volta a ser elegivel automaticamente.
+    """
+
+    def __init__(self, db: Optional["DatabaseManager"] = None, retry_base_sec: float = QUEUE_RETRY_BASE_SEC):
+        self.db = db or DatabaseManager()
+        self.retry_base_sec = max(0.0, float(retry_base_sec))
+        self.db.ensure_schema(QUEUE_TABLE, lambda: _ensure_queue_table(self.db))
+        self.owner_prefix = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def _execute(self, sql: str, params=()):
+        conn = self.db.get_connection()
+        try:
+            conn.execute(sql, params)
+            if not self.db.use_turso:
+                conn.commit()
+        finally:
+            conn.close()
+
+    def _find_active(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        rows = self.db.execute_query(
+            f"SELECT id, status FROM {QUEUE_TABLE} WHERE dedupe_key = ? LIMIT 1",
+            (idempotency_key,),
+        ) or []
+        if not rows:
+            return None
+        return {"id": _row_value(rows[0], "id", 0), "status": _row_value(rows[0], "status", 1)}
+
+    def enqueue(
+        self,
+        topic: str,
+        payload: Optional[Dict[str, Any]] = None,
+        priority: int = 0,
+        idempotency_key: Optional[str] = None,
+        delay_sec: float = 0,
+        max_attempts: int = QUEUE_DEFAULT_MAX_ATTEMPTS,
+    ) -> Dict[str, Any]:
+        """Retorna {"id", "created"}; com chave ativa repetida devolve o job existente."""
+        if idempotency_key:
+            existing = self._find_active(idempotency_key)
+            if existing:
+                return {"id": existing["id"], "created": False, "status": existing["status"]}
+
+        job_id = uuid.uuid4().hex
+        now = _now_ms()
+        try:
+            self._execute(
+                f"""
+                INSERT INTO {QUEUE_TABLE} (
+                  id, topic, payload_json, priority, status, dedupe_key, idempotency_key, attempts, max_attempts,
+                  available_at_ms, lease_owner, lease_expires_at_ms, last_error, created_at_ms, updated_at_ms, finished_at_ms
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, NULL, NULL, NULL, ?, ?, NULL)
+                """,
+                (
+                    job_id,
+                    topic,
+                    json.dumps(payload or {}, ensure_ascii=False),
+                    int(priority),
+                    STATUS_QUEUED,
+                    idempotency_key,
+                    idempotency_key,
+                    max(1, int(max_attempts)),
+                    now + int(max(0.0, float(delay_sec)) * 1000),
+                    now,
+                    now,
+                ),
+            )
+        except Exception:
+            # Corrida com outro produtor na mesma chave: a UNIQUE de dedupe_key decide.
+            if idempotency_key:
+                existing = self._find_active(idempotency_key)
+                if existing:
+                    return {"id": existing["id"], "created": False, "status": existing["status"]}
+            raise
+        signal_work(topic)
+        return {"id": job_id, "created": True, "status": STATUS_QUEUED}
+
+    def claim(self, topics: Iterable[str], visibility_sec: int = QUEUE_DEFAULT_VISIBILITY_SEC) -> Optional[Dict[str, Any]]:
+        topic_list = [str(topic) for topic in topics if topic]
+        if not topic_list:
+            return None
+        placeholders = ", ".join("?" for _ in topic_list)
+        now = _now_ms()
+        # Lease vencido sem tentativas restantes (processo morreu no meio da ultima): vira DEAD
+        # em vez de ser reassumido indefinidamente.
+        self._execute(
+            f"""
+            UPDATE {QUEUE_TABLE}
+            SET status = ?, dedupe_key = NULL, lease_owner = NULL, lease_expires_at_ms = NULL,
+                last_error = ?, updated_at_ms = ?, finished_at_ms = ?
+            WHERE topic IN ({placeholders})
+              AND status = ? AND lease_expires_at_ms < ? AND attempts >= max_attempts
+            """,
+            (STATUS_DEAD, "lease expirado na ultima tentativa", now, now, *topic_list, STATUS_LEASED, now),
+        )
+        candidates = self.db.execute_query(
+            f"""
+            SELECT id
+            FROM {QUEUE_TABLE}
+            WHERE topic IN ({placeholders})
+              AND (
+                (status = ? AND available_at_ms <= ?)
+                OR (status = ? AND lease_expires_at_ms < ? AND attempts < max_attempts)
+              )
+            ORDER BY priority DESC, available_at_ms ASC, created_at_ms ASC
+            LIMIT 5
+            """,
+            (*topic_list, STATUS_QUEUED, now, STATUS_LEASED, now),
+        ) or []
+
+        for candidate in candidates:
+            job_id = _row_value(candidate, "id", 0)
+            lease_owner = f"{self.owner_prefix}-{uuid.uuid4().hex[:8]}"
+            self._execute(
+                f"""
+                UPDATE {QUEUE_TABLE}
+                SET status = ?, lease_owner = ?, lease_expires_at_ms = ?, attempts = attempts + 1, updated_at_ms = ?
+                WHERE id = ?
+                  AND (
+                    (status = ? AND available_at_ms <= ?)
+                    OR (status = ? AND lease_expires_at_ms < ? AND attempts < max_attempts)
+                  )
+                """,
+                (
+                    STATUS_LEASED,
+                    lease_owner,
+                    now + int(visibility_sec) * 1000,
+                    now,
+                    job_id,
+                    STATUS_QUEUED,
+                    now,
+                    STATUS_LEASED,
+                    now,
+                ),
+            )
+            rows = self.db.execute_query(
+                f"""
+                SELECT id, topic, payload_json, priority, attempts, max_attempts, idempotency_key
+                FROM {QUEUE_TABLE}
+                WHERE id = ? AND lease_owner = ?
+                """,
+                (job_id, lease_owner),
+            ) or []
+            if not rows:
+                continue
+            row = rows[0]
+            try:
+                payload = json.loads(_row_value(row, "payload_json", 2) or "{}")
+            except Exception:
+                payload = {}
+            return {
+                "id": _row_value(row, "id", 0),
+                "topic": _row_value(row, "topic", 1),
+                "payload": payload,
+                "priority": int(_row_value(row, "priority", 3) or 0),
+                "attempts": int(_row_value(row, "attempts", 4) or 0),
+                "max_attempts": int(_row_value(row, "max_attempts", 5) or 1),
+                "idempotency_key": _row_value(row, "idempotency_key", 6),
+                "lease_owner": lease_owner,
+            }
+        return None
+
+    def extend_lease(self, job: Dict[str, Any], visibility_sec: int = QUEUE_DEFAULT_VISIBILITY_SEC):
+        now = _now_ms()
+        self._execute(
+            f"UPDATE {QUEUE_TABLE} SET lease_expires_at_ms = ?, updated_at_ms = ? WHERE id = ? AND lease_owner = ?",
+            (now + int(visibility_sec) * 1000, now, job["id"], job["lease_owner"]),
+        )
+
+    def complete(self, job: Dict[str, Any]):
+        now = _now_ms()
+        self._execute(
+            f"""
+            UPDATE {QUEUE_TABLE}
+            SET status = ?, dedupe_key = NULL, lease_owner = NULL, lease_expires_at_ms = NULL,
+                updated_at_ms = ?, finished_at_ms = ?
+            WHERE id = ? AND lease_owner = ?
+            """,
+            (STATUS_DONE, now, now, job["id"], job["lease_owner"]),
+        )
+
+    def dead_letter(self, job: Dict[str, Any], error: str):
+        """Marca DEAD sem nova tentativa (ex.: cancelado ou estourou o timeout)."""
+        now = _now_ms()
+        self._execute(
+            f"""
+            UPDATE {QUEUE_TABLE}
+            SET status = ?, dedupe_key = NULL, lease_owner = NULL, lease_expires_at_ms = NULL,
+                last_error = ?, updated_at_ms = ?, finished_at_ms = ?
+            WHERE id = ? AND lease_owner = ?
+            """,
+            (STATUS_DEAD, str(error)[:4000], now, now, job["id"], job["lease_owner"]),
+        )
+
+    def fail(self, job: Dict[str, Any], error: str):
+        """Reagenda com backoff exponencial ou marca DEAD ao esgotar as tentativas."""
+        now = _now_ms()
+        attempts = int(job.get("attempts") or 1)
+        if attempts >= int(job.get("max_attempts") or 1):
+            self.dead_letter(job, error)
+            return
+        retry_ms = int(self.retry_base_sec * 1000 * (2 ** max(0, attempts - 1)))
+        self._execute(
+            f"""
+            UPDATE {QUEUE_TABLE}
+            SET status = ?, lease_owner = NULL, lease_expires_at_ms = NULL, available_at_ms = ?,
+                last_error = ?, updated_at_ms = ?
+            WHERE id = ? AND lease_owner = ?
+            """,
+            (STATUS_QUEUED, now + retry_ms, str(error)[:4000], now, job["id"], job["lease_owner"]),
+        )
+
+    def settle(self, job: Dict[str, Any], status: str, error: Optional[str] = None, cancelled: bool = False):
+        """Fecha o job conforme o status do JobExecutor: COMPLETED conclui; CANCELLED (ou timeout,
+        mesmo que a funcao tenha saido com outra excecao depois do cancelamento) vai direto para
+        DEAD, pois repetir so multiplicaria o custo do scraper travado; o resto usa `fail`."""
+        if status == "COMPLETED":
+            self.complete(job)
+        elif status == "CANCELLED" or cancelled:
+            self.dead_letter(job, error or status)
+        else:
+            self.fail(job, error or status)
+
+    def is_active(self, idempotency_key: str) -> bool:
+        return self._find_active(idempotency_key) is not None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        rows = self.db.execute_query(
+            f"""
+            SELECT topic, status, COUNT(1)
+            FROM {QUEUE_TABLE}
+            WHERE status IN (?, ?, ?)
+            GROUP BY topic, status
+            """,
+            (STATUS_QUEUED, STATUS_LEASED, STATUS_DEAD),
+        ) or []
+        return [
+            {"topic": _row_value(row, "topic", 0), "status": _row_value(row, "status", 1), "count": int(_row_value(row, "COUNT(1)", 2) or 0)}
+            for row in rows
+        ]
+
+
+def run_job_queue_self_check(db_path: Optional[str] = None, max_attempts: int = 3) -> Dict[str, Any]:
+    """Checagem em SQLite temporario do caminho de falha da fila serial: um servico que levanta
+    excecao vira job FAILED no JobExecutor, `settle` reagenda via `fail` e, esgotadas as tentativas,
+    o job termina DEAD; um lease vencido na ultima tentativa tambem vira DEAD no `claim`."""
+    import tempfile
+
+    import database_manager
+    from job_executor import CLASS_PLAYWRIGHT, JobExecutor
+
+    tmp_dir = None
+    if not db_path:
+        tmp_dir = tempfile.mkdtemp(prefix="job_queue_check_")
+        db_path = os.path.join(tmp_dir, "queue.db")
+    original_path = database_manager.LOCAL_DB_PATH
+    original_env = {name: os.environ.get(name) for name in ("DB_PROVIDER", "TURSO_URL")}
+    os.environ["DB_PROVIDER"] = "sqlite"
+    os.environ.pop("TURSO_URL", None)
+    database_manager.LOCAL_DB_PATH = db_path
+    try:
+        queue = DurableJobQueue(database_manager.DatabaseManager(), retry_base_sec=0)
+        executor = JobExecutor(class_limits={CLASS_PLAYWRIGHT: 1}, max_workers=1, name="QueueCheck")
+
+        def _raising_service():
+            raise RuntimeError("scraper falhou")
+
+        queue.enqueue("check_serial", {"action": "check"}, max_attempts=max_attempts)
+        statuses = []
+        while True:
+            task = queue.claim(["check_serial"], visibility_sec=60)
+            if not task:
+                break
+            job = executor.submit("check", _raising_service, job_class=CLASS_PLAYWRIGHT)
+            job.wait()
+            statuses.append(job.status)
+            queue.settle(task, job.status, job.error, cancelled=job.token.cancelled)
+
+        queue.enqueue("check_lease", {"action": "check"}, max_attempts=1)
+        abandoned = queue.claim(["check_lease"], visibility_sec=0)
+        time.sleep(0.01)
+        reclaimed = queue.claim(["check_lease"], visibility_sec=60)
+
+        rows = queue.db.execute_query(f"SELECT topic, status, attempts FROM {QUEUE_TABLE} ORDER BY topic") or []
+        final = {_row_value(row, "topic", 0): (_row_value(row, "status", 1), int(_row_value(row, "attempts", 2) or 0)) for row in rows}
+        result = {
+            "executorStatuses": statuses,
+            "executorFailed": executor.stats()["failed"],
+            "serial": final.get("check_serial"),
+            "expiredLease": final.get("check_lease"),
+            "leaseReclaimed": reclaimed is not None,
+        }
+        ok = (
+            statuses == ["FAILED"] * max_attempts
+            and result["serial"] == (STATUS_DEAD, max_attempts)
+            and abandoned is not None
+            and not result["leaseReclaimed"]
+            and result["expiredLease"] == (STATUS_DEAD, 1)
+        )
+        result["ok"] = ok
+    finally:
+        database_manager.LOCAL_DB_PATH = original_path
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        if tmp_dir:
+            import shutil
+
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"[job_queue] self-check {'OK' if result['ok'] else 'FALHOU'}: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    raise SystemExit(0 if run_job_queue_self_check()["ok"] else 1)
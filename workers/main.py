@@ -12,7 +12,6 @@ import re
 import unicodedata
 import traceback
 import faulthandler
-from collections import deque
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # --- TIMEZONE (Railway normalmente roda em UTC) ---
@@ -94,6 +93,19 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from database_manager import DatabaseManager
+    from db_pool import pool_stats as db_pool_stats
+    from sql_dialect import mysql_translation_stats
+    from feegow_reference_cache import reference_cache_stats
+    from job_queue import DurableJobQueue, WAKEUP, signal_work, wait_for_work
+    from job_executor import (
+        CLASS_API,
+        CLASS_BATCH,
+        CLASS_DB,
+        CLASS_PLAYWRIGHT,
+        JobExecutor,
+        cancellation_requested,
+        raise_if_cancelled,
+    )
     # Workers (Execução única)
     from worker_feegow_appointments import update_appointments_data
     from worker_appointments_confirmation_snapshot import update_appointments_confirmation_snapshot
@@ -242,14 +254,65 @@ service_locks = {}
 
 SERIALIZED_SCRAPER_SERVICES = {"faturamento", "repasses", "repasse_consolidacao"}
 SERIAL_QUEUE_POLL_SEC = max(1, int(os.getenv("FEGOW_SERIAL_QUEUE_POLL_SEC", "5")))
-REPASSE_JOB_DISPATCH_POLL_SEC = max(5, int(os.getenv("REPASSE_JOB_DISPATCH_POLL_SEC", "20")))
+SERIAL_QUEUE_TOPIC = "serial_scrapers"
+SERIAL_QUEUE_LEASE_SEC = max(60, int(os.getenv("FEGOW_SERIAL_QUEUE_LEASE_SEC", "300")))
+# Varredura unica das fontes externas (system_status + tabelas de jobs gravadas pelo painel).
+JOB_SWEEP_INTERVAL_SEC = max(2, int(os.getenv("JOB_SWEEP_INTERVAL_SEC", os.getenv("ON_DEMAND_POLL_INTERVAL_SEC", "15"))))
+REPASSE_JOB_STALE_CHECK_SEC = max(30, int(os.getenv("REPASSE_JOB_STALE_CHECK_SEC", "300")))
 REPASSE_JOB_STALE_MINUTES = max(5, int(os.getenv("REPASSE_JOB_STALE_MINUTES", "20")))
+SWEEP_WAKEUP_TOPIC = "system_status"
+# Tabelas de jobs consumidas por loops do proprio processo: o sweeper so os acorda.
+PENDING_JOB_WAKEUP_TOPICS = {
+    "intranet_knowledge_jobs": "intranet_knowledge_index",
+    "recruitment_ai_analysis_jobs": "recruitment_ai",
+}
 APPOINTMENTS_STALE_LOCK_SEC = max(60, int(os.getenv("APPOINTMENTS_STALE_LOCK_SEC", "180")))
 
-_serial_queue = deque()
-_serial_queue_lock = threading.Lock()
-_serial_queue_actions = set()
-_serial_running_action = None
+# Classe de concorrência de cada serviço no executor (padrão: CLASS_API).
+SERVICE_CONCURRENCY_CLASS = {
+    "faturamento": CLASS_PLAYWRIGHT,
+    "repasses": CLASS_PLAYWRIGHT,
+    "repasse_consolidacao": CLASS_PLAYWRIGHT,
+    "auth": CLASS_PLAYWRIGHT,
+    "auth_clinia": CLASS_PLAYWRIGHT,
+    "monitor_medico_prewarm": CLASS_PLAYWRIGHT,
+    "appointments": CLASS_DB,
+    "patients_registry": CLASS_DB,
+    "appointments_confirmation_snapshot": CLASS_DB,
+    "contratos": CLASS_DB,
+    "agenda_occupancy_refresh": CLASS_DB,
+    "checklist_recepcao_refresh": CLASS_BATCH,
+}
+
+# Timeout por serviço (s). Sobrescreva com EXECUTOR_JOB_TIMEOUTS="appointments=1800,faturamento=7200".
+SERVICE_TIMEOUT_SEC = {
+    "appointments": 1800,
+    "comercial": 1800,
+    "appointments_confirmation_snapshot": 1800,
+    "auth": 900,
+    "auth_clinia": 900,
+    "monitor_medico_prewarm": 600,
+    "checklist_recepcao_refresh": 21600,
+}
+for _item in str(os.getenv("EXECUTOR_JOB_TIMEOUTS", "")).split(","):
+    _name, _, _value = _item.partition("=")
+    try:
+        SERVICE_TIMEOUT_SEC[_name.strip()] = max(0, int(_value))
+    except ValueError:
+        pass
+
+EXECUTOR = JobExecutor()
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def _get_job_queue() -> "DurableJobQueue":
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = DurableJobQueue()
+        return _job_queue
 
 KNOWN_ACTIONS = {
     'appointments',
@@ -692,20 +755,24 @@ def run_checklist_recepcao_batch(trigger: str = "manual"):
 
 
 def _enqueue_serial_service(action: str, display_name: str, reason: str, raw_key: str = "") -> bool:
-    global _serial_running_action
-    with _serial_queue_lock:
-        if action == _serial_running_action or action in _serial_queue_actions:
-            return False
-        _serial_queue.append(
+    # Fila duravel: a chave de idempotencia cobre "na fila" e "em execucao" (lease ativo).
+    try:
+        result = _get_job_queue().enqueue(
+            SERIAL_QUEUE_TOPIC,
             {
                 "action": action,
                 "display_name": display_name,
                 "raw_key": raw_key or action,
                 "reason": reason,
                 "queued_at": time.time(),
-            }
+            },
+            idempotency_key=f"serial:{action}",
         )
-        _serial_queue_actions.add(action)
+    except Exception as e:
+        print(f"❌ Falha ao enfileirar {display_name} na fila serial: {e}")
+        return False
+    if not result["created"]:
+        return False
 
     details = f"Fila serial ({reason})"
     try:
@@ -769,7 +836,7 @@ def _run_service_direct(action: str, display_name: str, raw_key: str = ""):
             update_proposals()
         elif action == "repasses":
             drained = 0
-            while process_pending_repasse_jobs_once(
+            while not cancellation_requested() and process_pending_repasse_jobs_once(
                 auto_enqueue_if_empty=False,
                 requested_by="system_status",
             ):
@@ -777,7 +844,7 @@ def _run_service_direct(action: str, display_name: str, raw_key: str = ""):
             print(f"🔁 Repasses: jobs drenados={drained}")
         elif action == "repasse_consolidacao":
             drained = 0
-            while process_pending_consolidacao_jobs_once(
+            while not cancellation_requested() and process_pending_consolidacao_jobs_once(
                 auto_enqueue_if_empty=False,
                 requested_by="system_status",
                 headless=True,
@@ -786,7 +853,7 @@ def _run_service_direct(action: str, display_name: str, raw_key: str = ""):
             print(f"🔁 Repasse consolidação: jobs drenados={drained}")
         elif action == "repasse_email":
             drained = 0
-            while process_pending_repasse_email_jobs_once(
+            while not cancellation_requested() and process_pending_repasse_email_jobs_once(
                 max_jobs=1,
                 requested_by="system_status",
             ):
@@ -808,17 +875,17 @@ def _run_service_direct(action: str, display_name: str, raw_key: str = ""):
             process_pending_blocked_agendas_jobs_once()
         elif action == "payroll_point_sync":
             drained = 0
-            while process_pending_payroll_point_sync_jobs_once():
+            while not cancellation_requested() and process_pending_payroll_point_sync_jobs_once():
                 drained += 1
             print(f"Folha de pagamento (sync API): jobs drenados={drained}")
         elif action == "point_sync":
             drained = 0
-            while process_pending_point_sync_jobs_once():
+            while not cancellation_requested() and process_pending_point_sync_jobs_once():
                 drained += 1
             print(f"Ponto (sync API): jobs drenados={drained}")
         elif action == "marketing_funnel":
             drained = 0
-            while process_pending_marketing_funnel_jobs_once(
+            while not cancellation_requested() and process_pending_marketing_funnel_jobs_once(
                 auto_enqueue_if_empty=False,
                 requested_by="system_status",
             ):
@@ -826,7 +893,7 @@ def _run_service_direct(action: str, display_name: str, raw_key: str = ""):
             print(f"Marketing funil: jobs drenados={drained}")
         elif action == "clinia_ads":
             drained = 0
-            while process_pending_clinia_ads_jobs_once(
+            while not cancellation_requested() and process_pending_clinia_ads_jobs_once(
                 auto_enqueue_if_empty=(drained == 0),
                 requested_by="system_status",
             ):
@@ -837,12 +904,16 @@ def _run_service_direct(action: str, display_name: str, raw_key: str = ""):
         else:
             print(f"⚠️ Ação desconhecida solicitada: {action}")
 
+        raise_if_cancelled()
         elapsed = round(time.time() - start, 2)
         _update_status("COMPLETED", f"Concluído em {elapsed}s")
 
     except Exception as e:
         print(f"❌ Erro ao rodar serviço {display_name}: {e}")
         _update_status("ERROR", str(e))
+        # Propaga para o executor marcar o job como FAILED/CANCELLED: a fila serial decide
+        # entre retry com backoff e dead-letter a partir desse status.
+        raise
     finally:
         try:
             lock.release()
@@ -850,8 +921,35 @@ def _run_service_direct(action: str, display_name: str, raw_key: str = ""):
             pass
 
 
+def _on_service_timeout(action: str, raw_key: str = ""):
+    def _handler(job):
+        details = f"Timeout do executor após {job.timeout_sec}s; cancelamento solicitado."
+        try:
+            db = DatabaseManager()
+            db.update_heartbeat(action, "ERROR", details)
+            if raw_key and raw_key != action:
+                db.update_heartbeat(raw_key, "ERROR", details)
+        except Exception:
+            pass
+    return _handler
+
+
+def _submit_job(name: str, fn, raw_key: str = ""):
+    """Enfileira no executor (nunca roda na thread chamadora). Retorna o Job ou None se recusado."""
+    job = EXECUTOR.submit(
+        name,
+        fn,
+        job_class=SERVICE_CONCURRENCY_CLASS.get(name, CLASS_API),
+        timeout_sec=SERVICE_TIMEOUT_SEC.get(name),
+        on_timeout=_on_service_timeout(name, raw_key),
+    )
+    if job is None:
+        print(f"⏭️ Serviço já na fila/em execução ou fila cheia: {name}")
+    return job
+
+
 def run_service(key: str):
-    """Executa/agenda worker por chave mapeada.
+    """Agenda worker por chave mapeada no executor.
     Serviços de scraping de lote que fazem login Feegow são serializados em fila dedicada."""
     action, display_name = canonicalize(key)
     raw_key = str(key).strip() if key is not None else ""
@@ -862,7 +960,7 @@ def run_service(key: str):
             print(f"⏭️ Serviço já na fila serial/em execução: {display_name}")
         return
 
-    _run_service_direct(action, display_name, raw_key)
+    _submit_job(action, lambda: _run_service_direct(action, display_name, raw_key), raw_key)
 
 def run_hourly_workers():
     """Executa todos os workers não real-time uma vez (usa run_service)."""
@@ -973,39 +1071,6 @@ def run_clinia_token_renewal():
         print(f"❌ Falha na renovação de cookie Clinia: {e}")
         db.update_heartbeat("auth_clinia", "ERROR", str(e))
 
-def run_on_demand_listener():
-    print("👂 Listener de Atualizações Manuais iniciado.")
-    db = DatabaseManager()
-    poll_interval = int(os.getenv("ON_DEMAND_POLL_INTERVAL_SEC", "30"))
-    
-    while True:
-        try:
-            pedidos = db.execute_query("""
-                SELECT service_name 
-                FROM system_status 
-                WHERE status IN ('PENDING', 'QUEUED')
-            """)
-
-            for row in pedidos:
-                service = row[0] if isinstance(row, (tuple, list)) else row['service_name']
-                
-                print(f"\n⚡ GATILHO RECEBIDO: {service}")
-
-                try:
-                    start_time = time.time()
-                    # Delegate to shared executor which uses locks and writes canonical heartbeat
-                    run_service(service)
-                    
-                except Exception as e:
-                    print(f"❌ Erro {service}: {e}")
-                    db.update_heartbeat(service, "ERROR", str(e))
-
-        except Exception as e:
-            print(f"⚠️ Erro Listener: {e}")
-            time.sleep(poll_interval)
-        
-        time.sleep(poll_interval)
-
 # --- WRAPPERS DE SEGURANÇA ---
 def run_monitor_recepcao_safe():
     while True:
@@ -1059,7 +1124,13 @@ def run_scheduler():
     schedule.every().day.at("05:30").do(lambda: run_service('patients_registry'))
     schedule.every().day.at("05:35").do(lambda: run_service('clinia_ads'))
     schedule.every().day.at("05:40").do(lambda: run_service('marketing_funnel'))
-    schedule.every().day.at("06:15").do(run_agenda_occupancy_current_month)
+    def enqueue_agenda_occupancy_refresh():
+        _submit_job("agenda_occupancy_refresh", run_agenda_occupancy_current_month)
+
+    def enqueue_medico_prewarm():
+        _submit_job("monitor_medico_prewarm", run_medico_prewarm_job)
+
+    schedule.every().day.at("06:15").do(enqueue_agenda_occupancy_refresh)
 
     schedule.every().day.at("12:00").do(lambda: run_service('contratos'))
 
@@ -1068,15 +1139,15 @@ def run_scheduler():
     schedule.every().day.at("12:20").do(lambda: run_service('procedures_catalog'))
     schedule.every().day.at("12:30").do(lambda: run_service('patients_registry'))
     schedule.every().day.at("12:35").do(lambda: run_service('clinia_ads'))
-    schedule.every().day.at("12:45").do(run_agenda_occupancy_current_month)
+    schedule.every().day.at("12:45").do(enqueue_agenda_occupancy_refresh)
     schedule.every().day.at("18:10").do(lambda: run_service('marketing_funnel'))
     schedule.every().day.at("18:35").do(lambda: run_service('clinia_ads'))
-    schedule.every().day.at("18:45").do(run_agenda_occupancy_current_month)
+    schedule.every().day.at("18:45").do(enqueue_agenda_occupancy_refresh)
     # Pré-aquecimento de sessão do monitor médico antes da abertura (08:00)
-    schedule.every().day.at("07:40").do(run_medico_prewarm_job)
-    schedule.every().day.at("07:45").do(run_medico_prewarm_job)
-    schedule.every().day.at("07:50").do(run_medico_prewarm_job)
-    schedule.every().day.at("07:55").do(run_medico_prewarm_job)
+    schedule.every().day.at("07:40").do(enqueue_medico_prewarm)
+    schedule.every().day.at("07:45").do(enqueue_medico_prewarm)
+    schedule.every().day.at("07:50").do(enqueue_medico_prewarm)
+    schedule.every().day.at("07:55").do(enqueue_medico_prewarm)
     # Workers pesados: 14h, 17h, 19h
     schedule.every().day.at("14:00").do(run_heavy_workers)
     schedule.every().day.at("17:00").do(run_heavy_workers)
@@ -1127,36 +1198,48 @@ def _now_db_ts():
 
 
 def _run_serial_queue_executor():
-    global _serial_running_action
     print(
         f"📦 Fila serial de scrapers iniciada | services={sorted(SERIALIZED_SCRAPER_SERVICES)} "
-        f"poll={SERIAL_QUEUE_POLL_SEC}s"
+        f"lease={SERIAL_QUEUE_LEASE_SEC}s"
     )
+    queue = _get_job_queue()
     while True:
-        task = None
-        with _serial_queue_lock:
-            if _serial_queue:
-                task = _serial_queue.popleft()
-                _serial_queue_actions.discard(task["action"])
-                _serial_running_action = task["action"]
-
+        try:
+            task = queue.claim([SERIAL_QUEUE_TOPIC], visibility_sec=SERIAL_QUEUE_LEASE_SEC)
+        except Exception as e:
+            print(f"⚠️ Fila serial: falha ao buscar próximo job: {e}")
+            task = None
         if not task:
-            time.sleep(SERIAL_QUEUE_POLL_SEC)
+            wait_for_work(SERIAL_QUEUE_TOPIC, SERIAL_QUEUE_POLL_SEC)
             continue
 
-        action = task["action"]
-        display_name = task.get("display_name") or CANONICAL_NAME.get(action, action)
-        raw_key = task.get("raw_key") or action
-        reason = task.get("reason") or "queue"
+        payload = task["payload"]
+        action = str(payload.get("action") or "")
+        display_name = payload.get("display_name") or CANONICAL_NAME.get(action, action)
+        raw_key = payload.get("raw_key") or action
+        reason = payload.get("reason") or "queue"
 
         try:
-            wait_sec = max(0, time.time() - float(task.get("queued_at") or time.time()))
-            print(f"🚚 Executando da fila serial: {display_name} | wait={wait_sec:.1f}s | reason={reason}")
-            _run_service_direct(action, display_name, raw_key)
-        finally:
-            with _serial_queue_lock:
-                if _serial_running_action == action:
-                    _serial_running_action = None
+            wait_sec = max(0, time.time() - float(payload.get("queued_at") or time.time()))
+            print(
+                f"🚚 Executando da fila serial: {display_name} | wait={wait_sec:.1f}s | reason={reason} "
+                f"| tentativa={task['attempts']}/{task['max_attempts']}"
+            )
+            # Roda no slot exclusivo de Playwright do executor (timeout/cancelamento) e aguarda,
+            # renovando o lease para que outro processo nao assuma o job durante a execucao.
+            job = _submit_job(action, lambda: _run_service_direct(action, display_name, raw_key), raw_key)
+            if job is None:
+                queue.fail(task, "executor recusou (ja em execucao ou fila cheia)")
+                continue
+            while not job.wait(max(10, SERIAL_QUEUE_LEASE_SEC // 3)):
+                queue.extend_lease(task, SERIAL_QUEUE_LEASE_SEC)
+            queue.settle(task, job.status, job.error, cancelled=job.token.cancelled)
+        except Exception as e:
+            print(f"⚠️ Fila serial: erro ao processar {display_name}: {e}")
+            try:
+                queue.fail(task, str(e))
+            except Exception:
+                pass
 
 
 def _query_pending_count(db: "DatabaseManager", table_name: str) -> int:
@@ -1277,36 +1360,100 @@ def _recover_stale_jobs(
     return recovered
 
 
-def _run_repasse_job_dispatcher():
+def _query_pending_counts(db: "DatabaseManager", table_names) -> dict:
+    """Conta jobs PENDING de varias tabelas numa unica consulta; se alguma tabela ainda nao
+    existir, cai para a contagem tabela a tabela."""
+    table_names = list(table_names)
+    union_sql = "\nUNION ALL\n".join(
+        f"SELECT '{table_name}' AS source, COUNT(1) AS cnt FROM {table_name} WHERE status = ?"
+        for table_name in table_names
+    )
+    conn = db.get_connection()
+    try:
+        rs = conn.execute(union_sql, tuple("PENDING" for _ in table_names))
+        rows = rs.fetchall() if hasattr(rs, "fetchall") else []
+    except Exception:
+        rows = None
+    finally:
+        conn.close()
+    if rows is None:
+        return {table_name: _query_pending_count(db, table_name) for table_name in table_names}
+    counts = {table_name: 0 for table_name in table_names}
+    for row in rows:
+        source = row[0] if isinstance(row, (tuple, list)) else row["source"]
+        cnt = row[1] if isinstance(row, (tuple, list)) else row["cnt"]
+        counts[str(source)] = int(cnt or 0)
+    return counts
+
+
+def _sweep_on_demand_requests(db: "DatabaseManager"):
+    pedidos = db.execute_query("""
+        SELECT service_name
+        FROM system_status
+        WHERE status IN ('PENDING', 'QUEUED')
+    """) or []
+
+    for row in pedidos:
+        service = row[0] if isinstance(row, (tuple, list)) else row['service_name']
+        action = canonicalize(service)[0]
+        if EXECUTOR.is_active(action):
+            continue
+        if action in SERIALIZED_SCRAPER_SERVICES and _get_job_queue().is_active(f"serial:{action}"):
+            continue
+
+        print(f"\n⚡ GATILHO RECEBIDO: {service}")
+        try:
+            # Apenas enfileira: o executor roda o job e grava o heartbeat canônico.
+            run_service(service)
+        except Exception as e:
+            print(f"❌ Erro {service}: {e}")
+            db.update_heartbeat(service, "ERROR", str(e))
+
+
+def _sweep_pending_job_tables(db: "DatabaseManager"):
+    counts = _query_pending_counts(
+        db,
+        ["repasse_sync_jobs", "repasse_consolidacao_jobs", "repasse_email_jobs", *PENDING_JOB_WAKEUP_TOPICS.keys()],
+    )
+    if counts.get("repasse_sync_jobs"):
+        _enqueue_serial_service("repasses", CANONICAL_NAME["repasses"], f"dispatcher pending={counts['repasse_sync_jobs']}")
+    if counts.get("repasse_consolidacao_jobs"):
+        _enqueue_serial_service(
+            "repasse_consolidacao",
+            CANONICAL_NAME["repasse_consolidacao"],
+            f"dispatcher pending={counts['repasse_consolidacao_jobs']}",
+        )
+    if counts.get("repasse_email_jobs") and not EXECUTOR.is_active("repasse_email"):
+        run_service("repasse_email")
+    for table_name, topic in PENDING_JOB_WAKEUP_TOPICS.items():
+        if counts.get(table_name):
+            signal_work(topic)
+
+
+def run_job_sweeper():
+    """Substitui o listener de system_status, o dispatcher de repasses e o polling dos loops de
+    IA/intranet: uma varredura consolidada por ciclo, acordada na hora por POST /wakeup."""
     print(
-        f"🧭 Dispatcher de jobs de repasse iniciado | poll={REPASSE_JOB_DISPATCH_POLL_SEC}s "
-        f"stale={REPASSE_JOB_STALE_MINUTES}min"
+        f"👂 Sweeper de jobs iniciado | interval={JOB_SWEEP_INTERVAL_SEC}s "
+        f"stale_check={REPASSE_JOB_STALE_CHECK_SEC}s stale={REPASSE_JOB_STALE_MINUTES}min"
     )
     db = DatabaseManager()
+    for topic in (SERIAL_QUEUE_TOPIC, *PENDING_JOB_WAKEUP_TOPICS.values()):
+        WAKEUP.register_publisher(topic)
+    last_stale_check = 0.0
+
     while True:
         try:
-            _recover_stale_jobs(db, "repasse_sync_jobs", "repasses", REPASSE_JOB_STALE_MINUTES)
-            _recover_stale_jobs(db, "repasse_consolidacao_jobs", "repasse_consolidacao", REPASSE_JOB_STALE_MINUTES)
-
-            pending_sync = _query_pending_count(db, "repasse_sync_jobs")
-            if pending_sync > 0:
-                _enqueue_serial_service("repasses", CANONICAL_NAME["repasses"], f"dispatcher pending={pending_sync}")
-
-            pending_consol = _query_pending_count(db, "repasse_consolidacao_jobs")
-            if pending_consol > 0:
-                _enqueue_serial_service(
-                    "repasse_consolidacao",
-                    CANONICAL_NAME["repasse_consolidacao"],
-                    f"dispatcher pending={pending_consol}",
-                )
-
-            pending_email = _query_pending_count(db, "repasse_email_jobs")
-            if pending_email > 0:
-                run_service("repasse_email")
+            if time.time() - last_stale_check >= REPASSE_JOB_STALE_CHECK_SEC:
+                last_stale_check = time.time()
+                _recover_stale_jobs(db, "repasse_sync_jobs", "repasses", REPASSE_JOB_STALE_MINUTES)
+                _recover_stale_jobs(db, "repasse_consolidacao_jobs", "repasse_consolidacao", REPASSE_JOB_STALE_MINUTES)
+            _sweep_on_demand_requests(db)
+            _sweep_pending_job_tables(db)
         except Exception as e:
-            print(f"⚠️ Dispatcher de repasses erro: {e}")
+            print(f"⚠️ Erro Sweeper: {e}")
 
-        time.sleep(REPASSE_JOB_DISPATCH_POLL_SEC)
+        wait_for_work(SWEEP_WAKEUP_TOPIC, JOB_SWEEP_INTERVAL_SEC)
 
 WATCHDOG_ENABLED = str(os.getenv("WATCHDOG_ENABLED", "1")).strip().lower() in ("1", "true", "yes", "on")
 WATCHDOG_INTERVAL_SEC = max(10, int(os.getenv("WATCHDOG_INTERVAL_SEC", "60")))
@@ -1356,9 +1503,22 @@ def _build_worker_health_payload():
         "railway": bool(os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("RAILWAY_PROJECT_ID")),
         "watchdogServices": [service for service in WATCHDOG_SERVICES if service in WATCHDOG_SUPPORTED_SERVICES],
         "threads": alive_threads,
+        "dbPools": db_pool_stats(),
+        "sqlTranslation": mysql_translation_stats(),
+        "feegowReferenceCache": reference_cache_stats(),
+        "executor": EXECUTOR.stats(),
+        "jobQueue": _job_queue_health(),
+        "wakeupNotifications": WAKEUP.notifications,
     }
 
 
+def _job_queue_health():
+    try:
+        return _get_job_queue().stats()
+    except Exception as e:
+        return {"error": str(e)}
+
+
 class _WorkerHealthcheckHandler(BaseHTTPRequestHandler):
     def do_GET(self):
         path = str(self.path or "/").split("?", 1)[0]
@@ -1378,6 +1538,29 @@ class _WorkerHealthcheckHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(body)
 
+    def do_POST(self):
+        # POST /wakeup?topic=<topico>: produtores externos (painel) acordam o consumidor na hora.
+        path, _, query = str(self.path or "/").partition("?")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > 0:
+            self.rfile.read(length)
+        if path != "/wakeup":
+            self.send_response(404)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(b'{"ok":false,"error":"not_found"}')
+            return
+
+        params = dict(item.partition("=")[::2] for item in query.split("&") if item)
+        topic = str(params.get("topic") or SWEEP_WAKEUP_TOPIC).strip() or SWEEP_WAKEUP_TOPIC
+        signal_work(topic)
+        body = json.dumps({"ok": True, "topic": topic}, ensure_ascii=True).encode("utf-8")
+        self.send_response(202)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def log_message(self, format, *args):
         return
 
@@ -1398,7 +1581,7 @@ def start_worker_healthcheck_server():
             print(
                 "🫀 Healthcheck HTTP do worker ativo | "
                 f"host={WORKER_HEALTHCHECK_HOST} port={WORKER_HEALTHCHECK_PORT} "
-                "paths=/healthz,/readyz"
+                "paths=/healthz,/readyz,/wakeup"
             )
             server.serve_forever()
         except Exception as e:
@@ -1522,9 +1705,10 @@ def start_orchestrator():
     # Normaliza nomes duplicados na system_status antes de iniciar threads
     normalize_system_status_rows()
     start_worker_healthcheck_server()
+    EXECUTOR.start()
     
     threads = [
-        threading.Thread(target=run_on_demand_listener, name="Listener", daemon=True),
+        threading.Thread(target=run_job_sweeper, name="Listener", daemon=True),
         threading.Thread(target=run_scheduler, name="Scheduler", daemon=True),
         threading.Thread(target=run_monitor_recepcao_safe, name="MonRec", daemon=True),
         threading.Thread(target=run_monitor_medico_safe, name="MonMed", daemon=True),
@@ -1532,7 +1716,6 @@ def start_orchestrator():
         threading.Thread(target=run_recruitment_ai_loop, name="RecruitAI", daemon=True),
         threading.Thread(target=run_intranet_knowledge_index_loop, name="IntraKnow", daemon=True),
         threading.Thread(target=_run_serial_queue_executor, name="SerialQueue", daemon=True),
-        threading.Thread(target=_run_repasse_job_dispatcher, name="RepasseDispatch", daemon=True),
         threading.Thread(target=run_watchdog, name="Watchdog", daemon=True),
     ]
 
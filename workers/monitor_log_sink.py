@@ -0,0 +1,377 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pytz
+
+try:
+    from database_manager import LOCAL_DB_PATH
+except ImportError:
+    from .database_manager import LOCAL_DB_PATH
+
+tz = pytz.timezone("America/Sao_Paulo")
+
+# Sink assincrono dos logs de ciclo/evento do monitor medico: o loop so enfileira em memoria,
+# uma thread grava em lote (INSERT multi-linha) por tamanho ou tempo.
+LOG_SINK_ENABLED = str(os.getenv("MONITOR_LOG_SINK_ENABLED", "1")).strip().lower() in ("1", "true", "yes")
+LOG_SINK_BUFFER_MAX = max(100, int(os.getenv("MONITOR_LOG_BUFFER_MAX", "5000")))
+LOG_SINK_FLUSH_ROWS = max(1, int(os.getenv("MONITOR_LOG_FLUSH_ROWS", "200")))
+LOG_SINK_FLUSH_INTERVAL_SEC = max(0.2, float(os.getenv("MONITOR_LOG_FLUSH_INTERVAL_SEC", "2")))
+LOG_SINK_RETRY_MAX_SEC = max(1.0, float(os.getenv("MONITOR_LOG_RETRY_MAX_SEC", "60")))
+# Spool local (JSONL): lotes ainda nao confirmados no banco sobrevivem a crash e sao reenviados no restart.
+LOG_SINK_SPOOL_PATH = str(
+    os.getenv("MONITOR_LOG_SPOOL_PATH", "")
+    or os.path.join(os.path.dirname(LOCAL_DB_PATH), "monitor_medico_log_spool.jsonl")
+).strip()
+LOG_SINK_SPOOL_MAX_BYTES = max(64 * 1024, int(os.getenv("MONITOR_LOG_SPOOL_MAX_BYTES", str(20 * 1024 * 1024))))
+# Estado completo das linhas de ciclo recentes, para que updates posteriores virem upsert da linha inteira.
+LOG_SINK_CYCLE_STATE_MAX = max(16, int(os.getenv("MONITOR_LOG_CYCLE_STATE_MAX", "512")))
+
+
+def _now_str() -> str:
+    return datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class MonitorLogSink:
+    """
+    Buffer em anel + escritor em lote para `monitor_medico_cycle_log` e `monitor_medico_event_log`.
+
+    - `create_cycle_log`, `update_cycle_log` e `log_event` nunca fazem I/O: so enfileiram.
+      Buffer cheio descarta o item mais antigo (evento antes de linha de ciclo) e conta em `dropped`.
+    - Create + updates da mesma linha de ciclo viram um unico upsert com o estado final.
+    - Cada lote vai para o spool (append + fsync) antes do banco; o spool so e truncado depois
+      do commit. Com o banco fora, os lotes se acumulam no spool e sao reenviados em ordem.
+    """
+
+    def __init__(
+        self,
+        db,
+        buffer_max: int = LOG_SINK_BUFFER_MAX,
+        flush_rows: int = LOG_SINK_FLUSH_ROWS,
+        flush_interval_sec: float = LOG_SINK_FLUSH_INTERVAL_SEC,
+        spool_path: Optional[str] = LOG_SINK_SPOOL_PATH,
+        spool_max_bytes: int = LOG_SINK_SPOOL_MAX_BYTES,
+        name: str = "MonitorLogSink",
+    ):
+        self.db = db
+        self.buffer_max = max(1, int(buffer_max))
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval_sec = max(0.05, float(flush_interval_sec))
+        self.spool_path = spool_path or None
+        self.spool_max_bytes = max(1024, int(spool_max_bytes))
+        self.name = name
+        self._events: deque = deque()
+        self._cycle_dirty: "OrderedDict[str, None]" = OrderedDict()
+        self._cycle_state: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cond = threading.Condition(threading.Lock())
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._retry_at = 0.0
+        self._retry_delay = 0.0
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "flushedCycleRows": 0,
+            "flushedEvents": 0,
+            "flushBatches": 0,
+            "flushErrors": 0,
+            "spooledBatches": 0,
+            "spoolDroppedBatches": 0,
+            "replayedBatches": 0,
+            "maxDepth": 0,
+            "lastFlushMs": 0.0,
+            "lastError": None,
+        }
+
+    # --- API do loop (nao bloqueia) ---
+    def create_cycle_log(self, payload: Dict[str, Any]) -> str:
+        log_id = str(payload.get("id") or "")
+        if not log_id:
+            return log_id
+        row = dict(payload)
+        now = _now_str()
+        row.setdefault("created_at", now)
+        row.setdefault("updated_at", row["created_at"])
+        with self._cond:
+            self._cycle_state[log_id] = row
+            self._cycle_state.move_to_end(log_id)
+            self._mark_cycle_dirty_locked(log_id)
+        return log_id
+
+    def update_cycle_log(self, log_id, updates: Dict[str, Any]):
+        if not log_id or not updates:
+            return
+        log_id = str(log_id)
+        with self._cond:
+            row = self._cycle_state.get(log_id)
+            if row is None:
+                # Linha ja saiu do cache de estado: vira UPDATE parcial para nao sobrescrever colunas.
+                row = {"id": log_id, "_partial": True}
+                self._cycle_state[log_id] = row
+            row.update(updates)
+            row["updated_at"] = _now_str()
+            self._cycle_state.move_to_end(log_id)
+            self._mark_cycle_dirty_locked(log_id)
+
+    def log_event(self, payload: Dict[str, Any]):
+        row = dict(payload)
+        row.setdefault("created_at", _now_str())
+        with self._cond:
+            self._events.append(row)
+            self._stats["enqueued"] += 1
+            self._enforce_capacity_locked()
+            self._notify_if_full_locked()
+
+    def _mark_cycle_dirty_locked(self, log_id: str):
+        if log_id not in self._cycle_dirty:
+            self._cycle_dirty[log_id] = None
+            self._stats["enqueued"] += 1
+        while len(self._cycle_state) > LOG_SINK_CYCLE_STATE_MAX:
+            oldest = next(iter(self._cycle_state))
+            if oldest in self._cycle_dirty:
+                break
+            self._cycle_state.popitem(last=False)
+        self._enforce_capacity_locked()
+        self._notify_if_full_locked()
+
+    def _depth_locked(self) -> int:
+        return len(self._events) + len(self._cycle_dirty)
+
+    def _enforce_capacity_locked(self):
+        while self._depth_locked() > self.buffer_max:
+            if self._events:
+                self._events.popleft()
+            else:
+                log_id, _ = self._cycle_dirty.popitem(last=False)
+                self._cycle_state.pop(log_id, None)
+            self._stats["dropped"] += 1
+        self._stats["maxDepth"] = max(self._stats["maxDepth"], self._depth_locked())
+
+    def _notify_if_full_locked(self):
+        if self._depth_locked() >= self.flush_rows:
+            self._cond.notify()
+
+    # --- Thread de escrita ---
+    def start(self) -> "MonitorLogSink":
+        with self._cond:
+            if self._thread is not None:
+                return self
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        # Replay do spool na propria thread: o start do monitor nao espera pelo banco.
+        try:
+            self._replay_spool_on_start()
+        except Exception as exc:
+            self._stats["lastError"] = f"{type(exc).__name__}: {exc}"
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval_sec
+                while not self._stopping and self._depth_locked() < self.flush_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception as exc:
+                self._stats["lastError"] = f"{type(exc).__name__}: {exc}"
+
+    def _drain(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._cond:
+            events = list(self._events)
+            self._events.clear()
+            cycles = [dict(self._cycle_state[log_id]) for log_id in self._cycle_dirty if log_id in self._cycle_state]
+            self._cycle_dirty.clear()
+        return {"cycles": cycles, "events": events}
+
+    def flush(self) -> bool:
+        """Drena o buffer para o spool e tenta gravar tudo o que estiver pendente. True se o banco confirmou."""
+        with self._flush_lock:
+            batch = self._drain()
+            has_batch = bool(batch["cycles"] or batch["events"])
+            if has_batch:
+                self._spool_append(batch)
+            pending = self._spool_read() if self.spool_path else ([batch] if has_batch else [])
+            if not pending:
+                return True
+            if time.monotonic() < self._retry_at:
+                if not self.spool_path and has_batch:
+                    self._requeue(batch)
+                return False
+            started = time.perf_counter()
+            try:
+                cycles, events = self._merge(pending)
+                full_cycles = [row for row in cycles if not row.get("_partial")]
+                partial_cycles = [row for row in cycles if row.get("_partial")]
+                if full_cycles:
+                    self.db.upsert_monitor_medico_cycle_logs(full_cycles)
+                if partial_cycles:
+                    # Caminho que propaga erro: o spool so pode ser truncado se o UPDATE entrou.
+                    self.db.update_monitor_medico_cycle_logs(partial_cycles)
+                if events:
+                    self.db.insert_monitor_medico_event_logs(events)
+            except Exception as exc:
+                self._stats["flushErrors"] += 1
+                self._stats["lastError"] = f"{type(exc).__name__}: {exc}"
+                self._retry_delay = min(LOG_SINK_RETRY_MAX_SEC, max(1.0, self._retry_delay * 2 or 1.0))
+                self._retry_at = time.monotonic() + self._retry_delay
+                if not self.spool_path and has_batch:
+                    self._requeue(batch)
+                return False
+            self._spool_truncate()
+            self._retry_delay = 0.0
+            self._retry_at = 0.0
+            self._stats["flushBatches"] += 1
+            self._stats["flushedCycleRows"] += len(cycles)
+            self._stats["flushedEvents"] += len(events)
+            self._stats["lastFlushMs"] = round((time.perf_counter() - started) * 1000.0, 1)
+            return True
+
+    def _requeue(self, batch: Dict[str, List[Dict[str, Any]]]):
+        # Sem spool: devolve o lote ao buffer (estado atual da linha de ciclo prevalece).
+        with self._cond:
+            for row in reversed(batch["events"]):
+                self._events.appendleft(row)
+            for row in batch["cycles"]:
+                log_id = str(row.get("id") or "")
+                if not log_id:
+                    continue
+                current = self._cycle_state.get(log_id)
+                self._cycle_state[log_id] = row if current is None else self._merge_cycle_row(row, current)
+                self._cycle_dirty[log_id] = None
+            self._enforce_capacity_locked()
+
+    @staticmethod
+    def _merge_cycle_row(older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+        # Campo a campo: um update parcial posterior nao apaga as colunas do estado completo anterior
+        # (nem de um parcial anterior, quando a linha saiu do cache entre os lotes).
+        merged = dict(older)
+        merged.update(newer)
+        if not (older.get("_partial") and newer.get("_partial")):
+            merged.pop("_partial", None)
+        return merged
+
+    @classmethod
+    def _merge(cls, batches):
+        # Lotes em ordem: campos mais recentes de cada linha de ciclo vencem; eventos sao idempotentes por id.
+        cycles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        events: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for batch in batches:
+            for row in batch.get("cycles") or []:
+                log_id = str(row.get("id") or "")
+                previous = cycles.get(log_id)
+                cycles[log_id] = row if previous is None else cls._merge_cycle_row(previous, row)
+            for row in batch.get("events") or []:
+                events[str(row.get("id") or "")] = row
+        cycles.pop("", None)
+        events.pop("", None)
+        return list(cycles.values()), list(events.values())
+
+    # --- Spool local ---
+    def _spool_append(self, batch):
+        if not self.spool_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.spool_path)), exist_ok=True)
+            line = json.dumps(batch, ensure_ascii=False, default=str, separators=(",", ":")) + "\n"
+            with open(self.spool_path, "a", encoding="utf-8") as fh:
+                fh.write(line)
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._stats["spooledBatches"] += 1
+            if os.path.getsize(self.spool_path) > self.spool_max_bytes:
+                self._spool_trim()
+        except Exception as exc:
+            self._stats["lastError"] = f"spool: {type(exc).__name__}: {exc}"
+
+    def _spool_read(self) -> List[Dict[str, Any]]:
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return []
+        batches = []
+        try:
+            with open(self.spool_path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        batches.append(json.loads(line))
+                    except ValueError:
+                        # Ultima linha truncada por crash no meio do append.
+                        continue
+        except Exception as exc:
+            self._stats["lastError"] = f"spool: {type(exc).__name__}: {exc}"
+        return batches
+
+    def _spool_trim(self):
+        # Spool acima do teto: descarta os lotes mais antigos e mantem os recentes.
+        batches = self._spool_read()
+        kept: List[str] = []
+        size = 0
+        for batch in reversed(batches):
+            line = json.dumps(batch, ensure_ascii=False, default=str, separators=(",", ":")) + "\n"
+            if size + len(line) > self.spool_max_bytes // 2:
+                break
+            kept.append(line)
+            size += len(line)
+        self._stats["spoolDroppedBatches"] += len(batches) - len(kept)
+        tmp_path = f"{self.spool_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.writelines(reversed(kept))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.spool_path)
+
+    def _spool_truncate(self):
+        if not self.spool_path:
+            return
+        try:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+        except Exception as exc:
+            self._stats["lastError"] = f"spool: {type(exc).__name__}: {exc}"
+
+    def _replay_spool_on_start(self):
+        pending = self._spool_read()
+        if not pending:
+            return
+        if self.flush():
+            self._stats["replayedBatches"] += len(pending)
+            print(f"   [LOG] {len(pending)} lote(s) de log do monitor reenviado(s) a partir do spool.")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = self._depth_locked()
+        spool_bytes = 0
+        if self.spool_path and os.path.exists(self.spool_path):
+            try:
+                spool_bytes = os.path.getsize(self.spool_path)
+            except OSError:
+                pass
+        return {
+            "depth": depth,
+            "capacity": self.buffer_max,
+            "spoolBytes": spool_bytes,
+            "retryInSec": round(max(0.0, self._retry_at - time.monotonic()), 1),
+            **self._stats,
+        }
@@ -1,12 +1,14 @@
 import time
 import sys
 import os
+import atexit
+import copy
 import hashlib
 import threading
 import uuid
 from datetime import datetime
-from queue import Queue, Empty
 from concurrent.futures import TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
 
 import pytz
 from dotenv import load_dotenv
@@ -18,10 +20,16 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from feegow_core import FeegowSystem
+    from feegow_queue_parser import ParserWorker
     from database_manager import DatabaseManager
+    from http_fanout import TokenBucket, fan_out, get_host_limiter
+    from monitor_log_sink import LOG_SINK_ENABLED, MonitorLogSink
 except ImportError:
     from .feegow_core import FeegowSystem
+    from .feegow_queue_parser import ParserWorker
     from .database_manager import DatabaseManager
+    from .http_fanout import TokenBucket, fan_out, get_host_limiter
+    from .monitor_log_sink import LOG_SINK_ENABLED, MonitorLogSink
 
 load_dotenv()
 
@@ -41,6 +49,21 @@ MONITOR_CYCLE_LOG_RETENTION_DAYS = max(1, int(os.getenv("MONITOR_MEDICO_CYCLE_LO
 MONITOR_EVENT_LOG_RETENTION_DAYS = max(1, int(os.getenv("MONITOR_MEDICO_EVENT_LOG_RETENTION_DAYS", "60")))
 MONITOR_LOG_INCLUDE_HTML_SNIPPET = str(os.getenv("MONITOR_MEDICO_LOG_INCLUDE_HTML_SNIPPET", "0")).strip().lower() in ("1", "true", "yes")
 MONITOR_LOG_HTML_SNIPPET_MAX_CHARS = max(80, int(os.getenv("MONITOR_MEDICO_LOG_HTML_SNIPPET_MAX_CHARS", "400")))
+# Pool de sessoes por unidade: cada unidade tem o proprio cookie jar (clonado de um unico login)
+# e as filas sao buscadas em paralelo, dividindo um token bucket por host.
+UNIT_FETCH_PARALLEL = str(os.getenv("MEDICO_PARALLEL_UNITS", "1")).strip().lower() in ("1", "true", "yes")
+UNIT_FETCH_RATE_PER_SEC = max(0.0, float(os.getenv("MEDICO_FETCH_RATE_PER_SEC", "4")))
+UNIT_SWITCH_SETTLE_SEC = max(0.0, float(os.getenv("MEDICO_UNIT_SWITCH_SETTLE_SEC", "1.0")))
+CYCLE_INTERVAL_SEC = max(1.0, float(os.getenv("MEDICO_CYCLE_INTERVAL_SEC", "15")))
+# Cookies de afinidade do ASP guardam a unidade ativa no servidor: nao sao clonados, para que
+# cada clone receba a propria sessao e o MudaLocal de uma unidade nao afete as outras.
+UNIT_SESSION_DROP_COOKIE_PREFIXES = tuple(
+    prefix.strip().lower()
+    for prefix in str(os.getenv("MEDICO_UNIT_SESSION_DROP_COOKIES", "ASPSESSIONID")).split(",")
+    if prefix.strip()
+)
+# Grava o HTML bruto das filas para replay offline (ver --benchmark).
+QUEUE_CAPTURE_DIR = str(os.getenv("MEDICO_QUEUE_CAPTURE_DIR", "") or "").strip()
 
 UNIDADES = [
     ("Ouro Verde", 2),
@@ -126,38 +149,139 @@ def _serialize_fetch_meta(meta, html=None):
     return payload
 
 
-def _parse_html_with_timeout(sistema, html, nome_unidade, timeout_sec):
-    result_queue = Queue(maxsize=1)
+# Worker persistente do parse: o prazo e conferido dentro do parse (ParseDeadlineExceeded), entao um
+# timeout libera a thread em vez de deixar uma thread abandonada por chamada.
+_PARSER_WORKER = ParserWorker(name="MedParse")
 
-    def _target():
-        try:
-            parsed = sistema.parse_html(html, nome_unidade)
-            result_queue.put(("ok", parsed), timeout=1)
-        except Exception as exc:
-            try:
-                result_queue.put(("err", exc), timeout=1)
-            except Exception:
-                pass
 
-    worker = threading.Thread(
-        target=_target,
-        name=f"MedParse-{nome_unidade}",
-        daemon=True,
-    )
-    worker.start()
-    worker.join(timeout=timeout_sec)
+def _parse_html_with_timeout(sistema, html, nome_unidade, timeout_sec):
+    return _PARSER_WORKER.run(sistema.parse_html, html, nome_unidade, timeout_sec=timeout_sec)
 
-    if worker.is_alive():
-        raise FutureTimeoutError(f"parse_html excedeu {timeout_sec}s")
 
+def _capture_queue_html(uid, html):
+    if not QUEUE_CAPTURE_DIR or not html:
+        return
     try:
-        status, payload = result_queue.get_nowait()
-    except Empty:
-        raise RuntimeError("parse_html terminou sem retornar resultado")
+        os.makedirs(QUEUE_CAPTURE_DIR, exist_ok=True)
+        name = f"unit_{uid}_{datetime.now(tz).strftime('%Y%m%d_%H%M%S')}.html"
+        tmp_path = os.path.join(QUEUE_CAPTURE_DIR, f".{name}.tmp")
+        with open(tmp_path, "wb") as fh:
+            fh.write(str(html).encode("iso-8859-1", errors="ignore"))
+        os.replace(tmp_path, os.path.join(QUEUE_CAPTURE_DIR, name))
+    except Exception as exc:
+        print(f"   [WARN] Falha ao gravar captura da fila {uid}: {exc}")
 
-    if status == "err":
-        raise payload
-    return payload
+
+class UnitSessionPool:
+    """
+    Uma sessao autenticada por unidade, clonada do cookie jar de um unico login.
+
+    Cada clone faz o MudaLocal uma vez e depois so busca a propria fila, entao as
+    unidades sao coletadas em paralelo sem disputar o contexto de unidade de uma
+    sessao compartilhada. Se os clones nao mantiverem a autenticacao (login preso
+    ao cookie de sessao do ASP), o pool cai para o modo serial na sessao principal.
+    """
+
+    def __init__(self, units, system_factory=FeegowSystem, parallel=None, limiter=None, settle_sec=None):
+        self.units = list(units)
+        self._factory = system_factory
+        self.master = system_factory()
+        self.mode = "pool" if (UNIT_FETCH_PARALLEL if parallel is None else parallel) else "serial"
+        self.settle_sec = UNIT_SWITCH_SETTLE_SEC if settle_sec is None else max(0.0, float(settle_sec))
+        self.limiter = limiter or get_host_limiter(
+            urlparse(self.master.base_url).netloc,
+            UNIT_FETCH_RATE_PER_SEC,
+            burst=max(1, len(self.units)),
+        )
+        self._systems = {}
+        self._bound = set()
+        self._master_lock = threading.Lock()
+
+    def login(self):
+        self._systems = {}
+        self._bound = set()
+        if not self.master.login():
+            return False
+        if self.mode == "pool":
+            for _, uid in self.units:
+                self._systems[uid] = self._clone_master()
+        return True
+
+    def _clone_master(self):
+        clone = self._factory()
+        clone.base_url = self.master.base_url
+        clone.session.headers.update(self.master.session.headers)
+        for cookie in self.master.session.cookies:
+            if str(cookie.name or "").lower().startswith(UNIT_SESSION_DROP_COOKIE_PREFIXES):
+                continue
+            clone.session.cookies.set_cookie(copy.copy(cookie))
+        return clone
+
+    def _fetch_on(self, sistema, uid, switch):
+        started = time.monotonic()
+        result = {"uid": uid, "html": None, "meta": {}, "switch_failed": False, "elapsed_sec": 0.0}
+        if switch:
+            self.limiter.acquire()
+            if not sistema.trocar_unidade(uid):
+                result["switch_failed"] = True
+                result["meta"] = {"reason": "trocar_unidade_failed"}
+                result["elapsed_sec"] = round(time.monotonic() - started, 3)
+                return result
+            if self.settle_sec > 0:
+                time.sleep(self.settle_sec)
+        self.limiter.acquire()
+        html = sistema.obter_fila_raw()
+        result["html"] = html
+        result["meta"] = dict(getattr(sistema, "last_queue_fetch_meta", {}) or {})
+        result["elapsed_sec"] = round(time.monotonic() - started, 3)
+        _capture_queue_html(uid, html)
+        return result
+
+    def _fetch_unit(self, uid):
+        if self.mode == "pool" and uid in self._systems:
+            result = self._fetch_on(self._systems[uid], uid, switch=uid not in self._bound)
+            if result["html"] is not None:
+                self._bound.add(uid)
+            elif not result["switch_failed"]:
+                # Sessao do clone caiu: proxima busca refaz o MudaLocal.
+                self._bound.discard(uid)
+            return result
+        with self._master_lock:
+            return self._fetch_on(self.master, uid, switch=True)
+
+    def _clones_lost_auth(self, results, targets):
+        if not results or any(r["html"] is not None or r["switch_failed"] for r in results.values()):
+            return False
+        if not all(str(r["meta"].get("reason") or "") in ("redirect_login", "login_html") for r in results.values()):
+            return False
+        with self._master_lock:
+            probe = self._fetch_on(self.master, targets[0], switch=True)
+        return probe["html"] is not None
+
+    def fetch_all(self, uids=None):
+        """Busca a fila de todas as unidades (ou de `uids`) em paralelo; devolve {uid: resultado}."""
+        targets = [uid for _, uid in self.units if uids is None or uid in uids]
+        fresh_clones = self.mode == "pool" and not any(uid in self._bound for uid in targets)
+        workers = len(targets) if self.mode == "pool" else 1
+        results = {}
+        for res in fan_out([(uid, lambda uid=uid: self._fetch_unit(uid)) for uid in targets], max_workers=workers):
+            if res.ok:
+                results[res.key] = res.value
+            else:
+                results[res.key] = {
+                    "uid": res.key,
+                    "html": None,
+                    "meta": {"reason": f"exception:{res.error.__class__.__name__}"},
+                    "switch_failed": False,
+                    "elapsed_sec": round(res.elapsed_sec, 3),
+                }
+        if fresh_clones and self._clones_lost_auth(results, targets):
+            print("   [POOL] Clones de sessao nao mantem autenticacao; usando coleta serial na sessao principal.")
+            self.mode = "serial"
+            self._systems = {}
+            self._bound = set()
+            return self.fetch_all(uids)
+        return results
 
 
 def run_medico_prewarm():
@@ -168,11 +292,11 @@ def run_medico_prewarm():
     - leitura/parsing básico da fila
     """
     db = DatabaseManager()
-    sistema = FeegowSystem()
+    pool = UnitSessionPool(UNIDADES)
     ts = datetime.now(tz).strftime("%H:%M:%S")
     db.update_heartbeat("monitor_medico", "RUNNING", "Prewarm: iniciando login e teste de coleta")
 
-    if not sistema.login():
+    if not pool.login():
         msg = "Prewarm: falha de login no Feegow"
         print(f"[{ts}] [PREWARM] {msg}")
         db.update_heartbeat("monitor_medico", "WARNING", msg)
@@ -180,17 +304,18 @@ def run_medico_prewarm():
 
     ok_units = 0
     results = []
+    fetches = pool.fetch_all()
     for nome_unidade, uid in UNIDADES:
+        fetch = fetches.get(uid) or {}
         try:
-            if not sistema.trocar_unidade(uid):
+            if fetch.get("switch_failed"):
                 results.append(f"{nome_unidade}:troca_falhou")
                 continue
-            time.sleep(0.6)
-            html = sistema.obter_fila_raw()
+            html = fetch.get("html")
             if html is None:
                 results.append(f"{nome_unidade}:sessao_invalida")
                 continue
-            df = _parse_html_with_timeout(sistema, html, nome_unidade, max(10, PARSE_TIMEOUT_SEC))
+            df = _parse_html_with_timeout(pool.master, html, nome_unidade, max(10, PARSE_TIMEOUT_SEC))
             ok_units += 1
             results.append(f"{nome_unidade}:{len(df)}")
         except Exception as e:
@@ -211,7 +336,8 @@ def run_medico_prewarm():
 def run_monitor_medico():
     print("=== MONITOR MEDICO (COM HISTORICO) INICIADO ===")
 
-    sistema = FeegowSystem()
+    pool = UnitSessionPool(UNIDADES)
+    sistema = pool.master
     db = DatabaseManager()
     sessao_ativa = False
     last_finalize_ts = 0
@@ -223,10 +349,22 @@ def run_monitor_medico():
     last_unit_counts = {nome: None for nome, _ in UNIDADES}
     unit_missing_tracker = {nome: {} for nome, _ in UNIDADES}
     last_midnight_finalize_date = None
+    last_sink_dropped = 0
+
+    # Telemetria de ciclo/evento vai para o sink em memoria; o loop nunca espera pelo banco.
+    log_sink = MonitorLogSink(db).start() if LOG_SINK_ENABLED else None
+    if log_sink is not None:
+        atexit.register(log_sink.stop)
+
+    def update_cycle_log(log_id, updates):
+        if log_sink is not None:
+            log_sink.update_cycle_log(log_id, updates)
+        else:
+            db.update_monitor_medico_cycle_log(log_id, updates)
 
     def log_event(cycle_id, unit_name, unit_id, event_type, severity="info", payload=None, patient_hash_id=None, patient_name=None):
         try:
-            db.insert_monitor_medico_event_log({
+            (log_sink.log_event if log_sink is not None else db.insert_monitor_medico_event_log)({
                 "id": _make_log_id("mmev"),
                 "cycle_id": cycle_id,
                 "unit_name": unit_name,
@@ -242,7 +380,7 @@ def run_monitor_medico():
 
     def create_unit_cycle_log(cycle_id, cycle_started_at, unit_name, unit_id, session_was_active, login_performed=False, login_success=False):
         log_id = _make_log_id("mmcy")
-        db.create_monitor_medico_cycle_log({
+        (log_sink.create_cycle_log if log_sink is not None else db.create_monitor_medico_cycle_log)({
             "id": log_id,
             "cycle_id": cycle_id,
             "cycle_started_at": cycle_started_at,
@@ -265,7 +403,25 @@ def run_monitor_medico():
         if heartbeat_detail:
             db.update_heartbeat("monitor_medico", "WARNING", heartbeat_detail)
 
+    def record_fetch(unit_cycle_log_id, fetch, extra=None):
+        html = fetch["html"]
+        fetch_meta = _serialize_fetch_meta(fetch["meta"], html)
+        queue_fetch_status = str(fetch_meta.get("reason") or "ok")
+        if html is not None and sistema._looks_like_empty_queue_html(str(html)):
+            queue_fetch_status = "empty_valid"
+        fetch["fetch_meta"] = fetch_meta
+        fetch["queue_fetch_status"] = queue_fetch_status
+        update_cycle_log(
+            unit_cycle_log_id,
+            {
+                **(extra or {}),
+                "queue_fetch_status": queue_fetch_status,
+                "queue_fetch_meta_json": fetch_meta,
+            },
+        )
+
     while True:
+        cycle_started_ts = time.monotonic()
         try:
             db.update_heartbeat("monitor_medico", "RUNNING", "Iniciando ciclo...")
             cycle_started_at = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
@@ -314,7 +470,7 @@ def run_monitor_medico():
                 print("   [AUTH] Realizando login...")
                 log_event(cycle_id, None, None, "login_started", "info", {"reason": "session_inactive"})
                 login_performed_this_cycle = True
-                if sistema.login():
+                if pool.login():
                     sessao_ativa = True
                     login_success_this_cycle = True
                     last_login_ts = time.time()
@@ -340,9 +496,14 @@ def run_monitor_medico():
             auth_issue_detected = False
             unidades_processadas = 0
 
+            db.update_heartbeat(
+                "monitor_medico",
+                "RUNNING",
+                f"Coletando {len(UNIDADES)} unidade(s) ({pool.mode})...",
+            )
+            unit_cycle_log_ids = {}
             for nome_unidade, uid in UNIDADES:
-                db.update_heartbeat("monitor_medico", "RUNNING", f"Coletando {nome_unidade}...")
-                unit_cycle_log_id = create_unit_cycle_log(
+                unit_cycle_log_ids[uid] = create_unit_cycle_log(
                     cycle_id,
                     cycle_started_at,
                     nome_unidade,
@@ -352,9 +513,82 @@ def run_monitor_medico():
                     login_success=login_success_this_cycle,
                 )
 
-                if not sistema.trocar_unidade(uid):
+            fetches = pool.fetch_all()
+            for nome_unidade, uid in UNIDADES:
+                fetch = fetches[uid]
+                if fetch["switch_failed"]:
+                    continue
+                record_fetch(unit_cycle_log_ids[uid], fetch)
+
+            # Sessao invalida em qualquer unidade: um unico re-login e nova busca so das afetadas.
+            invalid_units = [
+                (nome_unidade, uid)
+                for nome_unidade, uid in UNIDADES
+                if fetches[uid]["html"] is None and not fetches[uid]["switch_failed"]
+            ]
+            for nome_unidade, uid in invalid_units:
+                fetch_meta = fetches[uid]["fetch_meta"]
+                log_event(
+                    cycle_id,
+                    nome_unidade,
+                    uid,
+                    "session_invalid_detected",
+                    "warning",
+                    {"fetch_meta": fetch_meta},
+                )
+                warn_throttled(
+                    f"sessao_{nome_unidade}",
+                    f"[{timestamp}] [WARN] Sessao invalida em {nome_unidade}. Re-login imediato. {_format_fetch_meta(fetches[uid]['meta'])}",
+                    f"Sessao invalida em {nome_unidade}; reautenticando",
+                )
+                update_cycle_log(
+                    unit_cycle_log_ids[uid],
+                    {
+                        "session_was_active": False,
+                        "login_performed": True,
+                    },
+                )
+
+            if invalid_units:
+                sessao_ativa = False
+                relogin_ok = pool.login()
+                if relogin_ok:
+                    sessao_ativa = True
+                    last_login_ts = time.time()
+                    last_login_date = datetime.now(tz).date()
+                    refetches = pool.fetch_all([uid for _, uid in invalid_units])
+                for nome_unidade, uid in invalid_units:
+                    if not relogin_ok:
+                        log_event(
+                            cycle_id,
+                            nome_unidade,
+                            uid,
+                            "relogin_failed",
+                            "error",
+                            {"reason": "session_invalid"},
+                        )
+                        continue
+                    log_event(
+                        cycle_id,
+                        nome_unidade,
+                        uid,
+                        "relogin_success",
+                        "info",
+                        {"reason": "session_invalid"},
+                    )
+                    # Falha de troca apos re-login conta como falha de sessao, nao como unidade pulada.
+                    fetch = dict(refetches[uid], switch_failed=False)
+                    fetches[uid] = fetch
+                    if not refetches[uid]["switch_failed"]:
+                        record_fetch(unit_cycle_log_ids[uid], fetch, {"login_success": True})
+
+            for nome_unidade, uid in UNIDADES:
+                fetch = fetches[uid]
+                unit_cycle_log_id = unit_cycle_log_ids[uid]
+
+                if fetch["switch_failed"]:
                     print(f"[{timestamp}] Falha ao trocar para {nome_unidade} ({uid})")
-                    db.update_monitor_medico_cycle_log(
+                    update_cycle_log(
                         unit_cycle_log_id,
                         {
                             "cycle_result": "skipped",
@@ -372,105 +606,28 @@ def run_monitor_medico():
                     continue
                 unidades_processadas += 1
 
-                time.sleep(1.0)
-                html = sistema.obter_fila_raw()
-                fetch_meta = _serialize_fetch_meta(getattr(sistema, "last_queue_fetch_meta", {}), html)
-                queue_fetch_status = str(fetch_meta.get("reason") or "ok")
-                if html is not None and sistema._looks_like_empty_queue_html(str(html)):
-                    queue_fetch_status = "empty_valid"
-
-                db.update_monitor_medico_cycle_log(
-                    unit_cycle_log_id,
-                    {
-                        "queue_fetch_status": queue_fetch_status,
-                        "queue_fetch_meta_json": fetch_meta,
-                    },
-                )
+                html = fetch["html"]
                 if html is None:
-                    meta_info = _format_fetch_meta(getattr(sistema, "last_queue_fetch_meta", {}))
-                    log_event(
-                        cycle_id,
-                        nome_unidade,
-                        uid,
-                        "session_invalid_detected",
-                        "warning",
-                        {"fetch_meta": fetch_meta},
-                    )
+                    auth_issue_detected = True
                     warn_throttled(
-                        f"sessao_{nome_unidade}",
-                        f"[{timestamp}] [WARN] Sessao invalida em {nome_unidade}. Re-login imediato. {meta_info}",
-                        f"Sessao invalida em {nome_unidade}; reautenticando",
+                        f"relogin_falha_{nome_unidade}",
+                        f"[{timestamp}] [WARN] Re-login falhou em {nome_unidade}; unidade fica para o proximo ciclo. {_format_fetch_meta(fetch['meta'])}",
+                        f"Re-login falhou em {nome_unidade}; ciclo interrompido",
                     )
-                    sessao_ativa = False
-
-                    db.update_monitor_medico_cycle_log(
+                    update_cycle_log(
                         unit_cycle_log_id,
                         {
-                            "session_was_active": False,
-                            "login_performed": True,
+                            "cycle_result": "auth_retry",
+                            "message": "Re-login falhou; ciclo interrompido",
                         },
                     )
-
-                    if sistema.login():
-                        sessao_ativa = True
-                        last_login_ts = time.time()
-                        last_login_date = datetime.now(tz).date()
-                        log_event(
-                            cycle_id,
-                            nome_unidade,
-                            uid,
-                            "relogin_success",
-                            "info",
-                            {"reason": "session_invalid"},
-                        )
-                        if sistema.trocar_unidade(uid):
-                            time.sleep(0.8)
-                            html = sistema.obter_fila_raw()
-                            fetch_meta = _serialize_fetch_meta(getattr(sistema, "last_queue_fetch_meta", {}), html)
-                            queue_fetch_status = str(fetch_meta.get("reason") or "ok")
-                            if html is not None and sistema._looks_like_empty_queue_html(str(html)):
-                                queue_fetch_status = "empty_valid"
-                            db.update_monitor_medico_cycle_log(
-                                unit_cycle_log_id,
-                                {
-                                    "login_success": True,
-                                    "queue_fetch_status": queue_fetch_status,
-                                    "queue_fetch_meta_json": fetch_meta,
-                                },
-                            )
-                        else:
-                            html = None
-                    else:
-                        log_event(
-                            cycle_id,
-                            nome_unidade,
-                            uid,
-                            "relogin_failed",
-                            "error",
-                            {"reason": "session_invalid"},
-                        )
-                        html = None
-
-                    if html is None:
-                        auth_issue_detected = True
-                        meta_info = _format_fetch_meta(getattr(sistema, "last_queue_fetch_meta", {}))
-                        warn_throttled(
-                            f"relogin_falha_{nome_unidade}",
-                            f"[{timestamp}] [WARN] Re-login falhou em {nome_unidade}; encerrando ciclo para retry. {meta_info}",
-                            f"Re-login falhou em {nome_unidade}; ciclo interrompido",
-                        )
-                        db.update_monitor_medico_cycle_log(
-                            unit_cycle_log_id,
-                            {
-                                "cycle_result": "auth_retry",
-                                "message": "Re-login falhou; ciclo interrompido",
-                            },
-                        )
-                        break
+                    continue
+                fetch_meta = fetch.get("fetch_meta") or _serialize_fetch_meta(fetch["meta"], html)
+                queue_fetch_status = fetch.get("queue_fetch_status") or str(fetch_meta.get("reason") or "ok")
 
                 try:
                     df = _parse_html_with_timeout(sistema, html, nome_unidade, PARSE_TIMEOUT_SEC)
-                    db.update_monitor_medico_cycle_log(
+                    update_cycle_log(
                         unit_cycle_log_id,
                         {"parse_status": "ok"},
                     )
@@ -488,7 +645,7 @@ def run_monitor_medico():
                         f"[{timestamp}] [WARN] {nome_unidade}: parse_html excedeu {PARSE_TIMEOUT_SEC}s; unidade ignorada no ciclo.",
                         f"Timeout parse {nome_unidade} ({PARSE_TIMEOUT_SEC}s)",
                     )
-                    db.update_monitor_medico_cycle_log(
+                    update_cycle_log(
                         unit_cycle_log_id,
                         {
                             "parse_status": "timeout",
@@ -511,7 +668,7 @@ def run_monitor_medico():
                         f"[{timestamp}] [WARN] {nome_unidade}: erro no parse_html: {parse_err}",
                         f"Erro parse {nome_unidade}",
                     )
-                    db.update_monitor_medico_cycle_log(
+                    update_cycle_log(
                         unit_cycle_log_id,
                         {
                             "parse_status": "error",
@@ -542,7 +699,7 @@ def run_monitor_medico():
                 else:
                     hash_ids_atuais = set()
 
-                db.update_monitor_medico_cycle_log(
+                update_cycle_log(
                     unit_cycle_log_id,
                     {
                         "patients_detected_count": qtd_unidade,
@@ -578,7 +735,7 @@ def run_monitor_medico():
                         f"[{timestamp}] [WARN] {nome_unidade}: sem hash_ids_atuais; finalizacao pausada por seguranca.",
                         f"{nome_unidade}: hash_ids ausentes",
                     )
-                    db.update_monitor_medico_cycle_log(
+                    update_cycle_log(
                         unit_cycle_log_id,
                         {
                             "cycle_result": "warning",
@@ -604,7 +761,7 @@ def run_monitor_medico():
                         f"[{timestamp}] [WARN] {nome_unidade}: coleta sem resposta confiavel; finalizacao pausada por seguranca.",
                         f"{nome_unidade}: coleta inconfiavel",
                     )
-                    db.update_monitor_medico_cycle_log(
+                    update_cycle_log(
                         unit_cycle_log_id,
                         {
                             "cycle_result": "warning",
@@ -714,7 +871,7 @@ def run_monitor_medico():
                             f"{nome_unidade}: coleta vazia em confirmacao",
                         )
 
-                    db.update_monitor_medico_cycle_log(
+                    update_cycle_log(
                         unit_cycle_log_id,
                         {
                             "active_rows_before_count": len(rows_ativos_local),
@@ -750,7 +907,7 @@ def run_monitor_medico():
                                 "minutes": HARD_STALE_MINUTES,
                             },
                         )
-                        db.update_monitor_medico_cycle_log(
+                        update_cycle_log(
                             unit_cycle_log_id,
                             {
                                 "finalized_hard_stale_count": finalized_hard_stale_count,
@@ -764,6 +921,27 @@ def run_monitor_medico():
             if FINALIZE_INTERVAL_SEC <= 0 or (time.time() - last_finalize_ts) >= FINALIZE_INTERVAL_SEC:
                 last_finalize_ts = time.time()
 
+            if log_sink is not None:
+                sink_stats = log_sink.stats()
+                if sink_stats["dropped"] > last_sink_dropped:
+                    warn_throttled(
+                        "log_sink_dropped",
+                        (
+                            f"[{timestamp}] [WARN] Buffer de logs cheio: {sink_stats['dropped'] - last_sink_dropped} "
+                            f"item(ns) descartado(s) (fila={sink_stats['depth']}/{sink_stats['capacity']}, "
+                            f"spool={sink_stats['spoolBytes']}B)."
+                        ),
+                    )
+                    last_sink_dropped = sink_stats["dropped"]
+                elif sink_stats["retryInSec"] > 0:
+                    warn_throttled(
+                        "log_sink_retry",
+                        (
+                            f"[{timestamp}] [WARN] Gravacao de logs falhando; spool={sink_stats['spoolBytes']}B, "
+                            f"erro={sink_stats['lastError']}"
+                        ),
+                    )
+
             if auth_issue_detected:
                 consecutive_zero_cycles = 0
                 db.update_heartbeat(
@@ -843,8 +1021,133 @@ def run_monitor_medico():
                 pass
             sessao_ativa = False
 
-        time.sleep(15)
+        # Cadencia fixa: o tempo gasto na coleta sai do intervalo entre ciclos.
+        time.sleep(max(1.0, CYCLE_INTERVAL_SEC - (time.monotonic() - cycle_started_ts)))
+
+
+def run_queue_replay_benchmark(capture_dir, cycles=3, latency_sec=0.3, settle_sec=None):
+    """
+    Replay offline do HTML de fila capturado (MEDICO_QUEUE_CAPTURE_DIR) num stub HTTP local
+    que imita o MudaLocal por sessao do ASP. Compara a coleta serial na sessao unica (modo
+    antigo) com o pool por unidade. Nao faz login real nem grava no banco.
+    """
+    import json
+    from http_stub import FixtureStubServer
+
+    captures = {}
+    for name in sorted(os.listdir(capture_dir)):
+        parts = name.split("_")
+        if not name.endswith(".html") or len(parts) < 2 or parts[0] != "unit":
+            continue
+        with open(os.path.join(capture_dir, name), "rb") as fh:
+            captures.setdefault(int(parts[1].split(".")[0]), []).append(fh.read())
+    units = [(nome, uid) for nome, uid in UNIDADES if uid in captures]
+    if not units:
+        raise SystemExit(f"Nenhuma captura unit_<id>_*.html em {capture_dir}")
+
+    settle = UNIT_SWITCH_SETTLE_SEC if settle_sec is None else float(settle_sec)
+    session_units = {}
+    served_counts = {}
+    state_lock = threading.Lock()
+
+    def _handler(method, path, params, raw_body, headers):
+        cookies = dict(
+            part.strip().split("=", 1) for part in str(headers.get("Cookie") or "").split(";") if "=" in part
+        )
+        if cookies.get("FeegowAuth") != "1":
+            return 200, "<html>p=login name=\"password\" btnlogar</html>", "text/html"
+        sid = next((v for k, v in cookies.items() if k.startswith("ASPSESSIONID")), None)
+        set_cookie = {}
+        if not sid:
+            sid = uuid.uuid4().hex[:16]
+            set_cookie = {"Set-Cookie": f"ASPSESSIONIDBENCH={sid}; Path=/"}
+        with state_lock:
+            if params.get("P") == "MudaLocal":
+                session_units[sid] = int(params.get("MudaLocal") or 0)
+                return 200, "ok", "text/html", set_cookie
+            uid = session_units.get(sid)
+            pages = captures.get(uid) or []
+            if not pages:
+                return 200, "<html></html>", "text/html", set_cookie
+            idx = served_counts.get(uid, 0)
+            served_counts[uid] = idx + 1
+        return 200, pages[idx % len(pages)], "text/html; charset=iso-8859-1", set_cookie
+
+    timings = {}
+    mismatches = {}
+    with FixtureStubServer(latency_sec=latency_sec, handler=_handler) as stub:
+
+        class _ReplaySystem(FeegowSystem):
+            def __init__(self):
+                super().__init__()
+                self.base_url = stub.base_url
+
+            def login(self):
+                self.session.cookies.set("FeegowAuth", "1")
+                self.session.cookies.set("ASPSESSIONIDBENCH", "master")
+                return True
+
+        for label, parallel in (("serial", False), ("pool", True)):
+            served_counts.clear()
+            pool = UnitSessionPool(
+                units,
+                system_factory=_ReplaySystem,
+                parallel=parallel,
+                limiter=TokenBucket(UNIT_FETCH_RATE_PER_SEC, burst=max(1, len(units))),
+                settle_sec=settle,
+            )
+            pool.login()
+            per_cycle = []
+            mismatches[label] = 0
+            for _ in range(max(1, int(cycles))):
+                started = time.perf_counter()
+                fetches = pool.fetch_all()
+                per_cycle.append(round(time.perf_counter() - started, 3))
+                for _, uid in units:
+                    html = fetches[uid]["html"]
+                    expected = [page.decode("iso-8859-1", errors="ignore") for page in captures[uid]]
+                    if html is None or html not in expected:
+                        mismatches[label] += 1
+            timings[label] = {"mode": pool.mode, "cycles_sec": per_cycle, "total_sec": round(sum(per_cycle), 3)}
+        peak = stub.max_in_flight
+
+    summary = {
+        "units": [uid for _, uid in units],
+        "captures": sum(len(pages) for pages in captures.values()),
+        "latency_sec": latency_sec,
+        "settle_sec": settle,
+        "rate_per_sec": UNIT_FETCH_RATE_PER_SEC,
+        "peak_in_flight": peak,
+        "serial": timings["serial"],
+        "pool": timings["pool"],
+        "mismatches": mismatches,
+        "speedup_steady": (
+            round(timings["serial"]["cycles_sec"][-1] / timings["pool"]["cycles_sec"][-1], 2)
+            if timings["pool"]["cycles_sec"][-1]
+            else None
+        ),
+    }
+    print(f"[monitor_medico] benchmark {json.dumps(summary, ensure_ascii=False)}")
+    return summary
 
 
 if __name__ == "__main__":
-    run_monitor_medico()
+    args = sys.argv[1:]
+    if "--benchmark" in args:
+        capture_arg = QUEUE_CAPTURE_DIR
+        cycles_arg = 3
+        latency_ms = 300.0
+        for i, token in enumerate(args):
+            if token.startswith("--captures="):
+                capture_arg = token.split("=", 1)[1].strip()
+            elif token == "--captures" and i + 1 < len(args):
+                capture_arg = str(args[i + 1] or "").strip()
+            elif token.startswith("--cycles="):
+                cycles_arg = int(token.split("=", 1)[1].strip() or 3)
+            elif token.startswith("--latency-ms="):
+                latency_ms = float(token.split("=", 1)[1].strip() or 0)
+        if not capture_arg:
+            raise SystemExit("--benchmark exige --captures=DIR (gravado com MEDICO_QUEUE_CAPTURE_DIR).")
+        run_queue_replay_benchmark(capture_arg, cycles=cycles_arg, latency_sec=latency_ms / 1000.0)
+    else:
+        run_monitor_medico()
@@ -2,6 +2,8 @@ import contextlib
 import errno
 import os
 import random
+import signal
+import tempfile
 import threading
 import time
 from contextlib import ExitStack
@@ -65,11 +67,14 @@ def _is_resource_temp_error(exc: Exception) -> bool:
     return err_no == errno.EAGAIN
 
 
-@contextlib.contextmanager
-def _session_slot(startup_label: str):
+def _acquire_session_slot(startup_label: str):
     global _ACTIVE_SESSION_COUNT
     wait_started_at = time.time()
-    _SESSION_SEMAPHORE.acquire()
+    # Navegadores quentes ocupam slot: sem slot livre, encerra um ocioso de outra thread por vez.
+    acquired = _SESSION_SEMAPHORE.acquire(blocking=False)
+    while not acquired:
+        _BROKER.evict_idle_warm()
+        acquired = _SESSION_SEMAPHORE.acquire(timeout=1.0)
     waited_sec = time.time() - wait_started_at
 
     with _SESSION_LOCK:
@@ -83,15 +88,31 @@ def _session_slot(startup_label: str):
             f"active={active_count}/{PLAYWRIGHT_MAX_CONCURRENT_SESSIONS}"
         )
 
+
+
+def _release_session_slot():
+    global _ACTIVE_SESSION_COUNT
+    with _SESSION_LOCK:
+        _ACTIVE_SESSION_COUNT = max(0, _ACTIVE_SESSION_COUNT - 1)
+    _SESSION_SEMAPHORE.release()
+
+
+@contextlib.contextmanager
+def _session_slot(startup_label: str):
+    _acquire_session_slot(startup_label)
     try:
         yield
     finally:
-        with _SESSION_LOCK:
-            _ACTIVE_SESSION_COUNT = max(0, _ACTIVE_SESSION_COUNT - 1)
-        _SESSION_SEMAPHORE.release()
+        _release_session_slot()
 
 
-def _start_browser_with_retry(*, headless: bool, launch_args=None, startup_label: str = "playwright_startup"):
+def _start_browser_with_retry(
+    *,
+    headless: bool,
+    launch_args=None,
+    startup_label: str = "playwright_startup",
+    with_playwright: bool = False,
+):
     attempts = max(1, int(os.getenv("PLAYWRIGHT_STARTUP_MAX_ATTEMPTS", "4")))
     base_delay = max(0.5, float(os.getenv("PLAYWRIGHT_STARTUP_RETRY_BASE_SEC", "2.0")))
     jitter = max(0.0, float(os.getenv("PLAYWRIGHT_STARTUP_RETRY_JITTER_SEC", "0.5")))
@@ -105,6 +126,8 @@ def _start_browser_with_retry(*, headless: bool, launch_args=None, startup_label
                 with _interprocess_lock(startup_label):
                     playwright = stack.enter_context(sync_playwright())
                     browser = playwright.chromium.launch(headless=headless, args=merged_args)
+            if with_playwright:
+                return stack, browser, playwright
             return stack, browser
         except Exception as exc:
             stack.close()
@@ -123,6 +146,9 @@ def _start_browser_with_retry(*, headless: bool, launch_args=None, startup_label
 
 @contextlib.contextmanager
 def chromium_session(*, headless: bool = True, launch_args=None, startup_label: str = "playwright_startup"):
+    # Um segundo sync_playwright na mesma thread falha ("Sync API inside the asyncio loop"):
+    # fecha antes o navegador quente que o broker mantem nesta thread.
+    _BROKER.close_thread_browser()
     with _session_slot(startup_label):
         stack, browser = _start_browser_with_retry(
             headless=headless,
@@ -137,3 +163,449 @@ def chromium_session(*, headless: bool = True, launch_args=None, startup_label:
             except Exception:
                 pass
             stack.close()
+
+
+# --- Broker de navegadores aquecidos ---
+# A API sync do Playwright fica presa a thread que a criou, entao cada thread mantem o proprio
+# navegador quente e cada sessao recebe um contexto isolado (cookies/armazenamento proprios).
+# O navegador quente continua ocupando o slot de PLAYWRIGHT_MAX_CONCURRENT_SESSIONS ate ser descartado.
+PLAYWRIGHT_BROWSER_REUSE = str(os.getenv("PLAYWRIGHT_BROWSER_REUSE", "1")).strip().lower() in ("1", "true", "yes")
+PLAYWRIGHT_BROWSER_MAX_CONTEXTS = max(1, int(os.getenv("PLAYWRIGHT_BROWSER_MAX_CONTEXTS", "25")))
+PLAYWRIGHT_BROWSER_MAX_RSS_MB = max(0, int(os.getenv("PLAYWRIGHT_BROWSER_MAX_RSS_MB", "1200")))
+PLAYWRIGHT_BROWSER_IDLE_SEC = max(0, int(os.getenv("PLAYWRIGHT_BROWSER_IDLE_SEC", "900")))
+PLAYWRIGHT_BROWSER_MAX_WARM = max(0, int(os.getenv("PLAYWRIGHT_BROWSER_MAX_WARM", "2")))
+PLAYWRIGHT_STORAGE_STATE_DIR = os.getenv(
+    "PLAYWRIGHT_STORAGE_STATE_DIR",
+    os.path.join(tempfile.gettempdir(), "playwright_storage_state"),
+)
+PLAYWRIGHT_STORAGE_STATE_TTL_SEC = max(0, int(os.getenv("PLAYWRIGHT_STORAGE_STATE_TTL_SEC", "1800")))
+
+
+def _proc_children(pid: int):
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as fh:
+                children.extend(int(child) for child in fh.read().split())
+    except Exception:
+        pass
+    return children
+
+
+def _process_tree_rss_mb(pid) -> float:
+    """RSS (MB) do processo e descendentes via /proc; 0 quando indisponivel (ex.: fora do Linux)."""
+    if not pid:
+        return 0.0
+    total_kb = 0
+    stack = [int(pid)]
+    seen = set()
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            with open(f"/proc/{current}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except Exception:
+            continue
+        stack.extend(_proc_children(current))
+    return total_kb / 1024.0
+
+
+def _terminate_process_tree(pid) -> None:
+    if not pid:
+        return
+    pids = []
+    stack = [int(pid)]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack.extend(_proc_children(current))
+    for current in reversed(pids):
+        try:
+            os.kill(current, signal.SIGTERM)
+        except Exception:
+            pass
+
+
+def _driver_pid(playwright):
+    # O Playwright nao expoe o pid do driver; leitura best-effort do transporte interno.
+    try:
+        return playwright._impl_obj._connection._transport._proc.pid
+    except Exception:
+        return None
+
+
+def _storage_state_path(storage_key: str) -> str:
+    safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in str(storage_key))
+    return os.path.join(PLAYWRIGHT_STORAGE_STATE_DIR, f"{safe}.json")
+
+
+def _fresh_storage_state(storage_key):
+    """Caminho do storage_state salvo se ainda estiver dentro do TTL; None caso contrario."""
+    if not storage_key or PLAYWRIGHT_STORAGE_STATE_TTL_SEC <= 0:
+        return None
+    path = _storage_state_path(storage_key)
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+    if age > PLAYWRIGHT_STORAGE_STATE_TTL_SEC:
+        discard_storage_state(storage_key)
+        return None
+    return path
+
+
+def discard_storage_state(storage_key) -> None:
+    if not storage_key:
+        return
+    try:
+        os.remove(_storage_state_path(storage_key))
+    except OSError:
+        pass
+
+
+def _save_storage_state(context, storage_key) -> bool:
+    if not storage_key or PLAYWRIGHT_STORAGE_STATE_TTL_SEC <= 0:
+        return False
+    path = _storage_state_path(storage_key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(PLAYWRIGHT_STORAGE_STATE_DIR, mode=0o700, exist_ok=True)
+        context.storage_state(path=tmp_path)
+        # Cookies de sessao: arquivo legivel so pelo usuario do worker.
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as exc:
+        print(f"⚠️ Playwright: falha ao salvar storage_state ({storage_key}): {exc}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+class _WarmBrowser:
+    __slots__ = (
+        "stack", "browser", "key", "driver_pid", "started_at", "last_used_at", "contexts_served",
+        "holds_slot", "in_use", "evicted",
+    )
+
+    def __init__(self, stack, browser, key, driver_pid, holds_slot=False):
+        self.stack = stack
+        self.browser = browser
+        self.key = key
+        self.driver_pid = driver_pid
+        self.started_at = time.time()
+        self.last_used_at = self.started_at
+        self.contexts_served = 0
+        self.holds_slot = holds_slot
+        self.in_use = True
+        self.evicted = False
+
+    def alive(self) -> bool:
+        try:
+            return bool(self.browser.is_connected())
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        try:
+            self.browser.close()
+        except Exception:
+            pass
+        try:
+            self.stack.close()
+        except Exception:
+            pass
+
+
+class BrowserLease:
+    """Contexto isolado entregue pelo broker. `timed("login")` registra a duracao de uma etapa."""
+
+    def __init__(self, browser, context, storage_key=None, storage_state_hit=False, browser_reused=False):
+        self.browser = browser
+        self.context = context
+        self.storage_key = storage_key
+        self.storage_state_hit = storage_state_hit
+        self.browser_reused = browser_reused
+        self.save_storage_state = bool(storage_key)
+        self.timings = {}
+
+    @contextlib.contextmanager
+    def timed(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = round(self.timings.get(stage, 0.0) + (time.perf_counter() - started), 3)
+
+    def discard_storage_state(self) -> None:
+        """Sessao salva nao serve mais (ex.: caiu no login): apaga e nao regrava no fim."""
+        self.save_storage_state = False
+        discard_storage_state(self.storage_key)
+
+
+class BrowserBroker:
+    """Mantem um navegador quente por thread e entrega contextos isolados.
+    Recicla o navegador apos PLAYWRIGHT_BROWSER_MAX_CONTEXTS contextos, acima de
+    PLAYWRIGHT_BROWSER_MAX_RSS_MB, quando ocioso por PLAYWRIGHT_BROWSER_IDLE_SEC ou quando ja
+    existem PLAYWRIGHT_BROWSER_MAX_WARM navegadores quentes em outras threads.
+    Navegadores abertos com slot de sessao so devolvem o slot ao serem descartados; quem espera
+    por slot encerra (pelo pid) o quente ocioso mais antigo de outra thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._warm = {}
+        self._stats = {
+            "leases": 0,
+            "browser_starts": 0,
+            "browser_reuses": 0,
+            "browser_recycles": 0,
+            "warm_evictions": 0,
+            "storage_state_hits": 0,
+            "storage_state_misses": 0,
+            "startup_sec_total": 0.0,
+            "login_sec_total": 0.0,
+            "logins": 0,
+        }
+
+    def _bump(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                self._stats[name] = self._stats.get(name, 0) + value
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["warm_browsers"] = len(self._warm)
+        snapshot["startup_sec_total"] = round(snapshot["startup_sec_total"], 3)
+        snapshot["login_sec_total"] = round(snapshot["login_sec_total"], 3)
+        return snapshot
+
+    def _recycle_reason(self, warm: _WarmBrowser) -> str:
+        if warm.evicted:
+            return "despejado"
+        if not warm.alive():
+            return "desconectado"
+        if warm.contexts_served >= PLAYWRIGHT_BROWSER_MAX_CONTEXTS:
+            return f"contextos={warm.contexts_served}"
+        if PLAYWRIGHT_BROWSER_IDLE_SEC and (time.time() - warm.last_used_at) > PLAYWRIGHT_BROWSER_IDLE_SEC:
+            return "ocioso"
+        if PLAYWRIGHT_BROWSER_MAX_RSS_MB and warm.driver_pid:
+            rss_mb = _process_tree_rss_mb(warm.driver_pid)
+            if rss_mb > PLAYWRIGHT_BROWSER_MAX_RSS_MB:
+                return f"rss={rss_mb:.0f}MB"
+        return ""
+
+    def _return_slot(self, warm: _WarmBrowser):
+        with self._lock:
+            held = warm.holds_slot
+            warm.holds_slot = False
+        if held:
+            _release_session_slot()
+
+    def _drop(self, thread_id, warm: _WarmBrowser, reason: str):
+        with self._lock:
+            if self._warm.get(thread_id) is warm:
+                self._warm.pop(thread_id, None)
+        warm.close()
+        self._return_slot(warm)
+        if reason:
+            self._bump(browser_recycles=1)
+            print(f"♻️ Playwright: navegador reciclado ({reason}) apos {warm.contexts_served} contexto(s).")
+
+    def _reap_dead_threads(self):
+        # Objetos sync do Playwright so podem ser fechados pela thread dona; se ela morreu,
+        # resta encerrar o driver (e o Chromium filho) pelo pid.
+        alive = {thread.ident for thread in threading.enumerate()}
+        with self._lock:
+            orphans = [(tid, warm) for tid, warm in self._warm.items() if tid not in alive]
+            for tid, _ in orphans:
+                self._warm.pop(tid, None)
+        for _, warm in orphans:
+            _terminate_process_tree(warm.driver_pid)
+            self._return_slot(warm)
+            self._bump(browser_recycles=1)
+            print(f"♻️ Playwright: navegador de thread encerrada finalizado (driver pid={warm.driver_pid}).")
+
+    def evict_idle_warm(self) -> bool:
+        """Encerra o navegador quente ocioso mais antigo de outra thread que ocupa slot de sessao.
+        O processo morre aqui (libera memoria e slot); a thread dona fecha o resto no proximo uso."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            candidates = [
+                warm for tid, warm in self._warm.items()
+                if tid != thread_id and warm.holds_slot and not warm.in_use and not warm.evicted
+            ]
+            if not candidates:
+                return False
+            victim = min(candidates, key=lambda warm: warm.last_used_at)
+            victim.evicted = True
+        _terminate_process_tree(victim.driver_pid)
+        self._return_slot(victim)
+        self._bump(warm_evictions=1)
+        print(f"♻️ Playwright: navegador quente ocioso encerrado para liberar slot (driver pid={victim.driver_pid}).")
+        return True
+
+    def close_thread_browser(self):
+        """Fecha o navegador quente da thread atual (antes de outro sync_playwright nela)."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            warm = self._warm.get(thread_id)
+        if warm is not None:
+            self._drop(thread_id, warm, "")
+
+    def _acquire_browser(self, headless, launch_args, startup_label, session_slot=True):
+        self._reap_dead_threads()
+        thread_id = threading.get_ident()
+        key = (bool(headless), tuple(_merge_launch_args(launch_args)))
+        with self._lock:
+            warm = self._warm.get(thread_id)
+            if warm is not None:
+                warm.in_use = True
+        if warm is not None:
+            reason = "config" if warm.key != key else self._recycle_reason(warm)
+            if not reason:
+                if session_slot and not warm.holds_slot:
+                    _acquire_session_slot(startup_label)
+                    with self._lock:
+                        warm.holds_slot = True
+                self._bump(browser_reuses=1)
+                return warm, True, 0.0
+            self._drop(thread_id, warm, reason)
+
+        if session_slot:
+            _acquire_session_slot(startup_label)
+        started = time.perf_counter()
+        try:
+            stack, browser, playwright = _start_browser_with_retry(
+                headless=headless,
+                launch_args=launch_args,
+                startup_label=startup_label,
+                with_playwright=True,
+            )
+        except BaseException:
+            if session_slot:
+                _release_session_slot()
+            raise
+        startup_sec = time.perf_counter() - started
+        warm = _WarmBrowser(stack, browser, key, _driver_pid(playwright), holds_slot=session_slot)
+        with self._lock:
+            self._warm[thread_id] = warm
+        self._bump(browser_starts=1, startup_sec_total=startup_sec)
+        return warm, False, startup_sec
+
+    def _release_browser(self, warm: _WarmBrowser, broken: bool):
+        thread_id = threading.get_ident()
+        warm.last_used_at = time.time()
+        with self._lock:
+            warm.in_use = False
+        if broken or not PLAYWRIGHT_BROWSER_REUSE:
+            self._drop(thread_id, warm, "falha" if broken else "")
+            return
+        self._reap_dead_threads()
+        with self._lock:
+            warm_count = len(self._warm)
+        if PLAYWRIGHT_BROWSER_MAX_WARM and warm_count > PLAYWRIGHT_BROWSER_MAX_WARM:
+            self._drop(thread_id, warm, f"limite_quentes={PLAYWRIGHT_BROWSER_MAX_WARM}")
+            return
+        reason = self._recycle_reason(warm)
+        if reason:
+            self._drop(thread_id, warm, reason)
+
+    @contextlib.contextmanager
+    def lease(
+        self,
+        *,
+        headless: bool = True,
+        launch_args=None,
+        startup_label: str = "playwright_startup",
+        storage_key=None,
+        context_options=None,
+        session_slot: bool = True,
+        keep_warm: bool = True,
+    ):
+        # session_slot=False: o chamador controla o proprio paralelismo (ex.: shards de um job).
+        # keep_warm=False: thread de vida curta; o navegador fecha junto com o lease.
+        # O slot de sessao fica com o navegador quente (devolvido quando ele e descartado).
+        warm, reused, startup_sec = self._acquire_browser(headless, launch_args, startup_label, session_slot=session_slot)
+        state_path = _fresh_storage_state(storage_key)
+        options = dict(context_options or {})
+        if state_path:
+            options["storage_state"] = state_path
+        context_started = time.perf_counter()
+        try:
+            context = warm.browser.new_context(**options)
+        except Exception:
+            if not state_path:
+                self._release_browser(warm, broken=True)
+                raise
+            # storage_state corrompido: tenta de novo sem ele.
+            discard_storage_state(storage_key)
+            options.pop("storage_state", None)
+            state_path = None
+            try:
+                context = warm.browser.new_context(**options)
+            except Exception:
+                self._release_browser(warm, broken=True)
+                raise
+        warm.contexts_served += 1
+        lease = BrowserLease(
+            warm.browser,
+            context,
+            storage_key=storage_key,
+            storage_state_hit=bool(state_path),
+            browser_reused=reused,
+        )
+        lease.timings["startup"] = round(startup_sec, 3)
+        lease.timings["context"] = round(time.perf_counter() - context_started, 3)
+        if storage_key:
+            self._bump(**{"storage_state_hits" if state_path else "storage_state_misses": 1})
+        self._bump(leases=1)
+
+        failed = False
+        try:
+            yield lease
+        except BaseException:
+            failed = True
+            # Sessao salva pode ser a causa (ex.: expirou no servidor antes do TTL).
+            if storage_key:
+                discard_storage_state(storage_key)
+            raise
+        finally:
+            if not failed and lease.save_storage_state:
+                _save_storage_state(context, storage_key)
+            try:
+                context.close()
+            except Exception:
+                pass
+            if "login" in lease.timings:
+                self._bump(logins=1, login_sec_total=lease.timings["login"])
+            if keep_warm:
+                self._release_browser(warm, broken=not warm.alive())
+            else:
+                self._drop(threading.get_ident(), warm, "")
+            print(
+                "🧭 Playwright lease | "
+                f"label={startup_label} browser={'reuso' if reused else 'novo'} "
+                f"state={'hit' if lease.storage_state_hit else ('miss' if storage_key else '-')} "
+                + " ".join(f"{stage}={value:.2f}s" for stage, value in lease.timings.items())
+            )
+
+
+_BROKER = BrowserBroker()
+
+
+def get_browser_broker() -> BrowserBroker:
+    return _BROKER
+
+
+def browser_lease(**kwargs):
+    """Atalho para `get_browser_broker().lease(...)`: `with browser_lease(...) as lease: lease.context`."""
+    return _BROKER.lease(**kwargs)
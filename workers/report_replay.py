@@ -0,0 +1,332 @@
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+try:
+    from feegow_web_auth import hydrate_requests_session_from_context
+    from sharded_scrape import SHARD_DROP_COOKIE_PREFIXES
+except ImportError:
+    from .feegow_web_auth import hydrate_requests_session_from_context
+    from .sharded_scrape import SHARD_DROP_COOKIE_PREFIXES
+
+REPLAY_TIMEOUT_SEC = max(10.0, float(os.getenv("FEEGOW_REPLAY_TIMEOUT_SEC", "90") or "90"))
+REPLAY_RETRY_ATTEMPTS = max(1, int(os.getenv("FEEGOW_REPLAY_RETRY_ATTEMPTS", "2") or "2"))
+
+# Cabecalhos do navegador repetidos no replay (cookies vem da sessao hidratada).
+_REPLAY_HEADERS = ("user-agent", "referer", "origin", "accept", "accept-language", "content-type", "x-requested-with")
+_CSRF_FIELD_RE = re.compile(r"(csrf|token|__requestverification|__viewstate|__eventvalidation)", re.IGNORECASE)
+_LOGIN_MARKERS_RE = re.compile(
+    r"""(id=["']?User["'\s>]|id=["']?password["'\s>]|name=["']?User["'\s>]|[?&]P=Login\b)""",
+    re.IGNORECASE,
+)
+_FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+class ReplayMismatch(RuntimeError):
+    """A resposta do replay nao e a esperada (sessao/CSRF/layout mudou): o chamador volta ao navegador."""
+
+
+class CapturedRequest:
+    __slots__ = ("method", "url", "headers", "body", "response_text")
+
+    def __init__(self, method: str, url: str, headers: Dict[str, str], body: str, response_text: str):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.response_text = response_text
+
+
+class RequestRecorder:
+    """Grava as requisicoes document/xhr/fetch de uma pagina durante um bloco `with`.
+    O corpo da resposta so e lido depois, em `find` (objetos sync do Playwright nao devem ser
+    consultados dentro do handler do evento)."""
+
+    def __init__(self, page):
+        self.page = page
+        self.requests = []
+
+    def _on_request(self, request):
+        try:
+            if request.resource_type in ("document", "xhr", "fetch"):
+                self.requests.append(request)
+        except Exception:
+            pass
+
+    def __enter__(self):
+        self.page.on("request", self._on_request)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.page.remove_listener("request", self._on_request)
+        except Exception:
+            pass
+        return False
+
+    def find(self, predicate: Callable[[CapturedRequest], bool]) -> Optional[CapturedRequest]:
+        """Mais recente primeiro: a busca final costuma ser a ultima requisicao com o resultado."""
+        for request in reversed(self.requests):
+            try:
+                response = request.response()
+                if response is None:
+                    continue
+                captured = CapturedRequest(
+                    method=str(request.method or "GET").upper(),
+                    url=str(request.url or ""),
+                    headers={str(k).lower(): str(v) for k, v in (request.headers or {}).items()},
+                    body=str(request.post_data or ""),
+                    response_text=response.text(),
+                )
+            except Exception:
+                continue
+            if predicate(captured):
+                return captured
+        return None
+
+
+class RequestTemplate:
+    """Requisicao capturada com um campo variavel (ex.: AccountID do profissional)."""
+
+    def __init__(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        fields: List[Tuple[str, str]],
+        target_index: int,
+        in_body: bool,
+    ):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.fields = fields
+        self.target_index = target_index
+        self.in_body = in_body
+
+    @property
+    def target_field(self) -> str:
+        return self.fields[self.target_index][0]
+
+    @property
+    def csrf_fields(self) -> List[str]:
+        return [name for name, _ in self.fields if _CSRF_FIELD_RE.search(name)]
+
+    @classmethod
+    def from_capture(
+        cls,
+        captured: CapturedRequest,
+        target_value: str,
+        prefer_field: str = "",
+    ) -> "RequestTemplate":
+        content_type = captured.headers.get("content-type", "")
+        in_body = bool(captured.body)
+        if in_body and _FORM_CONTENT_TYPE not in content_type.lower():
+            raise ReplayMismatch(f"corpo da requisicao nao e formulario ({content_type or 'sem content-type'})")
+        raw = captured.body if in_body else urlsplit(captured.url).query
+        fields = parse_qsl(raw, keep_blank_values=True)
+
+        target = str(target_value or "").strip()
+        matches = [idx for idx, (_, value) in enumerate(fields) if value.strip() == target]
+        preferred = [idx for idx in matches if prefer_field and fields[idx][0].lower() == prefer_field.lower()]
+        if preferred:
+            target_index = preferred[0]
+        elif len(matches) == 1:
+            target_index = matches[0]
+        else:
+            raise ReplayMismatch(
+                f"campo variavel nao identificado na requisicao capturada (ocorrencias={len(matches)})"
+            )
+
+        headers = {name: captured.headers[name] for name in _REPLAY_HEADERS if name in captured.headers}
+        return cls(captured.method, captured.url, headers, fields, target_index, in_body)
+
+    def build(self, value: str) -> Tuple[str, str, Optional[str]]:
+        fields = list(self.fields)
+        fields[self.target_index] = (fields[self.target_index][0], str(value))
+        encoded = urlencode(fields)
+        if self.in_body:
+            return self.method, self.url, encoded
+        parts = urlsplit(self.url)
+        return self.method, urlunsplit((parts.scheme, parts.netloc, parts.path, encoded, parts.fragment)), None
+
+
+def _row_signature(row: Dict, ignore_keys: Sequence[str]) -> Tuple:
+    items = []
+    for key in sorted(row):
+        if key in ignore_keys:
+            continue
+        value = row[key]
+        if isinstance(value, float):
+            value = round(value, 2)
+        items.append((key, "" if value is None else str(value)))
+    return tuple(items)
+
+
+def compare_replayed_rows(browser_rows: Sequence[Dict], replayed_rows: Sequence[Dict], ignore_keys: Sequence[str] = ()) -> Optional[str]:
+    """None se o replay devolveu as mesmas linhas (chaves e valores, sem considerar a ordem) que o
+    navegador; senao a descricao da primeira divergencia. `ignore_keys` fica de fora (ex.: HTML bruto,
+    que o navegador e o lxml serializam de formas diferentes)."""
+    if len(browser_rows) != len(replayed_rows):
+        return f"replay devolveu {len(replayed_rows)} linha(s), navegador {len(browser_rows)}"
+    ignore = tuple(ignore_keys or ())
+    browser = sorted(_row_signature(row, ignore) for row in browser_rows)
+    replayed = sorted(_row_signature(row, ignore) for row in replayed_rows)
+    for browser_row, replayed_row in zip(browser, replayed):
+        if browser_row == replayed_row:
+            continue
+        browser_map, replayed_map = dict(browser_row), dict(replayed_row)
+        keys = sorted(set(browser_map) | set(replayed_map))
+        diff = next(key for key in keys if browser_map.get(key) != replayed_map.get(key))
+        return f"replay divergente em '{diff}': {replayed_map.get(diff)!r} != navegador {browser_map.get(diff)!r}"
+    return None
+
+
+def looks_like_login_response(text: str, final_url: str = "") -> bool:
+    if "p=login" in str(final_url or "").lower():
+        return True
+    return bool(_LOGIN_MARKERS_RE.search(text or ""))
+
+
+class ReplayClient:
+    """Pool de `requests.Session` hidratadas do contexto do navegador.
+
+    Sem os cookies ASPSESSIONID cada sessao abre a propria sessao ASP no servidor (o ASP classico
+    serializa requisicoes da mesma sessao). Se o servidor nao reconhecer a autenticacao assim, o
+    cliente passa a usar a sessao ASP do navegador (serializada no servidor, mas ainda sem render).
+    As sessoes sao montadas na thread do navegador: o contexto do Playwright nao pode ser lido de
+    outras threads.
+    """
+
+    def __init__(
+        self,
+        context,
+        concurrency: int = 4,
+        drop_cookie_prefixes: Sequence[str] = SHARD_DROP_COOKIE_PREFIXES,
+        timeout_sec: float = REPLAY_TIMEOUT_SEC,
+    ):
+        self.concurrency = max(1, int(concurrency))
+        self.timeout_sec = timeout_sec
+        self._drop_prefixes = tuple(drop_cookie_prefixes or ())
+        self._lock = threading.Lock()
+        self._sessions: "queue.LifoQueue[requests.Session]" = queue.LifoQueue()
+        self._dropped: List[Tuple[str, str, str, str]] = []
+        self.own_asp_session = False
+        self.requests_sent = 0
+        for _ in range(self.concurrency):
+            session = requests.Session()
+            hydrate_requests_session_from_context(context, session)
+            dropped = self._drop_asp_cookies(session)
+            if dropped and not self._dropped:
+                self._dropped = dropped
+            self._sessions.put(session)
+        self.own_asp_session = bool(self._dropped)
+
+    def _drop_asp_cookies(self, session: requests.Session) -> List[Tuple[str, str, str, str]]:
+        if not self._drop_prefixes:
+            return []
+        dropped = []
+        for cookie in list(session.cookies):
+            if any(cookie.name.startswith(prefix) for prefix in self._drop_prefixes):
+                dropped.append((cookie.name, cookie.value, cookie.domain, cookie.path))
+                session.cookies.clear(cookie.domain, cookie.path, cookie.name)
+        return dropped
+
+    def _share_browser_asp_session(self):
+        with self._lock:
+            self.own_asp_session = False
+
+    def _use_browser_asp_session(self, session: requests.Session):
+        # Troca a sessao ASP aberta pelo replay pela do navegador (que ja esta autenticada).
+        self._drop_asp_cookies(session)
+        for name, value, domain, path in self._dropped:
+            session.cookies.set(name, value, domain=domain, path=path)
+        session.feegow_browser_asp = True
+
+    def _send(self, template: RequestTemplate, value: str) -> requests.Response:
+        method, url, data = template.build(value)
+        session = self._sessions.get()
+        try:
+            if not self.own_asp_session and self._dropped and not getattr(session, "feegow_browser_asp", False):
+                self._use_browser_asp_session(session)
+            with self._lock:
+                self.requests_sent += 1
+            return session.request(
+                method,
+                url,
+                data=data,
+                headers=template.headers,
+                timeout=self.timeout_sec,
+                allow_redirects=True,
+            )
+        finally:
+            self._sessions.put(session)
+
+    def fetch(self, template: RequestTemplate, value: str) -> str:
+        last_error: Optional[Exception] = None
+        for _ in range(REPLAY_RETRY_ATTEMPTS):
+            try:
+                response = self._send(template, value)
+            except requests.RequestException as exc:
+                last_error = exc
+                continue
+            if response.status_code in (401, 403, 419):
+                raise ReplayMismatch(f"HTTP {response.status_code} no replay (sessao/CSRF)")
+            if response.status_code >= 500:
+                last_error = RuntimeError(f"HTTP {response.status_code} no replay")
+                continue
+            if "charset" not in (response.headers.get("content-type") or "").lower():
+                response.encoding = response.apparent_encoding
+            text = response.text
+            if looks_like_login_response(text, response.url):
+                if self.own_asp_session:
+                    self._share_browser_asp_session()
+                    continue
+                suffix = f" (campos de token: {', '.join(template.csrf_fields)})" if template.csrf_fields else ""
+                raise ReplayMismatch(f"replay caiu na tela de login{suffix}")
+            return text
+        raise RuntimeError(f"replay sem resposta valida: {last_error}")
+
+    def close(self):
+        while True:
+            try:
+                self._sessions.get_nowait().close()
+            except queue.Empty:
+                break
+            except Exception:
+                pass
+
+
+def replay_concurrently(
+    client: ReplayClient,
+    items: Iterable,
+    work: Callable[[object], object],
+) -> Iterable[Tuple[object, object, Optional[Exception]]]:
+    """Executa `work(item)` (um ou mais `client.fetch`) em paralelo e entrega (item, resultado, erro)
+    na ordem de conclusao. Depois do primeiro ReplayMismatch os itens ainda nao iniciados saem direto
+    com o mesmo erro (layout/sessao nao vai melhorar sozinho), para o chamador mandar tudo ao navegador."""
+    tripped: List[ReplayMismatch] = []
+
+    def _one(item):
+        if tripped:
+            raise ReplayMismatch(f"replay desativado: {tripped[0]}")
+        try:
+            return work(item)
+        except ReplayMismatch as exc:
+            tripped.append(exc)
+            raise
+
+    with ThreadPoolExecutor(max_workers=client.concurrency, thread_name_prefix="feegow-replay") as pool:
+        futures = {pool.submit(_one, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                yield item, future.result(), None
+            except Exception as exc:
+                yield item, None, exc
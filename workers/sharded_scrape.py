@@ -0,0 +1,289 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Cookies removidos do estado compartilhado: cada shard ganha a propria sessao ASP (o ASP classico
+# serializa requisicoes da mesma sessao) e mantem os cookies de autenticacao do lider.
+SHARD_DROP_COOKIE_PREFIXES = tuple(
+    prefix.strip()
+    for prefix in os.getenv("FEEGOW_SHARD_DROP_COOKIES", "ASPSESSIONID").split(",")
+    if prefix.strip()
+)
+SHARD_READY_TIMEOUT_SEC = max(30.0, float(os.getenv("FEEGOW_SHARD_READY_TIMEOUT_SEC", "300")))
+
+
+def resolve_shard_count(total_items: int, requested: int, min_items_per_shard: int = 1) -> int:
+    """Nao abre mais shards do que itens (respeitando o minimo de itens por shard)."""
+    if total_items <= 0:
+        return 1
+    by_size = max(1, total_items // max(1, int(min_items_per_shard)))
+    return max(1, min(int(requested or 1), by_size, total_items))
+
+
+class ShardSession:
+    """Estado de autenticacao visto por um shard (geracao do login e se usa a sessao ASP propria)."""
+
+    __slots__ = ("shard_id", "generation", "own_asp_session")
+
+    def __init__(self, shard_id: int, generation: int = 0, own_asp_session: bool = False):
+        self.shard_id = shard_id
+        self.generation = generation
+        self.own_asp_session = own_asp_session
+
+
+class SharedAuthState:
+    """Login unico compartilhado entre shards.
+
+    O lider faz login e publica o storage_state; os demais abrem contexto com esse estado. Quando um
+    shard cai no login, `recover` tenta em ordem: cookies de um login mais novo, a sessao ASP do
+    lider e, por ultimo, um login novo (serializado, para um shard nao derrubar a sessao do outro).
+    """
+
+    def __init__(self, login_fn: Callable, drop_cookie_prefixes: Sequence[str] = SHARD_DROP_COOKIE_PREFIXES):
+        self._login_fn = login_fn
+        self._drop_prefixes = tuple(drop_cookie_prefixes or ())
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._state: Optional[Dict] = None
+        self._error: Optional[BaseException] = None
+        self.generation = 0
+        self.relogins = 0
+
+    def publish(self, context) -> int:
+        state = context.storage_state()
+        with self._lock:
+            return self._publish_locked(state)
+
+    def _publish_locked(self, state: Dict) -> int:
+        previous = self._cookie_signature(self._state)
+        self._state = state
+        if previous != self._cookie_signature(state):
+            self.generation += 1
+        self._ready.set()
+        return self.generation
+
+    def fail(self, error: BaseException):
+        # Depois de publicado, a falha do lider nao e de login: os seguidores seguem com o estado.
+        with self._lock:
+            if self._ready.is_set():
+                return
+            self._error = error
+            self._ready.set()
+
+    def wait_ready(self, timeout: float = SHARD_READY_TIMEOUT_SEC):
+        if not self._ready.wait(timeout):
+            raise RuntimeError(f"login do shard lider nao concluiu em {timeout:.0f}s")
+        if self._error is not None:
+            raise RuntimeError(f"login do shard lider falhou: {self._error}")
+
+    @staticmethod
+    def _cookie_signature(state: Optional[Dict]):
+        cookies = (state or {}).get("cookies") or []
+        return tuple(sorted((c.get("name"), c.get("domain"), c.get("value")) for c in cookies))
+
+    def _is_dropped(self, cookie: Dict) -> bool:
+        name = str(cookie.get("name") or "")
+        return any(name.startswith(prefix) for prefix in self._drop_prefixes)
+
+    def context_options(self, shard: ShardSession, base: Optional[Dict] = None) -> Dict:
+        """Opcoes do new_context para um shard seguidor (estado do lider sem os cookies ASP)."""
+        with self._lock:
+            state = dict(self._state or {})
+            shard.generation = self.generation
+        cookies = list(state.get("cookies") or [])
+        if self._drop_prefixes:
+            kept = [c for c in cookies if not self._is_dropped(c)]
+            shard.own_asp_session = len(kept) != len(cookies)
+            cookies = kept
+        state["cookies"] = cookies
+        options = dict(base or {})
+        options["storage_state"] = state
+        return options
+
+    def recover(self, page, shard: ShardSession) -> str:
+        """Recupera a sessao de um shard; retorna a acao tomada (refresh|shared_asp|login)."""
+        with self._lock:
+            if self._state is not None and shard.generation != self.generation:
+                page.context.add_cookies(list(self._state.get("cookies") or []))
+                shard.generation = self.generation
+                shard.own_asp_session = False
+                return "refresh"
+            if shard.own_asp_session and self._state is not None:
+                # A sessao ASP propria nao herdou a autenticacao: passa a usar a do lider.
+                page.context.add_cookies(list(self._state.get("cookies") or []))
+                shard.own_asp_session = False
+                return "shared_asp"
+            self._login_fn(page)
+            self.relogins += 1
+            self._publish_locked(page.context.storage_state())
+            shard.generation = self.generation
+            return "login"
+
+
+class ShardProgress:
+    """Metricas de um shard; `record` tambem dispara o checkpoint do coordenador."""
+
+    def __init__(self, coordinator: "ShardCoordinator", shard_id: int):
+        self._coordinator = coordinator
+        self.shard_id = shard_id
+        self.done = 0
+        self.rows = 0
+        self.by_status: Dict[str, int] = {}
+        self.last_item_id = ""
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.error = ""
+
+    def record(self, item_id: str, status: str, rows: int = 0):
+        self.done += 1
+        self.rows += int(rows or 0)
+        self.by_status[status] = self.by_status.get(status, 0) + 1
+        self.last_item_id = str(item_id or "")
+        self._coordinator.checkpoint()
+
+    def snapshot(self) -> Dict:
+        elapsed = max(0.001, (self.finished_at or time.time()) - self.started_at)
+        return {
+            "shard": self.shard_id,
+            "done": self.done,
+            "rows": self.rows,
+            "by_status": dict(self.by_status),
+            "last_item_id": self.last_item_id,
+            "elapsed_sec": round(elapsed, 1),
+            "items_per_min": round(self.done * 60.0 / elapsed, 2),
+            "finished": self.finished_at is not None,
+            "error": self.error,
+        }
+
+
+class ShardCoordinator:
+    """Executa `run_shard(shard_id, items, progress)` por shard sobre uma fila compartilhada: cada shard
+    puxa o proximo item quando termina o anterior (profissionais pesados nao travam um shard inteiro e
+    os itens de um shard abortado ficam para os outros). O shard 0 roda na thread chamadora
+    (normalmente faz o login e publica o estado); os demais em threads proprias."""
+
+    def __init__(
+        self,
+        items: Sequence,
+        shard_count: int,
+        run_shard: Callable,
+        checkpoint_fn: Optional[Callable[[Dict], None]] = None,
+        checkpoint_min_interval_sec: float = 2.0,
+        label: str = "shards",
+        resumed_items: int = 0,
+    ):
+        self.total = len(items)
+        self._queue = deque(items)
+        self._queue_lock = threading.Lock()
+        # Item que cada shard puxou e ainda nao terminou (o shard so puxa o proximo depois de gravar).
+        self._in_flight: Dict[int, Any] = {}
+        self._requeued_ids = set()
+        self._abandoned: List = []
+        self._run_shard = run_shard
+        self._checkpoint_fn = checkpoint_fn
+        self._checkpoint_min_interval = max(0.0, float(checkpoint_min_interval_sec))
+        self._checkpoint_lock = threading.Lock()
+        self._last_checkpoint = 0.0
+        self.label = label
+        self.resumed_items = int(resumed_items or 0)
+        self.shard_count = max(1, int(shard_count))
+        self.progress = [ShardProgress(self, idx) for idx in range(self.shard_count)]
+        self.started_at = time.time()
+
+    def _iter_items(self, shard_id: int):
+        while True:
+            with self._queue_lock:
+                self._in_flight.pop(shard_id, None)
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                self._in_flight[shard_id] = item
+            yield item
+
+    def _release_in_flight(self, shard_id: int):
+        """Devolve a fila o item que o shard abortado estava processando (uma vez por item: um item
+        que derruba dois shards nao derruba os demais e fica em `remaining`)."""
+        with self._queue_lock:
+            if shard_id not in self._in_flight:
+                return
+            item = self._in_flight.pop(shard_id)
+            if id(item) in self._requeued_ids:
+                self._abandoned.append(item)
+                return
+            self._requeued_ids.add(id(item))
+            self._queue.appendleft(item)
+
+    def remaining(self) -> List:
+        """Itens que nenhum shard concluiu: nao chegaram a ser pegos (ex.: todos abortaram) ou
+        estavam em processamento em shards abortados."""
+        with self._queue_lock:
+            return list(self._abandoned) + list(self._queue)
+
+    def snapshot(self) -> Dict:
+        shards = [progress.snapshot() for progress in self.progress]
+        elapsed = max(0.001, time.time() - self.started_at)
+        done = sum(item["done"] for item in shards)
+        return {
+            "shard_count": len(shards),
+            "resumed_items": self.resumed_items,
+            "done": done,
+            "total": self.total,
+            "rows": sum(item["rows"] for item in shards),
+            "items_per_min": round(done * 60.0 / elapsed, 2),
+            "shards": shards,
+        }
+
+    def checkpoint(self, force: bool = False):
+        if not self._checkpoint_fn:
+            return
+        with self._checkpoint_lock:
+            now = time.time()
+            if not force and (now - self._last_checkpoint) < self._checkpoint_min_interval:
+                return
+            self._last_checkpoint = now
+            try:
+                self._checkpoint_fn(self.snapshot())
+            except Exception as exc:
+                print(f"⚠️ [{self.label}] falha ao gravar checkpoint dos shards: {exc}")
+
+    def _run_one(self, shard_id: int):
+        progress = self.progress[shard_id]
+        try:
+            self._run_shard(shard_id, self._iter_items(shard_id), progress)
+        except Exception as exc:
+            progress.error = str(exc)
+            self._release_in_flight(shard_id)
+            print(f"❌ [{self.label}] shard {shard_id + 1}/{self.shard_count} abortado: {exc}")
+        finally:
+            progress.finished_at = time.time()
+
+    def run(self) -> Dict:
+        threads = []
+        for shard_id in range(1, self.shard_count):
+            thread = threading.Thread(
+                target=self._run_one,
+                args=(shard_id,),
+                name=f"{self.label}-shard-{shard_id + 1}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+        self._run_one(0)
+        for thread in threads:
+            thread.join()
+        self.checkpoint(force=True)
+        summary = self.snapshot()
+        for item in summary["shards"]:
+            print(
+                f"📊 [{self.label}] shard {item['shard'] + 1}/{summary['shard_count']} "
+                f"itens={item['done']} linhas={item['rows']} "
+                f"tempo={item['elapsed_sec']:.1f}s ritmo={item['items_per_min']:.2f}/min "
+                f"status={item['by_status']}" + (f" erro={item['error']}" if item["error"] else "")
+            )
+        print(
+            f"📊 [{self.label}] total itens={summary['done']}/{summary['total']} linhas={summary['rows']} "
+            f"ritmo={summary['items_per_min']:.2f}/min retomados={summary['resumed_items']}"
+        )
+        return summary
@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+SQL_TRANSLATION_CACHE_SIZE = max(0, int(os.getenv("SQL_TRANSLATION_CACHE_SIZE", "512")))
+SQL_TRANSLATION_STATS_TOP = max(0, int(os.getenv("SQL_TRANSLATION_STATS_TOP", "10")))
+
+_PRAGMA_TABLE_INFO_RE = re.compile(r"^\s*PRAGMA\s+table_info\((.+)\)\s*;?\s*$", re.IGNORECASE)
+_DATETIME_NOW_RE = re.compile(r"datetime\('now'\)", re.IGNORECASE)
+_DATE_NOW_RE = re.compile(r"date\('now'\)", re.IGNORECASE)
+_INSERT_OR_REPLACE_RE = re.compile(r"INSERT\s+OR\s+REPLACE\s+INTO", re.IGNORECASE)
+_ON_CONFLICT_PROBE_RE = re.compile(r"ON\s+CONFLICT\s*\(", re.IGNORECASE)
+_ON_CONFLICT_UPDATE_RE = re.compile(r"ON\s+CONFLICT\s*\([^)]+\)\s*DO\s+UPDATE\s+SET", re.IGNORECASE)
+_EXCLUDED_COLUMN_RE = re.compile(r"\bexcluded\.([A-Za-z0-9_]+)", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_MYSQL_TABLE_INFO_SQL = """
+                SELECT COLUMN_NAME as name
+                FROM information_schema.columns
+                WHERE table_schema = DATABASE() AND table_name = %s
+                ORDER BY ORDINAL_POSITION
+            """
+
+_QUOTE_CHARS = ("'", '"', "`")
+
+
+def _split_quoted(sql: str):
+    """Divide o SQL em trechos (is_quoted, texto).
+    Reconhece '...', "..." e `...` com escape por aspas duplicadas e barra invertida."""
+    parts = []
+    buf = []
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch not in _QUOTE_CHARS:
+            buf.append(ch)
+            i += 1
+            continue
+        if buf:
+            parts.append((False, "".join(buf)))
+            buf = []
+        j = i + 1
+        while j < n:
+            cj = sql[j]
+            if cj == "\\" and ch != "`" and j + 1 < n:
+                j += 2
+                continue
+            if cj == ch:
+                if j + 1 < n and sql[j + 1] == ch:
+                    j += 2
+                    continue
+                break
+            j += 1
+        parts.append((True, sql[i:j + 1]))
+        i = j + 1
+    if buf:
+        parts.append((False, "".join(buf)))
+    return parts
+
+
+def _rewrite_placeholders(sql: str) -> str:
+    """`?` -> `%s` fora de literais e escape de `%` para o format do PyMySQL.
+    `%s`/`%%` ja presentes fora de literais sao preservados."""
+    out = []
+    for quoted, text in _split_quoted(sql):
+        if quoted:
+            out.append(text.replace("%", "%%"))
+            continue
+        i = 0
+        n = len(text)
+        while i < n:
+            ch = text[i]
+            if ch == "?":
+                out.append("%s")
+            elif ch == "%":
+                nxt = text[i + 1] if i + 1 < n else ""
+                if nxt in ("s", "%"):
+                    out.append(ch + nxt)
+                    i += 1
+                else:
+                    out.append("%%")
+            else:
+                out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _translate_uncached(sql: str):
+    """Retorna (sql_mysql, params_override). params_override=None preserva os params originais."""
+    pragma_match = _PRAGMA_TABLE_INFO_RE.match(sql)
+    if pragma_match:
+        raw_table = str(pragma_match.group(1) or "").strip()
+        return _MYSQL_TABLE_INFO_SQL, (raw_table.strip("`'\""),)
+
+    translated = _DATETIME_NOW_RE.sub("NOW()", sql)
+    translated = _DATE_NOW_RE.sub("CURDATE()", translated)
+    translated = _INSERT_OR_REPLACE_RE.sub("REPLACE INTO", translated)
+    if _ON_CONFLICT_PROBE_RE.search(translated):
+        translated = _ON_CONFLICT_UPDATE_RE.sub("ON DUPLICATE KEY UPDATE", translated)
+        translated = _EXCLUDED_COLUMN_RE.sub(r"VALUES(\1)", translated)
+    return _rewrite_placeholders(translated), None
+
+
+class SqlTranslationCache:
+    def __init__(self, max_size=SQL_TRANSLATION_CACHE_SIZE):
+        self.max_size = max(0, int(max_size))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def translate(self, sql, params=()):
+        if not sql:
+            return sql, params
+        key = str(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry["hits"] += 1
+                self.hits += 1
+                translated, override = entry["translated"], entry["params"]
+                return translated, (params if override is None else override)
+            self.misses += 1
+
+        translated, override = _translate_uncached(key)
+
+        if self.max_size > 0:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = {"translated": translated, "params": override, "hits": 0, "misses": 1}
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+                else:
+                    entry["misses"] += 1
+        return translated, (params if override is None else override)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self, top=SQL_TRANSLATION_STATS_TOP):
+        with self._lock:
+            total = self.hits + self.misses
+            ranked = sorted(self._entries.items(), key=lambda item: item[1]["hits"], reverse=True)[: max(0, int(top))]
+            return {
+                "size": len(self._entries),
+                "maxSize": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / total, 4) if total else None,
+                "topStatements": [
+                    {
+                        "sql": _WHITESPACE_RE.sub(" ", raw).strip()[:160],
+                        "hits": entry["hits"],
+                        "misses": entry["misses"],
+                    }
+                    for raw, entry in ranked
+                ],
+            }
+
+
+_MYSQL_TRANSLATOR = SqlTranslationCache()
+
+
+def translate_sql_for_mysql(sql, params=()):
+    return _MYSQL_TRANSLATOR.translate(sql, params)
+
+
+def mysql_translation_stats():
+    return _MYSQL_TRANSLATOR.stats()
@@ -8,11 +8,9 @@ import calendar
 from datetime import date, datetime, timedelta
 from collections import defaultdict
 from typing import Dict, Iterable, List, Optional, Set, Tuple
-from urllib.parse import unquote
+from urllib.parse import unquote, urlparse
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
@@ -21,6 +19,9 @@ try:
 except ImportError:
     DatabaseManager = None
 
+from http_fanout import ThreadLocalSessions, fan_out, get_host_limiter, make_retrying_session
+from job_queue import signal_work, wait_for_work
+
 
 SERVICE_NAME = "agenda_occupancy"
 STATUS_PENDING = "PENDING"
@@ -30,12 +31,23 @@ STATUS_FAILED = "FAILED"
 
 DEFAULT_UNITS = [2, 3, 12]
 APPOINTMENT_STATUSES = {1, 2, 3, 4, 7}
-API_BASE_URL = "https://api.feegow.com/v1/api"
+API_BASE_URL = str(os.getenv("AGENDA_OCCUPANCY_API_BASE_URL", "https://api.feegow.com/v1/api")).rstrip("/")
 
 SLOT_MINUTES = max(5, int(os.getenv("AGENDA_OCCUPANCY_SLOT_MINUTES", "10")))
 API_TIMEOUT_SEC = max(10, int(os.getenv("AGENDA_OCCUPANCY_API_TIMEOUT_SEC", "60")))
 API_SLEEP_SEC = max(0.0, float(os.getenv("AGENDA_OCCUPANCY_API_SLEEP_SEC", "0")))
 POLL_INTERVAL_SEC = max(10, int(os.getenv("AGENDA_OCCUPANCY_POLL_SEC", "30")))
+# Fan-out concorrente: chamadas simultaneas e limite global por host (token bucket).
+API_MAX_WORKERS = max(1, int(os.getenv("AGENDA_OCCUPANCY_API_MAX_WORKERS", "6")))
+API_RATE_PER_SEC = max(0.0, float(os.getenv("AGENDA_OCCUPANCY_API_RATE_PER_SEC", "5")))
+API_RATE_BURST = max(1.0, float(os.getenv("AGENDA_OCCUPANCY_API_RATE_BURST", "5")))
+if API_SLEEP_SEC > 0:
+    # Compatibilidade: o antigo sleep entre chamadas vira teto de taxa.
+    API_RATE_PER_SEC = min(API_RATE_PER_SEC, 1.0 / API_SLEEP_SEC) if API_RATE_PER_SEC > 0 else 1.0 / API_SLEEP_SEC
+# Janela maxima (dias) por chamada de available-schedule; 0 = periodo inteiro em uma chamada.
+AVAILABLE_WINDOW_DAYS = max(0, int(os.getenv("AGENDA_OCCUPANCY_WINDOW_DAYS", "31")))
+# Grava respostas da API como fixtures para replay offline (ver --benchmark).
+FIXTURE_RECORD_DIR = str(os.getenv("AGENDA_OCCUPANCY_RECORD_DIR", "") or "").strip()
 
 UNIT_NAME_MAP = {
     2: "OURO VERDE",
@@ -187,17 +199,7 @@ def _blocked_slots_count(time_start: str, time_end: str, slot_minutes: int) -> i
 
 
 def _make_session() -> requests.Session:
-    session = requests.Session()
-    retry = Retry(
-        total=3,
-        backoff_factor=0.5,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET"],
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
+    return make_retrying_session(pool_maxsize=API_MAX_WORKERS)
 
 
 def _get_api_token() -> str:
@@ -208,15 +210,24 @@ def _get_api_token() -> str:
     return token
 
 
+def _api_limiter():
+    return get_host_limiter(urlparse(API_BASE_URL).netloc, API_RATE_PER_SEC, API_RATE_BURST)
+
+
 def _api_get(session: requests.Session, token: str, endpoint: str, params: dict) -> dict:
     url = f"{API_BASE_URL}/{endpoint}"
     headers = {
         "x-access-token": token,
         "Content-Type": "application/json",
     }
+    _api_limiter().acquire()
     resp = session.get(url, headers=headers, params=params, timeout=API_TIMEOUT_SEC)
     resp.raise_for_status()
     data = resp.json()
+    if FIXTURE_RECORD_DIR:
+        from http_stub import record_fixture
+
+        record_fixture(FIXTURE_RECORD_DIR, "GET", urlparse(url).path, params, resp.status_code, data)
     if not isinstance(data, dict):
         return {}
     return data
@@ -408,6 +419,9 @@ def enqueue_agenda_occupancy_job(
     if own_db:
         dbm = None
 
+    if initial_status == STATUS_PENDING:
+        signal_work(SERVICE_NAME)
+
     return {
         "id": job_id,
         "status": initial_status,
@@ -507,7 +521,7 @@ def _list_professionals_by_unit(
     )
     items = data.get("content") if isinstance(data, dict) else []
     if not isinstance(items, list):
-        return {}, {}
+        return {}, {}, {}
 
     prof_specs: Dict[int, Set[int]] = {}
     spec_names: Dict[int, str] = {}
@@ -657,113 +671,158 @@ def _extract_available_counts(content: object) -> Dict[str, int]:
     return daily
 
 
-def _aggregate_available_slots(
-    session: requests.Session,
+def _date_windows(start_iso: str, end_iso: str, window_days: int = AVAILABLE_WINDOW_DAYS) -> List[Tuple[str, str]]:
+    if window_days <= 0:
+        return [(start_iso, end_iso)]
+    start_dt = datetime.strptime(start_iso, "%Y-%m-%d").date()
+    end_dt = datetime.strptime(end_iso, "%Y-%m-%d").date()
+    windows: List[Tuple[str, str]] = []
+    current = start_dt
+    while current <= end_dt:
+        win_end = min(end_dt, current + timedelta(days=window_days - 1))
+        windows.append((current.strftime("%Y-%m-%d"), win_end.strftime("%Y-%m-%d")))
+        current = win_end + timedelta(days=1)
+    return windows
+
+
+def _fetch_available_details(
+    sessions: ThreadLocalSessions,
     token: str,
     unit_id: int,
+    spec_id: int,
+    win_start: str,
+    win_end: str,
+    prof_id: Optional[int] = None,
+) -> Tuple[Dict[str, int], Set[int], Dict[Tuple[str, int], int]]:
+    params = {
+        "unidade_id": unit_id,
+        "data_start": _to_br_date(win_start),
+        "data_end": _to_br_date(win_end),
+        "tipo": "E",
+        "especialidade_id": spec_id,
+    }
+    if prof_id:
+        params["profissional_id"] = prof_id
+    data = _api_get(sessions.get(), token, "appoints/available-schedule", params)
+    content = data.get("content") if isinstance(data, dict) else []
+    return _extract_available_details(content)
+
+
+def _merge_available_details(
+    details: Tuple[Dict[str, int], Set[int], Dict[Tuple[str, int], int]],
+    unit_id: int,
+    spec_id: int,
+    win_start: str,
+    win_end: str,
+    agg: Dict[Tuple[str, int, int], int],
+    active_prof_by_spec: Dict[int, Set[int]],
+    agg_by_professional: Dict[Tuple[str, int, int, int], int],
+):
+    daily_counts, active_prof_ids, daily_by_professional = details
+    for pid in active_prof_ids:
+        active_prof_by_spec[spec_id].add(pid)
+    # Filtra pela janela consultada para nao contar duas vezes datas devolvidas fora dela.
+    for data_iso, count in daily_counts.items():
+        if data_iso < win_start or data_iso > win_end:
+            continue
+        agg[(data_iso, unit_id, spec_id)] += int(count or 0)
+    for (data_iso, prof_id), count in daily_by_professional.items():
+        if data_iso < win_start or data_iso > win_end or prof_id <= 0:
+            continue
+        agg_by_professional[(data_iso, unit_id, spec_id, prof_id)] += int(count or 0)
+
+
+def _aggregate_available_slots(
+    sessions: ThreadLocalSessions,
+    token: str,
     start_iso: str,
     end_iso: str,
-    unit_specialties: Set[int],
-    prof_specs: Optional[Dict[int, Set[int]]] = None,
-) -> Tuple[Dict[Tuple[str, int, int], int], Dict[int, Set[int]], Dict[Tuple[str, int, int, int], int]]:
+    unit_specialties: Dict[int, Set[int]],
+    unit_prof_specs: Optional[Dict[int, Dict[int, Set[int]]]] = None,
+    max_workers: int = API_MAX_WORKERS,
+) -> Tuple[Dict[Tuple[str, int, int], int], Dict[int, Dict[int, Set[int]]], Dict[Tuple[str, int, int, int], int]]:
     """
     Agrega slots disponíveis por unidade+especialidade.
 
     Abordagem principal:
       - chama /appoints/available-schedule por ESPECIALIDADE (sem profissional_id),
         para evitar subcontagem quando há inconsistência no vínculo profissional-especialidade.
+      - a matriz unidades x especialidades x janelas de datas roda em paralelo (fan_out),
+        respeitando o token bucket do host; o merge segue a ordem da matriz, nao a de conclusao.
 
     Fallback:
-      - se a chamada por especialidade falhar, tenta por profissional para a mesma especialidade.
+      - se a chamada por especialidade falhar, tenta por profissional para a mesma especialidade/janela.
     """
     agg: Dict[Tuple[str, int, int], int] = defaultdict(int)
-    active_prof_by_spec: Dict[int, Set[int]] = defaultdict(set)
+    active_by_unit: Dict[int, Dict[int, Set[int]]] = {}
     agg_by_professional: Dict[Tuple[str, int, int, int], int] = defaultdict(int)
-    start_br = _to_br_date(start_iso)
-    end_br = _to_br_date(end_iso)
-
-    specialties = sorted(int(s) for s in (unit_specialties or set()) if int(s) > 0)
-    total_calls = len(specialties)
-    done_calls = 0
-    prof_specs = prof_specs or {}
-
-    # Índice reverso para fallback
-    spec_to_profs: Dict[int, List[int]] = defaultdict(list)
-    for prof_id, specs in prof_specs.items():
-        for sid in specs:
-            sid_int = int(sid or 0)
-            if sid_int > 0:
-                spec_to_profs[sid_int].append(int(prof_id))
-
-    for spec_id in specialties:
-        params = {
-            "unidade_id": unit_id,
-            "data_start": start_br,
-            "data_end": end_br,
-            "tipo": "E",
-            "especialidade_id": spec_id,
-        }
-
-        used_fallback = False
-        try:
-            data = _api_get(session, token, "appoints/available-schedule", params)
-            content = data.get("content") if isinstance(data, dict) else []
-            daily_counts, active_prof_ids, daily_by_professional = _extract_available_details(content)
-            for pid in active_prof_ids:
-                active_prof_by_spec[spec_id].add(pid)
-            for data_iso, count in daily_counts.items():
-                if data_iso < start_iso or data_iso > end_iso:
-                    continue
-                agg[(data_iso, unit_id, spec_id)] += int(count or 0)
-            for (data_iso, prof_id), count in daily_by_professional.items():
-                if data_iso < start_iso or data_iso > end_iso or prof_id <= 0:
-                    continue
-                agg_by_professional[(data_iso, unit_id, spec_id, prof_id)] += int(count or 0)
-        except Exception as exc:
-            used_fallback = True
-            profs = spec_to_profs.get(spec_id) or []
-            print(
-                f"[agenda_occupancy] aviso available-schedule unidade={unit_id} "
-                f"especialidade={spec_id} (modo agregado) falhou: {exc} | fallback_profissionais={len(profs)}"
-            )
-            for prof_id in profs:
-                prof_params = {
-                    "unidade_id": unit_id,
-                    "profissional_id": prof_id,
-                    "data_start": start_br,
-                    "data_end": end_br,
-                    "tipo": "E",
-                    "especialidade_id": spec_id,
-                }
-                try:
-                    data = _api_get(session, token, "appoints/available-schedule", prof_params)
-                    content = data.get("content") if isinstance(data, dict) else []
-                    daily_counts, active_prof_ids, daily_by_professional = _extract_available_details(content)
-                    for pid in active_prof_ids:
-                        active_prof_by_spec[spec_id].add(pid)
-                    for data_iso, count in daily_counts.items():
-                        if data_iso < start_iso or data_iso > end_iso:
-                            continue
-                        agg[(data_iso, unit_id, spec_id)] += int(count or 0)
-                    for (data_iso, prof_id), count in daily_by_professional.items():
-                        if data_iso < start_iso or data_iso > end_iso or prof_id <= 0:
-                            continue
-                        agg_by_professional[(data_iso, unit_id, spec_id, prof_id)] += int(count or 0)
-                except Exception as inner_exc:
-                    print(
-                        f"[agenda_occupancy] aviso fallback available-schedule unidade={unit_id} "
-                        f"profissional={prof_id} especialidade={spec_id}: {inner_exc}"
+    unit_prof_specs = unit_prof_specs or {}
+    windows = _date_windows(start_iso, end_iso)
+
+    tasks = []
+    for unit_id in sorted(unit_specialties):
+        active_by_unit[unit_id] = defaultdict(set)
+        specialties = sorted(int(s) for s in (unit_specialties.get(unit_id) or set()) if int(s) > 0)
+        for spec_id in specialties:
+            for win_start, win_end in windows:
+                tasks.append(
+                    (
+                        (unit_id, spec_id, win_start, win_end),
+                        lambda u=unit_id, sp=spec_id, ws=win_start, we=win_end: _fetch_available_details(
+                            sessions, token, u, sp, ws, we
+                        ),
                     )
-                if API_SLEEP_SEC > 0:
-                    time.sleep(API_SLEEP_SEC)
+                )
 
-        done_calls += 1
-        if API_SLEEP_SEC > 0 and not used_fallback:
-            time.sleep(API_SLEEP_SEC)
+    def _progress(result, done_calls, total_calls):
         if done_calls % 25 == 0 or done_calls == total_calls:
-            print(f"[agenda_occupancy] available-schedule progresso: {done_calls}/{total_calls} (unidade={unit_id})")
+            print(f"[agenda_occupancy] available-schedule progresso: {done_calls}/{total_calls}")
+
+    fallback_tasks = []
+    for result in fan_out(tasks, max_workers, on_done=_progress):
+        unit_id, spec_id, win_start, win_end = result.key
+        if result.ok:
+            _merge_available_details(
+                result.value, unit_id, spec_id, win_start, win_end,
+                agg, active_by_unit[unit_id], agg_by_professional,
+            )
+            continue
 
-    return dict(agg), dict(active_prof_by_spec), dict(agg_by_professional)
+        # Índice reverso para fallback
+        profs = sorted(
+            int(prof_id)
+            for prof_id, specs in (unit_prof_specs.get(unit_id) or {}).items()
+            if spec_id in {int(sid or 0) for sid in specs}
+        )
+        print(
+            f"[agenda_occupancy] aviso available-schedule unidade={unit_id} "
+            f"especialidade={spec_id} janela={win_start}..{win_end} (modo agregado) falhou: {result.error} "
+            f"| fallback_profissionais={len(profs)}"
+        )
+        for prof_id in profs:
+            fallback_tasks.append(
+                (
+                    (unit_id, spec_id, win_start, win_end, prof_id),
+                    lambda u=unit_id, sp=spec_id, ws=win_start, we=win_end, p=prof_id: _fetch_available_details(
+                        sessions, token, u, sp, ws, we, prof_id=p
+                    ),
+                )
+            )
+
+    for result in fan_out(fallback_tasks, max_workers):
+        unit_id, spec_id, win_start, win_end, prof_id = result.key
+        if not result.ok:
+            print(
+                f"[agenda_occupancy] aviso fallback available-schedule unidade={unit_id} "
+                f"profissional={prof_id} especialidade={spec_id}: {result.error}"
+            )
+            continue
+        _merge_available_details(
+            result.value, unit_id, spec_id, win_start, win_end,
+            agg, active_by_unit[unit_id], agg_by_professional,
+        )
+
+    return dict(agg), {uid: dict(v) for uid, v in active_by_unit.items()}, dict(agg_by_professional)
 
 
 def _aggregate_blocked_slots(
@@ -1039,27 +1098,47 @@ def _replace_rows_for_period(
         conn.close()
 
 
-def _process_job(db: "DatabaseManager", job: Dict):
-    job_id = str(job.get("id"))
-    start_iso = str(job.get("start_date"))
-    end_iso = str(job.get("end_date"))
-    units = _normalize_unit_scope(job.get("units"))
-    requested_by = str(job.get("requested_by") or "manual")
+def _collect_occupancy_aggregates(
+    token: str,
+    units: List[int],
+    start_iso: str,
+    end_iso: str,
+    max_workers: int = API_MAX_WORKERS,
+) -> Dict:
+    sessions = ThreadLocalSessions(_make_session)
+    try:
+        return _collect_occupancy_aggregates_with(sessions, token, units, start_iso, end_iso, max_workers)
+    finally:
+        sessions.close()
 
-    print(
-        f"--- Agenda Occupancy | job={job_id} | periodo={start_iso}..{end_iso} "
-        f"| unidades={','.join(map(str, units))} | requested_by={requested_by} ---"
-    )
-    db.update_heartbeat(
-        SERVICE_NAME,
-        STATUS_RUNNING,
-        f"job={job_id} periodo={start_iso}..{end_iso} unidades={','.join(map(str, units))}",
-    )
 
-    token = _get_api_token()
-    session = _make_session()
+def _collect_occupancy_aggregates_with(
+    sessions: ThreadLocalSessions,
+    token: str,
+    units: List[int],
+    start_iso: str,
+    end_iso: str,
+    max_workers: int,
+) -> Dict:
+    # Etapa 1: catalogos e agendamentos de todas as unidades em paralelo.
+    stage_one = [("specialties", lambda: _list_specialties(sessions.get(), token))]
+    for unit_id in units:
+        stage_one.append(
+            (("professionals", unit_id), lambda u=unit_id: _list_professionals_by_unit(sessions.get(), token, u))
+        )
+        stage_one.append(
+            (
+                ("appointments", unit_id),
+                lambda u=unit_id: _aggregate_appointments(sessions.get(), token, u, start_iso, end_iso),
+            )
+        )
+    stage_one_results = {}
+    for result in fan_out(stage_one, max_workers):
+        if not result.ok:
+            raise result.error
+        stage_one_results[result.key] = result.value
 
-    specialty_names = _list_specialties(session, token)
+    specialty_names: Dict[int, str] = dict(stage_one_results["specialties"])
     unit_prof_specs: Dict[int, Dict[int, Set[int]]] = {}
     unit_specialties: Dict[int, Set[int]] = {}
     professional_names: Dict[int, str] = {}
@@ -1069,9 +1148,10 @@ def _process_job(db: "DatabaseManager", job: Dict):
     bloqueados: Dict[Tuple[str, int, int], int] = defaultdict(int)
     agendamentos_profissional: Dict[Tuple[str, int, int, int], int] = defaultdict(int)
     disponiveis_profissional: Dict[Tuple[str, int, int, int], int] = defaultdict(int)
+    appt_active_by_unit: Dict[int, Dict[int, Set[int]]] = {}
 
     for unit_id in units:
-        prof_specs, specialty_names_from_prof, professional_names_from_prof = _list_professionals_by_unit(session, token, unit_id)
+        prof_specs, specialty_names_from_prof, professional_names_from_prof = stage_one_results[("professionals", unit_id)]
         unit_prof_specs[unit_id] = prof_specs
         unit_specialties[unit_id] = set()
         professional_names.update(professional_names_from_prof)
@@ -1088,7 +1168,8 @@ def _process_job(db: "DatabaseManager", job: Dict):
             f"especialidades={len(unit_specialties[unit_id])}"
         )
 
-        agg_ag, appt_active_prof_by_spec, agg_ag_prof = _aggregate_appointments(session, token, unit_id, start_iso, end_iso)
+        agg_ag, appt_active_prof_by_spec, agg_ag_prof = stage_one_results[("appointments", unit_id)]
+        appt_active_by_unit[unit_id] = appt_active_prof_by_spec
         for k, v in agg_ag.items():
             agendamentos[k] += int(v or 0)
             unit_specialties[unit_id].add(k[2])
@@ -1096,24 +1177,28 @@ def _process_job(db: "DatabaseManager", job: Dict):
             agendamentos_profissional[k] += int(v or 0)
             unit_specialties[unit_id].add(k[2])
 
-        agg_disp, avail_active_prof_by_spec, agg_disp_prof = _aggregate_available_slots(
-            session=session,
-            token=token,
-            unit_id=unit_id,
-            start_iso=start_iso,
-            end_iso=end_iso,
-            unit_specialties=unit_specialties[unit_id],
-            prof_specs=prof_specs,
-        )
-        for k, v in agg_disp.items():
-            disponiveis[k] += int(v or 0)
-            unit_specialties[unit_id].add(k[2])
-        for k, v in agg_disp_prof.items():
-            disponiveis_profissional[k] += int(v or 0)
-            unit_specialties[unit_id].add(k[2])
-
+    # Etapa 2: matriz unidades x especialidades x janelas.
+    agg_disp, avail_active_by_unit, agg_disp_prof = _aggregate_available_slots(
+        sessions=sessions,
+        token=token,
+        start_iso=start_iso,
+        end_iso=end_iso,
+        unit_specialties={uid: set(specs) for uid, specs in unit_specialties.items()},
+        unit_prof_specs=unit_prof_specs,
+        max_workers=max_workers,
+    )
+    for k, v in agg_disp.items():
+        disponiveis[k] += int(v or 0)
+        unit_specialties[k[1]].add(k[2])
+    for k, v in agg_disp_prof.items():
+        disponiveis_profissional[k] += int(v or 0)
+        unit_specialties[k[1]].add(k[2])
+
+    # Etapa 3: bloqueios por unidade (dependem dos profissionais ativos por especialidade).
+    blocked_tasks = []
+    for unit_id in units:
         active_prof_by_spec: Dict[int, Set[int]] = defaultdict(set)
-        for source in (appt_active_prof_by_spec, avail_active_prof_by_spec):
+        for source in (appt_active_by_unit.get(unit_id), avail_active_by_unit.get(unit_id)):
             for sid, pset in (source or {}).items():
                 sid_int = int(sid or 0)
                 if sid_int <= 0:
@@ -1123,35 +1208,77 @@ def _process_job(db: "DatabaseManager", job: Dict):
                     if pid_int > 0:
                         active_prof_by_spec[sid_int].add(pid_int)
 
-        agg_bloq = _aggregate_blocked_slots(
-            session=session,
-            token=token,
-            unit_id=unit_id,
-            start_iso=start_iso,
-            end_iso=end_iso,
-            prof_specs=prof_specs,
-            unit_specialties=unit_specialties[unit_id],
-            allowed_prof_by_spec=dict(active_prof_by_spec),
+        blocked_tasks.append(
+            (
+                unit_id,
+                lambda u=unit_id, allowed=dict(active_prof_by_spec), specs=set(unit_specialties[unit_id]): _aggregate_blocked_slots(
+                    session=sessions.get(),
+                    token=token,
+                    unit_id=u,
+                    start_iso=start_iso,
+                    end_iso=end_iso,
+                    prof_specs=unit_prof_specs[u],
+                    unit_specialties=specs,
+                    allowed_prof_by_spec=allowed,
+                ),
+            )
         )
-        for k, v in agg_bloq.items():
+    for result in fan_out(blocked_tasks, max_workers):
+        if not result.ok:
+            raise result.error
+        for k, v in result.value.items():
             bloqueados[k] += int(v or 0)
-            unit_specialties[unit_id].add(k[2])
+            unit_specialties[result.key].add(k[2])
+
+    return {
+        "specialty_names": specialty_names,
+        "unit_specialties": unit_specialties,
+        "professional_names": professional_names,
+        "agendamentos": dict(agendamentos),
+        "disponiveis": dict(disponiveis),
+        "bloqueados": dict(bloqueados),
+        "agendamentos_profissional": dict(agendamentos_profissional),
+        "disponiveis_profissional": dict(disponiveis_profissional),
+    }
+
+
+def _process_job(db: "DatabaseManager", job: Dict):
+    job_id = str(job.get("id"))
+    start_iso = str(job.get("start_date"))
+    end_iso = str(job.get("end_date"))
+    units = _normalize_unit_scope(job.get("units"))
+    requested_by = str(job.get("requested_by") or "manual")
+
+    print(
+        f"--- Agenda Occupancy | job={job_id} | periodo={start_iso}..{end_iso} "
+        f"| unidades={','.join(map(str, units))} | requested_by={requested_by} ---"
+    )
+    db.update_heartbeat(
+        SERVICE_NAME,
+        STATUS_RUNNING,
+        f"job={job_id} periodo={start_iso}..{end_iso} unidades={','.join(map(str, units))}",
+    )
+
+    token = _get_api_token()
+    started_at = time.time()
+    aggregates = _collect_occupancy_aggregates(token, units, start_iso, end_iso)
+    fetch_elapsed = round(time.time() - started_at, 2)
 
     rows, anomaly_count = _build_daily_rows(
         start_iso=start_iso,
         end_iso=end_iso,
         units=units,
-        specialty_names=specialty_names,
-        unit_specialties=unit_specialties,
-        agendamentos=dict(agendamentos),
-        disponiveis=dict(disponiveis),
-        bloqueados=dict(bloqueados),
+        specialty_names=aggregates["specialty_names"],
+        unit_specialties=aggregates["unit_specialties"],
+        agendamentos=aggregates["agendamentos"],
+        disponiveis=aggregates["disponiveis"],
+        bloqueados=aggregates["bloqueados"],
     )
     professional_rows = _build_professional_daily_rows(
-        specialty_names=specialty_names,
-        professional_names=professional_names,
-        agendamentos_profissional=dict(agendamentos_profissional),
-        disponiveis_profissional=dict(disponiveis_profissional),
+        specialty_names=aggregates["specialty_names"],
+        professional_names=aggregates["professional_names"],
+        agendamentos_profissional=aggregates["agendamentos_profissional"],
+        disponiveis_profissional=aggregates["disponiveis_profissional"],
     )
 
     _replace_rows_for_period(
@@ -1165,7 +1292,7 @@ def _process_job(db: "DatabaseManager", job: Dict):
 
     details = (
         f"job={job_id} rows={len(rows)} professional_rows={len(professional_rows)} anomalias_capacidade={anomaly_count} "
-        f"periodo={start_iso}..{end_iso}"
+        f"periodo={start_iso}..{end_iso} fetch={fetch_elapsed}s"
     )
     _mark_job_done(db, job_id, STATUS_COMPLETED, "")
     db.update_heartbeat(SERVICE_NAME, STATUS_COMPLETED, details)
@@ -1239,8 +1366,9 @@ def process_pending_agenda_occupancy_jobs_once(
 def run_agenda_occupancy_loop():
     print(f"[agenda_occupancy] worker loop iniciado. poll={POLL_INTERVAL_SEC}s")
     while True:
+        processed = False
         try:
-            process_pending_agenda_occupancy_jobs_once()
+            processed = process_pending_agenda_occupancy_jobs_once()
         except Exception as exc:
             try:
                 db = DatabaseManager()
@@ -1248,7 +1376,53 @@ def run_agenda_occupancy_loop():
             except Exception:
                 pass
             print(f"[agenda_occupancy] loop error: {exc}")
-        time.sleep(POLL_INTERVAL_SEC)
+        if not processed:
+            wait_for_work(SERVICE_NAME, POLL_INTERVAL_SEC)
+
+
+def run_fixture_benchmark(
+    fixtures_dir: str,
+    start_iso: str,
+    end_iso: str,
+    units: Optional[List[int]] = None,
+    latency_sec: float = 0.15,
+    max_workers: int = API_MAX_WORKERS,
+) -> Dict:
+    """Replay offline de fixtures gravadas (AGENDA_OCCUPANCY_RECORD_DIR) num stub HTTP local,
+    comparando a coleta serial (1 worker) com a concorrente. Nao grava nada no banco."""
+    global API_BASE_URL
+    from http_stub import FixtureStubServer
+
+    units = _normalize_unit_scope(units)
+    original_base = API_BASE_URL
+    timings: Dict[str, float] = {}
+    outputs: Dict[str, Dict] = {}
+    with FixtureStubServer(fixtures_dir, latency_sec=latency_sec) as stub:
+        API_BASE_URL = stub.base_url + urlparse(original_base).path
+        try:
+            for label, workers in (("serial", 1), ("concurrent", max_workers)):
+                started = time.perf_counter()
+                outputs[label] = _collect_occupancy_aggregates("fixture", units, start_iso, end_iso, max_workers=workers)
+                timings[label] = round(time.perf_counter() - started, 3)
+        finally:
+            API_BASE_URL = original_base
+        fixture_count = len(stub.fixtures)
+        served, misses, peak = stub.requests_served, stub.misses, stub.max_in_flight
+
+    summary = {
+        "fixtures": fixture_count,
+        "requests": served,
+        "fixture_misses": misses,
+        "peak_in_flight": peak,
+        "serial_sec": timings["serial"],
+        "concurrent_sec": timings["concurrent"],
+        "speedup": round(timings["serial"] / timings["concurrent"], 2) if timings["concurrent"] else None,
+        "identical": outputs["serial"] == outputs["concurrent"],
+        "workers": max_workers,
+        "rate_per_sec": API_RATE_PER_SEC,
+    }
+    print(f"[agenda_occupancy] benchmark {json.dumps(summary, ensure_ascii=False)}")
+    return summary
 
 
 def _cli():
@@ -1287,6 +1461,29 @@ def _cli():
         period_ref = _normalize_period_ref(period_arg)
         start_arg, end_arg = _period_to_range(period_ref)
 
+    if "--benchmark" in args:
+        fixtures_arg = ""
+        latency_ms = 150.0
+        for i, token in enumerate(args):
+            if token.startswith("--fixtures="):
+                fixtures_arg = token.split("=", 1)[1].strip()
+            elif token == "--fixtures" and i + 1 < len(args):
+                fixtures_arg = str(args[i + 1] or "").strip()
+            elif token.startswith("--latency-ms="):
+                latency_ms = float(token.split("=", 1)[1].strip() or 0)
+        if not fixtures_arg:
+            raise SystemExit("--benchmark exige --fixtures=DIR (gravado com AGENDA_OCCUPANCY_RECORD_DIR).")
+        if not start_arg or not end_arg:
+            start_arg, end_arg = _period_to_range(_normalize_period_ref(None))
+        run_fixture_benchmark(
+            fixtures_arg,
+            _to_iso_date(start_arg),
+            _to_iso_date(end_arg),
+            units=units,
+            latency_sec=latency_ms / 1000.0,
+        )
+        return
+
     if "--enqueue" in args:
         if not start_arg or not end_arg:
             period_ref = _normalize_period_ref(None)
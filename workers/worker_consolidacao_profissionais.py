@@ -6,13 +6,16 @@ import json
 import os
 import re
 import sys
+import threading
 import time
 import unicodedata
 import uuid
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote_plus
 
+import lxml.html
 from bs4 import BeautifulSoup
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 
@@ -20,12 +23,16 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from database_manager import DatabaseManager
-    from feegow_web_auth import APP4_BASE_URL, login_feegow_app4, switch_feegow_unit
-    from playwright_runtime import chromium_session
+    from feegow_web_auth import APP4_BASE_URL, feegow_storage_key, login_feegow_app4, switch_feegow_unit
+    from playwright_runtime import browser_lease
+    from report_replay import ReplayClient, ReplayMismatch, RequestRecorder, RequestTemplate, compare_replayed_rows, replay_concurrently
+    from sharded_scrape import SharedAuthState, ShardCoordinator, ShardSession, resolve_shard_count
 except ImportError:
     DatabaseManager = None
-    from .feegow_web_auth import APP4_BASE_URL, login_feegow_app4, switch_feegow_unit
-    from .playwright_runtime import chromium_session
+    from .feegow_web_auth import APP4_BASE_URL, feegow_storage_key, login_feegow_app4, switch_feegow_unit
+    from .playwright_runtime import browser_lease
+    from .report_replay import ReplayClient, ReplayMismatch, RequestRecorder, RequestTemplate, compare_replayed_rows, replay_concurrently
+    from .sharded_scrape import SharedAuthState, ShardCoordinator, ShardSession, resolve_shard_count
 
 
 BASE_URL = APP4_BASE_URL
@@ -50,6 +57,20 @@ ITEM_NO_DATA = "NO_DATA"
 ITEM_SKIPPED_NOT_IN_FILTER = "SKIPPED_NOT_IN_FILTER"
 ITEM_SKIPPED_AMBIGUOUS_NAME = "SKIPPED_AMBIGUOUS_NAME"
 ITEM_ERROR = "ERROR"
+ITEM_FINISHED_STATUSES = (ITEM_SUCCESS, ITEM_NO_DATA, ITEM_SKIPPED_NOT_IN_FILTER, ITEM_SKIPPED_AMBIGUOUS_NAME)
+
+# Contextos de navegador em paralelo por job (cada shard tem a propria thread/sessao ASP).
+CONSOLIDACAO_SHARDS = max(1, int(os.getenv("CONSOLIDACAO_SHARDS", "3") or "3"))
+CONSOLIDACAO_MIN_ITEMS_PER_SHARD = max(1, int(os.getenv("CONSOLIDACAO_MIN_ITEMS_PER_SHARD", "5") or "5"))
+# Job RUNNING sem checkpoint ha mais que isso e considerado orfao (worker caiu) e e retomado.
+CONSOLIDACAO_JOB_STALE_SEC = max(300, int(os.getenv("CONSOLIDACAO_JOB_STALE_SEC", "1800") or "1800"))
+# Replay HTTP: autocomplete do executante + busca capturados no navegador e repetidos via requests.
+CONSOLIDACAO_HTTP_REPLAY = str(os.getenv("CONSOLIDACAO_HTTP_REPLAY", "1")).strip().lower() in ("1", "true", "yes", "on")
+CONSOLIDACAO_HTTP_CONCURRENCY = max(1, int(os.getenv("CONSOLIDACAO_HTTP_CONCURRENCY", "4") or "4"))
+# Profissionais raspados pelo navegador ate achar um com linhas para conferir o replay.
+CONSOLIDACAO_REPLAY_VERIFY_MAX = max(1, int(os.getenv("CONSOLIDACAO_REPLAY_VERIFY_MAX", "3") or "3"))
+# HTML bruto sai serializado de forma diferente pelo navegador e pelo lxml: fora da conferencia do replay.
+REPLAY_COMPARE_IGNORE_KEYS = ("raw_parent_html", "raw_detail_html")
 
 
 def _enable_readonly_safety(page):
@@ -321,6 +342,35 @@ def _ensure_consolidacao_tables(db: "DatabaseManager"):
             return
         conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns_sql})")
 
+    def _ensure_column(conn, table_name: str, column_name: str, column_def_sql: str):
+        if db.use_mysql:
+            rs = conn.execute(
+                """
+                SELECT COUNT(1)
+                FROM information_schema.columns
+                WHERE table_schema = DATABASE()
+                  AND table_name = ?
+                  AND column_name = ?
+                """,
+                (table_name, column_name),
+            )
+            rows = _fetch_rows(rs)
+            cnt = 0
+            if rows:
+                row = rows[0]
+                cnt = int(_row_value(row, 0, "COUNT(1)") or _row_value(row, 0, "count(1)") or 0)
+            if cnt == 0:
+                conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def_sql}")
+            return
+
+        rs = conn.execute(f"PRAGMA table_info({table_name})")
+        exists = any(
+            _clean_ws(_row_value(row, 1, "name")).lower() == column_name.lower()
+            for row in _fetch_rows(rs)
+        )
+        if not exists:
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def_sql}")
+
     conn = db.get_connection()
     try:
         conn.execute(
@@ -391,6 +441,7 @@ def _ensure_consolidacao_tables(db: "DatabaseManager"):
             )
             """
         )
+        _ensure_column(conn, "repasse_consolidacao_jobs", "shard_state_json", "TEXT")
         _ensure_index(conn, "repasse_consolidacao_jobs", "idx_repasse_consol_jobs_period", "period_ref")
         _ensure_index(conn, "repasse_consolidacao_jobs", "idx_repasse_consol_jobs_status", "status")
         _ensure_index(conn, "repasse_consolidacao_jobs", "idx_repasse_consol_jobs_created", "created_at")
@@ -471,15 +522,17 @@ def _list_active_professionals(db: "DatabaseManager", filter_ids: List[str]) ->
 
 
 def _get_pending_job(db: "DatabaseManager") -> Optional[Dict]:
+    stale_before = datetime.fromtimestamp(time.time() - CONSOLIDACAO_JOB_STALE_SEC).strftime("%Y-%m-%d %H:%M:%S")
     rows = db.execute_query(
         """
-        SELECT id, period_ref, scope, requested_by, professional_ids_json
+        SELECT id, period_ref, scope, requested_by, professional_ids_json, status
         FROM repasse_consolidacao_jobs
         WHERE status = ?
+           OR (status = ? AND updated_at < ?)
         ORDER BY created_at ASC
         LIMIT 1
         """,
-        (STATUS_PENDING,),
+        (STATUS_PENDING, STATUS_RUNNING, stale_before),
     ) or []
     if not rows:
         return None
@@ -490,6 +543,7 @@ def _get_pending_job(db: "DatabaseManager") -> Optional[Dict]:
         "scope": _clean_ws(_row_value(row, 2, "scope")),
         "requested_by": _clean_ws(_row_value(row, 3, "requested_by")),
         "professional_ids_json": _row_value(row, 4, "professional_ids_json"),
+        "resumed": _clean_ws(_row_value(row, 5, "status")).upper() == STATUS_RUNNING,
     }
 
 
@@ -551,8 +605,15 @@ def enqueue_consolidacao_job(
     }
 
 
-def _mark_job_running(db: "DatabaseManager", job_id: str):
+def _mark_job_running(db: "DatabaseManager", job_id: str, resumed: bool = False):
     now = _now_ts()
+    if resumed:
+        # Retomada: preserva started_at e o checkpoint; so renova o updated_at para reivindicar o job.
+        db.execute_query(
+            "UPDATE repasse_consolidacao_jobs SET status = ?, updated_at = ? WHERE id = ?",
+            (STATUS_RUNNING, now, job_id),
+        )
+        return
     db.execute_query(
         """
         UPDATE repasse_consolidacao_jobs
@@ -575,6 +636,27 @@ def _mark_job_done(db: "DatabaseManager", job_id: str, status: str, error: str =
     )
 
 
+def _save_shard_checkpoint(db: "DatabaseManager", job_id: str, snapshot: Dict):
+    db.execute_query(
+        "UPDATE repasse_consolidacao_jobs SET shard_state_json = ?, updated_at = ? WHERE id = ?",
+        (json.dumps(snapshot, ensure_ascii=False), _now_ts(), job_id),
+    )
+
+
+def _list_finished_professional_ids(db: "DatabaseManager", job_id: str) -> List[str]:
+    placeholders = ", ".join(["?"] * len(ITEM_FINISHED_STATUSES))
+    rows = db.execute_query(
+        f"""
+        SELECT professional_id
+        FROM repasse_consolidacao_job_items
+        WHERE job_id = ?
+          AND status IN ({placeholders})
+        """,
+        (job_id, *ITEM_FINISHED_STATUSES),
+    ) or []
+    return [_clean_ws(_row_value(row, 0, "professional_id")) for row in rows if _row_value(row, 0, "professional_id")]
+
+
 def _save_job_item(
     db: "DatabaseManager",
     job_id: str,
@@ -931,9 +1013,19 @@ def _handle_concurrent_session_prompt(page):
         pass
 
 
-def _recover_session_and_screen(page, date_from: str, date_to: str):
+def _recover_session_and_screen(
+    page,
+    date_from: str,
+    date_to: str,
+    auth: Optional[SharedAuthState] = None,
+    shard: Optional[ShardSession] = None,
+):
     _handle_concurrent_session_prompt(page)
-    _login_feegow(page)
+    if auth is not None and shard is not None:
+        # Com shards o relogin e coordenado: um login novo derruba as sessoes dos outros shards.
+        auth.recover(page, shard)
+    else:
+        _login_feegow(page)
     _open_consolidacao_screen(page)
     _apply_fixed_filters(page, date_from, date_to)
 
@@ -1289,12 +1381,11 @@ def _parse_detail_rows(detail_tr, debug: bool) -> List[Dict]:
     return detail_entries
 
 
-def _parse_result_rows(page, run_id: str, debug: bool) -> List[Dict]:
-    content = page.content()
+def _parse_result_html(content: str, debug: bool, features: str = "html.parser") -> List[Dict]:
     if re.search(r"Nenhum repasse", content, flags=re.IGNORECASE):
         return []
 
-    soup = BeautifulSoup(content, "html.parser")
+    soup = BeautifulSoup(content, features)
     table = _find_target_table(soup)
     if table is None:
         raise RuntimeError("tabela de consolidacao nao encontrada.")
@@ -1345,11 +1436,41 @@ def _parse_result_rows(page, run_id: str, debug: bool) -> List[Dict]:
 
         i += 2 if detail_tr is not None else 1
 
+    return rows
+
+
+def _parse_result_rows(page, run_id: str, debug: bool) -> List[Dict]:
+    rows = _parse_result_html(page.content(), debug)
     if debug and not rows:
         _dump_page(page, run_id, "parse_empty", debug)
     return rows
 
 
+def _parse_candidates_html(raw_html: str) -> List[Dict[str, str]]:
+    """Itens do autocomplete de executante (`.select-insert-item`) devolvidos pelo replay HTTP."""
+    if not _clean_ws(raw_html):
+        return []
+    try:
+        doc = lxml.html.fromstring(raw_html)
+    except Exception as exc:
+        raise ReplayMismatch(f"resposta do autocomplete ilegivel: {exc}")
+    out = []
+    for item in doc.xpath("//*[contains(concat(' ', normalize-space(@class), ' '), ' select-insert-item ')]"):
+        out.append(
+            {
+                "title": _clean_ws(item.get("data-title") or item.text_content()),
+                "value": _clean_ws(item.get("data-valor")),
+            }
+        )
+    return out
+
+
+def _looks_like_search_result(raw_html: str) -> bool:
+    if re.search(r"Nenhum repasse", raw_html or "", flags=re.IGNORECASE):
+        return True
+    return _find_target_table(BeautifulSoup(raw_html or "", "lxml")) is not None
+
+
 def _hash_line(period_ref: str, prof_internal_id: str, item: Dict) -> str:
     source = "|".join(
         [
@@ -1375,6 +1496,51 @@ def _hash_line(period_ref: str, prof_internal_id: str, item: Dict) -> str:
     return hashlib.md5(source.encode("utf-8")).hexdigest()
 
 
+def _build_output_rows(
+    run_id: str,
+    period_ref: str,
+    prof: Dict,
+    parsed: List[Dict],
+    chosen_candidate: Optional[Dict[str, str]],
+) -> List[Dict]:
+    out_rows = []
+    chosen_value = _clean_ws((chosen_candidate or {}).get("value"))
+    chosen_title = _clean_ws((chosen_candidate or {}).get("title"))
+    for item in parsed:
+        line_hash = _hash_line(period_ref, prof["internal_id"], item)
+        out_rows.append(
+            {
+                "run_id": run_id,
+                "period_ref": period_ref,
+                "professional_filter_id": prof["internal_id"],
+                "professional_filter_name": prof["name"],
+                "invoice_id": _clean_ws(item.get("invoice_id")),
+                "execution_date": _clean_ws(item.get("execution_date")),
+                "patient_name": _clean_ws(item.get("patient_name")),
+                "unit_name": _clean_ws(item.get("unit_name")),
+                "account_date": _clean_ws(item.get("account_date")),
+                "requester_name": _clean_ws(item.get("requester_name")),
+                "specialty_name": _clean_ws(item.get("specialty_name")),
+                "procedure_name": _clean_ws(item.get("procedure_name")),
+                "attendance_value_raw": _clean_ws(item.get("attendance_value_raw")),
+                "attendance_value_num": float(item.get("attendance_value_num") or 0),
+                "detail_status": _clean_ws(item.get("detail_status")),
+                "detail_status_text": _clean_ws(item.get("detail_status_text")),
+                "role_code": _clean_ws(item.get("role_code")),
+                "role_name": _clean_ws(item.get("role_name")),
+                "detail_professional_name": _clean_ws(item.get("detail_professional_name")),
+                "detail_repasse_raw": _clean_ws(item.get("detail_repasse_raw")),
+                "detail_repasse_num": float(item.get("detail_repasse_num") or 0),
+                "line_key_hash": line_hash,
+                "executante_option_value": chosen_value,
+                "executante_option_title": chosen_title,
+                "raw_parent_html": item.get("raw_parent_html") or "",
+                "raw_detail_html": item.get("raw_detail_html") or "",
+            }
+        )
+    return out_rows
+
+
 def _process_professional(
     page,
     run_id: str,
@@ -1384,6 +1550,8 @@ def _process_professional(
     prof: Dict,
     debug: bool,
     heartbeat_cb=None,
+    auth: Optional[SharedAuthState] = None,
+    shard: Optional[ShardSession] = None,
 ) -> Tuple[str, List[Dict], Optional[Dict]]:
     last_error = None
     for attempt in range(1, DEFAULT_RETRY_ATTEMPTS + 1):
@@ -1406,49 +1574,14 @@ def _process_professional(
             if not parsed:
                 return "NO_DATA", [], None
 
-            out_rows = []
-            chosen_value = _clean_ws((chosen_candidate or {}).get("value"))
-            chosen_title = _clean_ws((chosen_candidate or {}).get("title"))
-            for item in parsed:
-                line_hash = _hash_line(period_ref, prof["internal_id"], item)
-                out_rows.append(
-                    {
-                        "run_id": run_id,
-                        "period_ref": period_ref,
-                        "professional_filter_id": prof["internal_id"],
-                        "professional_filter_name": prof["name"],
-                        "invoice_id": _clean_ws(item.get("invoice_id")),
-                        "execution_date": _clean_ws(item.get("execution_date")),
-                        "patient_name": _clean_ws(item.get("patient_name")),
-                        "unit_name": _clean_ws(item.get("unit_name")),
-                        "account_date": _clean_ws(item.get("account_date")),
-                        "requester_name": _clean_ws(item.get("requester_name")),
-                        "specialty_name": _clean_ws(item.get("specialty_name")),
-                        "procedure_name": _clean_ws(item.get("procedure_name")),
-                        "attendance_value_raw": _clean_ws(item.get("attendance_value_raw")),
-                        "attendance_value_num": float(item.get("attendance_value_num") or 0),
-                        "detail_status": _clean_ws(item.get("detail_status")),
-                        "detail_status_text": _clean_ws(item.get("detail_status_text")),
-                        "role_code": _clean_ws(item.get("role_code")),
-                        "role_name": _clean_ws(item.get("role_name")),
-                        "detail_professional_name": _clean_ws(item.get("detail_professional_name")),
-                        "detail_repasse_raw": _clean_ws(item.get("detail_repasse_raw")),
-                        "detail_repasse_num": float(item.get("detail_repasse_num") or 0),
-                        "line_key_hash": line_hash,
-                        "executante_option_value": chosen_value,
-                        "executante_option_title": chosen_title,
-                        "raw_parent_html": item.get("raw_parent_html") or "",
-                        "raw_detail_html": item.get("raw_detail_html") or "",
-                    }
-                )
-
+            out_rows = _build_output_rows(run_id, period_ref, prof, parsed, chosen_candidate)
             return "OK", out_rows, None
 
         except Exception as exc:
             last_error = exc
             if attempt < DEFAULT_RETRY_ATTEMPTS:
                 try:
-                    _recover_session_and_screen(page, date_from, date_to)
+                    _recover_session_and_screen(page, date_from, date_to, auth, shard)
                 except Exception as recover_exc:
                     last_error = RuntimeError(f"{exc} | recovery_failed={recover_exc}")
                 continue
@@ -1566,6 +1699,327 @@ def _save_debug_outputs(
     print(f"debug_summary: {output_paths['summary']}")
 
 
+def _persist_professional_result(
+    db: "DatabaseManager",
+    job_id: str,
+    run_id: str,
+    period_ref: str,
+    prof: Dict,
+    status: str,
+    rows: List[Dict],
+    err: Optional[Dict],
+    duration_ms: int,
+    label: str,
+    counters: Dict[str, int],
+    all_rows: List[Dict],
+    all_errors: List[Dict],
+    lock: threading.Lock,
+) -> str:
+    """Grava o resultado de um profissional (linhas + item do job) e acumula contadores sob `lock`."""
+    if status == "OK":
+        _hb(db, "RUNNING", job_id, "persist", f"profissional={prof['name']}")
+        _upsert_professional_rows(
+            db=db,
+            job_id=job_id,
+            period_ref=period_ref,
+            professional_id=prof["internal_id"],
+            professional_name=prof["name"],
+            rows=rows,
+        )
+        total_repasse = Decimal("0")
+        for item in rows:
+            total_repasse += Decimal(str(item.get("detail_repasse_num") or 0))
+        _save_job_item(
+            db,
+            job_id,
+            prof["internal_id"],
+            prof["name"],
+            ITEM_SUCCESS,
+            len(rows),
+            total_repasse,
+            "",
+            duration_ms,
+        )
+        with lock:
+            counters["ok"] += 1
+            all_rows.extend(rows)
+        print(f"[{label}] OK {prof['name']}: linhas={len(rows)} total={float(total_repasse):.2f}")
+        return ITEM_SUCCESS
+
+    if status == "NO_DATA":
+        _hb(db, "RUNNING", job_id, "persist", f"profissional={prof['name']}")
+        _upsert_professional_rows(
+            db=db,
+            job_id=job_id,
+            period_ref=period_ref,
+            professional_id=prof["internal_id"],
+            professional_name=prof["name"],
+            rows=[],
+        )
+        _save_job_item(
+            db,
+            job_id,
+            prof["internal_id"],
+            prof["name"],
+            ITEM_NO_DATA,
+            0,
+            Decimal("0"),
+            "",
+            duration_ms,
+        )
+        with lock:
+            counters["no_data"] += 1
+        print(f"[{label}] NO_DATA {prof['name']}")
+        return ITEM_NO_DATA
+
+    if status == "SKIPPED_NOT_IN_FILTER":
+        _save_job_item(
+            db,
+            job_id,
+            prof["internal_id"],
+            prof["name"],
+            ITEM_SKIPPED_NOT_IN_FILTER,
+            0,
+            Decimal("0"),
+            "Executante nao encontrado no filtro da tela",
+            duration_ms,
+        )
+        with lock:
+            counters["skipped"] += 1
+        print(f"[{label}] SKIPPED_NOT_IN_FILTER {prof['name']}")
+        return ITEM_SKIPPED_NOT_IN_FILTER
+
+    if status == "SKIPPED_AMBIGUOUS_NAME":
+        _save_job_item(
+            db,
+            job_id,
+            prof["internal_id"],
+            prof["name"],
+            ITEM_SKIPPED_AMBIGUOUS_NAME,
+            0,
+            Decimal("0"),
+            "Nome ambiguo no filtro de executante",
+            duration_ms,
+        )
+        with lock:
+            counters["skipped_ambiguous"] += 1
+        print(f"[{label}] SKIPPED_AMBIGUOUS_NAME {prof['name']}")
+        return ITEM_SKIPPED_AMBIGUOUS_NAME
+
+    message = _clean_ws((err or {}).get("message")) or "erro desconhecido"
+    with lock:
+        counters["error"] += 1
+        all_errors.append(
+            {
+                "run_id": run_id,
+                "period_ref": period_ref,
+                "professional_id": prof["internal_id"],
+                "professional_name": prof["name"],
+                "status": status,
+                "duration_ms": duration_ms,
+                "error": err or {"message": message},
+                "logged_at": _now_ts(),
+            }
+        )
+    _save_job_item(
+        db,
+        job_id,
+        prof["internal_id"],
+        prof["name"],
+        ITEM_ERROR,
+        0,
+        Decimal("0"),
+        message,
+        duration_ms,
+    )
+    print(f"[{label}] ERROR {prof['name']}: {message}")
+    return ITEM_ERROR
+
+
+def _replay_professional(
+    client: ReplayClient,
+    candidates_template: RequestTemplate,
+    search_template: RequestTemplate,
+    run_id: str,
+    period_ref: str,
+    prof: Dict,
+    debug: bool,
+) -> Tuple[str, List[Dict]]:
+    """Mesmo fluxo de `_process_professional` (autocomplete -> escolha -> busca -> parse) via replay HTTP."""
+    candidates = _parse_candidates_html(client.fetch(candidates_template, prof["name"]))
+    chosen, match_status = _choose_candidate_for_professional(prof, candidates)
+    if match_status == "AMBIGUOUS":
+        return "SKIPPED_AMBIGUOUS_NAME", []
+    if match_status != "OK" or not chosen or not _clean_ws(chosen.get("value")):
+        return "SKIPPED_NOT_IN_FILTER", []
+    raw_html = client.fetch(search_template, _clean_ws(chosen.get("value")))
+    try:
+        parsed = _parse_result_html(raw_html, debug, features="lxml")
+    except RuntimeError as exc:
+        raise ReplayMismatch(str(exc))
+    if not parsed:
+        return "NO_DATA", []
+    return "OK", _build_output_rows(run_id, period_ref, prof, parsed, chosen)
+
+
+def _capture_replay_templates(
+    page,
+    lease,
+    run_id: str,
+    period_ref: str,
+    date_from: str,
+    date_to: str,
+    remaining: List[Dict],
+    debug: bool,
+    persist,
+    next_label,
+) -> Tuple[Optional[RequestTemplate], Optional[RequestTemplate], Optional[ReplayClient]]:
+    """Raspa os primeiros profissionais pelo navegador gravando autocomplete e busca; o replay so vale
+    se devolver, para um profissional com linhas, o mesmo executante e as mesmas linhas (chaves e valores)."""
+    for _ in range(min(CONSOLIDACAO_REPLAY_VERIFY_MAX, len(remaining))):
+        prof = remaining[0]
+        t0 = time.time()
+        with RequestRecorder(page) as recorder:
+            status, rows, err = _process_professional(
+                page=page,
+                run_id=run_id,
+                period_ref=period_ref,
+                date_from=date_from,
+                date_to=date_to,
+                prof=prof,
+                debug=debug,
+            )
+        remaining.pop(0)
+        persist(prof, status, rows, err, int((time.time() - t0) * 1000), next_label())
+        if status != "OK" or not rows:
+            continue
+
+        chosen_value = _clean_ws(rows[0].get("executante_option_value"))
+        candidates_capture = recorder.find(
+            lambda req: "select-insert-item" in (req.response_text or "")
+            and prof["name"] in unquote_plus(f"{req.body} {req.url}")
+        )
+        search_capture = recorder.find(
+            lambda req: bool(chosen_value)
+            and chosen_value in unquote_plus(f"{req.body} {req.url}")
+            and _looks_like_search_result(req.response_text)
+        )
+        if candidates_capture is None or search_capture is None:
+            raise ReplayMismatch("requisicoes de autocomplete/busca nao identificadas entre as capturadas")
+        candidates_template = RequestTemplate.from_capture(candidates_capture, prof["name"])
+        search_template = RequestTemplate.from_capture(search_capture, chosen_value, prefer_field="AccountID")
+        client = ReplayClient(lease.context, CONSOLIDACAO_HTTP_CONCURRENCY)
+        try:
+            replay_status, replay_rows = _replay_professional(
+                client, candidates_template, search_template, run_id, period_ref, prof, debug
+            )
+        except Exception:
+            client.close()
+            raise
+        replay_value = _clean_ws(replay_rows[0].get("executante_option_value")) if replay_rows else ""
+        divergence = None
+        if replay_status != "OK" or replay_value != chosen_value:
+            divergence = f"replay devolveu {replay_status}/{len(replay_rows)} linha(s), navegador OK/{len(rows)}"
+        else:
+            divergence = compare_replayed_rows(rows, replay_rows, ignore_keys=REPLAY_COMPARE_IGNORE_KEYS)
+        if divergence:
+            client.close()
+            raise ReplayMismatch(divergence)
+        return candidates_template, search_template, client
+    return None, None, None
+
+
+def _replay_pending_professionals(
+    db: "DatabaseManager",
+    job_id: str,
+    run_id: str,
+    period_ref: str,
+    date_from: str,
+    date_to: str,
+    pending: List[Dict],
+    headless: bool,
+    debug: bool,
+    persist,
+    next_label,
+) -> List[Dict]:
+    """Processa os profissionais pelo replay HTTP, em paralelo. Retorna os que precisam do navegador
+    (replay indisponivel, layout/CSRF divergente ou falha de rede)."""
+    remaining = list(pending)
+    candidates_template = search_template = None
+    client: Optional[ReplayClient] = None
+    capture_error: Optional[Exception] = None
+    _hb(db, "RUNNING", job_id, "replay_captura")
+    try:
+        with browser_lease(
+            headless=headless,
+            storage_key=feegow_storage_key(os.getenv("FEEGOW_USER"), 0, scope="consolidacao"),
+            context_options={"ignore_https_errors": True},
+        ) as lease:
+            page = lease.context.new_page()
+            page.on("dialog", lambda dialog: dialog.accept())
+            try:
+                with lease.timed("login"):
+                    _login_feegow(page)
+                _open_consolidacao_screen(page)
+                _apply_fixed_filters(page, date_from, date_to)
+                # Divergencia na captura nao pode sair do lease: o broker descartaria a sessao salva.
+                try:
+                    candidates_template, search_template, client = _capture_replay_templates(
+                        page, lease, run_id, period_ref, date_from, date_to, remaining, debug, persist, next_label
+                    )
+                except Exception as exc:
+                    capture_error = exc
+            finally:
+                try:
+                    page.close()
+                except Exception:
+                    pass
+    except Exception as exc:
+        capture_error = exc
+
+    if client is None or candidates_template is None or search_template is None:
+        reason = capture_error or "sem profissional com linhas para conferir"
+        print(f"⚠️ Replay HTTP da consolidacao indisponivel ({reason}); seguindo pelo navegador.")
+        return remaining
+
+    fallback: List[Dict] = []
+    started_at: Dict[str, float] = {}
+    replay_started = time.time()
+    done = 0
+    mismatch_logged = False
+
+    def _replay_one(prof: Dict) -> Tuple[str, List[Dict]]:
+        started_at[prof["internal_id"]] = time.time()
+        return _replay_professional(client, candidates_template, search_template, run_id, period_ref, prof, debug)
+
+    print(
+        f"🌐 Replay HTTP da consolidacao | profissionais={len(remaining)} concorrencia={client.concurrency} "
+        f"sessao_asp={'propria' if client.own_asp_session else 'navegador'}"
+    )
+    _hb(db, "RUNNING", job_id, "replay_http", f"profissionais={len(remaining)}")
+    try:
+        for prof, result, error in replay_concurrently(client, remaining, _replay_one):
+            if error is not None:
+                fallback.append(prof)
+                if isinstance(error, ReplayMismatch) and not mismatch_logged:
+                    mismatch_logged = True
+                    print(f"⚠️ Replay HTTP divergente ({error}); restantes voltam para o navegador.")
+                continue
+            status, rows = result
+            duration_ms = int((time.time() - started_at.get(prof["internal_id"], time.time())) * 1000)
+            persist(prof, status, rows, None, duration_ms, next_label("http"))
+            done += 1
+    finally:
+        client.close()
+
+    elapsed = max(0.001, time.time() - replay_started)
+    print(
+        f"📊 [consolidacao {job_id[:8]}] replay http itens={done}/{len(remaining)} "
+        f"ritmo={done * 60.0 / elapsed:.2f}/min requisicoes={client.requests_sent} navegador={len(fallback)}"
+    )
+    return fallback
+
+
 def _hb(db: "DatabaseManager", status: str, job_id: str, stage: str, extra: str = ""):
     details = f"job={job_id} etapa={stage}"
     if extra:
@@ -1596,6 +2050,12 @@ def _process_job(
         print(f"--- Repasse a conferir | job={job_id} | status={STATUS_FAILED} (sem profissionais) ---")
         return
 
+    # Retomada apos queda: so os profissionais sem item concluido voltam para a fila.
+    finished_ids = set(_list_finished_professional_ids(db, job_id)) if job.get("resumed") else set()
+    pending = [prof for prof in professionals if prof["internal_id"] not in finished_ids]
+    resumed_count = len(professionals) - len(pending)
+    shard_count = resolve_shard_count(len(pending), CONSOLIDACAO_SHARDS, CONSOLIDACAO_MIN_ITEMS_PER_SHARD)
+
     scope_label = _clean_ws(job.get("scope")) or ("selected" if selected_ids else "all")
     run_id = _run_id()
     start_ts = time.time()
@@ -1611,151 +2071,153 @@ def _process_job(
 
     print(
         f"--- Repasse a conferir | job={job_id} | periodo={period_ref} | "
-        f"de={date_from} ate={date_to} | profissionais={len(professionals)} | escopo={scope_label} ---"
+        f"de={date_from} ate={date_to} | profissionais={len(professionals)} | escopo={scope_label} | "
+        f"shards={shard_count}" + (f" | retomados={resumed_count}" if resumed_count else "") + " ---"
     )
     _hb(db, "RUNNING", job_id, "init", f"periodo={period_ref} profissionais={len(professionals)}")
 
-    with chromium_session(headless=headless) as browser:
-        context = browser.new_context(ignore_https_errors=True)
-        page = context.new_page()
-        page.on("dialog", lambda dialog: dialog.accept())
+    counters_lock = threading.Lock()
+    seen = [resumed_count]
+    auth = SharedAuthState(_login_feegow)
+
+    def _next_label(suffix: str = "") -> str:
+        with counters_lock:
+            seen[0] += 1
+            label = f"{seen[0]}/{len(professionals)}"
+        return f"{label} {suffix}" if suffix else label
+
+    def _persist(prof: Dict, status: str, rows: List[Dict], err: Optional[Dict], duration_ms: int, label: str) -> str:
+        return _persist_professional_result(
+            db,
+            job_id,
+            run_id,
+            period_ref,
+            prof,
+            status,
+            rows,
+            err,
+            duration_ms,
+            label,
+            counters,
+            all_rows,
+            all_errors,
+            counters_lock,
+        )
+
+    if CONSOLIDACAO_HTTP_REPLAY and len(pending) > 1:
+        pending = _replay_pending_professionals(
+            db,
+            job_id,
+            run_id,
+            period_ref,
+            date_from,
+            date_to,
+            pending,
+            headless,
+            debug,
+            _persist,
+            _next_label,
+        )
+        shard_count = resolve_shard_count(len(pending), CONSOLIDACAO_SHARDS, CONSOLIDACAO_MIN_ITEMS_PER_SHARD)
+
+    def _run_shard(shard_id: int, items, progress):
+        shard = ShardSession(shard_id)
+        leader = shard_id == 0
+        if leader:
+            lease_cm = browser_lease(
+                headless=headless,
+                storage_key=feegow_storage_key(os.getenv("FEEGOW_USER"), 0, scope="consolidacao"),
+                context_options={"ignore_https_errors": True},
+            )
+        else:
+            auth.wait_ready()
+            lease_cm = browser_lease(
+                headless=headless,
+                startup_label="consolidacao_shard",
+                context_options=auth.context_options(shard, {"ignore_https_errors": True}),
+                session_slot=False,
+                keep_warm=False,
+            )
+
         try:
-            _hb(db, "RUNNING", job_id, "login")
-            _login_feegow(page)
-            _hb(db, "RUNNING", job_id, "filtros")
-            _open_consolidacao_screen(page)
-            _apply_fixed_filters(page, date_from, date_to)
-
-            for idx, prof in enumerate(professionals, start=1):
-                t0 = time.time()
-
-                def _stage_cb(stage: str, prof_name: str = ""):
-                    if stage in ("validacao", "executante", "buscar", "parse"):
-                        suffix = f"profissional={prof_name}" if prof_name else ""
-                        _hb(db, "RUNNING", job_id, stage, suffix)
-
-                status, rows, err = _process_professional(
-                    page=page,
-                    run_id=run_id,
-                    period_ref=period_ref,
-                    date_from=date_from,
-                    date_to=date_to,
-                    prof=prof,
-                    debug=debug,
-                    heartbeat_cb=_stage_cb,
-                )
-
-                duration_ms = int((time.time() - t0) * 1000)
-                if status == "OK":
-                    _hb(db, "RUNNING", job_id, "persist", f"profissional={prof['name']}")
-                    _upsert_professional_rows(
-                        db=db,
-                        job_id=job_id,
-                        period_ref=period_ref,
-                        professional_id=prof["internal_id"],
-                        professional_name=prof["name"],
-                        rows=rows,
-                    )
-                    total_repasse = Decimal("0")
-                    for item in rows:
-                        total_repasse += Decimal(str(item.get("detail_repasse_num") or 0))
-                    _save_job_item(
-                        db,
-                        job_id,
-                        prof["internal_id"],
-                        prof["name"],
-                        ITEM_SUCCESS,
-                        len(rows),
-                        total_repasse,
-                        "",
-                        duration_ms,
-                    )
-                    counters["ok"] += 1
-                    all_rows.extend(rows)
-                    print(
-                        f"[{idx}/{len(professionals)}] OK {prof['name']}: "
-                        f"linhas={len(rows)} total={float(total_repasse):.2f}"
-                    )
-                elif status == "NO_DATA":
-                    _hb(db, "RUNNING", job_id, "persist", f"profissional={prof['name']}")
-                    _upsert_professional_rows(
-                        db=db,
-                        job_id=job_id,
-                        period_ref=period_ref,
-                        professional_id=prof["internal_id"],
-                        professional_name=prof["name"],
-                        rows=[],
-                    )
-                    _save_job_item(
-                        db,
-                        job_id,
-                        prof["internal_id"],
-                        prof["name"],
-                        ITEM_NO_DATA,
-                        0,
-                        Decimal("0"),
-                        "",
-                        duration_ms,
-                    )
-                    counters["no_data"] += 1
-                    print(f"[{idx}/{len(professionals)}] NO_DATA {prof['name']}")
-                elif status == "SKIPPED_NOT_IN_FILTER":
-                    _save_job_item(
-                        db,
-                        job_id,
-                        prof["internal_id"],
-                        prof["name"],
-                        ITEM_SKIPPED_NOT_IN_FILTER,
-                        0,
-                        Decimal("0"),
-                        "Executante nao encontrado no filtro da tela",
-                        duration_ms,
-                    )
-                    counters["skipped"] += 1
-                    print(f"[{idx}/{len(professionals)}] SKIPPED_NOT_IN_FILTER {prof['name']}")
-                elif status == "SKIPPED_AMBIGUOUS_NAME":
-                    _save_job_item(
-                        db,
-                        job_id,
-                        prof["internal_id"],
-                        prof["name"],
-                        ITEM_SKIPPED_AMBIGUOUS_NAME,
-                        0,
-                        Decimal("0"),
-                        "Nome ambiguo no filtro de executante",
-                        duration_ms,
-                    )
-                    counters["skipped_ambiguous"] += 1
-                    print(f"[{idx}/{len(professionals)}] SKIPPED_AMBIGUOUS_NAME {prof['name']}")
-                else:
-                    counters["error"] += 1
-                    message = _clean_ws((err or {}).get("message")) or "erro desconhecido"
-                    all_errors.append(
-                        {
-                            "run_id": run_id,
-                            "period_ref": period_ref,
-                            "professional_id": prof["internal_id"],
-                            "professional_name": prof["name"],
-                            "status": status,
-                            "duration_ms": duration_ms,
-                            "error": err or {"message": message},
-                            "logged_at": _now_ts(),
-                        }
-                    )
-                    _save_job_item(
-                        db,
-                        job_id,
-                        prof["internal_id"],
-                        prof["name"],
-                        ITEM_ERROR,
-                        0,
-                        Decimal("0"),
-                        message,
-                        duration_ms,
-                    )
-                    print(f"[{idx}/{len(professionals)}] ERROR {prof['name']}: {message}")
-        finally:
-            context.close()
+            with lease_cm as lease:
+                page = lease.context.new_page()
+                page.on("dialog", lambda dialog: dialog.accept())
+                try:
+                    if leader:
+                        _hb(db, "RUNNING", job_id, "login")
+                        with lease.timed("login"):
+                            _login_feegow(page)
+                        auth.publish(lease.context)
+                        _hb(db, "RUNNING", job_id, "filtros")
+                    try:
+                        _open_consolidacao_screen(page)
+                        _apply_fixed_filters(page, date_from, date_to)
+                    except Exception:
+                        if leader:
+                            raise
+                        _recover_session_and_screen(page, date_from, date_to, auth, shard)
+
+                    for prof in items:
+                        t0 = time.time()
+                        label = _next_label(f"s{shard_id + 1}" if shard_count > 1 else "")
+
+                        def _stage_cb(stage: str, prof_name: str = ""):
+                            if stage in ("validacao", "executante", "buscar", "parse"):
+                                suffix = f"profissional={prof_name}" if prof_name else ""
+                                _hb(db, "RUNNING", job_id, stage, suffix)
+
+                        status, rows, err = _process_professional(
+                            page=page,
+                            run_id=run_id,
+                            period_ref=period_ref,
+                            date_from=date_from,
+                            date_to=date_to,
+                            prof=prof,
+                            debug=debug,
+                            heartbeat_cb=_stage_cb,
+                            auth=auth if shard_count > 1 else None,
+                            shard=shard,
+                        )
+                        item_status = _persist(prof, status, rows, err, int((time.time() - t0) * 1000), label)
+                        progress.record(prof["internal_id"], item_status, len(rows) if status == "OK" else 0)
+                finally:
+                    # O contexto e fechado pelo broker; a pagina sai antes para liberar memoria do navegador quente.
+                    try:
+                        page.close()
+                    except Exception:
+                        pass
+        except Exception as exc:
+            if leader:
+                # Inclui falha ao abrir o lease (sem slot/launch): seguidores nao esperam o timeout.
+                auth.fail(exc)
+            raise
+
+    if pending:
+        coordinator = ShardCoordinator(
+            pending,
+            shard_count,
+            _run_shard,
+            checkpoint_fn=lambda snapshot: _save_shard_checkpoint(db, job_id, snapshot),
+            label=f"consolidacao {job_id[:8]}",
+            resumed_items=resumed_count,
+        )
+        summary = coordinator.run()
+        aborted = [item["error"] for item in summary["shards"] if item["error"]]
+        leftovers = coordinator.remaining()
+        if aborted and len(leftovers) == len(pending):
+            # Nenhum shard chegou a processar (ex.: login do lider falhou): falha o job como antes.
+            raise RuntimeError(aborted[0])
+        # Itens nao concluidos por shards abortados viram erro (o job nao e retomado depois).
+        for prof in leftovers:
+            _persist(
+                prof,
+                "ERROR",
+                [],
+                {"stage": "shard", "message": f"shard abortado: {aborted[0] if aborted else 'sem shard disponivel'}"},
+                0,
+                "-",
+            )
 
     if counters["error"] >= len(professionals):
         final_status = STATUS_FAILED
@@ -1828,7 +2290,9 @@ def process_pending_consolidacao_jobs_once(
         db.update_heartbeat(SERVICE_NAME, "COMPLETED", "Sem jobs pendentes")
         return False
 
-    _mark_job_running(db, pending["id"])
+    _mark_job_running(db, pending["id"], resumed=bool(pending.get("resumed")))
+    if pending.get("resumed"):
+        print(f"🔁 Retomando job de consolidacao interrompido | id={pending['id']} | periodo={pending['period_ref']}")
     try:
         _process_job(
             db=db,
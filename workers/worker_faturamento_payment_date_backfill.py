@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import argparse
+import calendar
+
+# --- SETUP DE IMPORTS ---
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from database_manager import DatabaseManager
+except ImportError:
+    DatabaseManager = None
+
+from worker_faturamento_scraping import (
+    PAYMENT_DATE_COL,
+    _ensure_payment_date_index,
+    _fetch_scalar,
+    _parse_report_date,
+    _table_columns,
+    update_faturamento_summary,
+)
+
+TABLE_NAME = "faturamento_analitico"
+
+
+def _rows(result):
+    if result is None:
+        return []
+    if hasattr(result, "fetchall"):
+        return result.fetchall()
+    return list(result)
+
+
+def ensure_payment_date_column(db, conn):
+    if PAYMENT_DATE_COL not in _table_columns(conn, TABLE_NAME):
+        sql_type = "VARCHAR(10)" if db.use_mysql else "TEXT"
+        print(f"➕ Adicionando coluna {PAYMENT_DATE_COL} em {TABLE_NAME}")
+        conn.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN {PAYMENT_DATE_COL} {sql_type}")
+    _ensure_payment_date_index(db, conn, TABLE_NAME)
+    if not db.use_turso:
+        conn.commit()
+
+
+def backfill_payment_date(db, batch_size=200, sleep_seconds=0.0):
+    """Preenche payment_date das linhas antigas em lotes de valores distintos de data_do_pagamento:
+    cada lote e um UPDATE com CASE (um scan por lote, nao por linha). Idempotente e retomavel."""
+    conn = db.get_connection()
+    total_values = 0
+    try:
+        ensure_payment_date_column(db, conn)
+
+        # Linhas sem data de origem recebem '' (sentinela de "nao normalizavel").
+        conn.execute(
+            f"UPDATE {TABLE_NAME} SET {PAYMENT_DATE_COL} = '' "
+            f"WHERE {PAYMENT_DATE_COL} IS NULL AND data_do_pagamento IS NULL"
+        )
+        if not db.use_turso:
+            conn.commit()
+
+        while True:
+            values = [
+                row[0]
+                for row in _rows(conn.execute(
+                    f"""
+                    SELECT DISTINCT data_do_pagamento
+                    FROM {TABLE_NAME}
+                    WHERE {PAYMENT_DATE_COL} IS NULL
+                    LIMIT ?
+                    """,
+                    (int(batch_size),),
+                ))
+            ]
+            if not values:
+                break
+
+            case_sql = " ".join(["WHEN ? THEN ?"] * len(values))
+            case_params = []
+            for value in values:
+                case_params.extend([value, _parse_report_date(value) or ""])
+            placeholders = ", ".join(["?"] * len(values))
+            conn.execute(
+                f"""
+                UPDATE {TABLE_NAME}
+                SET {PAYMENT_DATE_COL} = CASE data_do_pagamento {case_sql} ELSE '' END
+                WHERE {PAYMENT_DATE_COL} IS NULL
+                  AND data_do_pagamento IN ({placeholders})
+                """,
+                tuple(case_params) + tuple(values),
+            )
+            if not db.use_turso:
+                conn.commit()
+            total_values += len(values)
+            print(f"   💾 payment_date preenchido para {total_values} valor(es) distinto(s) de data_do_pagamento")
+            if sleep_seconds > 0:
+                time.sleep(sleep_seconds)
+    finally:
+        conn.close()
+    return total_values
+
+
+def rebuild_summaries(db, start_date_iso=None, end_date_iso=None):
+    """Recalcula os resumos mes a mes (substitui o backfill completo que rodava dentro do scraper)."""
+    conn = db.get_connection()
+    try:
+        min_d = start_date_iso or _fetch_scalar(conn.execute(
+            f"SELECT MIN({PAYMENT_DATE_COL}) FROM {TABLE_NAME} WHERE {PAYMENT_DATE_COL} > ''"
+        ))
+        max_d = end_date_iso or _fetch_scalar(conn.execute(
+            f"SELECT MAX({PAYMENT_DATE_COL}) FROM {TABLE_NAME} WHERE {PAYMENT_DATE_COL} > ''"
+        ))
+    finally:
+        conn.close()
+    if not min_d or not max_d:
+        print("⏭️ Sem datas em faturamento_analitico para recalcular resumos.")
+        return 0
+
+    year, month = int(min_d[:4]), int(min_d[5:7])
+    months = 0
+    while f"{year:04d}-{month:02d}" <= max_d[:7]:
+        last_day = calendar.monthrange(year, month)[1]
+        update_faturamento_summary(
+            db,
+            f"{year:04d}-{month:02d}-01",
+            f"{year:04d}-{month:02d}-{last_day:02d}",
+            update_monthly=True,
+        )
+        months += 1
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return months
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Migração única: preenche faturamento_analitico.payment_date em lotes e, opcionalmente, recalcula os resumos."
+    )
+    parser.add_argument("--batch-size", type=int, default=200, help="Valores distintos de data por lote (padrão: 200).")
+    parser.add_argument("--sleep-seconds", type=float, default=0.0, help="Pausa entre lotes em segundos.")
+    parser.add_argument("--rebuild-summary", action="store_true", help="Recalcula resumo diário/mensal do histórico após o preenchimento.")
+    parser.add_argument("--start-date", default="", help="Início do recálculo de resumos (YYYY-MM-DD). Padrão: menor data.")
+    parser.add_argument("--end-date", default="", help="Fim do recálculo de resumos (YYYY-MM-DD). Padrão: maior data.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = DatabaseManager()
+    started = time.time()
+    values = backfill_payment_date(db, batch_size=max(1, args.batch_size), sleep_seconds=max(0.0, args.sleep_seconds))
+    print(f"✅ payment_date: {values} valor(es) distinto(s) migrado(s) em {time.time() - started:.1f}s")
+    if args.rebuild_summary:
+        months = rebuild_summaries(db, args.start_date or None, args.end_date or None)
+        print(f"✅ Resumos recalculados: {months} mês(es)")
@@ -11,8 +11,8 @@ import hashlib
 import hashlib
 import unicodedata
 from io import StringIO
-from feegow_web_auth import APP4_BASE_URL, login_feegow_app4, switch_feegow_unit
-from playwright_runtime import chromium_session
+from feegow_web_auth import APP4_BASE_URL, feegow_storage_key, login_feegow_app4, switch_feegow_unit
+from playwright_runtime import browser_lease
 
 # --- SETUP DE IMPORTS ---
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -121,6 +121,42 @@ def _ensure_mysql_unique_index(conn, table_name, index_name, columns_sql):
 def _ensure_sqlite_unique_index(conn, index_name, table_name, columns_sql):
     conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns_sql})")
 
+# Data de pagamento normalizada (YYYY-MM-DD) gravada junto com a linha: filtros e GROUP BY do
+# resumo usam o indice em vez de reinterpretar data_do_pagamento (texto em varios formatos).
+PAYMENT_DATE_COL = 'payment_date'
+PAYMENT_DATE_INDEX = 'idx_faturamento_analitico_payment_date'
+SUMMARY_DATE_CHUNK = 500
+
+def _table_columns(conn, table_name):
+    try:
+        pragma = conn.execute(f"PRAGMA table_info({table_name})")
+        rows = pragma.fetchall() if hasattr(pragma, 'fetchall') else list(pragma)
+    except Exception:
+        return set()
+    cols = set()
+    for row in rows:
+        if isinstance(row, dict):
+            col_name = row.get('name')
+        elif hasattr(row, '__getitem__'):
+            col_name = row[1] if len(row) > 1 else row[0]
+        else:
+            col_name = None
+        if col_name:
+            cols.add(col_name)
+    return cols
+
+def _ensure_payment_date_index(db, conn, table_name='faturamento_analitico'):
+    if db.use_mysql:
+        _ensure_mysql_index(conn, table_name, PAYMENT_DATE_INDEX, PAYMENT_DATE_COL)
+    else:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {PAYMENT_DATE_INDEX} ON {table_name}({PAYMENT_DATE_COL})")
+
+def normalize_payment_dates(series):
+    """Converte data_do_pagamento (dd/mm/aaaa, ISO, etc.) em ISO; parse feito 1x por valor distinto."""
+    raw = series.astype(object).where(series.notna(), None)
+    parsed = {value: _parse_report_date(value) for value in pd.unique(raw) if value is not None}
+    return raw.map(lambda value: parsed.get(value) if value is not None else None)
+
 def _select_usuario_da_conta_column(page):
     last_error = None
     for _ in range(3):
@@ -176,6 +212,238 @@ def _select_usuario_da_conta_column(page):
         print(f"⚠️ Falha ao selecionar colunas: {last_error}")
     return False
 
+# --- EXTRAÇÃO INCREMENTAL DO RELATÓRIO (TR=72) ---
+REPORT_TABLE_SELECTOR = "#table-resultado"
+REPORT_STREAM_ENABLED = str(os.getenv("FATURAMENTO_STREAM_ENABLED", "1")).strip().lower() not in ("0", "false", "no")
+REPORT_STREAM_CHUNK_ROWS = max(50, int(os.getenv("FATURAMENTO_STREAM_CHUNK_ROWS", "500")))
+# Janela sem linha nova (apos o scroll) para considerar o relatorio completo.
+REPORT_SCROLL_STABLE_SEC = max(0.5, float(os.getenv("FATURAMENTO_SCROLL_STABLE_SEC", "6")))
+REPORT_SCROLL_MAX_SEC = max(30.0, float(os.getenv("FATURAMENTO_SCROLL_MAX_SEC", "900")))
+
+# Instala um MutationObserver na tabela: cada <tr> novo do tbody entra numa fila; remocao de linhas
+# (re-render da tabela) marca `reset`. Texto das celulas segue o pd.read_html (colspan expandido,
+# display:none ignorado, espacos colapsados). Retorna false se o layout nao for o esperado.
+_REPORT_STREAM_INSTALL_JS = """
+(selector) => {
+    const table = document.querySelector(selector);
+    if (!table) return false;
+    if (window.__fatStream && window.__fatStream.table === table) return true;
+    if (window.__fatStream && window.__fatStream.observer) window.__fatStream.observer.disconnect();
+    const hidden = (el) => /display:none/i.test((el.getAttribute("style") || "").replace(/\\s/g, ""));
+    const cellText = (cell) => {
+        let node = cell;
+        if (cell.querySelector("[style]")) {
+            node = cell.cloneNode(true);
+            node.querySelectorAll("[style]").forEach((el) => { if (hidden(el)) el.remove(); });
+        }
+        return (node.textContent || "").trim().replace(/[\\r\\n]+|\\s{2,}/g, " ");
+    };
+    const cells = (tr) => {
+        const out = [];
+        for (const cell of tr.children) {
+            if ((cell.tagName !== "TD" && cell.tagName !== "TH") || hidden(cell)) continue;
+            const span = Math.max(1, parseInt(cell.getAttribute("colspan") || "1", 10) || 1);
+            const value = cellText(cell);
+            for (let i = 0; i < span; i++) out.push(value);
+        }
+        return out;
+    };
+    const bodyRows = () => Array.from(table.querySelectorAll(":scope > tbody > tr"));
+    const state = {
+        table,
+        cells,
+        hidden,
+        bodyRows,
+        pending: bodyRows(),
+        seen: 0,
+        reset: false,
+        head: Array.from(table.querySelectorAll(":scope > thead > tr")).filter((tr) => !hidden(tr)).map(cells),
+    };
+    state.seen = state.pending.length;
+    state.observer = new MutationObserver((mutations) => {
+        for (const m of mutations) {
+            for (const node of m.addedNodes) {
+                const parent = node.parentElement;
+                // So linhas de tbody: thead/tfoot (totais) nao sao linhas de dados.
+                if (node.nodeName === "TR" && parent && parent.tagName === "TBODY" && parent.parentElement === table) {
+                    state.pending.push(node);
+                    state.seen += 1;
+                } else if (node.nodeName === "TBODY") {
+                    const rows = Array.from(node.children).filter((tr) => tr.nodeName === "TR");
+                    state.pending.push(...rows);
+                    state.seen += rows.length;
+                }
+            }
+            for (const node of m.removedNodes) {
+                if (node.nodeName === "TR" || node.nodeName === "TBODY") state.reset = true;
+            }
+        }
+    });
+    state.observer.observe(table, { childList: true, subtree: true });
+    window.__fatStream = state;
+    return true;
+}
+"""
+
+# Devolve ate `maxRows` linhas pendentes (JSON) e libera a fila; em re-render, reinicia a partir do DOM atual.
+_REPORT_STREAM_DRAIN_JS = """
+(maxRows) => {
+    const state = window.__fatStream;
+    if (!state) return null;
+    if (state.reset) {
+        state.reset = false;
+        state.pending = state.bodyRows();
+        state.seen = state.pending.length;
+        return { reset: true, rows: [], head: state.head, seen: state.seen };
+    }
+    const batch = state.pending.splice(0, maxRows);
+    const rows = [];
+    for (const tr of batch) {
+        if (!tr.isConnected || state.hidden(tr)) continue;
+        rows.push(state.cells(tr));
+    }
+    return { reset: false, rows, head: state.head, seen: state.seen, pending: state.pending.length };
+}
+"""
+
+_REPORT_STREAM_FOOT_JS = """
+() => {
+    const state = window.__fatStream;
+    if (!state) return [];
+    if (state.observer) state.observer.disconnect();
+    return Array.from(state.table.querySelectorAll(":scope > tfoot > tr"))
+        .filter((tr) => !state.hidden(tr))
+        .map(state.cells);
+}
+"""
+
+class ReportRowStream:
+    """Coleta as linhas do relatorio enquanto a pagina rola: o navegador envia lotes JSON de linhas
+    novas (MutationObserver) e o scroll termina quando a contagem fica estavel por `stable_sec`."""
+
+    def __init__(self, page, selector=REPORT_TABLE_SELECTOR, chunk_rows=REPORT_STREAM_CHUNK_ROWS,
+                 stable_sec=REPORT_SCROLL_STABLE_SEC, max_sec=REPORT_SCROLL_MAX_SEC, logger=print):
+        self.page = page
+        self.selector = selector
+        self.chunk_rows = int(chunk_rows)
+        self.stable_sec = float(stable_sec)
+        self.max_sec = float(max_sec)
+        self.logger = logger
+        self.head = []
+        self.rows = []
+        self.seen = 0
+        self.resets = 0
+        self.chunks = 0
+
+    def install(self):
+        return bool(self.page.evaluate(_REPORT_STREAM_INSTALL_JS, self.selector))
+
+    def drain(self):
+        """Puxa lotes ate a fila do navegador esvaziar; retorna quantas linhas chegaram."""
+        received = 0
+        while True:
+            payload = self.page.evaluate(_REPORT_STREAM_DRAIN_JS, self.chunk_rows)
+            if payload is None:
+                raise RuntimeError("stream do relatorio nao instalado")
+            self.head = payload.get("head") or self.head
+            self.seen = int(payload.get("seen") or 0)
+            if payload.get("reset"):
+                # Tabela foi re-renderizada: descarta o que veio antes e recomeca do DOM atual.
+                self.resets += 1
+                self.rows = []
+                received = 0
+                continue
+            batch = payload.get("rows") or []
+            if batch:
+                self.chunks += 1
+                self.rows.extend(batch)
+                received += len(batch)
+            if not payload.get("pending"):
+                return received
+
+    def scroll_until_stable(self):
+        started = time.monotonic()
+        timeout_ms = int(self.stable_sec * 1000)
+        self.drain()
+        while (time.monotonic() - started) < self.max_sec:
+            seen_before = self.seen
+            self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            try:
+                self.page.wait_for_function(
+                    "(n) => !!window.__fatStream && (window.__fatStream.seen !== n || window.__fatStream.reset)",
+                    arg=seen_before,
+                    timeout=timeout_ms,
+                    polling=100,
+                )
+            except Exception:
+                # Nenhuma linha nova dentro da janela: contagem estabilizou.
+                break
+            self.drain()
+        else:
+            self.logger(f"⚠️ Scroll do relatorio excedeu {self.max_sec:.0f}s; usando {self.seen} linhas.")
+        self.drain()
+        foot = self.page.evaluate(_REPORT_STREAM_FOOT_JS) or []
+        return self.rows + list(foot)
+
+    def to_dataframe(self, rows=None):
+        return report_rows_to_dataframe(self.head, self.rows if rows is None else rows)
+
+def report_rows_to_dataframe(head, rows):
+    """Mesmo resultado do pd.read_html(decimal=',', thousands='.') para uma tabela de cabecalho unico:
+    linhas irregulares completadas com '' e inferencia de tipos feita uma vez sobre a coluna inteira."""
+    from pandas.io.parsers import TextParser
+
+    if not head or len(head) != 1:
+        raise ValueError(f"cabecalho inesperado no relatorio ({len(head or [])} linhas)")
+    body = [list(head[0])] + [list(row) for row in rows]
+    width = max(len(row) for row in body)
+    for row in body:
+        if len(row) < width:
+            row.extend([""] * (width - len(row)))
+    with TextParser(body, header=0, decimal=',', thousands='.') as parser:
+        return parser.read()
+
+def _read_report_html(page):
+    html = page.content()
+    dfs = pd.read_html(StringIO(html), decimal=',', thousands='.')
+    return max(dfs, key=lambda x: x.size)
+
+def _scroll_report_legacy(page):
+    last_count = 0
+    no_change_count = 0
+    while no_change_count < 5:
+        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        time.sleep(2.5)
+        current_count = page.locator(f"{REPORT_TABLE_SELECTOR} tbody tr").count()
+        if current_count > last_count:
+            last_count = current_count
+            no_change_count = 0
+        else:
+            no_change_count += 1
+    return last_count
+
+def extract_report_dataframe(page, logger=print):
+    """Rola o relatorio e devolve o DataFrame bruto. Usa o stream incremental; se a tabela nao tiver o
+    layout esperado (ou o stream falhar), volta ao scroll fixo + pd.read_html da pagina inteira."""
+    if REPORT_STREAM_ENABLED:
+        started = time.monotonic()
+        try:
+            stream = ReportRowStream(page, logger=logger)
+            if stream.install():
+                rows = stream.scroll_until_stable()
+                df_raw = stream.to_dataframe(rows)
+                logger(
+                    f"✅ Extraído: {len(df_raw)} linhas "
+                    f"({stream.chunks} lotes, {time.monotonic() - started:.1f}s, resets={stream.resets})."
+                )
+                return df_raw
+            logger("⚠️ Tabela do relatorio nao encontrada para stream; usando leitura completa.")
+        except Exception as e:
+            logger(f"⚠️ Stream do relatorio falhou ({e}); usando leitura completa.")
+    last_count = _scroll_report_legacy(page)
+    logger(f"✅ Extraído: {last_count} linhas.")
+    return _read_report_html(page)
+
 def _strip_accents(value: str) -> str:
     if value is None:
         return ''
@@ -359,8 +627,9 @@ def save_dataframe_to_db(db, df, table_name, delete_condition=None):
     """
     Função auxiliar para salvar DataFrame no Turso ou SQLite.
     Substitui o pandas.to_sql que falha com drivers HTTP.
+    Para faturamento_analitico retorna as datas (payment_date) gravadas, usadas pelo resumo incremental.
     """
-    if df.empty: return
+    if df.empty: return []
     
     conn = db.get_connection()
     try:
@@ -403,6 +672,14 @@ def save_dataframe_to_db(db, df, table_name, delete_condition=None):
 
         is_faturamento_analitico = table_name == 'faturamento_analitico' and 'line_key_hash' in df.columns
 
+        touched_dates = []
+        payment_src_col = _find_column_by_normalized_key(df.columns, 'data_do_pagamento') if table_name == 'faturamento_analitico' else None
+        if payment_src_col:
+            df = df.copy()
+            # '' marca data invalida (nao volta a ser NULL, que indica linha ainda nao migrada).
+            df[PAYMENT_DATE_COL] = normalize_payment_dates(df[payment_src_col]).fillna('')
+            touched_dates = sorted(d for d in df[PAYMENT_DATE_COL].dropna().unique() if d)
+
         # 2. Garante a tabela (Criação Dinâmica baseada no DF)
         # Mapeia tipos do Pandas para SQLite/MySQL
         type_map = {
@@ -414,6 +691,8 @@ def save_dataframe_to_db(db, df, table_name, delete_condition=None):
             sql_type = type_map.get(str(dtype), 'TEXT')
             if db.use_mysql and table_name == 'faturamento_analitico' and col == 'line_key_hash':
                 sql_type = 'VARCHAR(32)'
+            if db.use_mysql and col == PAYMENT_DATE_COL and payment_src_col:
+                sql_type = 'VARCHAR(10)'
             cols_def.append(f"{col} {sql_type}")
         
         create_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(cols_def)})"
@@ -442,10 +721,18 @@ def save_dataframe_to_db(db, df, table_name, delete_condition=None):
                     sql_type = type_map.get(str(dtype), 'TEXT')
                     if db.use_mysql and table_name == 'faturamento_analitico' and col == 'line_key_hash':
                         sql_type = 'VARCHAR(32)'
+                    if db.use_mysql and col == PAYMENT_DATE_COL and payment_src_col:
+                        sql_type = 'VARCHAR(10)'
                     conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {col} {sql_type}")
         except Exception as e:
             print(f"⚠️ Não foi possível ajustar colunas da tabela {table_name}: {e}")
 
+        if payment_src_col:
+            try:
+                _ensure_payment_date_index(db, conn, table_name)
+            except Exception as e:
+                print(f"⚠️ Nao foi possivel garantir indice de {PAYMENT_DATE_COL}: {e}")
+
         # 2. Limpeza (Delete prévio)
         if is_faturamento_analitico and db.use_mysql:
             try:
@@ -528,290 +815,282 @@ def save_dataframe_to_db(db, df, table_name, delete_condition=None):
             # Batch Local/MySQL
             conn.executemany(insert_sql, clean_data)
             conn.commit()
-            
+
+        return touched_dates
     except Exception as e:
         print(f"❌ Erro ao salvar no banco: {e}")
         raise
     finally:
         conn.close()
 
-def update_faturamento_summary(db, start_date_iso, end_date_iso, update_monthly=True):
+def _ensure_daily_summary_table(db, conn):
+    if db.use_mysql:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS faturamento_resumo_diario (
+                data_ref VARCHAR(191) NOT NULL,
+                unidade VARCHAR(191) NOT NULL,
+                grupo VARCHAR(191) NOT NULL,
+                procedimento VARCHAR(191) NOT NULL,
+                procedimento_key VARCHAR(32) NOT NULL DEFAULT '',
+                total_pago DOUBLE,
+                qtd BIGINT,
+                updated_at TEXT,
+                PRIMARY KEY (data_ref, unidade, grupo, procedimento_key)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+        )
+        _ensure_mysql_procedure_key(conn, "faturamento_resumo_diario", ["data_ref", "unidade", "grupo"])
+        _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_data", "data_ref")
+        _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_unidade", "unidade")
+        _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_grupo", "grupo")
+        _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_proc", "procedimento")
+        _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_data_unidade", "data_ref, unidade")
+        _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_data_grupo", "data_ref, grupo")
+    else:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS faturamento_resumo_diario (
+                data_ref TEXT NOT NULL,
+                unidade TEXT NOT NULL,
+                grupo TEXT NOT NULL,
+                procedimento TEXT NOT NULL,
+                total_pago REAL,
+                qtd INTEGER,
+                updated_at TEXT,
+                PRIMARY KEY (data_ref, unidade, grupo, procedimento)
+            )
+        """)
+        # Índices para acelerar filtros mais comuns
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_data ON faturamento_resumo_diario(data_ref)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_unidade ON faturamento_resumo_diario(unidade)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_grupo ON faturamento_resumo_diario(grupo)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_proc ON faturamento_resumo_diario(procedimento)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_data_unidade ON faturamento_resumo_diario(data_ref, unidade)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_data_grupo ON faturamento_resumo_diario(data_ref, grupo)")
+
+def _ensure_monthly_summary_table(db, conn):
+    if db.use_mysql:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS faturamento_resumo_mensal (
+                month_ref VARCHAR(191) NOT NULL,
+                unidade VARCHAR(191) NOT NULL,
+                grupo VARCHAR(191) NOT NULL,
+                procedimento VARCHAR(191) NOT NULL,
+                procedimento_key VARCHAR(32) NOT NULL DEFAULT '',
+                total_pago DOUBLE,
+                qtd BIGINT,
+                updated_at TEXT,
+                PRIMARY KEY (month_ref, unidade, grupo, procedimento_key)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+        )
+        _ensure_mysql_procedure_key(conn, "faturamento_resumo_mensal", ["month_ref", "unidade", "grupo"])
+        _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month", "month_ref")
+        _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_unidade", "unidade")
+        _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_grupo", "grupo")
+        _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_proc", "procedimento")
+        _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month_unidade", "month_ref, unidade")
+        _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month_grupo", "month_ref, grupo")
+    else:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS faturamento_resumo_mensal (
+                month_ref TEXT NOT NULL,
+                unidade TEXT NOT NULL,
+                grupo TEXT NOT NULL,
+                procedimento TEXT NOT NULL,
+                total_pago REAL,
+                qtd INTEGER,
+                updated_at TEXT,
+                PRIMARY KEY (month_ref, unidade, grupo, procedimento)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month ON faturamento_resumo_mensal(month_ref)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_unidade ON faturamento_resumo_mensal(unidade)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_grupo ON faturamento_resumo_mensal(grupo)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_proc ON faturamento_resumo_mensal(procedimento)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month_unidade ON faturamento_resumo_mensal(month_ref, unidade)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month_grupo ON faturamento_resumo_mensal(month_ref, grupo)")
+
+def _legacy_payment_date_expr(db):
+    """Normalizacao em SQL de data_do_pagamento para linhas ainda sem payment_date (nao usa indice)."""
+    if db.use_mysql:
+        return (
+            "CASE WHEN INSTR(data_do_pagamento, '/') > 0 "
+            "THEN CONCAT(SUBSTR(data_do_pagamento, 7, 4), '-', SUBSTR(data_do_pagamento, 4, 2), '-', SUBSTR(data_do_pagamento, 1, 2)) "
+            "ELSE data_do_pagamento END"
+        )
+    return (
+        "(CASE WHEN instr(data_do_pagamento, '/') > 0 "
+        "THEN substr(data_do_pagamento, 7, 4) || '-' || substr(data_do_pagamento, 4, 2) || '-' || substr(data_do_pagamento, 1, 2) "
+        "ELSE data_do_pagamento END)"
+    )
+
+def _resolve_summary_date_expr(db, conn):
+    """Usa a coluna indexada payment_date quando todas as linhas ja foram migradas."""
+    if PAYMENT_DATE_COL not in _table_columns(conn, 'faturamento_analitico'):
+        print("   ℹ️ faturamento_analitico sem payment_date; usando normalização em SQL (sem índice).")
+        return _legacy_payment_date_expr(db)
+    pending = _fetch_scalar(conn.execute(
+        f"SELECT 1 FROM faturamento_analitico WHERE {PAYMENT_DATE_COL} IS NULL LIMIT 1"
+    ))
+    if pending:
+        print(
+            "   ℹ️ Há linhas sem payment_date; rode worker_faturamento_payment_date_backfill.py. "
+            "Usando normalização em SQL (sem índice)."
+        )
+        return f"COALESCE({PAYMENT_DATE_COL}, {_legacy_payment_date_expr(db)})"
+    return PAYMENT_DATE_COL
+
+def _rebuild_daily_summary(db, conn, date_expr, where_summary, where_source, params):
+    conn.execute(f"DELETE FROM faturamento_resumo_diario WHERE {where_summary}", params)
+    if db.use_mysql:
+        sql = f"""
+            INSERT INTO faturamento_resumo_diario (
+                data_ref, unidade, grupo, procedimento, procedimento_key, total_pago, qtd, updated_at
+            )
+            SELECT
+                {date_expr} as data_ref,
+                COALESCE(TRIM(unidade), '') as unidade,
+                COALESCE(TRIM(grupo), '') as grupo,
+                COALESCE(TRIM(procedimento), '') as procedimento,
+                MIN(MD5(COALESCE(TRIM(procedimento), ''))) as procedimento_key,
+                SUM(total_pago) as total_pago,
+                COUNT(*) as qtd,
+                NOW() as updated_at
+            FROM faturamento_analitico
+            WHERE {where_source}
+            GROUP BY data_ref, unidade, grupo, procedimento
+        """
+    else:
+        sql = f"""
+            INSERT INTO faturamento_resumo_diario (
+                data_ref, unidade, grupo, procedimento, total_pago, qtd, updated_at
+            )
+            SELECT
+                {date_expr} as data_ref,
+                COALESCE(TRIM(unidade), '') as unidade,
+                COALESCE(TRIM(grupo), '') as grupo,
+                COALESCE(TRIM(procedimento), '') as procedimento,
+                SUM(total_pago) as total_pago,
+                COUNT(*) as qtd,
+                datetime('now') as updated_at
+            FROM faturamento_analitico
+            WHERE {where_source}
+            GROUP BY data_ref, unidade, grupo, procedimento
+        """
+    conn.execute(sql, params)
+
+def _rebuild_monthly_summary(db, conn, month_ref):
+    year, month = map(int, month_ref.split('-'))
+    last_day = calendar.monthrange(year, month)[1]
+    month_start = f"{year:04d}-{month:02d}-01"
+    month_end = f"{year:04d}-{month:02d}-{last_day:02d}"
+
+    conn.execute("DELETE FROM faturamento_resumo_mensal WHERE month_ref = ?", (month_ref,))
+
+    if db.use_mysql:
+        monthly_sql = """
+            INSERT INTO faturamento_resumo_mensal (
+                month_ref, unidade, grupo, procedimento, procedimento_key, total_pago, qtd, updated_at
+            )
+            SELECT
+                substr(data_ref, 1, 7) as month_ref,
+                unidade,
+                grupo,
+                procedimento,
+                MIN(procedimento_key) as procedimento_key,
+                SUM(total_pago) as total_pago,
+                SUM(qtd) as qtd,
+                NOW() as updated_at
+            FROM faturamento_resumo_diario
+            WHERE data_ref BETWEEN ? AND ?
+            GROUP BY month_ref, unidade, grupo, procedimento
+        """
+    else:
+        monthly_sql = """
+            INSERT INTO faturamento_resumo_mensal (
+                month_ref, unidade, grupo, procedimento, total_pago, qtd, updated_at
+            )
+            SELECT
+                substr(data_ref, 1, 7) as month_ref,
+                unidade,
+                grupo,
+                procedimento,
+                SUM(total_pago) as total_pago,
+                SUM(qtd) as qtd,
+                datetime('now') as updated_at
+            FROM faturamento_resumo_diario
+            WHERE data_ref BETWEEN ? AND ?
+            GROUP BY month_ref, unidade, grupo, procedimento
+        """
+    conn.execute(monthly_sql, (month_start, month_end))
+
+def _months_between(start_date_iso, end_date_iso):
+    months = []
+    year, month = int(start_date_iso[:4]), int(start_date_iso[5:7])
+    end_key = end_date_iso[:7]
+    while f"{year:04d}-{month:02d}" <= end_key:
+        months.append(f"{year:04d}-{month:02d}")
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return months
+
+def summary_months(start_date_iso, end_date_iso, touched_dates=None):
+    """Meses impactados pela janela + datas gravadas fora dela (ex.: estornos por data de referência)."""
+    months = set(_months_between(start_date_iso, end_date_iso))
+    months.update(str(d)[:7] for d in (touched_dates or []) if d)
+    return sorted(months)
+
+def update_faturamento_summary(db, start_date_iso, end_date_iso, update_monthly=True, touched_dates=None):
     """
     Atualiza a tabela de resumo diário baseada em faturamento_analitico.
     Mantém a granularidade necessária para filtros por unidade/grupo/procedimento.
+    Recalcula só a janela [start, end] e as `touched_dates` fora dela (retornadas por
+    save_dataframe_to_db); a carga histórica completa fica no backfill dedicado.
     """
     conn = db.get_connection()
     try:
-        # Normaliza data_do_pagamento para ISO (YYYY-MM-DD) se necessário
-        if db.use_mysql:
-            date_expr = (
-                "CASE WHEN INSTR(data_do_pagamento, '/') > 0 "
-                "THEN CONCAT(SUBSTR(data_do_pagamento, 7, 4), '-', SUBSTR(data_do_pagamento, 4, 2), '-', SUBSTR(data_do_pagamento, 1, 2)) "
-                "ELSE data_do_pagamento END"
-            )
-        else:
-            date_expr = (
-                "(CASE WHEN instr(data_do_pagamento, '/') > 0 "
-                "THEN substr(data_do_pagamento, 7, 4) || '-' || substr(data_do_pagamento, 4, 2) || '-' || substr(data_do_pagamento, 1, 2) "
-                "ELSE data_do_pagamento END)"
-            )
-
-        # Cria tabela de resumo se não existir
-        if db.use_mysql:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS faturamento_resumo_diario (
-                    data_ref VARCHAR(191) NOT NULL,
-                    unidade VARCHAR(191) NOT NULL,
-                    grupo VARCHAR(191) NOT NULL,
-                    procedimento VARCHAR(191) NOT NULL,
-                    procedimento_key VARCHAR(32) NOT NULL DEFAULT '',
-                    total_pago DOUBLE,
-                    qtd BIGINT,
-                    updated_at TEXT,
-                    PRIMARY KEY (data_ref, unidade, grupo, procedimento_key)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                """
-            )
-            _ensure_mysql_procedure_key(conn, "faturamento_resumo_diario", ["data_ref", "unidade", "grupo"])
-            _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_data", "data_ref")
-            _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_unidade", "unidade")
-            _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_grupo", "grupo")
-            _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_proc", "procedimento")
-            _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_data_unidade", "data_ref, unidade")
-            _ensure_mysql_index(conn, "faturamento_resumo_diario", "idx_fat_resumo_diario_data_grupo", "data_ref, grupo")
-        else:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS faturamento_resumo_diario (
-                    data_ref TEXT NOT NULL,
-                    unidade TEXT NOT NULL,
-                    grupo TEXT NOT NULL,
-                    procedimento TEXT NOT NULL,
-                    total_pago REAL,
-                    qtd INTEGER,
-                    updated_at TEXT,
-                    PRIMARY KEY (data_ref, unidade, grupo, procedimento)
-                )
-            """)
-            # Índices para acelerar filtros mais comuns
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_data ON faturamento_resumo_diario(data_ref)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_unidade ON faturamento_resumo_diario(unidade)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_grupo ON faturamento_resumo_diario(grupo)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_proc ON faturamento_resumo_diario(procedimento)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_data_unidade ON faturamento_resumo_diario(data_ref, unidade)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_diario_data_grupo ON faturamento_resumo_diario(data_ref, grupo)")
-
-        # Se a tabela de resumo estiver vazia, faz backfill completo (1x)
-        try:
-            row = conn.execute("SELECT COUNT(*) as cnt FROM faturamento_resumo_diario")
-            cnt = None
-            if hasattr(row, 'fetchone'):
-                cnt = row.fetchone()[0]
-            else:
-                rows = list(row)
-                if rows:
-                    cnt = rows[0][0]
-            if cnt == 0:
-                rng = conn.execute(f"""
-                    SELECT MIN({date_expr}) as min_d, MAX({date_expr}) as max_d
-                    FROM faturamento_analitico
-                    WHERE {date_expr} IS NOT NULL
-                """)
-                min_d = max_d = None
-                if hasattr(rng, 'fetchone'):
-                    r = rng.fetchone()
-                    if r:
-                        min_d, max_d = r[0], r[1]
-                else:
-                    rows = list(rng)
-                    if rows:
-                        min_d, max_d = rows[0][0], rows[0][1]
-                if min_d and max_d:
-                    print(f"   🔁 Backfill resumo diário: {min_d} a {max_d}")
-                    start_date_iso, end_date_iso = min_d, max_d
-        except Exception:
-            # Se falhar o backfill automático, seguimos com o range atual
-            pass
-
-        # Limpa o período alvo antes de recalcular
-        conn.execute(
-            "DELETE FROM faturamento_resumo_diario WHERE data_ref BETWEEN ? AND ?",
-            (start_date_iso, end_date_iso)
+        _ensure_daily_summary_table(db, conn)
+        date_expr = _resolve_summary_date_expr(db, conn)
+
+        _rebuild_daily_summary(
+            db,
+            conn,
+            date_expr,
+            "data_ref BETWEEN ? AND ?",
+            f"{date_expr} BETWEEN ? AND ?",
+            (start_date_iso, end_date_iso),
         )
-
-        # Recalcula o resumo do período
-        if db.use_mysql:
-            sql = f"""
-                INSERT INTO faturamento_resumo_diario (
-                    data_ref, unidade, grupo, procedimento, procedimento_key, total_pago, qtd, updated_at
-                )
-                SELECT
-                    {date_expr} as data_ref,
-                    COALESCE(TRIM(unidade), '') as unidade,
-                    COALESCE(TRIM(grupo), '') as grupo,
-                    COALESCE(TRIM(procedimento), '') as procedimento,
-                    MIN(MD5(COALESCE(TRIM(procedimento), ''))) as procedimento_key,
-                    SUM(total_pago) as total_pago,
-                    COUNT(*) as qtd,
-                    NOW() as updated_at
-                FROM faturamento_analitico
-                WHERE {date_expr} BETWEEN ? AND ?
-                GROUP BY data_ref, unidade, grupo, procedimento
-            """
-        else:
-            sql = f"""
-                INSERT INTO faturamento_resumo_diario (
-                    data_ref, unidade, grupo, procedimento, total_pago, qtd, updated_at
-                )
-                SELECT
-                    {date_expr} as data_ref,
-                    COALESCE(TRIM(unidade), '') as unidade,
-                    COALESCE(TRIM(grupo), '') as grupo,
-                    COALESCE(TRIM(procedimento), '') as procedimento,
-                    SUM(total_pago) as total_pago,
-                    COUNT(*) as qtd,
-                    datetime('now') as updated_at
-                FROM faturamento_analitico
-                WHERE {date_expr} BETWEEN ? AND ?
-                GROUP BY data_ref, unidade, grupo, procedimento
-            """
-        conn.execute(sql, (start_date_iso, end_date_iso))
+        extra_dates = sorted({str(d) for d in (touched_dates or []) if d and not (start_date_iso <= str(d) <= end_date_iso)})
+        for i in range(0, len(extra_dates), SUMMARY_DATE_CHUNK):
+            chunk = extra_dates[i:i + SUMMARY_DATE_CHUNK]
+            placeholders = ', '.join(['?'] * len(chunk))
+            _rebuild_daily_summary(
+                db,
+                conn,
+                date_expr,
+                f"data_ref IN ({placeholders})",
+                f"{date_expr} IN ({placeholders})",
+                tuple(chunk),
+            )
 
         if not db.use_turso:
             conn.commit()
-        print(f"   ✅ Resumo diário atualizado: {start_date_iso} a {end_date_iso}")
+        extra_msg = f" (+{len(extra_dates)} data(s) fora da janela)" if extra_dates else ""
+        print(f"   ✅ Resumo diário atualizado: {start_date_iso} a {end_date_iso}{extra_msg}")
 
         if update_monthly:
-            # ---------------------------------------------------------
             # Resumo mensal (baseado no diário para reduzir leituras)
-            # ---------------------------------------------------------
-            if db.use_mysql:
-                conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS faturamento_resumo_mensal (
-                        month_ref VARCHAR(191) NOT NULL,
-                        unidade VARCHAR(191) NOT NULL,
-                        grupo VARCHAR(191) NOT NULL,
-                        procedimento VARCHAR(191) NOT NULL,
-                        procedimento_key VARCHAR(32) NOT NULL DEFAULT '',
-                        total_pago DOUBLE,
-                        qtd BIGINT,
-                        updated_at TEXT,
-                        PRIMARY KEY (month_ref, unidade, grupo, procedimento_key)
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                    """
-                )
-                _ensure_mysql_procedure_key(conn, "faturamento_resumo_mensal", ["month_ref", "unidade", "grupo"])
-                _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month", "month_ref")
-                _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_unidade", "unidade")
-                _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_grupo", "grupo")
-                _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_proc", "procedimento")
-                _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month_unidade", "month_ref, unidade")
-                _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month_grupo", "month_ref, grupo")
-            else:
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS faturamento_resumo_mensal (
-                        month_ref TEXT NOT NULL,
-                        unidade TEXT NOT NULL,
-                        grupo TEXT NOT NULL,
-                        procedimento TEXT NOT NULL,
-                        total_pago REAL,
-                        qtd INTEGER,
-                        updated_at TEXT,
-                        PRIMARY KEY (month_ref, unidade, grupo, procedimento)
-                    )
-                """)
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month ON faturamento_resumo_mensal(month_ref)")
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_unidade ON faturamento_resumo_mensal(unidade)")
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_grupo ON faturamento_resumo_mensal(grupo)")
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_proc ON faturamento_resumo_mensal(procedimento)")
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month_unidade ON faturamento_resumo_mensal(month_ref, unidade)")
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month_grupo ON faturamento_resumo_mensal(month_ref, grupo)")
-
-            monthly_start_date = start_date_iso
-            monthly_end_date = end_date_iso
-            start_month = monthly_start_date[:7]
-            end_month = monthly_end_date[:7]
-
-            # Se tabela mensal estiver vazia, faz backfill completo baseado no diário
-            try:
-                row_m = conn.execute("SELECT COUNT(*) as cnt FROM faturamento_resumo_mensal")
-                cnt_m = None
-                if hasattr(row_m, 'fetchone'):
-                    cnt_m = row_m.fetchone()[0]
-                else:
-                    rows_m = list(row_m)
-                    if rows_m:
-                        cnt_m = rows_m[0][0]
-                if cnt_m == 0:
-                    rng_m = conn.execute("""
-                        SELECT MIN(data_ref) as min_d, MAX(data_ref) as max_d
-                        FROM faturamento_resumo_diario
-                        WHERE data_ref IS NOT NULL
-                    """)
-                    min_m = max_m = None
-                    if hasattr(rng_m, 'fetchone'):
-                        r_m = rng_m.fetchone()
-                        if r_m:
-                            min_m, max_m = r_m[0], r_m[1]
-                    else:
-                        rows_m = list(rng_m)
-                        if rows_m:
-                            min_m, max_m = rows_m[0][0], rows_m[0][1]
-                    if min_m and max_m:
-                        print(f"   🔁 Backfill resumo mensal: {min_m[:7]} a {max_m[:7]}")
-                        monthly_start_date = min_m
-                        monthly_end_date = max_m
-                        start_month = monthly_start_date[:7]
-                        end_month = monthly_end_date[:7]
-            except Exception:
-                pass
-
-            conn.execute(
-                "DELETE FROM faturamento_resumo_mensal WHERE month_ref BETWEEN ? AND ?",
-                (start_month, end_month)
-            )
-
-            if db.use_mysql:
-                monthly_sql = """
-                    INSERT INTO faturamento_resumo_mensal (
-                        month_ref, unidade, grupo, procedimento, procedimento_key, total_pago, qtd, updated_at
-                    )
-                    SELECT
-                        substr(data_ref, 1, 7) as month_ref,
-                        unidade,
-                        grupo,
-                        procedimento,
-                        MIN(procedimento_key) as procedimento_key,
-                        SUM(total_pago) as total_pago,
-                        SUM(qtd) as qtd,
-                        NOW() as updated_at
-                    FROM faturamento_resumo_diario
-                    WHERE data_ref BETWEEN ? AND ?
-                    GROUP BY month_ref, unidade, grupo, procedimento
-                """
-            else:
-                monthly_sql = """
-                    INSERT INTO faturamento_resumo_mensal (
-                        month_ref, unidade, grupo, procedimento, total_pago, qtd, updated_at
-                    )
-                    SELECT
-                        substr(data_ref, 1, 7) as month_ref,
-                        unidade,
-                        grupo,
-                        procedimento,
-                        SUM(total_pago) as total_pago,
-                        SUM(qtd) as qtd,
-                        datetime('now') as updated_at
-                    FROM faturamento_resumo_diario
-                    WHERE data_ref BETWEEN ? AND ?
-                    GROUP BY month_ref, unidade, grupo, procedimento
-                """
-            conn.execute(monthly_sql, (monthly_start_date, monthly_end_date))
+            _ensure_monthly_summary_table(db, conn)
+            months = summary_months(start_date_iso, end_date_iso, extra_dates)
+            for month_ref in months:
+                _rebuild_monthly_summary(db, conn, month_ref)
 
             if not db.use_turso:
                 conn.commit()
-            print(f"   ✅ Resumo mensal atualizado: {start_month} a {end_month}")
+            print(f"   ✅ Resumo mensal atualizado: {', '.join(months)}")
     except Exception as e:
         print(f"   ⚠️ Erro ao atualizar resumo diário: {e}")
     finally:
@@ -820,92 +1099,8 @@ def update_faturamento_summary(db, start_date_iso, end_date_iso, update_monthly=
 def update_faturamento_monthly_from_daily(db, month_ref):
     conn = db.get_connection()
     try:
-        if db.use_mysql:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS faturamento_resumo_mensal (
-                    month_ref VARCHAR(191) NOT NULL,
-                    unidade VARCHAR(191) NOT NULL,
-                    grupo VARCHAR(191) NOT NULL,
-                    procedimento VARCHAR(191) NOT NULL,
-                    procedimento_key VARCHAR(32) NOT NULL DEFAULT '',
-                    total_pago DOUBLE,
-                    qtd BIGINT,
-                    updated_at TEXT,
-                    PRIMARY KEY (month_ref, unidade, grupo, procedimento_key)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                """
-            )
-            _ensure_mysql_procedure_key(conn, "faturamento_resumo_mensal", ["month_ref", "unidade", "grupo"])
-            _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month", "month_ref")
-            _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_unidade", "unidade")
-            _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_grupo", "grupo")
-            _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_proc", "procedimento")
-            _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month_unidade", "month_ref, unidade")
-            _ensure_mysql_index(conn, "faturamento_resumo_mensal", "idx_fat_resumo_mensal_month_grupo", "month_ref, grupo")
-        else:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS faturamento_resumo_mensal (
-                    month_ref TEXT NOT NULL,
-                    unidade TEXT NOT NULL,
-                    grupo TEXT NOT NULL,
-                    procedimento TEXT NOT NULL,
-                    total_pago REAL,
-                    qtd INTEGER,
-                    updated_at TEXT,
-                    PRIMARY KEY (month_ref, unidade, grupo, procedimento)
-                )
-            """)
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month ON faturamento_resumo_mensal(month_ref)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_unidade ON faturamento_resumo_mensal(unidade)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_grupo ON faturamento_resumo_mensal(grupo)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_proc ON faturamento_resumo_mensal(procedimento)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month_unidade ON faturamento_resumo_mensal(month_ref, unidade)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_fat_resumo_mensal_month_grupo ON faturamento_resumo_mensal(month_ref, grupo)")
-
-        year, month = map(int, month_ref.split('-'))
-        last_day = calendar.monthrange(year, month)[1]
-        month_start = f"{year:04d}-{month:02d}-01"
-        month_end = f"{year:04d}-{month:02d}-{last_day:02d}"
-
-        conn.execute("DELETE FROM faturamento_resumo_mensal WHERE month_ref = ?", (month_ref,))
-
-        if db.use_mysql:
-            monthly_sql = """
-                INSERT INTO faturamento_resumo_mensal (
-                    month_ref, unidade, grupo, procedimento, procedimento_key, total_pago, qtd, updated_at
-                )
-                SELECT
-                    substr(data_ref, 1, 7) as month_ref,
-                    unidade,
-                    grupo,
-                    procedimento,
-                    MIN(procedimento_key) as procedimento_key,
-                    SUM(total_pago) as total_pago,
-                    SUM(qtd) as qtd,
-                    NOW() as updated_at
-                FROM faturamento_resumo_diario
-                WHERE data_ref BETWEEN ? AND ?
-                GROUP BY month_ref, unidade, grupo, procedimento
-            """
-        else:
-            monthly_sql = """
-                INSERT INTO faturamento_resumo_mensal (
-                    month_ref, unidade, grupo, procedimento, total_pago, qtd, updated_at
-                )
-                SELECT
-                    substr(data_ref, 1, 7) as month_ref,
-                    unidade,
-                    grupo,
-                    procedimento,
-                    SUM(total_pago) as total_pago,
-                    SUM(qtd) as qtd,
-                    datetime('now') as updated_at
-                FROM faturamento_resumo_diario
-                WHERE data_ref BETWEEN ? AND ?
-                GROUP BY month_ref, unidade, grupo, procedimento
-            """
-        conn.execute(monthly_sql, (month_start, month_end))
+        _ensure_monthly_summary_table(db, conn)
+        _rebuild_monthly_summary(db, conn, month_ref)
 
         if not db.use_turso:
             conn.commit()
@@ -956,15 +1151,15 @@ def run_scraper():
     print(f"📅 Janela: {inicio_vis} até {fim_vis}")
     db.update_heartbeat("faturamento", "RUNNING", f"Extraindo {inicio_vis}-{fim_vis}")
 
-    with chromium_session(headless=True) as browser:
-        context = browser.new_context()
-        page = context.new_page()
+    with browser_lease(headless=True, storage_key=feegow_storage_key(user, 0, scope="faturamento")) as lease:
+        page = lease.context.new_page()
 
         try:
             # --- LÓGICA DE SCRAPING ORIGINAL (INTACTA) ---
             print("🔐 Login...")
-            login_feegow_app4(page, user, password, logger=print)
-            switch_feegow_unit(page, 0, logger=print)
+            with lease.timed("login"):
+                login_feegow_app4(page, user, password, logger=print)
+                switch_feegow_unit(page, 0, logger=print)
             time.sleep(1.5)
 
             print("📂 Acessando Relatório...")
@@ -1020,24 +1215,8 @@ def run_scraper():
                 print("⏳ Baixando...")
                 page.wait_for_selector("#table-resultado tbody tr", timeout=30000)
             
-            last_count = 0
-            no_change_count = 0
-            while no_change_count < 5: 
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                time.sleep(2.5)
-                current_count = page.locator("#table-resultado tbody tr").count()
-                if current_count > last_count:
-                    last_count = current_count
-                    no_change_count = 0
-                else:
-                    no_change_count += 1
-            
-            print(f"✅ Extraído: {last_count} linhas.")
-
             # --- PROCESSAMENTO DOS DADOS ---
-            html = page.content()
-            dfs = pd.read_html(StringIO(html), decimal=',', thousands='.')
-            df_raw = max(dfs, key=lambda x: x.size)
+            df_raw = extract_report_dataframe(page)
             
             df = df_raw.copy()
             df.columns = [clean_column_name(c) for c in df.columns]
@@ -1058,14 +1237,11 @@ def run_scraper():
             # Define condição de limpeza para evitar duplicidade no período
             condition = f"{col_data} >= '{iso_inicio}' AND {col_data} <= '{iso_fim}'"
             
-            save_dataframe_to_db(db, df, 'faturamento_analitico', delete_condition=condition)
-            update_faturamento_summary(db, iso_inicio, iso_fim, update_monthly=False)
+            touched_dates = save_dataframe_to_db(db, df, 'faturamento_analitico', delete_condition=condition)
+            update_faturamento_summary(db, iso_inicio, iso_fim, update_monthly=False, touched_dates=touched_dates)
             # Atualiza o(s) mês(es) impactado(s) pela janela (para evitar inconsistência em virada de mês)
-            month_ref_start = iso_inicio[:7]
-            month_ref_end = iso_fim[:7]
-            update_faturamento_monthly_from_daily(db, month_ref_start)
-            if month_ref_end != month_ref_start:
-                update_faturamento_monthly_from_daily(db, month_ref_end)
+            for month_ref in summary_months(iso_inicio, iso_fim, touched_dates):
+                update_faturamento_monthly_from_daily(db, month_ref)
             
             print(f"🚀 Finalizado com Sucesso.")
             db.update_heartbeat("faturamento", "ONLINE", f"{len(df)} registros")
@@ -5,7 +5,6 @@ import datetime
 import calendar
 import hashlib
 import argparse
-from io import StringIO
 
 import pandas as pd
 from playwright.sync_api import sync_playwright
@@ -22,6 +21,7 @@ except ImportError:
 from worker_faturamento_scraping import (
     clean_column_name,
     clean_currency,
+    extract_report_dataframe,
     prepare_faturamento_dataframe,
     save_dataframe_to_db,
     update_faturamento_summary,
@@ -446,6 +446,7 @@ def run_scraper_2025(start_date=None, end_date=None, use_checkpoint=True, sleep_
         return
 
     processed_ranges = []
+    touched_dates = set()
     if use_checkpoint:
         ensure_checkpoint_table(db)
 
@@ -552,23 +553,7 @@ def run_scraper_2025(start_date=None, end_date=None, use_checkpoint=True, sleep_
                         print("⏳ Baixando...")
                         page.wait_for_selector("#table-resultado tbody tr", timeout=30000)
 
-                    last_count = 0
-                    no_change_count = 0
-                    while no_change_count < 5:
-                        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                        time.sleep(2.5)
-                        current_count = page.locator("#table-resultado tbody tr").count()
-                        if current_count > last_count:
-                            last_count = current_count
-                            no_change_count = 0
-                        else:
-                            no_change_count += 1
-
-                    print(f"✅ Extraído: {last_count} linhas.")
-
-                    html = page.content()
-                    dfs = pd.read_html(StringIO(html), decimal=',', thousands='.')
-                    df_raw = max(dfs, key=lambda x: x.size)
+                    df_raw = extract_report_dataframe(page)
 
                     df = df_raw.copy()
                     df.columns = [clean_column_name(c) for c in df.columns]
@@ -581,7 +566,7 @@ def run_scraper_2025(start_date=None, end_date=None, use_checkpoint=True, sleep_
 
                     condition = f"{col_data} >= '{iso_inicio}' AND {col_data} <= '{iso_fim}'"
                     print(f"💾 Salvando mês {month:02d}/{year}: {len(df)} registros no faturamento_analitico")
-                    save_dataframe_to_db(db, df, 'faturamento_analitico', delete_condition=condition)
+                    touched_dates.update(save_dataframe_to_db(db, df, 'faturamento_analitico', delete_condition=condition) or [])
 
                     processed_ranges.append((iso_inicio, iso_fim))
                     if use_checkpoint and full_month:
@@ -604,7 +589,7 @@ def run_scraper_2025(start_date=None, end_date=None, use_checkpoint=True, sleep_
         start_ref = start_date.strftime("%Y-%m-%d")
         end_ref = end_date.strftime("%Y-%m-%d")
         print(f"🧮 Recalculando resumos de {start_ref} até {end_ref} a partir do analítico...")
-        update_faturamento_summary(db, start_ref, end_ref, update_monthly=True)
+        update_faturamento_summary(db, start_ref, end_ref, update_monthly=True, touched_dates=sorted(touched_dates))
 
     print("🚀 Backfill histórico finalizado com sucesso.")
     db.update_heartbeat("faturamento", "ONLINE", "Backfill histórico finalizado")
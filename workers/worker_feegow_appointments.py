@@ -34,74 +34,59 @@ def clean_int(value, default=0):
     except Exception:
         return default
 
-def update_appointments_data():
-    print(f"--- Worker Feegow Appointments (Batch Optimized): {datetime.datetime.now().strftime('%H:%M:%S')} ---")
-    db = DatabaseManager()
-    db.update_heartbeat("appointments", "RUNNING", "Baixando dados (Full)...")
+APPOINTMENTS_SYNC_WINDOW_DAYS = max(1, int(os.getenv("APPOINTMENTS_SYNC_WINDOW_DAYS", "30")))
+# Se a API devolver bem menos linhas que o esperado (resposta parcial), nao remove nada.
+APPOINTMENTS_TOMBSTONE_MAX_RATIO = min(1.0, max(0.0, float(os.getenv("APPOINTMENTS_TOMBSTONE_MAX_RATIO", "0.5"))))
+VALID_STATUSES = [1, 2, 3, 4, 6, 7, 11, 15, 16, 22]
+WRITE_CHUNK_SIZE = 500
+ID_LOOKUP_CHUNK_SIZE = 500
 
-    # 1. DOWNLOAD (Mantendo o método rápido de 60 dias)
-    now = datetime.datetime.now()
-    start_date = (now - datetime.timedelta(days=30)).strftime('%d-%m-%Y')
-    end_date = (now + datetime.timedelta(days=30)).strftime('%d-%m-%Y')
-    
-    try:
-        df = fetch_financial_data(start_date=start_date, end_date=end_date)
-    except Exception as e:
-        msg = f"Erro API: {e}"
-        print(msg)
-        db.update_heartbeat("appointments", "ERROR", msg)
-        return
+# Colunas persistidas, na ordem do INSERT; updated_at fica fora do hash de conteudo.
+CONTENT_COLUMNS = [
+    'appointment_id', 'date', 'status_id', 'value',
+    'specialty', 'professional_name', 'procedure_group',
+    'patient_id', 'procedure_id', 'procedure_name', 'first_appointment_flag',
+    'scheduled_by', 'unit_name', 'scheduled_at',
+]
 
-    if df.empty:
-        db.update_heartbeat("appointments", "WARNING", "API retornou vazio")
-        return
+UPSERT_SQL = '''
+    INSERT INTO feegow_appointments (
+        appointment_id, date, status_id, value, 
+        specialty, professional_name, procedure_group,
+        patient_id, procedure_id, procedure_name, first_appointment_flag,
+        scheduled_by, unit_name, scheduled_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(appointment_id) DO UPDATE SET
+        date = excluded.date,
+        status_id = excluded.status_id,
+        value = excluded.value,
+        specialty = excluded.specialty,
+        procedure_group = excluded.procedure_group,
+        patient_id = excluded.patient_id,
+        procedure_id = excluded.procedure_id,
+        procedure_name = excluded.procedure_name,
+        first_appointment_flag = excluded.first_appointment_flag,
+        professional_name = excluded.professional_name,
+        unit_name = excluded.unit_name,
+        scheduled_by = excluded.scheduled_by,
+        scheduled_at = excluded.scheduled_at,
+        updated_at = excluded.updated_at
+'''
 
-    # 2. PREPARAÇÃO DOS DADOS
-    # Transformamos o DF em uma lista de tuplas para inserção em lote
-    col_status = 'status_id' if 'status_id' in df.columns else 'status'
-    valid_statuses = [1, 2, 3, 4, 6, 7, 11, 15, 16, 22]
-    
-    df[col_status] = pd.to_numeric(df[col_status], errors='coerce').fillna(0).astype(int)
-    df_to_save = df[df[col_status].isin(valid_statuses)].copy()
-
-    agora = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    data_params = []
-
-    for _, row in df_to_save.iterrows():
-        app_id = int(row.get('agendamento_id') or row.get('id') or 0)
-        if app_id == 0: continue
-        
-        raw_date = row.get('data') or row.get('data_agendamento')
-        iso_date = agora[:10]
-        if raw_date:
-            try: iso_date = pd.to_datetime(raw_date, dayfirst=True).strftime('%Y-%m-%d')
-            except: pass
-
-        val = clean_currency(row.get('valor') or row.get('valor_total_agendamento'))
-        sched_at = str(row.get('agendado_em') or '').strip()
-        nome_prof = str(row.get('nome_profissional') or row.get('profissional') or 'Desconhecido')
-        
-        # Monta a tupla de parâmetros
-        params = (
-            app_id, iso_date, int(row.get(col_status)), val, 
-            str(row.get('especialidade') or 'Geral'), 
-            nome_prof,
-            str(row.get('procedure_group') or 'Geral'),
-            clean_int(row.get('paciente_id')),
-            clean_int(row.get('procedimento_id')),
-            str(row.get('procedure_name') or 'N/A'),
-            clean_int(row.get('primeiro_agendamento') or row.get('first_appointment_flag')),
-            str(row.get('agendado_por') or 'Sis'),
-            str(row.get('nome_fantasia') or 'Matriz'),
-            sched_at,
-            agora
-        )
-        data_params.append(params)
+SHADOW_UPSERT_SQL = '''
+    INSERT INTO feegow_appointments_sync_hashes (appointment_id, date, content_hash, tombstoned_at, updated_at)
+    VALUES (?, ?, ?, NULL, ?)
+    ON CONFLICT(appointment_id) DO UPDATE SET
+        date = excluded.date,
+        content_hash = excluded.content_hash,
+        tombstoned_at = NULL,
+        updated_at = excluded.updated_at
+'''
 
-    # 3. SALVAMENTO EM LOTE (BATCH)
+
+def _ensure_schema(db):
     conn = db.get_connection()
     try:
-        # Garante criação da Tabela
         conn.execute('''
             CREATE TABLE IF NOT EXISTS feegow_appointments (
                 appointment_id INTEGER PRIMARY KEY, date TEXT, status_id INTEGER, value REAL, 
@@ -110,8 +95,19 @@ def update_appointments_data():
                 scheduled_by TEXT, unit_name TEXT, scheduled_at TEXT, updated_at TEXT
             )
         ''')
-        
-        # --- CORREÇÃO: MIGRAÇÕES RODAM EM QUALQUER BANCO (TURSO OU LOCAL) ---
+        # Tabela sombra: ultimo hash gravado por agendamento (detecao de mudancas).
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS feegow_appointments_sync_hashes (
+                appointment_id INTEGER PRIMARY KEY,
+                date VARCHAR(10),
+                content_hash VARCHAR(32) NOT NULL,
+                tombstoned_at VARCHAR(20),
+                updated_at VARCHAR(20)
+            )
+        ''')
+        if not db.use_turso: conn.commit()
+
+        # --- MIGRAÇÕES (uma vez por processo; rodam em qualquer banco) ---
         migrations = [
             "ALTER TABLE feegow_appointments ADD COLUMN scheduled_by TEXT",
             "ALTER TABLE feegow_appointments ADD COLUMN unit_name TEXT",
@@ -121,63 +117,203 @@ def update_appointments_data():
             "ALTER TABLE feegow_appointments ADD COLUMN procedure_name TEXT",
             "ALTER TABLE feegow_appointments ADD COLUMN first_appointment_flag INTEGER"
         ]
-        
         for mig in migrations:
             try:
                 conn.execute(mig)
-                # No Turso/LibSQL o execute já pode ser autocommit, mas não custa garantir no local
                 if not db.use_turso: conn.commit()
             except Exception:
                 # Se a coluna já existir, vai dar erro e cair aqui. Ignoramos.
                 pass
-        
-        # ---------------------------------------------------------------------
-
-        sql = '''
-            INSERT INTO feegow_appointments (
-                appointment_id, date, status_id, value, 
-                specialty, professional_name, procedure_group,
-                patient_id, procedure_id, procedure_name, first_appointment_flag,
-                scheduled_by, unit_name, scheduled_at, updated_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(appointment_id) DO UPDATE SET
-                date = excluded.date,
-                status_id = excluded.status_id,
-                value = excluded.value,
-                specialty = excluded.specialty,
-                procedure_group = excluded.procedure_group,
-                patient_id = excluded.patient_id,
-                procedure_id = excluded.procedure_id,
-                procedure_name = excluded.procedure_name,
-                first_appointment_flag = excluded.first_appointment_flag,
-                professional_name = excluded.professional_name,
-                unit_name = excluded.unit_name,
-                scheduled_by = excluded.scheduled_by,
-                scheduled_at = excluded.scheduled_at,
-                updated_at = excluded.updated_at
-        '''
-
-        print(f" > Salvando {len(data_params)} registros...")
-        start_save = time.time()
+        try:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_feegow_appt_hashes_date ON feegow_appointments_sync_hashes(date)")
+            if not db.use_turso: conn.commit()
+        except Exception:
+            pass
+    finally:
+        conn.close()
+
+
+def _first_truthy(df, columns, default=None):
+    """Equivalente vetorizado de `row.get(a) or row.get(b) or default`."""
+    result = pd.Series([None] * len(df), index=df.index, dtype=object)
+    for col in columns:
+        if col not in df.columns:
+            continue
+        values = df[col]
+        numeric_zero = values.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool) and v == 0)
+        truthy = values.notna() & (values.astype(str).str.strip() != '') & ~numeric_zero
+        result = result.where(result.notna() | ~truthy, values)
+    if default is not None:
+        result = result.fillna(default)
+    return result
+
+
+def _int_series(values, default=0):
+    return pd.to_numeric(values, errors='coerce').fillna(default).astype('int64')
+
+
+def _currency_series(values):
+    numeric = pd.to_numeric(values, errors='coerce')
+    text = values.astype(str).str.replace('R$', '', regex=False).str.replace(' ', '', regex=False)
+    text = text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    # Numericos nativos passam direto; strings no formato BR sao convertidas.
+    parsed = numeric.where(values.map(lambda v: isinstance(v, (int, float))), pd.to_numeric(text, errors='coerce'))
+    return parsed.fillna(0.0).astype(float)
+
+
+def build_appointment_rows(df, today_iso):
+    """Monta o DataFrame final (CONTENT_COLUMNS) sem iterrows e com um unico to_datetime."""
+    col_status = 'status_id' if 'status_id' in df.columns else 'status'
+    statuses = _int_series(df[col_status])
+    df = df[statuses.isin(VALID_STATUSES)]
+    statuses = statuses[df.index]
+
+    out = pd.DataFrame(index=df.index)
+    out['appointment_id'] = _int_series(_first_truthy(df, ['agendamento_id', 'id'], 0))
+    raw_dates = _first_truthy(df, ['data', 'data_agendamento'])
+    parsed_dates = pd.to_datetime(raw_dates, dayfirst=True, errors='coerce', format='mixed')
+    out['date'] = parsed_dates.dt.strftime('%Y-%m-%d').fillna(today_iso)
+    out['status_id'] = statuses
+    out['value'] = _currency_series(_first_truthy(df, ['valor', 'valor_total_agendamento'], 0))
+    out['specialty'] = _first_truthy(df, ['especialidade'], 'Geral').astype(str)
+    out['professional_name'] = _first_truthy(df, ['nome_profissional', 'profissional'], 'Desconhecido').astype(str)
+    out['procedure_group'] = _first_truthy(df, ['procedure_group'], 'Geral').astype(str)
+    out['patient_id'] = _int_series(_first_truthy(df, ['paciente_id'], 0))
+    out['procedure_id'] = _int_series(_first_truthy(df, ['procedimento_id'], 0))
+    out['procedure_name'] = _first_truthy(df, ['procedure_name'], 'N/A').astype(str)
+    out['first_appointment_flag'] = _int_series(_first_truthy(df, ['primeiro_agendamento', 'first_appointment_flag'], 0))
+    out['scheduled_by'] = _first_truthy(df, ['agendado_por'], 'Sis').astype(str)
+    out['unit_name'] = _first_truthy(df, ['nome_fantasia'], 'Matriz').astype(str)
+    out['scheduled_at'] = _first_truthy(df, ['agendado_em'], '').astype(str).str.strip()
 
-        if db.use_turso:
-            # BATCH OTIMIZADO (TURSO)
-            CHUNK_SIZE = 500
-            for i in range(0, len(data_params), CHUNK_SIZE):
-                chunk = data_params[i:i + CHUNK_SIZE]
-                stmts = []
-                for p in chunk:
-                    stmts.append(libsql_client.Statement(sql, p))
-                conn.batch(stmts)
-                print(".", end="", flush=True)
-                
-        else:
-            # BATCH LOCAL (SQLITE)
-            conn.executemany(sql, data_params)
-            conn.commit()
+    out = out[out['appointment_id'] != 0]
+    # Mesmo agendamento repetido na resposta: vale a ultima ocorrencia (como no upsert em lote).
+    out = out.drop_duplicates(subset=['appointment_id'], keep='last').reset_index(drop=True)
+    # Hash estavel (siphash do pandas com chave fixa) sobre as colunas de conteudo.
+    out['content_hash'] = pd.util.hash_pandas_object(out[CONTENT_COLUMNS], index=False).map(lambda h: format(h, '016x'))
+    return out[CONTENT_COLUMNS + ['content_hash']]
+
+
+def _load_shadow(db, window_start, window_end, appointment_ids):
+    """Hashes conhecidos dos agendamentos da janela e dos IDs recebidos agora."""
+    shadow = {}
+    rows = db.execute_query(
+        "SELECT appointment_id, content_hash, tombstoned_at FROM feegow_appointments_sync_hashes WHERE date >= ? AND date <= ?",
+        (window_start, window_end),
+    ) or []
+    for row in rows:
+        shadow[int(row[0])] = {"hash": row[1], "tombstoned": bool(row[2]), "in_window": True}
+
+    missing = [int(app_id) for app_id in appointment_ids if int(app_id) not in shadow]
+    for i in range(0, len(missing), ID_LOOKUP_CHUNK_SIZE):
+        chunk = missing[i:i + ID_LOOKUP_CHUNK_SIZE]
+        placeholders = ", ".join("?" for _ in chunk)
+        rows = db.execute_query(
+            f"SELECT appointment_id, content_hash, tombstoned_at FROM feegow_appointments_sync_hashes WHERE appointment_id IN ({placeholders})",
+            tuple(chunk),
+        ) or []
+        for row in rows:
+            shadow[int(row[0])] = {"hash": row[1], "tombstoned": bool(row[2]), "in_window": False}
+    return shadow
+
+
+def _write_batches(db, conn, statements):
+    """statements: lista de (sql, params). Turso via batch; SQLite/MySQL via executemany por SQL."""
+    if not statements:
+        return
+    if db.use_turso:
+        for i in range(0, len(statements), WRITE_CHUNK_SIZE):
+            chunk = statements[i:i + WRITE_CHUNK_SIZE]
+            conn.batch([libsql_client.Statement(sql, params) for sql, params in chunk])
+            print(".", end="", flush=True)
+        return
+    grouped = {}
+    for sql, params in statements:
+        grouped.setdefault(sql, []).append(params)
+    for sql, params_list in grouped.items():
+        conn.executemany(sql, params_list)
+    conn.commit()
+
+
+def update_appointments_data():
+    print(f"--- Worker Feegow Appointments (Delta Sync): {datetime.datetime.now().strftime('%H:%M:%S')} ---")
+    db = DatabaseManager()
+    db.update_heartbeat("appointments", "RUNNING", "Baixando dados (Full)...")
+
+    # 1. DOWNLOAD (janela de ±APPOINTMENTS_SYNC_WINDOW_DAYS dias)
+    now = datetime.datetime.now()
+    window_start_dt = now - datetime.timedelta(days=APPOINTMENTS_SYNC_WINDOW_DAYS)
+    window_end_dt = now + datetime.timedelta(days=APPOINTMENTS_SYNC_WINDOW_DAYS)
+    start_date = window_start_dt.strftime('%d-%m-%Y')
+    end_date = window_end_dt.strftime('%d-%m-%Y')
+    
+    try:
+        df = fetch_financial_data(start_date=start_date, end_date=end_date)
+    except Exception as e:
+        msg = f"Erro API: {e}"
+        print(msg)
+        db.update_heartbeat("appointments", "ERROR", msg)
+        return
+
+    if df.empty:
+        db.update_heartbeat("appointments", "WARNING", "API retornou vazio")
+        return
+
+    # 2. PREPARAÇÃO DOS DADOS (vetorizada) + DETECÇÃO DE MUDANÇAS
+    agora = now.strftime('%Y-%m-%d %H:%M:%S')
+    rows = build_appointment_rows(df, agora[:10])
+    window_start = window_start_dt.strftime('%Y-%m-%d')
+    window_end = window_end_dt.strftime('%Y-%m-%d')
+
+    conn = None
+    try:
+        db.ensure_schema("feegow_appointments", lambda: _ensure_schema(db))
+        shadow = _load_shadow(db, window_start, window_end, rows['appointment_id'].tolist())
+
+        known = rows['appointment_id'].map(lambda app_id: shadow.get(int(app_id)))
+        known_hash = known.map(lambda item: item["hash"] if item and not item["tombstoned"] else None)
+        is_new = known_hash.isna()
+        is_changed = ~is_new & (known_hash != rows['content_hash'])
+        to_write = rows[is_new | is_changed]
+        unchanged_count = int(len(rows) - len(to_write))
+
+        current_ids = set(int(app_id) for app_id in rows['appointment_id'])
+        live_in_window = [app_id for app_id, item in shadow.items() if item["in_window"] and not item["tombstoned"]]
+        removed_ids = [app_id for app_id in live_in_window if app_id not in current_ids]
+        tombstones_skipped = False
+        if live_in_window and len(removed_ids) > APPOINTMENTS_TOMBSTONE_MAX_RATIO * len(live_in_window):
+            print(f"⚠️ {len(removed_ids)} de {len(live_in_window)} agendamentos sumiram da API; remoções ignoradas nesta execução.")
+            removed_ids = []
+            tombstones_skipped = True
+
+        statements = []
+        for values in to_write[CONTENT_COLUMNS + ['content_hash']].itertuples(index=False, name=None):
+            content, content_hash = values[:-1], values[-1]
+            params = tuple(v.item() if hasattr(v, 'item') else v for v in content)
+            statements.append((UPSERT_SQL, params + (agora,)))
+            statements.append((SHADOW_UPSERT_SQL, (params[0], params[1], content_hash, agora)))
+        for app_id in removed_ids:
+            statements.append(("DELETE FROM feegow_appointments WHERE appointment_id = ?", (app_id,)))
+            statements.append((
+                "UPDATE feegow_appointments_sync_hashes SET tombstoned_at = ?, updated_at = ? WHERE appointment_id = ?",
+                (agora, agora, app_id),
+            ))
+
+        # 3. SALVAMENTO EM LOTE (apenas o delta)
+        new_count = int(is_new.sum())
+        changed_count = int(is_changed.sum())
+        print(f" > Delta: novos={new_count} alterados={changed_count} inalterados={unchanged_count} removidos={len(removed_ids)}")
+        start_save = time.time()
+        conn = db.get_connection()
+        _write_batches(db, conn, statements)
 
         duration = round(time.time() - start_save, 2)
-        msg = f"Sucesso: {len(data_params)} registros em {duration}s"
+        msg = (
+            f"Sucesso: {len(rows)} registros em {duration}s | "
+            f"novos={new_count} alterados={changed_count} inalterados={unchanged_count} removidos={len(removed_ids)}"
+        )
+        if tombstones_skipped:
+            msg += " (remoções suspensas: resposta parcial)"
         print(f"\n✅ {msg}")
         db.update_heartbeat("appointments", "ONLINE", msg)
 
@@ -185,7 +321,8 @@ def update_appointments_data():
         print(f"\n❌ Erro Salvando: {e}")
         db.update_heartbeat("appointments", "ERROR", str(e))
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
 
 if __name__ == "__main__":
     update_appointments_data()
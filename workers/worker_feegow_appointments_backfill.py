@@ -17,8 +17,10 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 load_dotenv(os.path.join(BASE_DIR, ".env.local"))
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from feegow_reference_cache import get_reference_rows
+
 API_URL = "https://api.feegow.com/v1/api/appoints/search"
-PROCEDURES_URL = "https://api.feegow.com/v1/api/procedures/list"
 
 
 def is_lost_connection_error(exc: Exception) -> bool:
@@ -279,15 +281,8 @@ def fetch_month(start_date: datetime.date, end_date: datetime.date) -> list:
 
 def fetch_procedure_name_map() -> dict:
     try:
-        res = requests.get(PROCEDURES_URL, headers=api_headers(), timeout=120)
-        if res.status_code >= 400:
-            raise RuntimeError(f"HTTP {res.status_code}: {res.text[:220]}")
-        body = res.json()
-        if not body.get("success", False):
-            raise RuntimeError(f"API success=false: {body}")
-        content = body.get("content", [])
-        if not isinstance(content, list):
-            return {}
+        # Catalogo compartilhado com os demais workers (TTL + revalidacao + copia em disco).
+        content = get_reference_rows("procedures", api_headers)
         mapping = {}
         for row in content:
             proc_id = clean_int(row.get("procedimento_id") or row.get("id"))
@@ -1,14 +1,24 @@
 import os
 import sys
+import json
 import math
 import time
+import hashlib
 import argparse
 import datetime
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from feegow_client import fetch_patients_page
+    from http_fanout import get_host_limiter
+except ImportError:
+    from .http_fanout import get_host_limiter
+
+try:
+    from feegow_client import BASE_URL, fetch_patients_page
     from database_manager import DatabaseManager
     import libsql_client
 except ImportError:
@@ -19,6 +29,19 @@ SERVICE_NAME = 'patients_registry'
 DEFAULT_PAGE_SIZE = max(1, int(os.getenv('FEEGOW_PATIENTS_PAGE_SIZE', '100')))
 DEFAULT_OVERLAP_DAYS = max(0, int(os.getenv('FEEGOW_PATIENTS_OVERLAP_DAYS', '1')))
 DEFAULT_SLEEP_SEC = max(0.0, float(os.getenv('FEEGOW_PATIENTS_PAGE_SLEEP_SEC', '0')))
+# Fatias: faixas contiguas de offset (SLICE_PAGES paginas cada) buscadas em paralelo; o cursor de
+# cada fatia fica em feegow_patients_sync_slices e uma execucao interrompida continua de onde parou.
+DEFAULT_MAX_WORKERS = max(1, int(os.getenv('FEEGOW_PATIENTS_MAX_WORKERS', '4')))
+DEFAULT_SLICE_PAGES = max(1, int(os.getenv('FEEGOW_PATIENTS_SLICE_PAGES', '5')))
+PATIENTS_RATE_PER_SEC = max(0.0, float(os.getenv('FEEGOW_PATIENTS_RATE_PER_SEC', '4')))
+PATIENTS_RATE_BURST = max(1.0, float(os.getenv('FEEGOW_PATIENTS_RATE_BURST', '4')))
+# Acima disso os offsets salvos ja nao batem com a listagem atual: comeca uma passada nova.
+RESUME_MAX_HOURS = max(1, int(os.getenv('FEEGOW_PATIENTS_RESUME_MAX_HOURS', '24')))
+HASH_LOOKUP_CHUNK_SIZE = 500
+
+SLICE_STATUS_PENDING = 'pending'
+SLICE_STATUS_DONE = 'done'
+SLICE_STATUS_END = 'end'
 
 
 def clean_int(value, default=None):
@@ -66,6 +89,7 @@ def ensure_patients_table(db, conn):
             alterado_em TEXT,
             programa_saude_json TEXT,
             payload_json TEXT,
+            payload_hash TEXT,
             updated_at TEXT
         )
         '''
@@ -84,6 +108,7 @@ def ensure_patients_table(db, conn):
         'ALTER TABLE feegow_patients ADD COLUMN alterado_em TEXT',
         'ALTER TABLE feegow_patients ADD COLUMN programa_saude_json TEXT',
         'ALTER TABLE feegow_patients ADD COLUMN payload_json TEXT',
+        'ALTER TABLE feegow_patients ADD COLUMN payload_hash TEXT',
         'ALTER TABLE feegow_patients ADD COLUMN updated_at TEXT',
     ]
 
@@ -104,6 +129,22 @@ def ensure_patients_table(db, conn):
         )
         '''
     )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS feegow_patients_sync_slices (
+            run_key VARCHAR(40) NOT NULL,
+            slice_no INTEGER NOT NULL,
+            start_offset INTEGER,
+            end_offset INTEGER,
+            next_offset INTEGER,
+            status VARCHAR(20),
+            received INTEGER,
+            saved INTEGER,
+            updated_at TEXT,
+            PRIMARY KEY (run_key, slice_no)
+        )
+        '''
+    )
     if not db.use_turso:
         conn.commit()
 
@@ -158,9 +199,13 @@ def get_incremental_date(conn, overlap_days=1):
         return None
 
 
-def build_row(item, now_str):
-    import json
+def payload_hash(item):
+    # Chaves ordenadas: a mesma ficha com campos em outra ordem nao conta como alteracao.
+    raw = json.dumps(item, ensure_ascii=False, default=str, sort_keys=True)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
 
+def build_row(item, now_str):
     patient_id = clean_int(item.get('patient_id'), default=0)
     if not patient_id:
         return None
@@ -179,20 +224,53 @@ def build_row(item, now_str):
         clean_str(item.get('alterado_em')),
         json.dumps(item.get('programa_de_saude') or [], ensure_ascii=False, default=str),
         json.dumps(item, ensure_ascii=False, default=str),
+        payload_hash(item),
         now_str,
     )
 
 
-def save_batch(db, conn, rows):
+def load_payload_hashes(conn, patient_ids):
+    ids = sorted({int(pid) for pid in patient_ids if pid})
+    hashes = {}
+    for start in range(0, len(ids), HASH_LOOKUP_CHUNK_SIZE):
+        chunk = ids[start:start + HASH_LOOKUP_CHUNK_SIZE]
+        placeholders = ','.join(['?'] * len(chunk))
+        rs = conn.execute(
+            f'SELECT patient_id, payload_hash FROM feegow_patients WHERE patient_id IN ({placeholders})',
+            tuple(chunk),
+        )
+        rows = rs.fetchall() if hasattr(rs, 'fetchall') else getattr(rs, 'rows', [])
+        for row in rows or []:
+            if isinstance(row, dict):
+                hashes[int(row.get('patient_id') or 0)] = row.get('payload_hash')
+            else:
+                hashes[int(row[0] or 0)] = row[1]
+    return hashes
+
+
+def changed_rows(conn, rows):
+    """Linhas novas ou com payload diferente do gravado. Linhas antigas sem payload_hash contam como
+    alteradas uma vez (a regravacao preenche o hash)."""
     if not rows:
+        return []
+    known = load_payload_hashes(conn, [row[0] for row in rows])
+    latest = {}
+    for row in rows:
+        latest[row[0]] = row
+    return [row for pid, row in latest.items() if known.get(pid) != row[-2]]
+
+
+def save_batch(db, conn, rows, extra_statements=()):
+    """Upsert das linhas; `extra_statements` ((sql, params), ...) entram na mesma transacao/batch."""
+    if not rows and not extra_statements:
         return 0
 
     sql = '''
         INSERT INTO feegow_patients (
             patient_id, nome, nome_social, nascimento, bairro,
             tabela_id, sexo_id, email, celular,
-            criado_em, alterado_em, programa_saude_json, payload_json, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            criado_em, alterado_em, programa_saude_json, payload_json, payload_hash, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(patient_id) DO UPDATE SET
             nome = excluded.nome,
             nome_social = excluded.nome_social,
@@ -206,6 +284,7 @@ def save_batch(db, conn, rows):
             alterado_em = excluded.alterado_em,
             programa_saude_json = excluded.programa_saude_json,
             payload_json = excluded.payload_json,
+            payload_hash = excluded.payload_hash,
             updated_at = excluded.updated_at
     '''
 
@@ -213,98 +292,344 @@ def save_batch(db, conn, rows):
         if libsql_client is None:
             raise RuntimeError('libsql_client nao disponivel para batch Turso')
         statements = [libsql_client.Statement(sql, row) for row in rows]
+        statements.extend(libsql_client.Statement(extra_sql, params) for extra_sql, params in extra_statements)
         conn.batch(statements)
     else:
-        conn.executemany(sql, rows)
+        if rows:
+            conn.executemany(sql, rows)
+        for extra_sql, params in extra_statements:
+            conn.execute(extra_sql, params)
         conn.commit()
 
     return len(rows)
 
 
-def sync_feegow_patients(full_sync=False, alterado_em=None, page_size=DEFAULT_PAGE_SIZE, max_pages=None, sleep_sec=DEFAULT_SLEEP_SEC):
-    print(f"--- Worker Feegow Patients: {datetime.datetime.now().strftime('%H:%M:%S')} ---")
-    db = DatabaseManager()
-    db.update_heartbeat(SERVICE_NAME, 'RUNNING', 'Baixando cadastro de pacientes...')
-
-    conn = db.get_connection()
-    try:
-        ensure_patients_table(db, conn)
-        has_existing_rows = table_has_rows(conn)
-        incremental_date = clean_str(alterado_em)
-        sync_mode = 'full'
+SLICE_UPSERT_SQL = '''
+    INSERT INTO feegow_patients_sync_slices (
+        run_key, slice_no, start_offset, end_offset, next_offset, status, received, saved, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(run_key, slice_no) DO UPDATE SET
+        next_offset = excluded.next_offset,
+        status = excluded.status,
+        received = excluded.received,
+        saved = excluded.saved,
+        updated_at = excluded.updated_at
+'''
+
+
+class PatientSlice:
+    """Faixa [start_offset, end_offset) da listagem e o cursor (next_offset) ja gravado."""
+
+    __slots__ = ('slice_no', 'start_offset', 'end_offset', 'next_offset', 'status', 'received', 'saved')
+
+    def __init__(self, slice_no, start_offset, end_offset, next_offset=None, status=SLICE_STATUS_PENDING, received=0, saved=0):
+        self.slice_no = int(slice_no)
+        self.start_offset = int(start_offset)
+        self.end_offset = int(end_offset)
+        self.next_offset = int(start_offset if next_offset is None else next_offset)
+        self.status = status or SLICE_STATUS_PENDING
+        self.received = int(received or 0)
+        self.saved = int(saved or 0)
+
+    def checkpoint(self, run_key):
+        now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return SLICE_UPSERT_SQL, (
+            run_key, self.slice_no, self.start_offset, self.end_offset, self.next_offset,
+            self.status, self.received, self.saved, now_str,
+        )
 
-        if not full_sync and not incremental_date and has_existing_rows:
-            incremental_date = get_incremental_date(conn, DEFAULT_OVERLAP_DAYS)
-        if incremental_date:
-            sync_mode = f'incremental alterado_em>={incremental_date}'
 
-        is_bootstrap_run = (not incremental_date) and ((not has_existing_rows) or bool(full_sync))
-        should_mark_bootstrap_complete = is_bootstrap_run and max_pages is None
-        set_sync_state(db, conn, 'last_sync_mode', sync_mode)
-        if is_bootstrap_run:
-            set_sync_state(db, conn, 'bootstrap_complete', '0')
+def get_sync_states(conn):
+    rs = conn.execute('SELECT sync_key, sync_value FROM feegow_patients_sync_state')
+    rows = rs.fetchall() if hasattr(rs, 'fetchall') else getattr(rs, 'rows', [])
+    states = {}
+    for row in rows or []:
+        if isinstance(row, dict):
+            states[str(row.get('sync_key'))] = row.get('sync_value')
+        else:
+            states[str(row[0])] = row[1]
+    return states
 
-        print(f' -> Modo de sincronizacao: {sync_mode}')
 
-        offset = 0
-        page = 0
-        total_saved = 0
-        total_received = 0
-        empty_pages = 0
+def load_run_slices(conn, run_key):
+    rs = conn.execute(
+        '''
+        SELECT slice_no, start_offset, end_offset, next_offset, status, received, saved
+        FROM feegow_patients_sync_slices
+        WHERE run_key = ?
+        ORDER BY slice_no
+        ''',
+        (str(run_key),),
+    )
+    rows = rs.fetchall() if hasattr(rs, 'fetchall') else getattr(rs, 'rows', [])
+    slices = []
+    for row in rows or []:
+        if isinstance(row, dict):
+            row = tuple(row.get(key) for key in PatientSlice.__slots__)
+        slices.append(PatientSlice(*row))
+    return slices
+
+
+def resumable_run(states, page_size, full_sync=False, alterado_em=None, now=None):
+    """Execucao interrompida que pode continuar: mesma pagina, recente e com filtro compativel com o
+    pedido (sem filtro explicito, retoma qualquer uma; --full so retoma passada completa)."""
+    if str(states.get('slice_run_status') or '') != 'running' or not states.get('slice_run_key'):
+        return None
+    started = parse_dt(states.get('slice_run_started_at'))
+    if started is None or ((now or datetime.datetime.now()) - started).total_seconds() > RESUME_MAX_HOURS * 3600:
+        return None
+    if clean_int(states.get('slice_run_page_size')) != int(page_size):
+        return None
+    run_filter = clean_str(states.get('slice_run_filter'))
+    requested = clean_str(alterado_em)
+    if requested and requested != run_filter:
+        return None
+    if full_sync and run_filter:
+        return None
+    return {
+        'run_key': str(states.get('slice_run_key')),
+        'filter': run_filter,
+        'bootstrap': str(states.get('slice_run_bootstrap') or '') == '1',
+        'mode': clean_str(states.get('last_sync_mode')) or ('full' if not run_filter else f'incremental alterado_em>={run_filter}'),
+    }
+
+
+def fetch_patients_slice_page(offset, page_size, extra_params=None, limiter=None, sleep_sec=0.0):
+    if limiter is not None:
+        limiter.acquire()
+    response = fetch_patients_page(limit=page_size, offset=offset, extra_params=extra_params)
+    # request_endpoint devolve {} em erro de rede/HTTP: sem 'content' nao e pagina vazia.
+    if not isinstance(response, dict) or response.get('success') is False or 'content' not in response:
+        raise RuntimeError(f'Feegow patient/list retornou erro no offset {offset}: {response}')
+    if sleep_sec > 0:
+        time.sleep(sleep_sec)
+    return response.get('content') or []
+
+
+def sync_patient_slices(
+    db,
+    conn,
+    run_key,
+    slices,
+    page_size,
+    extra_params=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    slice_pages=DEFAULT_SLICE_PAGES,
+    limiter=None,
+    max_pages=None,
+    sleep_sec=0.0,
+):
+    """Percorre a listagem em fatias concorrentes; cada pagina recebida grava so os pacientes com
+    payload alterado e avanca o cursor da fatia na mesma transacao. Fatias novas sao criadas ate uma
+    pagina curta marcar o fim da listagem. Retorna o resumo (complete=False se algo ficou pendente)."""
+    span = max(1, int(slice_pages)) * int(page_size)
+    workers = max(1, int(max_workers or 1))
+    summary = {'saved': 0, 'unchanged': 0, 'received': 0, 'pages': 0, 'slices': 0, 'failed': [], 'complete': False}
+
+    end_offsets = [sl.next_offset for sl in slices if sl.status == SLICE_STATUS_END]
+    data_end = min(end_offsets) if end_offsets else None
+    pending = deque(sl for sl in slices if sl.status == SLICE_STATUS_PENDING)
+    next_slice_no = max((sl.slice_no for sl in slices), default=-1) + 1
+    budget_left = [None if max_pages is None else max(0, int(max_pages))]
+
+    def _take_budget():
+        if budget_left[0] is None:
+            return True
+        if budget_left[0] <= 0:
+            return False
+        budget_left[0] -= 1
+        return True
+
+    def _next_slice():
+        nonlocal next_slice_no
+        while pending:
+            sl = pending.popleft()
+            if data_end is not None and sl.next_offset >= data_end:
+                sl.status = SLICE_STATUS_DONE
+                save_batch(db, conn, [], [sl.checkpoint(run_key)])
+                continue
+            return sl
+        if data_end is not None:
+            return None
+        start = next_slice_no * span
+        sl = PatientSlice(next_slice_no, start, start + span)
+        next_slice_no += 1
+        # Grava a fatia antes de buscar: retomada nao perde fatias que estavam em voo.
+        save_batch(db, conn, [], [sl.checkpoint(run_key)])
+        summary['slices'] += 1
+        return sl
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='patients') as executor:
+        in_flight = {}
+
+        def _submit(sl):
+            if not _take_budget():
+                return False
+            in_flight[executor.submit(fetch_patients_slice_page, sl.next_offset, page_size, extra_params, limiter, sleep_sec)] = sl
+            return True
 
         while True:
-            if max_pages is not None and page >= max_pages:
+            while len(in_flight) < workers and (budget_left[0] is None or budget_left[0] > 0):
+                sl = _next_slice()
+                if sl is None:
+                    break
+                _submit(sl)
+            if not in_flight:
                 break
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                sl = in_flight.pop(future)
+                offset = sl.next_offset
+                try:
+                    content = future.result()
+                except Exception as exc:
+                    summary['failed'].append(sl.slice_no)
+                    print(f' -> Fatia {sl.slice_no} offset={offset}: ERRO {exc}')
+                    continue
+
+                received = len(content)
+                now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                rows = [row for row in (build_row(item, now_str) for item in content) if row is not None]
+                to_write = changed_rows(conn, rows)
+
+                sl.next_offset = offset + page_size
+                sl.received += received
+                sl.saved += len(to_write)
+                if received < page_size:
+                    sl.status = SLICE_STATUS_END
+                    sl.next_offset = offset + received
+                    data_end = sl.next_offset if data_end is None else min(data_end, sl.next_offset)
+                elif sl.next_offset >= sl.end_offset:
+                    sl.status = SLICE_STATUS_DONE
+                save_batch(db, conn, to_write, [sl.checkpoint(run_key)])
+
+                summary['pages'] += 1
+                summary['received'] += received
+                summary['saved'] += len(to_write)
+                summary['unchanged'] += len(rows) - len(to_write)
+                print(f' -> Fatia {sl.slice_no} offset={offset}: {received} pacientes ({len(to_write)} gravados)')
+
+                if sl.status == SLICE_STATUS_PENDING:
+                    if data_end is not None and sl.next_offset >= data_end:
+                        sl.status = SLICE_STATUS_DONE
+                        save_batch(db, conn, [], [sl.checkpoint(run_key)])
+                    elif not _submit(sl):
+                        pending.appendleft(sl)
+
+    summary['complete'] = data_end is not None and not summary['failed'] and not pending
+    return summary
+
+
+def start_run(db, conn, page_size, run_filter, bootstrap, mode):
+    run_key = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+    for key, value in (
+        ('slice_run_key', run_key),
+        ('slice_run_status', 'running'),
+        ('slice_run_filter', run_filter or ''),
+        ('slice_run_page_size', int(page_size)),
+        ('slice_run_bootstrap', '1' if bootstrap else '0'),
+        ('slice_run_started_at', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+        ('last_sync_mode', mode),
+    ):
+        set_sync_state(db, conn, key, value)
+    return run_key
+
+
+def finish_run(db, conn, run_key):
+    conn.execute('DELETE FROM feegow_patients_sync_slices WHERE run_key = ?', (str(run_key),))
+    if not db.use_turso:
+        conn.commit()
+    set_sync_state(db, conn, 'slice_run_status', 'done')
+
+
+def sync_feegow_patients(
+    full_sync=False,
+    alterado_em=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    max_pages=None,
+    sleep_sec=DEFAULT_SLEEP_SEC,
+    max_workers=DEFAULT_MAX_WORKERS,
+    slice_pages=DEFAULT_SLICE_PAGES,
+    resume=True,
+):
+    print(f"--- Worker Feegow Patients: {datetime.datetime.now().strftime('%H:%M:%S')} ---")
+    db = DatabaseManager()
+    db.update_heartbeat(SERVICE_NAME, 'RUNNING', 'Baixando cadastro de pacientes...')
 
-            params = {}
+    conn = db.get_connection()
+    try:
+        ensure_patients_table(db, conn)
+        run = resumable_run(get_sync_states(conn), page_size, full_sync, alterado_em) if resume else None
+
+        if run:
+            run_key = run['run_key']
+            incremental_date = run['filter']
+            sync_mode = run['mode']
+            is_bootstrap_run = run['bootstrap']
+            slices = load_run_slices(conn, run_key)
+            print(f' -> Retomando {sync_mode} ({sum(1 for sl in slices if sl.status == SLICE_STATUS_PENDING)} fatias pendentes)')
+        else:
+            has_existing_rows = table_has_rows(conn)
+            incremental_date = clean_str(alterado_em)
+            sync_mode = 'full'
+
+            if not full_sync and not incremental_date and has_existing_rows:
+                incremental_date = get_incremental_date(conn, DEFAULT_OVERLAP_DAYS)
             if incremental_date:
-                params['alterado_em'] = incremental_date
-
-            response = fetch_patients_page(limit=page_size, offset=offset, extra_params=params)
-            if not isinstance(response, dict) or response.get('success') is False:
-                raise RuntimeError(f'Feegow patient/list retornou erro na pagina {page + 1}: {response}')
-
-            content = response.get('content') or []
-            received = len(content)
-            page += 1
-            total_received += received
-
-            print(f' -> Pagina {page}: {received} pacientes (offset={offset})')
-
-            if not content:
-                empty_pages += 1
-                if empty_pages >= 1:
-                    break
-                offset += page_size
-                continue
+                sync_mode = f'incremental alterado_em>={incremental_date}'
 
-            rows = []
-            now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            for item in content:
-                row = build_row(item, now_str)
-                if row is not None:
-                    rows.append(row)
+            is_bootstrap_run = (not incremental_date) and ((not has_existing_rows) or bool(full_sync))
+            if is_bootstrap_run:
+                set_sync_state(db, conn, 'bootstrap_complete', '0')
+            run_key = start_run(db, conn, page_size, incremental_date, is_bootstrap_run, sync_mode)
+            slices = []
 
-            total_saved += save_batch(db, conn, rows)
-
-            if received < page_size:
-                break
+        print(f' -> Modo de sincronizacao: {sync_mode}')
 
-            offset += page_size
-            if sleep_sec > 0:
-                time.sleep(sleep_sec)
+        params = {}
+        if incremental_date:
+            params['alterado_em'] = incremental_date
+        limiter = get_host_limiter(urlparse(BASE_URL).netloc, PATIENTS_RATE_PER_SEC, PATIENTS_RATE_BURST)
+        summary = sync_patient_slices(
+            db,
+            conn,
+            run_key,
+            slices,
+            page_size,
+            extra_params=params,
+            max_workers=max_workers,
+            slice_pages=slice_pages,
+            limiter=limiter,
+            max_pages=max_pages,
+            sleep_sec=sleep_sec,
+        )
 
-        details = f'{total_saved} pacientes sincronizados ({sync_mode})'
-        if should_mark_bootstrap_complete:
-            set_sync_state(db, conn, 'bootstrap_complete', '1')
-            set_sync_state(db, conn, 'bootstrap_completed_at', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        if summary['failed']:
+            # Cursores ficam gravados: a proxima execucao retoma so as fatias pendentes.
+            raise RuntimeError(
+                f"Feegow patient/list falhou em {len(summary['failed'])} fatia(s) "
+                f"({summary['saved']} pacientes gravados; execucao retomavel)"
+            )
+
+        details = f"{summary['saved']} pacientes sincronizados, {summary['unchanged']} sem alteracao ({sync_mode})"
+        if summary['complete']:
+            finish_run(db, conn, run_key)
+            if is_bootstrap_run:
+                set_sync_state(db, conn, 'bootstrap_complete', '1')
+                set_sync_state(db, conn, 'bootstrap_completed_at', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        else:
+            details += ' | parcial'
         print(f'OK {details}')
         db.update_heartbeat(SERVICE_NAME, 'COMPLETED', details)
         return {
-            'saved': total_saved,
-            'received': total_received,
+            'saved': summary['saved'],
+            'unchanged': summary['unchanged'],
+            'received': summary['received'],
             'mode': sync_mode,
-            'pages': page,
+            'pages': summary['pages'],
+            'slices': summary['slices'],
+            'resumed': bool(run),
+            'complete': summary['complete'],
         }
     except Exception as exc:
         print(f'ERRO ao sincronizar pacientes Feegow: {exc}')
@@ -314,6 +639,148 @@ def sync_feegow_patients(full_sync=False, alterado_em=None, page_size=DEFAULT_PA
         conn.close()
 
 
+def _legacy_sync_serial(db, conn, page_size, params=None):
+    # Loop antigo (offset serial, grava toda linha recebida) mantido so para comparacao no benchmark.
+    offset = 0
+    saved = 0
+    while True:
+        response = fetch_patients_page(limit=page_size, offset=offset, extra_params=params or {})
+        content = (response or {}).get('content') or []
+        now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        saved += save_batch(db, conn, [row for row in (build_row(item, now_str) for item in content) if row is not None])
+        if len(content) < page_size:
+            return saved
+        offset += page_size
+
+
+def run_patients_stub_benchmark(patients=5000, page_size=100, latency_ms=150.0, changed_ratio=0.05, max_workers=DEFAULT_MAX_WORKERS):
+    """Offline contra um stub do patient/list em SQLite temporario: loop serial antigo, passada em
+    fatias concorrentes, segunda passada com `changed_ratio` dos cadastros alterados (escritas) e uma
+    passada que falha numa pagina e e retomada (requisicoes refeitas)."""
+    import shutil
+    import tempfile
+
+    import database_manager
+    import feegow_client
+    from http_stub import FixtureStubServer
+
+    total = max(1, int(patients))
+    version = {'changed_every': 0}
+    fail_offsets = set()
+
+    def _item(pid):
+        changed = version['changed_every'] and pid % version['changed_every'] == 0
+        return {
+            'patient_id': pid,
+            'nome': f'Paciente {pid}' + (' (alterado)' if changed else ''),
+            'nascimento': '1990-01-01',
+            'email': f'p{pid}@example.com',
+            'celular': '11999990000',
+            'criado_em': '2020-01-01 08:00:00',
+            'alterado_em': '2026-01-02 08:00:00' if changed else '2025-01-01 08:00:00',
+            'programa_de_saude': [],
+        }
+
+    def _handler(method, path, params, raw_body, headers):
+        if not path.rstrip('/').endswith('/patient/list'):
+            return None
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or page_size)
+        if offset in fail_offsets:
+            fail_offsets.discard(offset)
+            return 400, {'success': False, 'content': []}
+        return 200, {'success': True, 'content': [_item(pid) for pid in range(offset + 1, min(total, offset + limit) + 1)]}
+
+    tmp_dir = tempfile.mkdtemp(prefix='patients_bench_')
+    env_overrides = {'DB_PROVIDER': 'sqlite', 'TURSO_URL': None, 'FEEGOW_ACCESS_TOKEN': 'bench'}
+    original_env = {name: os.environ.get(name) for name in env_overrides}
+    original_path = database_manager.LOCAL_DB_PATH
+    original_base_url = feegow_client.BASE_URL
+    results = {}
+    try:
+        for name, value in env_overrides.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        feegow_client.invalidate_headers()
+        with FixtureStubServer(latency_sec=max(0.0, latency_ms / 1000.0), handler=_handler) as stub:
+            feegow_client.BASE_URL = stub.base_url
+            # Limite maior que o real para medir a concorrencia, nao o bucket.
+            limiter = get_host_limiter(f'bench-{stub.base_url}', 50.0, 50.0)
+
+            def _measure(label, fn):
+                served_before = stub.requests_served
+                started = time.perf_counter()
+                try:
+                    outcome = fn()
+                except RuntimeError as exc:
+                    outcome = {'error': str(exc)}
+                results[label] = dict(
+                    {'sec': round(time.perf_counter() - started, 3), 'requests': stub.requests_served - served_before},
+                    **{key: outcome[key] for key in ('saved', 'unchanged', 'complete', 'error') if key in outcome},
+                )
+
+            database_manager.LOCAL_DB_PATH = os.path.join(tmp_dir, 'legacy.db')
+            db = DatabaseManager()
+            conn = db.get_connection()
+            try:
+                ensure_patients_table(db, conn)
+                _measure('legacy', lambda: {'saved': _legacy_sync_serial(db, conn, page_size)})
+            finally:
+                conn.close()
+
+            database_manager.LOCAL_DB_PATH = os.path.join(tmp_dir, 'sliced.db')
+            db = DatabaseManager()
+            conn = db.get_connection()
+            try:
+                ensure_patients_table(db, conn)
+                run_key = start_run(db, conn, page_size, None, False, 'full')
+
+                def _sliced():
+                    summary = sync_patient_slices(db, conn, run_key, load_run_slices(conn, run_key), page_size, max_workers=max_workers, limiter=limiter)
+                    if summary['complete']:
+                        finish_run(db, conn, run_key)
+                    return summary
+
+                _measure('sliced', _sliced)
+
+                version['changed_every'] = max(1, int(round(1.0 / changed_ratio))) if changed_ratio > 0 else 0
+                run_key = start_run(db, conn, page_size, None, False, 'full')
+                _measure('sliced_rerun', _sliced)
+
+                # Falha no meio da passada: a retomada so refaz as paginas que faltavam.
+                fail_offsets.add((total // page_size // 2) * page_size)
+                run_key = start_run(db, conn, page_size, None, False, 'full')
+                _measure('interrupted', _sliced)
+                _measure('resumed', _sliced)
+            finally:
+                conn.close()
+            peak = stub.max_in_flight
+    finally:
+        feegow_client.BASE_URL = original_base_url
+        feegow_client.invalidate_headers()
+        database_manager.LOCAL_DB_PATH = original_path
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    summary = {
+        'patients': total,
+        'page_size': page_size,
+        'latency_ms': latency_ms,
+        'changed_ratio': changed_ratio,
+        'peak_in_flight': peak,
+        'runs': results,
+        'speedup': round(results['legacy']['sec'] / results['sliced']['sec'], 2) if results['sliced']['sec'] else None,
+    }
+    print(f'[worker_feegow_patients] benchmark {json.dumps(summary, ensure_ascii=False)}')
+    return summary
+
+
 def build_arg_parser():
     parser = argparse.ArgumentParser(description='Sincroniza cadastro de pacientes da API Feegow')
     parser.add_argument('--full', action='store_true', help='Forca sincronizacao completa')
@@ -321,15 +788,32 @@ def build_arg_parser():
     parser.add_argument('--page-size', dest='page_size', type=int, default=DEFAULT_PAGE_SIZE, help='Tamanho da pagina')
     parser.add_argument('--max-pages', dest='max_pages', type=int, default=None, help='Limita numero de paginas (smoke)')
     parser.add_argument('--sleep-seconds', dest='sleep_seconds', type=float, default=DEFAULT_SLEEP_SEC, help='Pausa entre paginas')
+    parser.add_argument('--workers', dest='workers', type=int, default=DEFAULT_MAX_WORKERS, help='Fatias buscadas em paralelo')
+    parser.add_argument('--slice-pages', dest='slice_pages', type=int, default=DEFAULT_SLICE_PAGES, help='Paginas por fatia')
+    parser.add_argument('--no-resume', dest='resume', action='store_false', help='Ignora execucao interrompida e comeca do zero')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark offline contra stub do patient/list')
+    parser.add_argument('--bench-patients', dest='bench_patients', type=int, default=5000, help='Pacientes no stub do benchmark')
+    parser.add_argument('--latency-ms', dest='latency_ms', type=float, default=150.0, help='Latencia do stub do benchmark')
     return parser
 
 
 if __name__ == '__main__':
     args = build_arg_parser().parse_args()
+    if args.benchmark:
+        run_patients_stub_benchmark(
+            patients=args.bench_patients,
+            page_size=max(1, int(args.page_size or DEFAULT_PAGE_SIZE)),
+            latency_ms=args.latency_ms,
+            max_workers=max(1, int(args.workers or DEFAULT_MAX_WORKERS)),
+        )
+        sys.exit(0)
     sync_feegow_patients(
         full_sync=bool(args.full),
         alterado_em=args.alterado_em,
         page_size=max(1, int(args.page_size or DEFAULT_PAGE_SIZE)),
         max_pages=args.max_pages if args.max_pages and args.max_pages > 0 else None,
         sleep_sec=max(0.0, float(args.sleep_seconds or 0)),
+        max_workers=max(1, int(args.workers or DEFAULT_MAX_WORKERS)),
+        slice_pages=max(1, int(args.slice_pages or DEFAULT_SLICE_PAGES)),
+        resume=bool(args.resume),
     )
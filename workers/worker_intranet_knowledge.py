@@ -2,8 +2,11 @@ import io
 import hashlib
 import json
 import os
+import random
+import sys
 import time
 import uuid
+from array import array
 import zipfile
 from datetime import datetime, timezone
 from pathlib import Path
@@ -11,8 +14,15 @@ from typing import Any, Dict, List, Optional
 from xml.etree import ElementTree
 
 from database_manager import DatabaseManager
+from http_fanout import fan_out
+from job_queue import wait_for_work
 from storage_s3 import download_s3_object_bytes
 
+try:
+    import libsql_client
+except ImportError:
+    libsql_client = None
+
 try:
     from openai import OpenAI
 except Exception:
@@ -39,8 +49,17 @@ REINDEX_BATCH_SIZE = max(1, int(os.getenv("INTRANET_KNOWLEDGE_BATCH_SIZE", "80")
 EMBED_BATCH_SIZE = max(1, int(os.getenv("INTRANET_KNOWLEDGE_EMBED_BATCH_SIZE", "20")))
 CHUNK_TARGET_TOKENS = max(300, int(os.getenv("KNOWLEDGE_CHUNK_TARGET_TOKENS", "1000")))
 CHUNK_OVERLAP_TOKENS = max(60, int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP_TOKENS", "160")))
+EMBED_MAX_WORKERS = max(1, int(os.getenv("INTRANET_KNOWLEDGE_EMBED_WORKERS", "4")))
+EMBED_MAX_RETRIES = max(0, int(os.getenv("INTRANET_KNOWLEDGE_EMBED_MAX_RETRIES", "5")))
+EMBED_BACKOFF_BASE_SEC = max(0.1, float(os.getenv("INTRANET_KNOWLEDGE_EMBED_BACKOFF_SEC", "1.0")))
 EMBEDDING_MODEL = str(os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small") or "").strip() or "text-embedding-3-small"
 OPENAI_BASE_URL = str(os.getenv("OPENAI_BASE_URL", "") or "").strip() or None
+# "openai" (padrao) ou "fake": vetores deterministicos locais para benchmark/dev sem API.
+EMBEDDING_PROVIDER = str(os.getenv("INTRANET_KNOWLEDGE_EMBEDDING_PROVIDER", "openai") or "").strip().lower() or "openai"
+FAKE_EMBEDDING_DIM = max(8, int(os.getenv("INTRANET_KNOWLEDGE_FAKE_EMBEDDING_DIM", "1536")))
+FAKE_EMBEDDING_LATENCY_SEC = max(0.0, float(os.getenv("INTRANET_KNOWLEDGE_FAKE_EMBEDDING_LATENCY_SEC", "0")))
+EMBEDDING_CACHE_TABLE = "intranet_knowledge_embedding_cache"
+EMBEDDING_CACHE_LOOKUP_CHUNK = 200
 
 
 def _now_iso() -> str:
@@ -158,6 +177,125 @@ def _build_chunks(source: Dict[str, Any]) -> List[Dict[str, Any]]:
     return chunks
 
 
+def _chunk_hash(chunk_text: str) -> str:
+    return f"h{hashlib.md5(_clean(chunk_text).encode('utf-8')).hexdigest()}"
+
+
+def pack_embedding(vector: List[float]) -> bytes:
+    """float32 little-endian (4 bytes por dimensao, ~4x menor que o JSON)."""
+    packed = array("f", vector)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_embedding(blob: bytes) -> List[float]:
+    packed = array("f")
+    packed.frombytes(bytes(blob))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tolist()
+
+
+def _ensure_embedding_storage(db: DatabaseManager):
+    blob_type = "LONGBLOB" if db.use_mysql else "BLOB"
+    _execute(
+        db,
+        f"""
+        CREATE TABLE IF NOT EXISTS {EMBEDDING_CACHE_TABLE} (
+          chunk_hash VARCHAR(64) NOT NULL,
+          embedding_model VARCHAR(120) NOT NULL,
+          dims INTEGER NOT NULL,
+          embedding_f32 {blob_type} NOT NULL,
+          created_at VARCHAR(32) NOT NULL,
+          PRIMARY KEY (chunk_hash, embedding_model)
+        )
+        """,
+    )
+    # A tabela de chunks e criada pelo painel; sem ela, tenta de novo na proxima construcao.
+    columns = {_clean(_row_get(row, "name", 1)) for row in _query(db, "PRAGMA table_info(intranet_knowledge_chunks)")}
+    if not columns:
+        return False
+    if "embedding_f32" not in columns:
+        _execute(db, f"ALTER TABLE intranet_knowledge_chunks ADD COLUMN embedding_f32 {blob_type} NULL")
+    return True
+
+
+class EmbeddingCache:
+    """Cache enderecado por conteudo (chunk_hash + modelo -> vetor float32).
+
+    Chunks inalterados nunca voltam para a API. Sem `db`, funciona so em memoria (benchmark).
+    """
+
+    def __init__(self, db: Optional[DatabaseManager], model: str):
+        self.db = db
+        self.model = model
+        self._memory: Dict[str, List[float]] = {}
+        self.hits = 0
+        self.misses = 0
+        if db is not None:
+            db.ensure_schema(EMBEDDING_CACHE_TABLE, lambda: _ensure_embedding_storage(db))
+
+    def get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {h: self._memory[h] for h in hashes if h in self._memory}
+        pending = [h for h in hashes if h not in found]
+        if self.db is not None:
+            for start in range(0, len(pending), EMBEDDING_CACHE_LOOKUP_CHUNK):
+                batch = pending[start : start + EMBEDDING_CACHE_LOOKUP_CHUNK]
+                placeholders = ", ".join("?" for _ in batch)
+                rows = _query(
+                    self.db,
+                    f"""
+                    SELECT chunk_hash, embedding_f32
+                    FROM {EMBEDDING_CACHE_TABLE}
+                    WHERE embedding_model = ? AND chunk_hash IN ({placeholders})
+                    """,
+                    (self.model, *batch),
+                )
+                for row in rows:
+                    blob = _row_get(row, "embedding_f32", 1)
+                    if blob:
+                        found[_clean(_row_get(row, "chunk_hash", 0))] = unpack_embedding(blob)
+        self._memory.update(found)
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def seed(self, vectors: Dict[str, List[float]]):
+        """Aproveita vetores ja gravados nos chunks atuais da fonte (antes do cache existir)."""
+        for chunk_hash, vector in vectors.items():
+            if vector:
+                self._memory.setdefault(chunk_hash, vector)
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        self._memory.update(vectors)
+        if self.db is None:
+            return
+        now = _now_iso()
+        rows = [
+            (chunk_hash, self.model, len(vector), pack_embedding(vector), now)
+            for chunk_hash, vector in vectors.items()
+        ]
+        sql = f"""
+            INSERT INTO {EMBEDDING_CACHE_TABLE} (chunk_hash, embedding_model, dims, embedding_f32, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(chunk_hash, embedding_model) DO UPDATE SET
+              dims = excluded.dims,
+              embedding_f32 = excluded.embedding_f32
+        """
+        conn = self.db.get_connection()
+        try:
+            if self.db.use_turso:
+                conn.batch([libsql_client.Statement(sql, row) for row in rows])
+            else:
+                conn.executemany(sql, rows)
+                conn.commit()
+        finally:
+            conn.close()
+
+
 def _get_openai_client():
     api_key = _clean(os.getenv("OPENAI_API_KEY"))
     if not api_key:
@@ -170,20 +308,124 @@ def _get_openai_client():
     return OpenAI(**kwargs)
 
 
-def _embed_many(texts: List[str]) -> List[List[float]]:
+def fake_embedding(text: str, dims: int = FAKE_EMBEDDING_DIM) -> List[float]:
+    """Vetor unitario deterministico derivado do texto (mesma entrada -> mesmo vetor)."""
+    seed = int.from_bytes(hashlib.sha256(_clean(text).encode("utf-8")).digest()[:8], "little")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dims)]
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+
+class FakeEmbeddingProvider:
+    def __init__(self, dims: int = FAKE_EMBEDDING_DIM, latency_sec: float = FAKE_EMBEDDING_LATENCY_SEC):
+        self.dims = dims
+        self.latency_sec = latency_sec
+        self.model = f"fake-embedding-{dims}"
+        self.calls = 0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency_sec > 0:
+            time.sleep(self.latency_sec)
+        return [fake_embedding(text, self.dims) for text in texts]
+
+
+class OpenAIEmbeddingProvider:
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        self.model = model
+        self.client = _get_openai_client()
+        self.calls = 0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        response = self.client.embeddings.create(model=self.model, input=texts)
+        return [list(item.embedding) for item in response.data]
+
+
+def _get_embedding_provider():
+    if EMBEDDING_PROVIDER == "fake":
+        return FakeEmbeddingProvider()
+    return OpenAIEmbeddingProvider()
+
+
+def _is_retryable_embedding_error(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return int(status) == 429 or int(status) >= 500
+    return type(exc).__name__ in {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+
+def _embed_batch_with_backoff(provider, batch: List[str]) -> List[List[float]]:
+    attempt = 0
+    while True:
+        try:
+            vectors = provider.embed(batch)
+            if len(vectors) != len(batch):
+                raise RuntimeError(f"Embedding retornou {len(vectors)} vetores para {len(batch)} textos.")
+            return vectors
+        except Exception as exc:
+            if attempt >= EMBED_MAX_RETRIES or not _is_retryable_embedding_error(exc):
+                raise
+            delay = EMBED_BACKOFF_BASE_SEC * (2 ** attempt) * (0.5 + random.random())
+            attempt += 1
+            print(f"[intranet_knowledge] embedding falhou ({type(exc).__name__}); tentativa {attempt} em {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _embed_many(texts: List[str], cache: Optional[EmbeddingCache] = None, provider=None, max_workers: int = EMBED_MAX_WORKERS) -> List[List[float]]:
+    """Embeddings na ordem de `texts`: cache primeiro, faltantes em lotes concorrentes com backoff."""
     if not texts:
         return []
 
-    client = _get_openai_client()
-    embeddings: List[List[float]] = []
+    hashes = [_chunk_hash(text) for text in texts]
+    vectors = cache.get_many(list(dict.fromkeys(hashes))) if cache is not None else {}
+
+    missing: Dict[str, str] = {}
+    for chunk_hash, text in zip(hashes, texts):
+        if chunk_hash not in vectors:
+            missing.setdefault(chunk_hash, text)
+
+    if missing:
+        provider = provider or _get_embedding_provider()
+        missing_hashes = list(missing.keys())
+        batches = [missing_hashes[i : i + EMBED_BATCH_SIZE] for i in range(0, len(missing_hashes), EMBED_BATCH_SIZE)]
+        results = fan_out(
+            [
+                (tuple(batch), (lambda batch=batch: _embed_batch_with_backoff(provider, [missing[h] for h in batch])))
+                for batch in batches
+            ],
+            max_workers,
+        )
+        fresh: Dict[str, List[float]] = {}
+        for result in results:
+            if not result.ok:
+                raise result.error
+            fresh.update(zip(result.key, result.value))
+        if cache is not None:
+            cache.put_many(fresh)
+        vectors.update(fresh)
+
+    return [vectors[chunk_hash] for chunk_hash in hashes]
 
-    for start in range(0, len(texts), EMBED_BATCH_SIZE):
-        batch = texts[start : start + EMBED_BATCH_SIZE]
-        response = client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
-        for item in response.data:
-            embeddings.append(list(item.embedding))
 
-    return embeddings
+def _load_existing_source_vectors(db: DatabaseManager, source_id: str, model: str) -> Dict[str, List[float]]:
+    rows = _query(
+        db,
+        """
+        SELECT chunk_hash, embedding_f32, embedding_json
+        FROM intranet_knowledge_chunks
+        WHERE knowledge_source_id = ? AND embedding_model = ?
+        """,
+        (_clean(source_id), model),
+    )
+    vectors: Dict[str, List[float]] = {}
+    for row in rows:
+        blob = _row_get(row, "embedding_f32", 1)
+        vector = unpack_embedding(blob) if blob else _json_loads(_row_get(row, "embedding_json", 2), [])
+        if vector:
+            vectors[_clean(_row_get(row, "chunk_hash", 0))] = vector
+    return vectors
 
 
 def _get_pending_job(db: DatabaseManager) -> Optional[Dict[str, Any]]:
@@ -297,43 +539,67 @@ def _mark_source_failed(db: DatabaseManager, source_id: str, error_message: str)
     )
 
 
-def _replace_source_chunks(db: DatabaseManager, source: Dict[str, Any], chunks: List[Dict[str, Any]], embeddings: List[List[float]]):
+def _replace_source_chunks(
+    db: DatabaseManager,
+    source: Dict[str, Any],
+    chunks: List[Dict[str, Any]],
+    embeddings: List[List[float]],
+    model: str = EMBEDDING_MODEL,
+):
+    """DELETE + INSERTs + status da fonte numa unica transacao (batch atomico no Turso)."""
     source_id = _clean(source["id"])
     now = _now_iso()
-    _execute(db, "DELETE FROM intranet_knowledge_chunks WHERE knowledge_source_id = ?", (source_id,))
-
+    insert_sql = """
+        INSERT INTO intranet_knowledge_chunks (
+          id, knowledge_source_id, chunk_index, chunk_text, chunk_hash,
+          embedding_model, embedding_json, embedding_f32, token_count, visibility_ref_json, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    rows = []
     for index, item in enumerate(chunks):
-        _execute(
-            db,
-            """
-            INSERT INTO intranet_knowledge_chunks (
-              id, knowledge_source_id, chunk_index, chunk_text, chunk_hash,
-              embedding_model, embedding_json, token_count, visibility_ref_json, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
+        vector = embeddings[index] if index < len(embeddings) else []
+        rows.append(
             (
                 str(uuid.uuid4()),
                 source_id,
                 int(item["chunk_index"]),
                 _clean(item["chunk_text"]),
-                f"h{hashlib.md5(_clean(item['chunk_text']).encode('utf-8')).hexdigest()}",
-                EMBEDDING_MODEL,
-                _json_dumps(embeddings[index] if index < len(embeddings) else []),
+                _chunk_hash(item["chunk_text"]),
+                model,
+                _json_dumps(vector),
+                pack_embedding(vector) if vector else None,
                 int(item["token_count"]),
                 _json_dumps(item["visibility_ref_json"]),
                 now,
-            ),
+            )
         )
-
-    _execute(
-        db,
-        """
+    delete_sql = "DELETE FROM intranet_knowledge_chunks WHERE knowledge_source_id = ?"
+    update_sql = """
         UPDATE intranet_knowledge_sources
         SET status = 'indexed', last_indexed_at = ?, last_error = NULL, updated_at = ?
         WHERE id = ?
-        """,
-        (now, now, source_id),
-    )
+    """
+
+    conn = db.get_connection()
+    try:
+        if db.use_turso:
+            conn.batch(
+                [libsql_client.Statement(delete_sql, (source_id,))]
+                + [libsql_client.Statement(insert_sql, row) for row in rows]
+                + [libsql_client.Statement(update_sql, (now, now, source_id))]
+            )
+            return
+        try:
+            conn.execute(delete_sql, (source_id,))
+            if rows:
+                conn.executemany(insert_sql, rows)
+            conn.execute(update_sql, (now, now, source_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
 
 
 def _get_file_format(file_name: str, mime_type: str) -> str:
@@ -423,13 +689,17 @@ def _ensure_source_content_text(db: DatabaseManager, source: Dict[str, Any]) ->
     return refreshed
 
 
-def _index_source(db: DatabaseManager, source: Dict[str, Any]):
+def _index_source(db: DatabaseManager, source: Dict[str, Any], provider=None) -> Dict[str, int]:
     hydrated = _ensure_source_content_text(db, source)
     chunks = _build_chunks(hydrated)
     if not chunks:
         raise RuntimeError("A fonte nao possui texto suficiente para indexacao.")
-    embeddings = _embed_many([item["chunk_text"] for item in chunks])
-    _replace_source_chunks(db, hydrated, chunks, embeddings)
+    provider = provider or _get_embedding_provider()
+    cache = EmbeddingCache(db, provider.model)
+    cache.seed(_load_existing_source_vectors(db, hydrated["id"], provider.model))
+    embeddings = _embed_many([item["chunk_text"] for item in chunks], cache=cache, provider=provider)
+    _replace_source_chunks(db, hydrated, chunks, embeddings, model=provider.model)
+    return {"cache_hits": cache.hits, "embedded": cache.misses}
 
 
 def _process_specific_source_job(db: DatabaseManager, source_id: str) -> Dict[str, int]:
@@ -439,14 +709,17 @@ def _process_specific_source_job(db: DatabaseManager, source_id: str) -> Dict[st
     if source["status"] == "archived":
         return {"indexed": 0, "failed": 0, "skipped": 1}
 
-    _index_source(db, source)
-    return {"indexed": 1, "failed": 0, "skipped": 0}
+    stats = _index_source(db, source)
+    return {"indexed": 1, "failed": 0, "skipped": 0, **stats}
 
 
 def _process_global_reindex_job(db: DatabaseManager) -> Dict[str, int]:
     indexed = 0
     failed = 0
     skipped = 0
+    cache_hits = 0
+    embedded = 0
+    provider = _get_embedding_provider()
 
     while True:
         sources = [item for item in _list_pending_sources(db, REINDEX_BATCH_SIZE) if item]
@@ -460,13 +733,15 @@ def _process_global_reindex_job(db: DatabaseManager) -> Dict[str, int]:
                 if source["status"] == "archived":
                     skipped += 1
                     continue
-                _index_source(db, source)
+                stats = _index_source(db, source, provider=provider)
+                cache_hits += stats["cache_hits"]
+                embedded += stats["embedded"]
                 indexed += 1
             except Exception as exc:
                 failed += 1
                 _mark_source_failed(db, source["id"], str(exc))
 
-    return {"indexed": indexed, "failed": failed, "skipped": skipped}
+    return {"indexed": indexed, "failed": failed, "skipped": skipped, "cache_hits": cache_hits, "embedded": embedded}
 
 
 def process_pending_knowledge_jobs_once() -> bool:
@@ -497,7 +772,8 @@ def process_pending_knowledge_jobs_once() -> bool:
             result = _process_global_reindex_job(db)
 
         summary = (
-            f"job={job['id']} concluido | indexed={result['indexed']} failed={result['failed']} skipped={result['skipped']}"
+            f"job={job['id']} concluido | indexed={result['indexed']} failed={result['failed']} skipped={result['skipped']} "
+            f"cache_hits={result.get('cache_hits', 0)} embedded={result.get('embedded', 0)}"
         )
         if result["failed"] > 0:
             _mark_job_done(
@@ -523,6 +799,47 @@ def process_pending_knowledge_jobs_once() -> bool:
         return True
 
 
+def run_fake_embedding_benchmark(
+    num_chunks: int = 200,
+    latency_sec: float = 0.2,
+    dims: int = 256,
+    max_workers: int = EMBED_MAX_WORKERS,
+) -> Dict[str, Any]:
+    """Benchmark offline do pipeline de embeddings com o provider fake (sem API e sem banco):
+    serial frio x concorrente frio x reindexacao com cache quente."""
+    texts = [f"Trecho sintetico {index}: " + ("conteudo da intranet " * 40) for index in range(num_chunks)]
+    timings: Dict[str, float] = {}
+    calls: Dict[str, int] = {}
+
+    for label, workers in (("serial", 1), ("concurrent", max_workers)):
+        provider = FakeEmbeddingProvider(dims=dims, latency_sec=latency_sec)
+        started = time.perf_counter()
+        _embed_many(texts, cache=EmbeddingCache(None, provider.model), provider=provider, max_workers=workers)
+        timings[label] = round(time.perf_counter() - started, 3)
+        calls[label] = provider.calls
+
+    provider = FakeEmbeddingProvider(dims=dims, latency_sec=latency_sec)
+    cache = EmbeddingCache(None, provider.model)
+    _embed_many(texts, cache=cache, provider=provider, max_workers=max_workers)
+    edited = list(texts)
+    edited[0] = edited[0] + " (editado)"
+    calls_before = provider.calls
+    started = time.perf_counter()
+    _embed_many(edited, cache=cache, provider=provider, max_workers=max_workers)
+    timings["reindex_one_changed"] = round(time.perf_counter() - started, 3)
+    calls["reindex_one_changed"] = provider.calls - calls_before
+
+    sample = fake_embedding(texts[0], dims)
+    return {
+        "chunks": num_chunks,
+        "batchSize": EMBED_BATCH_SIZE,
+        "timingsSec": timings,
+        "providerCalls": calls,
+        "jsonBytesPerVector": len(_json_dumps(sample)),
+        "blobBytesPerVector": len(pack_embedding(sample)),
+    }
+
+
 def run_intranet_knowledge_index_loop():
     db = DatabaseManager()
     db.update_heartbeat(SERVICE_NAME, HEARTBEAT_COMPLETED, "Worker de conhecimento da intranet iniciado")
@@ -530,7 +847,8 @@ def run_intranet_knowledge_index_loop():
         try:
             processed = process_pending_knowledge_jobs_once()
             if not processed:
-                time.sleep(POLL_SECONDS)
+                # Acorda imediatamente quando o orquestrador sinaliza job novo; POLL_SECONDS e o teto.
+                wait_for_work(SERVICE_NAME, POLL_SECONDS)
         except Exception as exc:
             db.update_heartbeat(SERVICE_NAME, HEARTBEAT_FAILED, f"loop_error={exc}")
             time.sleep(POLL_SECONDS)
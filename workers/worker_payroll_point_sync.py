@@ -1,21 +1,23 @@
 import base64
+import hashlib
 import json
 import os
-import ssl
+import threading
 import time
 import unicodedata
 import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Iterable, List, Optional, Tuple
-from urllib.error import HTTPError, URLError
 from urllib.parse import urlencode, urlparse
-from urllib.request import Request, urlopen
+
+import requests
 try:
     from zoneinfo import ZoneInfo
 except Exception:  # pragma: no cover - fallback for older Python runtimes
     ZoneInfo = None
 
 from database_manager import DatabaseManager
+from http_fanout import ThreadLocalSessions, fan_out, get_host_limiter, make_retrying_session
 from storage_s3 import upload_s3_object_bytes
 
 
@@ -26,6 +28,13 @@ STATUS_COMPLETED = "COMPLETED"
 STATUS_FAILED = "FAILED"
 SYNC_ACTOR = "system_sync_solides"
 HTTP_TIMEOUT_SEC = max(15, int(os.getenv("SOLIDES_SYNC_TIMEOUT_SEC", "45")))
+SYNC_MAX_WORKERS = max(1, int(os.getenv("SOLIDES_SYNC_MAX_WORKERS", "6")))
+# Teto global de requisicoes/s por host da Solides, dividido entre todas as threads do processo.
+SYNC_RATE_PER_SEC = max(0.0, float(os.getenv("SOLIDES_SYNC_RATE_PER_SEC", "8")))
+SYNC_RATE_BURST = max(1.0, float(os.getenv("SOLIDES_SYNC_RATE_BURST", "8")))
+DAY_CACHE_ENABLED = str(os.getenv("SOLIDES_DAY_CACHE_ENABLED", "1")).strip().lower() in ("1", "true", "yes", "on")
+# Dias anteriores a hoje-N (fuso de trabalho) sem ajuste pendente sao considerados fechados.
+DAY_CACHE_CLOSE_AFTER_DAYS = max(1, int(os.getenv("SOLIDES_DAY_CACHE_CLOSE_AFTER_DAYS", "3")))
 STAGE_DISCOVERING_EMPLOYEES = "DISCOVERING_EMPLOYEES"
 STAGE_SYNCING_DAILY_ACTIVITY = "SYNCING_DAILY_ACTIVITY"
 STAGE_SYNCING_BALANCES_AND_SIGNATURES = "SYNCING_BALANCES_AND_SIGNATURES"
@@ -443,6 +452,150 @@ class SolidesApiError(RuntimeError):
     pass
 
 
+def _canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _hash_text(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class DailyActivityCache:
+    """Cache persistente das respostas de /daily-activity de dias já fechados.
+
+    Um dia é fechado quando está a mais de DAY_CACHE_CLOSE_AFTER_DAYS dias de hoje e
+    não tem ajuste pendente. A entrada guarda o hash dos ajustes daquele dia: se um
+    ajuste for aprovado, criado ou removido depois, o hash muda e o dia é rebuscado.
+    Leituras e gravações de rede ficam em memória; `flush()` persiste em lote.
+    """
+
+    def __init__(self, db: DatabaseManager, enabled: bool = DAY_CACHE_ENABLED, today_iso: Optional[str] = None):
+        self.db = db
+        self.enabled = bool(enabled)
+        today = datetime.strptime(today_iso, "%Y-%m-%d").date() if today_iso else datetime.now(WORK_TZ).date()
+        self.closed_until = (today - timedelta(days=DAY_CACHE_CLOSE_AFTER_DAYS)).isoformat()
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def load(self, employee_ids: Iterable[str], start_iso: str, end_iso: str):
+        ids = sorted({_clean(item) for item in employee_ids if _clean(item)})
+        if not self.enabled or not ids or start_iso > self.closed_until:
+            return
+        rows = []
+        for offset in range(0, len(ids), 200):
+            chunk = ids[offset:offset + 200]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows.extend(self.db.execute_query(
+                f"""
+                SELECT solides_employee_id, work_date, adjustments_hash, content_hash, payload_json
+                FROM payroll_point_activity_cache
+                WHERE work_date >= ? AND work_date <= ? AND solides_employee_id IN ({placeholders})
+                """,
+                (start_iso, min(end_iso, self.closed_until), *chunk),
+            ) or [])
+        with self._lock:
+            for row in rows:
+                payload_json = _clean(_row_get(row, "payload_json", 4))
+                # Entrada corrompida ou truncada não é confiável: deixa cair para a API.
+                if not payload_json or _hash_text(payload_json) != _clean(_row_get(row, "content_hash", 3)):
+                    continue
+                try:
+                    payload = json.loads(payload_json)
+                except Exception:
+                    continue
+                key = (_clean(_row_get(row, "solides_employee_id", 0)), _clean(_row_get(row, "work_date", 1)))
+                self._entries[key] = {
+                    "adjustments_hash": _clean(_row_get(row, "adjustments_hash", 2)),
+                    "payload": payload,
+                }
+
+    def _day_fingerprint(self, day_iso: str, adjustment_maps: Optional[Dict[str, Any]]) -> Optional[str]:
+        if not self.enabled or adjustment_maps is None or day_iso > self.closed_until:
+            return None
+        if (adjustment_maps.get("pending_by_date") or {}).get(day_iso):
+            return None
+        return _hash_text(_canonical_json((adjustment_maps.get("by_date") or {}).get(day_iso) or []))
+
+    def lookup(self, employee_id: str, day_iso: str, adjustment_maps: Optional[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        fingerprint = self._day_fingerprint(day_iso, adjustment_maps)
+        if fingerprint is None:
+            return None
+        with self._lock:
+            entry = self._entries.get((employee_id, day_iso))
+            if entry is not None and entry["adjustments_hash"] == fingerprint:
+                self.hits += 1
+                return entry["payload"]
+            self.misses += 1
+        return None
+
+    def store(self, employee_id: str, day_iso: str, adjustment_maps: Optional[Dict[str, Any]], payload: List[Dict[str, Any]]):
+        fingerprint = self._day_fingerprint(day_iso, adjustment_maps)
+        if fingerprint is None:
+            return
+        # Serializa já na gravação: o payload segue adiante e não deve afetar o que vai para o cache.
+        payload_json = _canonical_json(payload)
+        with self._lock:
+            self._entries[(employee_id, day_iso)] = {"adjustments_hash": fingerprint, "payload": payload}
+            self._pending[(employee_id, day_iso)] = {"adjustments_hash": fingerprint, "payload_json": payload_json}
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        now = _now_iso()
+        statements: List[Tuple[str, Tuple[Any, ...]]] = []
+        for (employee_id, day_iso), entry in pending.items():
+            statements.append((
+                "DELETE FROM payroll_point_activity_cache WHERE solides_employee_id = ? AND work_date = ?",
+                (employee_id, day_iso),
+            ))
+            statements.append((
+                """
+                INSERT INTO payroll_point_activity_cache (
+                  solides_employee_id, work_date, adjustments_hash, content_hash, payload_json, fetched_at
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    employee_id,
+                    day_iso,
+                    entry["adjustments_hash"],
+                    _hash_text(entry["payload_json"]),
+                    entry["payload_json"],
+                    now,
+                ),
+            ))
+        _bulk_execute(self.db, statements)
+        self.stored += len(pending)
+        return len(pending)
+
+
+def invalidate_daily_activity_cache(
+    db: DatabaseManager,
+    solides_employee_id: Optional[str] = None,
+    start_iso: Optional[str] = None,
+    end_iso: Optional[str] = None,
+):
+    """Remove entradas do cache de dias fechados (ex.: após correção manual na Sólides)."""
+    clauses = []
+    params: List[Any] = []
+    if solides_employee_id:
+        clauses.append("solides_employee_id = ?")
+        params.append(solides_employee_id)
+    if start_iso:
+        clauses.append("work_date >= ?")
+        params.append(start_iso)
+    if end_iso:
+        clauses.append("work_date <= ?")
+        params.append(end_iso)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    _execute(db, f"DELETE FROM payroll_point_activity_cache{where}", tuple(params))
+
+
 class SolidesClient:
     def __init__(self):
         self.token = (
@@ -458,7 +611,17 @@ class SolidesClient:
         self.punch_base = _clean(os.getenv("TANGERINO_PUNCH_API_BASE")) or "https://api.tangerino.com.br/api/punch"
         self.employer_base = _clean(os.getenv("TANGERINO_EMPLOYER_API_BASE")) or "https://api.tangerino.com.br/api/employer"
         self.reports_base = _clean(os.getenv("TANGERINO_REPORTS_API_BASE")) or "https://api.tangerino.com.br/api/time-sheet"
-        self._ssl_context = ssl.create_default_context()
+        # Sessao keep-alive por thread; o limitador por host vale para o processo inteiro.
+        # raise_on_status=False: esgotadas as retentativas de 5xx volta a ultima resposta (e o corpo, ex.:
+        # "A data não pode ser maior que 1 dia", que aciona o fallback de meio dia) em vez de RetryError.
+        self._sessions = ThreadLocalSessions(
+            lambda: make_retrying_session(pool_maxsize=SYNC_MAX_WORKERS, raise_on_status=False)
+        )
+        self.requests_made = 0
+        self._stats_lock = threading.Lock()
+
+    def close(self):
+        self._sessions.close()
 
     def _request_raw(
         self,
@@ -474,31 +637,34 @@ class SolidesClient:
             query_params[key] = value
         query = f"?{urlencode(query_params, doseq=True)}" if query_params else ""
         url = absolute_url or f"{base_url.rstrip('/')}{path}{query}"
-        request = Request(
-            url,
-            headers={
-                "Authorization": f"Basic {self.token}",
-                "Accept": "*/*",
-                "User-Agent": "consultare-hub/solides-sync",
-            },
-            method="GET",
-        )
+        get_host_limiter(urlparse(url).netloc, SYNC_RATE_PER_SEC, SYNC_RATE_BURST).acquire()
+        with self._stats_lock:
+            self.requests_made += 1
         try:
-            with urlopen(request, timeout=HTTP_TIMEOUT_SEC, context=self._ssl_context) as response:
-                return {
-                    "url": url,
-                    "body": response.read(),
-                    "content_type": _clean(response.headers.get("Content-Type")),
-                    "content_disposition": _clean(response.headers.get("Content-Disposition")),
-                }
-        except HTTPError as exc:
-            body = exc.read().decode("utf-8", "ignore")
-            if exc.code == 404:
-                return {"url": url, "not_found": True, "body": body.encode("utf-8")}
-            raise SolidesApiError(f"Erro HTTP {exc.code} em {path or url}: {body[:300] or exc.reason}") from exc
-        except URLError as exc:
+            response = self._sessions.get().get(
+                url,
+                headers={
+                    "Authorization": f"Basic {self.token}",
+                    "Accept": "*/*",
+                    "User-Agent": "consultare-hub/solides-sync",
+                },
+                timeout=HTTP_TIMEOUT_SEC,
+            )
+        except requests.RequestException as exc:
             raise SolidesApiError(f"Falha de rede ao acessar {path or url}: {exc}") from exc
 
+        if response.status_code == 404:
+            return {"url": url, "not_found": True, "body": response.content}
+        if response.status_code >= 400:
+            body = response.content.decode("utf-8", "ignore")
+            raise SolidesApiError(f"Erro HTTP {response.status_code} em {path or url}: {body[:300] or response.reason}")
+        return {
+            "url": url,
+            "body": response.content,
+            "content_type": _clean(response.headers.get("Content-Type")),
+            "content_disposition": _clean(response.headers.get("Content-Disposition")),
+        }
+
     def _paginate(self, path: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         items: List[Dict[str, Any]] = []
         page = 0
@@ -667,14 +833,25 @@ class SolidesClient:
             f"Tentativa principal: {last_error}. Fallback: {fallback_details}"
         )
 
-    def get_daily_activity(self, employee_id: str, start_ms: int, end_ms: int) -> List[Dict[str, Any]]:
+    def get_daily_activity(
+        self,
+        employee_id: str,
+        start_ms: int,
+        end_ms: int,
+        day_cache: Optional["DailyActivityCache"] = None,
+        adjustment_maps: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
         day_map: Dict[str, Dict[str, Any]] = {}
         for day_iso in _date_range_iter(start_ms, end_ms):
-            # O endpoint /daily-activity aceita apenas um único dia por chamada e
-            # interpreta os milissegundos no fuso operacional do colaborador.
-            # Mantemos a janela diária em horário local e aplicamos retry com
-            # fallback em meio período quando a API oscila com erro de faixa.
-            payload = self._get_daily_activity_for_day(employee_id, day_iso)
+            payload = day_cache.lookup(employee_id, day_iso, adjustment_maps) if day_cache is not None else None
+            if payload is None:
+                # O endpoint /daily-activity aceita apenas um único dia por chamada e
+                # interpreta os milissegundos no fuso operacional do colaborador.
+                # Mantemos a janela diária em horário local e aplicamos retry com
+                # fallback em meio período quando a API oscila com erro de faixa.
+                payload = self._get_daily_activity_for_day(employee_id, day_iso)
+                if day_cache is not None:
+                    day_cache.store(employee_id, day_iso, adjustment_maps, payload)
 
             for employee_payload in payload:
                 for list_key, field_name in (
@@ -919,6 +1096,20 @@ def _ensure_tables(db: DatabaseManager):
         )
         """,
     )
+    _execute(
+        db,
+        """
+        CREATE TABLE IF NOT EXISTS payroll_point_activity_cache (
+          solides_employee_id VARCHAR(64) NOT NULL,
+          work_date VARCHAR(10) NOT NULL,
+          adjustments_hash VARCHAR(64) NOT NULL,
+          content_hash VARCHAR(64) NOT NULL,
+          payload_json LONGTEXT NOT NULL,
+          fetched_at VARCHAR(32) NOT NULL,
+          PRIMARY KEY (solides_employee_id, work_date)
+        )
+        """,
+    )
     _safe_execute(
         db,
         "ALTER TABLE payroll_point_daily ADD COLUMN pending_adjustments_count INTEGER NOT NULL DEFAULT 0",
@@ -1634,8 +1825,53 @@ def _build_daily_rows_for_employee(
     return items
 
 
+def _fetch_employee_bundle(
+    client: SolidesClient,
+    day_cache: Optional[DailyActivityCache],
+    employee_id: str,
+    external_id: Optional[str],
+    start_ms: int,
+    end_ms: int,
+    include_balance_and_signature: bool = True,
+) -> Dict[str, Any]:
+    """Busca tudo o que a competência precisa de um colaborador; roda em paralelo entre colaboradores."""
+    # Os ajustes vêm primeiro: além de alimentar os indicadores, definem quais dias
+    # estão fechados e se a entrada em cache daquele dia continua válida.
+    adjustments = client.get_adjustments(employee_id, start_ms, end_ms)
+    adjustment_maps = _build_adjustment_maps(adjustments)
+    bundle: Dict[str, Any] = {
+        "adjustments": adjustments,
+        "adjustment_maps": adjustment_maps,
+        "daily_activity": client.get_daily_activity(
+            employee_id,
+            start_ms,
+            end_ms,
+            day_cache=day_cache,
+            adjustment_maps=adjustment_maps,
+        ),
+        "hours_balance": None,
+        "signature": None,
+        "signature_error": None,
+    }
+    if not include_balance_and_signature:
+        return bundle
+    bundle["hours_balance"] = client.get_hours_balance(employee_id, external_id, start_ms, end_ms)
+    try:
+        bundle["signature"] = client.get_last_signature(employee_id)
+    except Exception as exc:
+        bundle["signature_error"] = exc
+    return bundle
+
+
 def _process_job(db: DatabaseManager, job: Dict[str, Any]):
     client = SolidesClient()
+    try:
+        _process_job_with_client(db, job, client)
+    finally:
+        client.close()
+
+
+def _process_job_with_client(db: DatabaseManager, job: Dict[str, Any], client: SolidesClient):
     started_at = _now_iso()
     db.update_heartbeat(SERVICE_NAME, STATUS_RUNNING, f"job={job['id']} competencia={job['month_ref']}")
     _mark_run_running(db, job.get("run_id"), "Sincronização com a API da Sólides em andamento.")
@@ -1697,6 +1933,9 @@ def _process_job(db: DatabaseManager, job: Dict[str, Any]):
         0,
     )
 
+    day_cache = DailyActivityCache(db)
+    fetch_started = time.monotonic()
+    linked_pairs: List[Tuple[Dict[str, Any], Dict[str, Any], str]] = []
     for local_employee in local_employees:
         linked_id = _clean(local_employee.get("solides_employee_id"))
         if not linked_id:
@@ -1704,32 +1943,86 @@ def _process_job(db: DatabaseManager, job: Dict[str, Any]):
         remote_employee = remote_employees_by_id.get(linked_id)
         if remote_employee is None:
             unmatched_local_links.append(local_employee)
-            processed_employees += 1
-            _update_run_progress(
-                db,
-                job.get("run_id"),
-                started_at,
-                STAGE_SYNCING_DAILY_ACTIVITY,
-                f"Sincronizando ponto diário de {processed_employees} de {total_employees} colaborador(es).",
-                total_employees,
-                processed_employees,
-                len(point_rows),
-                synchronized_employees=len(synchronized_employee_keys),
-                synchronized_days=len(point_rows),
-                unmatched_employees=len(unmatched_local_links),
-                pending_adjustments=pending_adjustments,
-                pending_signatures=pending_signatures,
-            )
             continue
-
         synchronized_employee_keys.add(linked_id)
+        linked_pairs.append((local_employee, remote_employee, linked_id))
+
+    # Registros remotos sem vínculo local explícito continuam visíveis na prontidão.
+    orphan_remote_employees = []
+    for remote_employee in remote_employees:
+        remote_id = _clean(remote_employee.get("id"))
+        if not remote_id or remote_id in synchronized_employee_keys:
+            continue
+        if _resolve_local_employee(remote_employee, local_lookup) is not None:
+            continue
+        orphan_remote_employees.append(remote_employee)
+
+    day_cache.load(
+        [linked_id for _, _, linked_id in linked_pairs] + [_clean(item.get("id")) for item in orphan_remote_employees],
+        job["period_start"],
+        job["period_end"],
+    )
+
+    progress = {"employees": len(unmatched_local_links), "days": 0, "pending_adjustments": 0, "pending_signatures": 0}
+    pairs_by_id = {linked_id: (local_employee, remote_employee) for local_employee, remote_employee, linked_id in linked_pairs}
+
+    def _on_linked_done(result, done: int, total: int):
+        progress["employees"] += 1
+        if result.ok:
+            bundle = result.value
+            progress["days"] += len(bundle["daily_activity"])
+            progress["pending_adjustments"] += bundle["adjustment_maps"]["pending_count"]
+            local_employee, remote_employee = pairs_by_id[result.key]
+            signature_row = _build_signature_row(
+                job["period_start"], job["period_end"], remote_employee, local_employee, bundle["signature"] or {}
+            )
+            if signature_row and signature_row["status"] in ("PENDENTE", "PROCESSANDO"):
+                progress["pending_signatures"] += 1
+        _update_run_progress(
+            db,
+            job.get("run_id"),
+            started_at,
+            STAGE_SYNCING_DAILY_ACTIVITY,
+            f"Sincronizando ponto diário de {progress['employees']} de {total_employees} colaborador(es).",
+            total_employees,
+            progress["employees"],
+            progress["days"],
+            synchronized_employees=len(synchronized_employee_keys),
+            synchronized_days=progress["days"],
+            unmatched_employees=len(unmatched_local_links),
+            pending_adjustments=progress["pending_adjustments"],
+            pending_signatures=progress["pending_signatures"],
+        )
+
+    linked_results = fan_out(
+        [
+            (
+                linked_id,
+                lambda linked_id=linked_id, remote_employee=remote_employee: _fetch_employee_bundle(
+                    client,
+                    day_cache,
+                    linked_id,
+                    _clean(remote_employee.get("externalId")) or None,
+                    start_ms,
+                    end_ms,
+                ),
+            )
+            for _, remote_employee, linked_id in linked_pairs
+        ],
+        SYNC_MAX_WORKERS,
+        on_done=_on_linked_done,
+    )
+
+    for (local_employee, remote_employee, linked_id), result in zip(linked_pairs, linked_results):
+        if not result.ok:
+            day_cache.flush()
+            raise result.error
+        bundle = result.value
         schedule_ref = remote_employee.get("currentWorkSchedule") or {}
         schedule_id = _clean(schedule_ref.get("id"))
         work_schedule = work_schedules.get(schedule_id) if schedule_id else None
-        adjustments = client.get_adjustments(linked_id, start_ms, end_ms)
-        adjustment_maps = _build_adjustment_maps(adjustments)
-
-        daily_activity = client.get_daily_activity(linked_id, start_ms, end_ms)
+        adjustments = bundle["adjustments"]
+        adjustment_maps = bundle["adjustment_maps"]
         point_rows.extend(
             _build_daily_rows_for_employee(
                 job["period_start"],
@@ -1737,13 +2030,13 @@ def _process_job(db: DatabaseManager, job: Dict[str, Any]):
                 remote_employee,
                 local_employee,
                 work_schedule,
-                daily_activity,
+                bundle["daily_activity"],
                 adjustment_maps,
                 job.get("run_id"),
             )
         )
 
-        hours_balance = client.get_hours_balance(linked_id, _clean(remote_employee.get("externalId")) or None, start_ms, end_ms)
+        hours_balance = bundle["hours_balance"]
         if hours_balance:
             hours_balance_rows.append(
                 {
@@ -1762,35 +2055,15 @@ def _process_job(db: DatabaseManager, job: Dict[str, Any]):
         pending_adjustments += adjustment_maps["pending_count"]
         occurrence_rows.extend(_build_occurrence_rows(job["period_start"], job["period_end"], local_employee, adjustments))
 
-        try:
-            signature_payload = client.get_last_signature(linked_id)
-        except Exception as exc:
-            signature_payload = None
-            print(f"[payroll_point_sync] aviso ao consultar assinatura do colaborador {linked_id}: {exc}")
-        signature_row = _build_signature_row(job["period_start"], job["period_end"], remote_employee, local_employee, signature_payload or {})
+        if bundle["signature_error"]:
+            print(f"[payroll_point_sync] aviso ao consultar assinatura do colaborador {linked_id}: {bundle['signature_error']}")
+        signature_row = _build_signature_row(job["period_start"], job["period_end"], remote_employee, local_employee, bundle["signature"] or {})
         if signature_row:
             signature_rows.append(signature_row)
             if signature_row["status"] in ("PENDENTE", "PROCESSANDO"):
                 pending_signatures += 1
 
-        processed_employees += 1
-        _update_run_progress(
-            db,
-            job.get("run_id"),
-            started_at,
-            STAGE_SYNCING_DAILY_ACTIVITY,
-            f"Sincronizando ponto diário de {processed_employees} de {total_employees} colaborador(es).",
-            total_employees,
-            processed_employees,
-            len(point_rows),
-            synchronized_employees=len(synchronized_employee_keys),
-            synchronized_days=len(point_rows),
-            unmatched_employees=len(unmatched_local_links),
-            pending_adjustments=pending_adjustments,
-            pending_signatures=pending_signatures,
-        )
-
-    # Registros remotos sem vínculo local explícito continuam visíveis na prontidão.
+    processed_employees = len(unmatched_local_links) + len(linked_pairs)
     _update_run_progress(
         db,
         job.get("run_id"),
@@ -1806,14 +2079,29 @@ def _process_job(db: DatabaseManager, job: Dict[str, Any]):
         pending_adjustments=pending_adjustments,
         pending_signatures=pending_signatures,
     )
-    for remote_employee in remote_employees:
-        remote_id = _clean(remote_employee.get("id"))
-        if not remote_id or remote_id in synchronized_employee_keys:
-            continue
-        local_employee = _resolve_local_employee(remote_employee, local_lookup)
-        if local_employee is not None:
-            continue
-        daily_activity = client.get_daily_activity(remote_id, start_ms, end_ms)
+    orphan_results = fan_out(
+        [
+            (
+                _clean(remote_employee.get("id")),
+                lambda remote_id=_clean(remote_employee.get("id")): _fetch_employee_bundle(
+                    client,
+                    day_cache,
+                    remote_id,
+                    None,
+                    start_ms,
+                    end_ms,
+                    include_balance_and_signature=False,
+                ),
+            )
+            for remote_employee in orphan_remote_employees
+        ],
+        SYNC_MAX_WORKERS,
+    )
+    day_cache.flush()
+    for remote_employee, result in zip(orphan_remote_employees, orphan_results):
+        if not result.ok:
+            raise result.error
+        daily_activity = result.value["daily_activity"]
         if not daily_activity:
             continue
         schedule_ref = remote_employee.get("currentWorkSchedule") or {}
@@ -1831,6 +2119,7 @@ def _process_job(db: DatabaseManager, job: Dict[str, Any]):
                 job.get("run_id"),
             )
         )
+    fetch_elapsed = time.monotonic() - fetch_started
 
     _update_run_progress(
         db,
@@ -1880,6 +2169,10 @@ def _process_job(db: DatabaseManager, job: Dict[str, Any]):
     if ged_signature_enabled is False:
         details_parts.append("Assinatura digital desabilitada no empregador; estado mantido apenas como informativo.")
     details_parts.extend(sync_warnings[:2])
+    details_parts.append(
+        f"Coleta: {fetch_elapsed:.1f}s, {client.requests_made} requisição(ões) à API, "
+        f"{day_cache.hits} dia(s) fechado(s) reaproveitado(s) do cache, {day_cache.stored} gravado(s)."
+    )
     details = " ".join(details_parts)
 
     _update_run_progress(
@@ -2,14 +2,26 @@
 import os
 import datetime
 import pandas as pd
+import heapq
 import json
+import math
+import random
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from urllib.parse import urlparse
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from feegow_client import fetch_proposals, request_endpoint
+    from bulk_upsert import UpsertSpec, bulk_upsert
+    from http_fanout import get_host_limiter
+except ImportError:
+    from .bulk_upsert import UpsertSpec, bulk_upsert
+    from .http_fanout import get_host_limiter
+
+try:
+    from feegow_client import BASE_URL, fetch_proposals, request_endpoint
     from database_manager import DatabaseManager
     import libsql_client
 except ImportError:
@@ -18,6 +30,49 @@ except ImportError:
 CONTACT_CACHE_STALE_DAYS = max(1, int(os.getenv('PROPOSALS_CONTACT_CACHE_STALE_DAYS', '30')))
 CONTACT_CACHE_LIMIT_PER_BATCH = max(1, int(os.getenv('PROPOSALS_CONTACT_CACHE_LIMIT_PER_BATCH', '40')))
 CONTACT_CACHE_MAX_WORKERS = max(1, int(os.getenv('PROPOSALS_CONTACT_CACHE_MAX_WORKERS', '6')))
+# Fila de refresh de contatos (feegow_patient_contacts_refresh_queue): cada paciente tem um vencimento
+# (due_at) calculado pela temperatura (proposta recente, valor, contato que muda) ou pelo backoff de
+# falha; cada lote gasta CONTACT_CACHE_LIMIT_PER_BATCH chamadas nos vencidos mais urgentes.
+CONTACT_REFRESH_MIN_FACTOR = 0.5
+CONTACT_REFRESH_MAX_FACTOR = max(1.0, float(os.getenv('PROPOSALS_CONTACT_REFRESH_MAX_FACTOR', '3')))
+CONTACT_REFRESH_RECENCY_DAYS = 14.0
+CONTACT_REFRESH_VALUE_REF = max(1.0, float(os.getenv('PROPOSALS_CONTACT_REFRESH_VALUE_REF', '5000')))
+CONTACT_REFRESH_MISSING_BOOST = 4.0
+CONTACT_REFRESH_CANDIDATES_FACTOR = 4
+CONTACT_REFRESH_BACKOFF_BASE_MIN = max(1.0, float(os.getenv('PROPOSALS_CONTACT_REFRESH_BACKOFF_BASE_MIN', '30')))
+CONTACT_REFRESH_BACKOFF_MAX_HOURS = max(1.0, float(os.getenv('PROPOSALS_CONTACT_REFRESH_BACKOFF_MAX_HOURS', '72')))
+CONTACT_REFRESH_RETENTION_DAYS = max(1, int(os.getenv('PROPOSALS_CONTACT_REFRESH_RETENTION_DAYS', '180')))
+
+# Intervalo coberto (por data de inclusao da proposta), relativo a hoje.
+PROPOSALS_LOOKBACK_DAYS = max(1, int(os.getenv('PROPOSALS_LOOKBACK_DAYS', '30')))
+PROPOSALS_LOOKAHEAD_DAYS = max(0, int(os.getenv('PROPOSALS_LOOKAHEAD_DAYS', '30')))
+# Janelas adaptativas: dividem ao meio quando a resposta chega perto do limite de linhas e
+# dobram de tamanho quando as respostas vem pequenas.
+PROPOSALS_WINDOW_DAYS = max(1, int(os.getenv('PROPOSALS_WINDOW_DAYS', '5')))
+PROPOSALS_WINDOW_MIN_DAYS = max(1, int(os.getenv('PROPOSALS_WINDOW_MIN_DAYS', '1')))
+PROPOSALS_WINDOW_MAX_DAYS = max(PROPOSALS_WINDOW_MIN_DAYS, int(os.getenv('PROPOSALS_WINDOW_MAX_DAYS', '15')))
+PROPOSALS_WINDOW_MAX_ROWS = max(10, int(os.getenv('PROPOSALS_WINDOW_MAX_ROWS', '500')))
+PROPOSALS_WINDOW_WIDEN_RATIO = 0.25
+PROPOSALS_MAX_WORKERS = max(1, int(os.getenv('PROPOSALS_MAX_WORKERS', '4')))
+PROPOSALS_RATE_PER_SEC = max(0.0, float(os.getenv('PROPOSALS_RATE_PER_SEC', '2')))
+PROPOSALS_RATE_BURST = max(1.0, float(os.getenv('PROPOSALS_RATE_BURST', '2')))
+# High-water mark: datas anteriores a (marca - dias mutaveis) ja foram sincronizadas e quase nao
+# mudam; as execucoes seguintes so revisitam a janela recente. Uma varredura completa a cada N horas.
+PROPOSALS_MUTABLE_DAYS = max(1, int(os.getenv('PROPOSALS_MUTABLE_DAYS', '7')))
+PROPOSALS_FULL_RESYNC_HOURS = max(1, int(os.getenv('PROPOSALS_FULL_RESYNC_HOURS', '24')))
+
+FEEGOW_PROPOSALS_COLUMNS = (
+    'proposal_id', 'date', 'status', 'unit_name', 'professional_name', 'total_value',
+    'items_json', 'patient_id', 'proposal_last_update', 'updated_at',
+)
+FEEGOW_PROPOSALS_UPSERT = UpsertSpec('feegow_proposals', FEEGOW_PROPOSALS_COLUMNS, ('proposal_id',), FEEGOW_PROPOSALS_COLUMNS[1:])
+CONTACT_REFRESH_QUEUE_COLUMNS = (
+    'patient_id', 'due_at', 'last_proposal_date', 'last_proposal_value',
+    'checks', 'changes', 'failures', 'last_error_at', 'updated_at',
+)
+CONTACT_REFRESH_QUEUE_UPSERT = UpsertSpec(
+    'feegow_patient_contacts_refresh_queue', CONTACT_REFRESH_QUEUE_COLUMNS, ('patient_id',), CONTACT_REFRESH_QUEUE_COLUMNS[1:]
+)
 
 
 def clean_currency(value):
@@ -79,6 +134,21 @@ def ensure_support_tables(db):
             )
             '''
         )
+        conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS feegow_patient_contacts_refresh_queue (
+                patient_id INTEGER PRIMARY KEY,
+                due_at TEXT,
+                last_proposal_date TEXT,
+                last_proposal_value REAL,
+                checks INTEGER DEFAULT 0,
+                changes INTEGER DEFAULT 0,
+                failures INTEGER DEFAULT 0,
+                last_error_at TEXT,
+                updated_at TEXT
+            )
+            '''
+        )
 
         existing_columns = set()
         rs = conn.execute('PRAGMA table_info(feegow_proposals)')
@@ -96,6 +166,16 @@ def ensure_support_tables(db):
             if name:
                 existing_columns.add(name)
 
+        conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS feegow_proposals_sync_state (
+                sync_key VARCHAR(100) PRIMARY KEY,
+                sync_value TEXT,
+                updated_at TEXT
+            )
+            '''
+        )
+
         if 'patient_id' not in existing_columns:
             conn.execute('ALTER TABLE feegow_proposals ADD COLUMN patient_id INTEGER')
         if 'proposal_last_update' not in existing_columns:
@@ -106,6 +186,7 @@ def ensure_support_tables(db):
             conn.execute('CREATE INDEX IF NOT EXISTS idx_prop_unit ON feegow_proposals(unit_name)')
             conn.execute('CREATE INDEX IF NOT EXISTS idx_prop_status ON feegow_proposals(status)')
             conn.execute('CREATE INDEX IF NOT EXISTS idx_prop_patient ON feegow_proposals(patient_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_contact_refresh_due ON feegow_patient_contacts_refresh_queue(due_at)')
         else:
             if db.use_mysql:
                 indexes = {
@@ -113,17 +194,19 @@ def ensure_support_tables(db):
                     'idx_prop_unit': 'CREATE INDEX idx_prop_unit ON feegow_proposals(unit_name)',
                     'idx_prop_status': 'CREATE INDEX idx_prop_status ON feegow_proposals(status(120))',
                     'idx_prop_patient': 'CREATE INDEX idx_prop_patient ON feegow_proposals(patient_id)',
+                    'idx_contact_refresh_due': 'CREATE INDEX idx_contact_refresh_due ON feegow_patient_contacts_refresh_queue(due_at(19))',
                 }
                 for index_name, ddl in indexes.items():
+                    table_name = ddl.split(' ON ', 1)[1].split('(', 1)[0]
                     rs = conn.execute(
                         """
                         SELECT COUNT(1)
                         FROM information_schema.statistics
                         WHERE table_schema = DATABASE()
-                          AND table_name = 'feegow_proposals'
+                          AND table_name = ?
                           AND index_name = ?
                         """,
-                        (index_name,),
+                        (table_name, index_name),
                     )
                     row = rs.fetchone() if hasattr(rs, 'fetchone') else None
                     if row and row[0] == 0:
@@ -135,6 +218,7 @@ def ensure_support_tables(db):
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_prop_unit ON feegow_proposals(unit_name)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_prop_status ON feegow_proposals(status)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_prop_patient ON feegow_proposals(patient_id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_contact_refresh_due ON feegow_patient_contacts_refresh_queue(due_at)')
                 conn.commit()
     finally:
         conn.close()
@@ -172,7 +256,7 @@ def parse_cache_timestamp(value):
     return None
 
 
-def should_refresh_cache_row(row):
+def should_refresh_cache_row(row, stale_days=CONTACT_CACHE_STALE_DAYS, now=None):
     if not row:
         return True
     patient_name = str(row[1] or '').strip() if len(row) > 1 else ''
@@ -184,51 +268,208 @@ def should_refresh_cache_row(row):
     parsed = parse_cache_timestamp(updated_at)
     if not parsed:
         return True
-    return (datetime.datetime.now() - parsed).days >= CONTACT_CACHE_STALE_DAYS
+    return ((now or datetime.datetime.now()) - parsed).total_seconds() >= stale_days * 86400
 
 
-def sync_patient_contacts_cache(db, patient_ids):
-    unique_ids = sorted({int(pid) for pid in (patient_ids or []) if str(pid or '').strip().isdigit() and int(pid) > 0})
-    if not unique_ids:
+def _row_values(row, columns):
+    if isinstance(row, dict):
+        return tuple(row.get(column) for column in columns)
+    return tuple(row)
+
+
+def _float_or_zero(value):
+    try:
+        number = float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(number) else number
+
+
+def _parse_proposal_day(value):
+    raw = str(value or '').strip()[:10]
+    try:
+        return datetime.datetime.strptime(raw, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def contact_refresh_heat(last_proposal_date, last_proposal_value, checks, changes, now):
+    """0..1: quanto vale manter o contato fresco. Media ponderada da recencia da ultima proposta,
+    do valor (log, relativo a CONTACT_REFRESH_VALUE_REF) e da taxa de mudanca observada do contato
+    (suavizada: sem historico conta como 50%)."""
+    day = _parse_proposal_day(last_proposal_date)
+    recency = math.exp(-abs((now.date() - day).days) / CONTACT_REFRESH_RECENCY_DAYS) if day else 0.0
+    value = max(0.0, _float_or_zero(last_proposal_value))
+    value_score = min(1.0, math.log1p(value) / math.log1p(CONTACT_REFRESH_VALUE_REF))
+    change_rate = (int(changes or 0) + 1.0) / (int(checks or 0) + 2.0)
+    return (recency + value_score + 2.0 * change_rate) / 4.0
+
+
+def contact_refresh_interval_days(heat):
+    # Paciente "quente" revalida antes de CONTACT_CACHE_STALE_DAYS; "frio" espera ate o fator maximo.
+    factor = CONTACT_REFRESH_MAX_FACTOR - (CONTACT_REFRESH_MAX_FACTOR - CONTACT_REFRESH_MIN_FACTOR) * heat
+    return CONTACT_CACHE_STALE_DAYS * factor
+
+
+def contact_refresh_backoff(failures):
+    """Backoff exponencial com jitter (metade fixa + metade aleatoria) para IDs que falharam: um
+    paciente inexistente ou uma API instavel nao consome o orcamento de toda execucao."""
+    delay_sec = min(
+        CONTACT_REFRESH_BACKOFF_MAX_HOURS * 3600.0,
+        CONTACT_REFRESH_BACKOFF_BASE_MIN * 60.0 * (2 ** max(0, int(failures) - 1)),
+    )
+    return datetime.timedelta(seconds=delay_sec / 2.0 + random.uniform(0.0, delay_sec / 2.0))
+
+
+def _fmt_ts(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def enqueue_contact_refresh(db, patient_signals, now=None):
+    """Inclui/atualiza pacientes na fila de refresh com o sinal das propostas da janela
+    ({patient_id: (data da proposta, valor)}). Paciente novo vence ja; proposta mais recente que a
+    conhecida antecipa o vencimento (exceto durante o backoff de falha)."""
+    signals = {}
+    for pid, signal in (patient_signals or {}).items():
+        if str(pid or '').strip().isdigit() and int(pid) > 0:
+            signals[int(pid)] = signal or (None, None)
+    if not signals:
         return 0
 
+    now = now or datetime.datetime.now()
+    now_str = _fmt_ts(now)
+    ids = sorted(signals)
     conn = db.get_connection()
     try:
-        placeholders = ','.join(['?'] * len(unique_ids))
+        placeholders = ','.join(['?'] * len(ids))
         rs = conn.execute(
             f'''
-            SELECT patient_id, patient_name, phone_primary, email_primary, cpf, updated_at
-            FROM feegow_patient_contacts_cache
+            SELECT {', '.join(CONTACT_REFRESH_QUEUE_COLUMNS)}
+            FROM feegow_patient_contacts_refresh_queue
             WHERE patient_id IN ({placeholders})
             ''',
-            tuple(unique_ids),
+            tuple(ids),
         )
         rows = rs.fetchall() if hasattr(rs, 'fetchall') else getattr(rs, 'rows', [])
-        cache_by_id = {}
-        for row in rows or []:
-            if isinstance(row, dict):
-                cache_by_id[int(row.get('patient_id') or 0)] = (
-                    row.get('patient_id'), row.get('patient_name'), row.get('phone_primary'), row.get('email_primary'), row.get('cpf'), row.get('updated_at')
-                )
-            elif isinstance(row, (list, tuple)) and row:
-                cache_by_id[int(row[0] or 0)] = row
+    finally:
+        conn.close()
+    existing = {}
+    for row in rows or []:
+        values = _row_values(row, CONTACT_REFRESH_QUEUE_COLUMNS)
+        existing[int(values[0] or 0)] = values
+
+    out = []
+    for pid in ids:
+        date, value = signals[pid]
+        date = None if _is_missing(date) else normalize_datetime_text(date)
+        value = None if _is_missing(value) else _float_or_zero(value)
+        current = existing.get(pid)
+        if current is None:
+            out.append((pid, now_str, date, value, 0, 0, 0, None, now_str))
+            continue
+        _, due_at, old_date, old_value, checks, changes, failures, last_error_at, _ = current
+        if date and (not old_date or str(date) > str(old_date)):
+            if not int(failures or 0):
+                due_at = min(str(due_at or now_str), now_str)
+            old_date, old_value = date, value
+        elif date and str(date) == str(old_date or ''):
+            old_value = max(_float_or_zero(old_value), _float_or_zero(value))
+        out.append((pid, due_at or now_str, old_date, old_value, checks or 0, changes or 0, failures or 0, last_error_at, now_str))
+    return bulk_upsert(db, CONTACT_REFRESH_QUEUE_UPSERT, out)
+
+
+def _due_contact_candidates(db, now, limit):
+    conn = db.get_connection()
+    try:
+        cutoff = (now - datetime.timedelta(days=CONTACT_REFRESH_RETENTION_DAYS)).strftime('%Y-%m-%d')
+        # Pacientes sem proposta ha muito tempo saem da fila (voltam se aparecerem numa janela).
+        conn.execute('DELETE FROM feegow_patient_contacts_refresh_queue WHERE last_proposal_date < ?', (cutoff,))
+        if not db.use_turso:
+            conn.commit()
+        rs = conn.execute(
+            f'''
+            SELECT {', '.join('q.' + column for column in CONTACT_REFRESH_QUEUE_COLUMNS[:-1])},
+                   c.patient_name, c.phone_primary, c.email_primary, c.cpf, c.updated_at
+            FROM feegow_patient_contacts_refresh_queue q
+            LEFT JOIN feegow_patient_contacts_cache c ON c.patient_id = q.patient_id
+            WHERE q.due_at <= ?
+            ORDER BY q.due_at
+            LIMIT ?
+            ''',
+            (_fmt_ts(now), int(limit)),
+        )
+        rows = rs.fetchall() if hasattr(rs, 'fetchall') else getattr(rs, 'rows', [])
+    finally:
+        conn.close()
+    columns = CONTACT_REFRESH_QUEUE_COLUMNS[:-1] + ('patient_name', 'phone_primary', 'email_primary', 'cpf', 'cache_updated_at')
+    return [_row_values(row, columns) for row in rows or []]
 
-        ids_to_fetch = [patient_id for patient_id in unique_ids if should_refresh_cache_row(cache_by_id.get(patient_id))]
-        ids_to_fetch = ids_to_fetch[:CONTACT_CACHE_LIMIT_PER_BATCH]
-        if not ids_to_fetch:
-            return 0
 
-        contacts = []
-        with ThreadPoolExecutor(max_workers=CONTACT_CACHE_MAX_WORKERS) as executor:
-            future_map = {executor.submit(fetch_patient_contact, patient_id): patient_id for patient_id in ids_to_fetch}
-            for future in as_completed(future_map):
-                result = future.result()
-                if result:
-                    contacts.append(result)
+def _contact_fields(values):
+    return tuple(str(value or '').strip() for value in values)
+
 
-        if not contacts:
-            return 0
+def refresh_due_contacts(db, budget=CONTACT_CACHE_LIMIT_PER_BATCH, now=None, fetcher=None):
+    """Gasta o orcamento de chamadas ao patient/search nos pacientes vencidos mais urgentes.
 
+    A fila persistida (indice em due_at) entrega os vencidos; um heap de minimo ordena por urgencia
+    (temperatura x atraso, contato ausente primeiro). Quem ainda esta fresco pelo proprio intervalo
+    (ex.: gravado pelo painel) e reagendado sem chamada. Retorna quantos contatos foram gravados."""
+    now = now or datetime.datetime.now()
+    fetcher = fetcher or fetch_patient_contact
+    budget = max(0, int(budget))
+    if not budget:
+        return 0
+
+    candidates = _due_contact_candidates(db, now, budget * CONTACT_REFRESH_CANDIDATES_FACTOR)
+    now_str = _fmt_ts(now)
+    queue_rows = []
+    heap = []
+    for cand in candidates:
+        pid, due_at, proposal_date, proposal_value, checks, changes, failures, last_error_at = cand[:8]
+        cache_row = (pid,) + tuple(cand[8:13]) if any(value is not None for value in cand[8:13]) else None
+        heat = contact_refresh_heat(proposal_date, proposal_value, checks, changes, now)
+        interval_days = contact_refresh_interval_days(heat)
+        if not should_refresh_cache_row(cache_row, interval_days, now):
+            next_due = parse_cache_timestamp(cache_row[5]) + datetime.timedelta(days=interval_days)
+            queue_rows.append((pid, _fmt_ts(max(next_due, now)), proposal_date, proposal_value, checks or 0, changes or 0, failures or 0, last_error_at, now_str))
+            continue
+        cached_at = parse_cache_timestamp(cache_row[5]) if cache_row else None
+        if cached_at is None:
+            overdue = CONTACT_REFRESH_MISSING_BOOST
+        else:
+            overdue = min(CONTACT_REFRESH_MISSING_BOOST - 1.0, (now - cached_at).total_seconds() / (interval_days * 86400.0) - 1.0)
+        heap.append((-heat * (1.0 + max(0.0, overdue)), str(due_at or ''), int(pid), cand, cache_row, heat))
+    heapq.heapify(heap)
+    picked = [heapq.heappop(heap) for _ in range(min(budget, len(heap)))]
+
+    results = {}
+    if picked:
+        with ThreadPoolExecutor(max_workers=CONTACT_CACHE_MAX_WORKERS) as executor:
+            future_map = {executor.submit(fetcher, entry[2]): entry[2] for entry in picked}
+            for future in as_completed(future_map):
+                try:
+                    results[future_map[future]] = future.result()
+                except Exception:
+                    results[future_map[future]] = None
+
+    contacts = []
+    for _, _, pid, cand, cache_row, _ in picked:
+        _, _, proposal_date, proposal_value, checks, changes, failures, last_error_at = cand[:8]
+        contact = results.get(pid)
+        if not contact:
+            failures = int(failures or 0) + 1
+            queue_rows.append((pid, _fmt_ts(now + contact_refresh_backoff(failures)), proposal_date, proposal_value, checks or 0, changes or 0, failures, now_str, now_str))
+            continue
+        contacts.append(contact)
+        fields = _contact_fields((contact.get('patient_name'), contact.get('phone_primary'), contact.get('email_primary'), contact.get('cpf')))
+        changed = cache_row is not None and _contact_fields(cache_row[1:5]) != fields
+        checks = int(checks or 0) + 1
+        changes = int(changes or 0) + int(changed)
+        interval_days = contact_refresh_interval_days(contact_refresh_heat(proposal_date, proposal_value, checks, changes, now))
+        queue_rows.append((pid, _fmt_ts(now + datetime.timedelta(days=interval_days)), proposal_date, proposal_value, checks, changes, 0, last_error_at, now_str))
+
+    if contacts:
         sql = '''
             INSERT INTO feegow_patient_contacts_cache (
                 patient_id, patient_name, phone_primary, email_primary, cpf, updated_at
@@ -250,116 +491,319 @@ def sync_patient_contacts_cache(db, patient_ids):
             )
             for item in contacts
         ]
+        conn = db.get_connection()
+        try:
+            if db.use_turso:
+                stmts = [libsql_client.Statement(sql, p) for p in params]
+                conn.batch(stmts)
+            else:
+                conn.executemany(sql, params)
+                conn.commit()
+        finally:
+            conn.close()
+    if queue_rows:
+        bulk_upsert(db, CONTACT_REFRESH_QUEUE_UPSERT, queue_rows)
+    return len(contacts)
 
+
+def sync_patient_contacts_cache(db, patient_ids):
+    """Enfileira os pacientes da janela (ids ou {id: (data, valor)} de proposals_frame) e consome o
+    orcamento do lote na fila de refresh priorizada."""
+    if isinstance(patient_ids, dict):
+        signals = patient_ids
+    else:
+        signals = {pid: (None, None) for pid in (patient_ids or [])}
+    try:
+        enqueue_contact_refresh(db, signals)
+        return refresh_due_contacts(db, CONTACT_CACHE_LIMIT_PER_BATCH)
+    except Exception as e:
+        print(f'⚠️ Erro ao sincronizar cache de pacientes: {e}')
+        return 0
+
+
+def get_sync_state(db, sync_key):
+    conn = db.get_connection()
+    try:
+        rs = conn.execute('SELECT sync_value FROM feegow_proposals_sync_state WHERE sync_key = ?', (str(sync_key),))
+        rows = rs.fetchall() if hasattr(rs, 'fetchall') else getattr(rs, 'rows', [])
+        if not rows:
+            return None
+        row = rows[0]
+        value = row.get('sync_value') if isinstance(row, dict) else row[0]
+        return None if value is None else str(value)
+    except Exception:
+        return None
+    finally:
+        conn.close()
+
+
+def set_sync_state(db, values):
+    now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    sql = """
+        INSERT INTO feegow_proposals_sync_state (sync_key, sync_value, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(sync_key) DO UPDATE SET
+            sync_value = excluded.sync_value,
+            updated_at = excluded.updated_at
+    """
+    params = [(str(key), None if value is None else str(value), now_str) for key, value in values.items()]
+    conn = db.get_connection()
+    try:
         if db.use_turso:
-            stmts = [libsql_client.Statement(sql, p) for p in params]
-            conn.batch(stmts)
+            conn.batch([libsql_client.Statement(sql, p) for p in params])
         else:
             conn.executemany(sql, params)
             conn.commit()
-        return len(params)
-    except Exception as e:
-        print(f'⚠️ Erro ao sincronizar cache de pacientes: {e}')
-        return 0
     finally:
         conn.close()
 
 
-def process_and_save_batch(db, df):
-    if df.empty:
-        return 0, set()
+def _int_or_none(value):
+    # Mesmo int(valor or 0) do loop antigo; None quando nao converte (linha descartada).
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return None
 
-    conn = db.get_connection()
-    data_params = []
-    patient_ids = set()
 
-    for _, row in df.iterrows():
-        try:
-            prop_id = int(row.get('proposal_id') or 0)
-            if prop_id == 0:
-                continue
+def _is_missing(value):
+    # Chave ausente na linha vira NaN no DataFrame do proposal/list.
+    return value is None or (isinstance(value, float) and math.isnan(value))
 
-            iso_date = row.get('proposal_date')
-            status = row.get('status', 'Pendente')
-            proposal_last_update = normalize_datetime_text(row.get('proposal_last_update'))
 
-            unit_data = row.get('unidade') or {}
-            unit_name = 'Matriz'
-            if isinstance(unit_data, dict):
-                unit_name = unit_data.get('nome_fantasia', 'Matriz')
+def _parse_patient_id(value):
+    """(ok, patient_id): vazio/NaN -> (True, None); valor que nao converte -> (False, None)."""
+    if _is_missing(value):
+        return True, None
+    if not str(value or '').strip():
+        return True, None
+    patient_id = _int_or_none(value)
+    return patient_id is not None, patient_id
 
-            prof_name = row.get('proposer_name', 'Sistema')
-            patient_id = int(row.get('PacienteID') or 0) if str(row.get('PacienteID') or '').strip() else None
-            if patient_id and patient_id > 0:
-                patient_ids.add(patient_id)
 
+def _proposal_totals(procs, value):
+    """(total liquido, items_json) de uma proposta; None se os procedimentos vierem malformados."""
+    try:
+        if isinstance(procs, dict) and 'data' in procs:
             total_liquido = 0.0
             items_list = []
-            procs = row.get('procedimentos') or {}
-            if isinstance(procs, dict) and 'data' in procs:
-                item_array = procs['data']
-                for item in item_array:
-                    v_bruto = clean_currency(item.get('valor'))
-                    v_desc = clean_currency(item.get('desconto'))
-                    liquido_item = v_bruto - v_desc
-                    total_liquido += liquido_item
-                    items_list.append({'nome': item.get('nome'), 'valor': liquido_item})
-            else:
-                total_liquido = clean_currency(row.get('value'))
-
-            params = (
-                prop_id,
-                iso_date,
-                status,
-                unit_name,
-                prof_name,
-                total_liquido,
-                json.dumps(items_list, ensure_ascii=False),
-                patient_id,
-                proposal_last_update,
-            )
-            data_params.append(params)
-        except Exception:
-            pass
+            for item in procs['data']:
+                liquido_item = clean_currency(item.get('valor')) - clean_currency(item.get('desconto'))
+                total_liquido += liquido_item
+                items_list.append({'nome': item.get('nome'), 'valor': liquido_item})
+            return total_liquido, json.dumps(items_list, ensure_ascii=False)
+        return clean_currency(value), '[]'
+    except Exception:
+        return None
 
-    if not data_params:
-        conn.close()
-        return 0, set()
-
-    sql = '''
-        INSERT INTO feegow_proposals (
-            proposal_id, date, status, unit_name,
-            professional_name, total_value, items_json,
-            patient_id, proposal_last_update, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-        ON CONFLICT(proposal_id) DO UPDATE SET
-            date = excluded.date,
-            status = excluded.status,
-            unit_name = excluded.unit_name,
-            professional_name = excluded.professional_name,
-            total_value = excluded.total_value,
-            items_json = excluded.items_json,
-            patient_id = excluded.patient_id,
-            proposal_last_update = excluded.proposal_last_update,
-            updated_at = excluded.updated_at
-    '''
+
+def proposals_frame(df, updated_at=None):
+    """DataFrame do proposal/list -> linhas de feegow_proposals (colunas de FEEGOW_PROPOSALS_UPSERT),
+    coluna a coluna em vez de iterrows. Retorna (frame, sinais por paciente) com
+    {patient_id: (data da proposta mais recente, maior valor nessa data)} para a fila de contatos."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=list(FEEGOW_PROPOSALS_COLUMNS)), {}
+
+    def _col(name, default=None):
+        if name in df.columns:
+            return df[name].tolist()
+        return [default] * len(df)
+
+    proposal_ids = [_int_or_none(v) for v in _col('proposal_id')]
+    patients = [_parse_patient_id(v) for v in _col('PacienteID')]
+    totals = [_proposal_totals(procs, value) for procs, value in zip(_col('procedimentos'), _col('value'))]
+    units = [(u.get('nome_fantasia', 'Matriz') if isinstance(u, dict) else 'Matriz') for u in _col('unidade')]
+    last_updates = [None if _is_missing(v) else normalize_datetime_text(v) for v in _col('proposal_last_update')]
+
+    out = pd.DataFrame(
+        {
+            'proposal_id': pd.Series(proposal_ids, dtype=object),
+            'date': _col('proposal_date'),
+            'status': _col('status', 'Pendente'),
+            'unit_name': units,
+            'professional_name': _col('proposer_name', 'Sistema'),
+            'total_value': [t[0] if t else None for t in totals],
+            'items_json': [t[1] if t else None for t in totals],
+            'patient_id': pd.Series([pid for _, pid in patients], dtype=object),
+            'proposal_last_update': last_updates,
+            # datetime('now') do SQL antigo (UTC).
+            'updated_at': updated_at or datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+    )
+    # Mesmos descartes do loop antigo: id ausente/zero/invalido, PacienteID invalido, procedimentos malformados.
+    keep = [
+        pid not in (None, 0) and patient_ok and total is not None
+        for pid, (patient_ok, _), total in zip(proposal_ids, patients, totals)
+    ]
+    out = out[keep].reset_index(drop=True)
+    signals = {}
+    for pid, date, total in zip(out['patient_id'].tolist(), out['date'].tolist(), out['total_value'].tolist()):
+        if pid is None or int(pid) <= 0:
+            continue
+        date = None if _is_missing(date) else str(date)
+        current = signals.get(int(pid))
+        if current is None or (date or '') > (current[0] or ''):
+            signals[int(pid)] = (date, total)
+        elif (date or '') == (current[0] or ''):
+            signals[int(pid)] = (date, max(_float_or_zero(current[1]), _float_or_zero(total)))
+    return out, signals
+
+
+def process_and_save_batch(db, df):
+    if df.empty:
+        return 0, {}
+
+    frame, patient_signals = proposals_frame(df)
+    if frame.empty:
+        return 0, {}
 
     try:
-        if db.use_turso:
-            stmts = [libsql_client.Statement(sql, p) for p in data_params]
-            conn.batch(stmts)
-        else:
-            conn.executemany(sql, data_params)
-            conn.commit()
-        return len(data_params), patient_ids
+        # Multi-linha numa transacao (Turso: um batch) em vez de executemany linha a linha.
+        return bulk_upsert(db, FEEGOW_PROPOSALS_UPSERT, frame), patient_signals
     except Exception as e:
         print(f'❌ Erro Batch: {e}')
-        return 0, set()
-    finally:
-        conn.close()
+        return 0, {}
+
+
+def _window_days(window):
+    return (window[1] - window[0]).days + 1
+
+
+class AdaptiveWindowSplitter:
+    """Fatia [inicio, fim] (datas inclusivas) em janelas de tamanho adaptativo.
+
+    `next_window` corta a proxima janela com o tamanho atual (metades de janelas divididas saem
+    primeiro); `report` recebe o numero de linhas de uma janela: no limite de linhas ela e dividida
+    ao meio (a resposta pode ter vindo truncada/pesada) e o tamanho cai; respostas pequenas dobram o
+    tamanho das proximas. So e usado pela thread que despacha as janelas.
+    """
+
+    def __init__(
+        self,
+        start,
+        end,
+        initial_days=PROPOSALS_WINDOW_DAYS,
+        min_days=PROPOSALS_WINDOW_MIN_DAYS,
+        max_days=PROPOSALS_WINDOW_MAX_DAYS,
+        max_rows=PROPOSALS_WINDOW_MAX_ROWS,
+    ):
+        self.min_days = max(1, int(min_days))
+        self.max_days = max(self.min_days, int(max_days))
+        self.max_rows = max(1, int(max_rows))
+        self.days = min(self.max_days, max(self.min_days, int(initial_days)))
+        self._cursor = start
+        self._end = end
+        self._pending = deque()
+        self.splits = 0
+        self.widenings = 0
+
+    def next_window(self):
+        if self._pending:
+            return self._pending.popleft()
+        if self._cursor > self._end:
+            return None
+        window_end = min(self._cursor + datetime.timedelta(days=self.days - 1), self._end)
+        window = (self._cursor, window_end)
+        self._cursor = window_end + datetime.timedelta(days=1)
+        return window
+
+    def report(self, window, rows):
+        """True se a janela foi aceita; False se foi dividida (as metades voltam para a fila)."""
+        days = _window_days(window)
+        if rows >= self.max_rows and days > self.min_days:
+            half = days // 2
+            mid = window[0] + datetime.timedelta(days=half - 1)
+            self._pending.appendleft((mid + datetime.timedelta(days=1), window[1]))
+            self._pending.appendleft((window[0], mid))
+            self.days = max(self.min_days, min(self.days, half))
+            self.splits += 1
+            return False
+        if rows < self.max_rows * PROPOSALS_WINDOW_WIDEN_RATIO and self.days < self.max_days:
+            self.days = min(self.max_days, self.days * 2)
+            self.widenings += 1
+        return True
 
 
-def update_proposals():
+def _fmt_window(window):
+    return window[0].strftime('%d-%m-%Y'), window[1].strftime('%d-%m-%Y')
+
+
+def fetch_proposals_window(window, limiter=None):
+    if limiter is not None:
+        limiter.acquire()
+    s_str, e_str = _fmt_window(window)
+    return fetch_proposals(s_str, e_str, strict=True)
+
+
+def sync_proposals_range(
+    db,
+    start,
+    end,
+    max_workers=PROPOSALS_MAX_WORKERS,
+    limiter=None,
+    splitter=None,
+    sync_contacts=True,
+):
+    """Busca [start, end] em janelas adaptativas concorrentes (limitadas pelo token bucket do host) e
+    grava cada janela aceita assim que chega. Retorna o resumo com as janelas que falharam."""
+    splitter = splitter or AdaptiveWindowSplitter(start, end)
+    summary = {'saved': 0, 'contacts': 0, 'windows': 0, 'failed': [], 'splits': 0, 'widenings': 0}
+    workers = max(1, int(max_workers or 1))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='proposals') as executor:
+        in_flight = {}
+        while True:
+            while len(in_flight) < workers:
+                window = splitter.next_window()
+                if window is None:
+                    break
+                in_flight[executor.submit(fetch_proposals_window, window, limiter)] = window
+            if not in_flight:
+                break
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                window = in_flight.pop(future)
+                s_str, e_str = _fmt_window(window)
+                try:
+                    df = future.result()
+                except Exception as e:
+                    summary['failed'].append(window)
+                    print(f" > Lote: {s_str} a {e_str} ... ❌ Erro: {e}")
+                    continue
+                if not splitter.report(window, len(df)):
+                    print(f" > Lote: {s_str} a {e_str} ... ✂️ {len(df)} linhas, dividindo janela.")
+                    continue
+                summary['windows'] += 1
+                if df.empty:
+                    print(f" > Lote: {s_str} a {e_str} ... .")
+                    continue
+                qtd, patient_signals = process_and_save_batch(db, df)
+                summary['saved'] += qtd
+                cache_synced = sync_patient_contacts_cache(db, patient_signals) if sync_contacts else 0
+                summary['contacts'] += cache_synced
+                print(f" > Lote: {s_str} a {e_str} ... ✅ {qtd} salvos | contatos cache: {cache_synced}.")
+
+    summary['splits'] = splitter.splits
+    summary['widenings'] = splitter.widenings
+    return summary
+
+
+def resolve_sync_start(db, now, full_start, force_full=False):
+    """(inicio, modo): varredura completa sem marca ou quando a ultima completa e antiga; senao so a
+    janela mutavel a partir do high-water mark."""
+    if force_full:
+        return full_start, 'full'
+    high_water = parse_cache_timestamp(get_sync_state(db, 'high_water_date'))
+    last_full = parse_cache_timestamp(get_sync_state(db, 'last_full_sync_at'))
+    if high_water is None or last_full is None:
+        return full_start, 'full'
+    if (now - last_full).total_seconds() >= PROPOSALS_FULL_RESYNC_HOURS * 3600:
+        return full_start, 'full'
+    start = high_water.date() - datetime.timedelta(days=PROPOSALS_MUTABLE_DAYS)
+    return max(full_start, start), 'incremental'
+
+
+def update_proposals(force_full=None):
     print(f"--- Worker Propostas (Hibrido + Batch): {datetime.datetime.now().strftime('%H:%M:%S')} ---")
 
     db = DatabaseManager()
@@ -370,44 +814,40 @@ def update_proposals():
     except Exception as e:
         print(f'Erro tabela: {e}')
 
-    now = datetime.datetime.now()
-    start_date_obj = now - datetime.timedelta(days=30)
-    end_date_obj = now + datetime.timedelta(days=30)
+    if force_full is None:
+        force_full = str(os.getenv('PROPOSALS_FORCE_FULL', '0')).strip().lower() in ('1', 'true', 'yes')
 
-    current_start = start_date_obj
-    chunk_days = 5
-    total_saved = 0
-    total_contacts_synced = 0
+    now = datetime.datetime.now()
+    full_start = (now - datetime.timedelta(days=PROPOSALS_LOOKBACK_DAYS)).date()
+    end_date = (now + datetime.timedelta(days=PROPOSALS_LOOKAHEAD_DAYS)).date()
+    start_date, mode = resolve_sync_start(db, now, full_start, force_full=force_full)
 
-    print(f"📆 Janela: {start_date_obj.strftime('%d/%m')} a {end_date_obj.strftime('%d/%m')}")
+    print(f"📆 Janela: {start_date.strftime('%d/%m')} a {end_date.strftime('%d/%m')} ({mode})")
 
     try:
-        while current_start < end_date_obj:
-            current_end = min(current_start + datetime.timedelta(days=chunk_days), end_date_obj)
-
-            s_str = current_start.strftime('%d-%m-%Y')
-            e_str = current_end.strftime('%d-%m-%Y')
-
-            print(f" > Lote: {s_str} a {e_str} ...", end='', flush=True)
-
-            try:
-                df = fetch_proposals(s_str, e_str)
-                if not df.empty:
-                    qtd, patient_ids = process_and_save_batch(db, df)
-                    total_saved += qtd
-                    cache_synced = sync_patient_contacts_cache(db, patient_ids)
-                    total_contacts_synced += cache_synced
-                    print(f" ✅ {qtd} salvos | contatos cache: {cache_synced}.")
-                else:
-                    print(' .')
-            except Exception as e:
-                print(f" ❌ Erro: {e}")
-
-            current_start = current_end + datetime.timedelta(days=1)
-            time.sleep(1)
+        limiter = get_host_limiter(urlparse(BASE_URL).netloc, PROPOSALS_RATE_PER_SEC, PROPOSALS_RATE_BURST)
+        summary = sync_proposals_range(db, start_date, end_date, limiter=limiter)
+
+        # A marca so avanca ate a primeira janela que falhou: a proxima execucao volta nela.
+        state = {'high_water_date': now.strftime('%Y-%m-%d %H:%M:%S')}
+        if summary['failed']:
+            first_failed = min(window[0] for window in summary['failed'])
+            if first_failed < now.date():
+                state['high_water_date'] = f"{first_failed.strftime('%Y-%m-%d')} 00:00:00"
+        elif mode == 'full':
+            state['last_full_sync_at'] = now.strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            set_sync_state(db, state)
+        except Exception as e:
+            print(f'⚠️ Erro ao gravar high-water mark das propostas: {e}')
 
-        msg_final = f'Total processado: {total_saved} | contatos cache: {total_contacts_synced}'
-        print(f"\n🏁 {msg_final}")
+        msg_final = (
+            f"Total processado: {summary['saved']} | contatos cache: {summary['contacts']}"
+            f" | janelas: {summary['windows']} ({mode})"
+        )
+        if summary['failed']:
+            msg_final += f" | falhas: {len(summary['failed'])}"
+        print(f"\n🏁 {msg_final} | divisoes: {summary['splits']} | ampliacoes: {summary['widenings']}")
         db.update_heartbeat('comercial', 'ONLINE', msg_final)
 
     except Exception as e:
@@ -415,5 +855,154 @@ def update_proposals():
         db.update_heartbeat('comercial', 'ERROR', str(e))
 
 
+
+def _legacy_sync_fixed_windows(db, start, end, chunk_days=5, sleep_sec=1.0):
+    # Loop antigo (janelas fixas, serial, pausa entre lotes) mantido so para comparacao no benchmark.
+    saved = 0
+    current = start
+    while current <= end:
+        current_end = min(current + datetime.timedelta(days=chunk_days), end)
+        df = fetch_proposals(*_fmt_window((current, current_end)))
+        if not df.empty:
+            saved += process_and_save_batch(db, df)[0]
+        current = current_end + datetime.timedelta(days=1)
+        time.sleep(sleep_sec)
+    return saved
+
+
+def run_proposals_stub_benchmark(days=60, per_day=40, latency_ms=300.0, api_cap=0, legacy_sleep_sec=1.0):
+    """Offline contra um stub do proposal/list em SQLite temporario: janelas fixas seriais (loop
+    antigo) contra as janelas adaptativas concorrentes. `api_cap` > 0 simula a API truncando
+    respostas grandes; a comparacao mostra quantas propostas cada modo gravou."""
+    import shutil
+    import tempfile
+
+    import database_manager
+    import feegow_client
+    from http_stub import FixtureStubServer
+
+    end = datetime.date.today()
+    start = end - datetime.timedelta(days=max(1, int(days)) - 1)
+    by_day = {}
+    next_id = 1
+    for offset in range((end - start).days + 1):
+        day = start + datetime.timedelta(days=offset)
+        count = int(per_day) if day.weekday() < 5 else max(1, int(per_day) // 8)
+        by_day[day] = list(range(next_id, next_id + count))
+        next_id += count
+    expected = next_id - 1
+
+    def _handler(method, path, params, raw_body, headers):
+        if not path.rstrip('/').endswith('/proposal/list'):
+            return None
+        try:
+            first = datetime.datetime.strptime(params.get('data_inicio', ''), '%d-%m-%Y').date()
+            last = datetime.datetime.strptime(params.get('data_fim', ''), '%d-%m-%Y').date()
+        except ValueError:
+            return 400, {'success': False, 'content': []}
+        content = []
+        for day, ids in sorted(by_day.items()):
+            if first <= day <= last:
+                content.extend(
+                    {
+                        'proposal_id': pid,
+                        'proposal_date': day.strftime('%Y-%m-%d'),
+                        'status': 'Pendente',
+                        'unidade': {'nome_fantasia': 'Unidade Bench'},
+                        'proposer_name': 'Bench',
+                        'value': 'R$ 1.234,50',
+                        'proposal_last_update': f"{day.strftime('%Y-%m-%d')} 10:00:00",
+                    }
+                    for pid in ids
+                )
+        if api_cap and len(content) > int(api_cap):
+            content = content[: int(api_cap)]
+        return 200, {'success': True, 'content': content}
+
+    tmp_dir = tempfile.mkdtemp(prefix='proposals_bench_')
+    env_overrides = {'DB_PROVIDER': 'sqlite', 'TURSO_URL': None, 'FEEGOW_ACCESS_TOKEN': 'bench'}
+    original_env = {name: os.environ.get(name) for name in env_overrides}
+    original_path = database_manager.LOCAL_DB_PATH
+    original_base_url = feegow_client.BASE_URL
+    results = {}
+    try:
+        for name, value in env_overrides.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        feegow_client.invalidate_headers()
+        with FixtureStubServer(latency_sec=max(0.0, latency_ms / 1000.0), handler=_handler) as stub:
+            feegow_client.BASE_URL = stub.base_url
+            for label in ('legacy', 'adaptive'):
+                database_manager.LOCAL_DB_PATH = os.path.join(tmp_dir, f'{label}.db')
+                db = DatabaseManager()
+                ensure_support_tables(db)
+                served_before = stub.requests_served
+                started = time.perf_counter()
+                if label == 'legacy':
+                    saved = _legacy_sync_fixed_windows(db, start, end, sleep_sec=legacy_sleep_sec)
+                    extra = {}
+                else:
+                    # Limite maior que o real para medir a concorrencia, nao o bucket.
+                    limiter = get_host_limiter(f'bench-{stub.base_url}', 50.0, 50.0)
+                    splitter = AdaptiveWindowSplitter(
+                        start, end, max_rows=min(PROPOSALS_WINDOW_MAX_ROWS, int(api_cap) or PROPOSALS_WINDOW_MAX_ROWS)
+                    )
+                    summary = sync_proposals_range(db, start, end, limiter=limiter, splitter=splitter, sync_contacts=False)
+                    saved = summary['saved']
+                    extra = {'splits': summary['splits'], 'widenings': summary['widenings'], 'failed': len(summary['failed'])}
+                elapsed = time.perf_counter() - started
+                rows = db.execute_query('SELECT COUNT(1) FROM feegow_proposals')
+                results[label] = dict(
+                    {
+                        'sec': round(elapsed, 3),
+                        'requests': stub.requests_served - served_before,
+                        'saved': saved,
+                        'rows_in_db': int(rows[0][0]) if rows else 0,
+                    },
+                    **extra,
+                )
+            peak = stub.max_in_flight
+    finally:
+        feegow_client.BASE_URL = original_base_url
+        feegow_client.invalidate_headers()
+        database_manager.LOCAL_DB_PATH = original_path
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    summary = {
+        'days': days,
+        'expected_rows': expected,
+        'latency_ms': latency_ms,
+        'api_cap': api_cap,
+        'peak_in_flight': peak,
+        'legacy': results['legacy'],
+        'adaptive': results['adaptive'],
+        'speedup': round(results['legacy']['sec'] / results['adaptive']['sec'], 2) if results['adaptive']['sec'] else None,
+    }
+    print(f'[worker_proposals] benchmark {json.dumps(summary, ensure_ascii=False)}')
+    return summary
+
+
 if __name__ == '__main__':
-    update_proposals()
+    args = sys.argv[1:]
+    if '--benchmark' in args:
+        options = {'days': 60, 'per_day': 40, 'latency_ms': 300.0, 'api_cap': 0, 'legacy_sleep_sec': 1.0}
+        for token in args:
+            for flag, key, cast in (
+                ('--days=', 'days', int),
+                ('--per-day=', 'per_day', int),
+                ('--latency-ms=', 'latency_ms', float),
+                ('--api-cap=', 'api_cap', int),
+                ('--legacy-sleep=', 'legacy_sleep_sec', float),
+            ):
+                if token.startswith(flag):
+                    options[key] = cast(token.split('=', 1)[1].strip() or 0)
+        run_proposals_stub_benchmark(**options)
+    else:
+        update_proposals(force_full=True if '--full' in args else None)
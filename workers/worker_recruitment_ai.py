@@ -10,6 +10,7 @@ from typing import Any, Dict, Optional
 from xml.etree import ElementTree
 
 from database_manager import DatabaseManager
+from job_queue import wait_for_work
 from storage_s3 import download_s3_object_bytes
 
 try:
@@ -656,7 +657,7 @@ def run_recruitment_ai_loop():
         try:
             had_job = process_pending_recruitment_ai_jobs_once()
             if not had_job:
-                time.sleep(POLL_SECONDS)
+                wait_for_work(SERVICE_NAME, POLL_SECONDS)
         except Exception as exc:
             db.update_heartbeat(SERVICE_NAME, STATUS_FAILED, f"loop_error={exc}")
             time.sleep(max(POLL_SECONDS, 10))
@@ -3,6 +3,7 @@ import sys
 import time
 import re
 import json
+import threading
 import hashlib
 import uuid
 import unicodedata
@@ -10,7 +11,9 @@ import calendar
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote_plus
 
+import lxml.html
 from bs4 import BeautifulSoup
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 
@@ -18,12 +21,16 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from database_manager import DatabaseManager
-    from feegow_web_auth import APP4_BASE_URL, login_feegow_app4, switch_feegow_unit
-    from playwright_runtime import chromium_session
+    from feegow_web_auth import APP4_BASE_URL, feegow_storage_key, login_feegow_app4, switch_feegow_unit
+    from playwright_runtime import browser_lease
+    from report_replay import ReplayClient, ReplayMismatch, RequestRecorder, RequestTemplate, compare_replayed_rows, replay_concurrently
+    from sharded_scrape import SharedAuthState, ShardCoordinator, ShardSession, resolve_shard_count
 except ImportError:
     DatabaseManager = None
-    from .feegow_web_auth import APP4_BASE_URL, login_feegow_app4, switch_feegow_unit
-    from .playwright_runtime import chromium_session
+    from .feegow_web_auth import APP4_BASE_URL, feegow_storage_key, login_feegow_app4, switch_feegow_unit
+    from .playwright_runtime import browser_lease
+    from .report_replay import ReplayClient, ReplayMismatch, RequestRecorder, RequestTemplate, compare_replayed_rows, replay_concurrently
+    from .sharded_scrape import SharedAuthState, ShardCoordinator, ShardSession, resolve_shard_count
 
 
 BASE_URL = APP4_BASE_URL
@@ -45,6 +52,19 @@ ITEM_ERROR = "ERROR"
 DEFAULT_RETRY_ATTEMPTS = max(1, int(os.getenv("REPASSE_RETRY_ATTEMPTS", "3") or "3"))
 SEARCH_RESULT_TIMEOUT_MS = max(30000, int(os.getenv("REPASSE_SEARCH_TIMEOUT_MS", "60000") or "60000"))
 SEARCH_PROCESSING_TIMEOUT_MS = max(5000, int(os.getenv("REPASSE_PROCESSING_TIMEOUT_MS", "20000") or "20000"))
+# Contextos de navegador em paralelo por job (cada shard tem a propria thread/sessao ASP).
+REPASSE_SHARDS = max(1, int(os.getenv("REPASSE_SHARDS", "3") or "3"))
+REPASSE_MIN_ITEMS_PER_SHARD = max(1, int(os.getenv("REPASSE_MIN_ITEMS_PER_SHARD", "5") or "5"))
+# Job RUNNING sem checkpoint ha mais que isso e considerado orfao (worker caiu) e e retomado.
+REPASSE_JOB_STALE_SEC = max(300, int(os.getenv("REPASSE_JOB_STALE_SEC", "1800") or "1800"))
+ITEM_FINISHED_STATUSES = (ITEM_SUCCESS, ITEM_NO_DATA)
+# Replay HTTP da busca: captura o POST do relatorio no navegador e repete por profissional via requests.
+REPASSE_HTTP_REPLAY = str(os.getenv("REPASSE_HTTP_REPLAY", "1")).strip().lower() in ("1", "true", "yes", "on")
+REPASSE_HTTP_CONCURRENCY = max(1, int(os.getenv("REPASSE_HTTP_CONCURRENCY", "4") or "4"))
+# Profissionais raspados pelo navegador ate achar um com linhas para conferir o replay.
+REPASSE_REPLAY_VERIFY_MAX = max(1, int(os.getenv("REPASSE_REPLAY_VERIFY_MAX", "3") or "3"))
+_NO_DATA_RE = re.compile(r"Nenhum repasse consolidado foi encontrado", re.IGNORECASE)
+_REPORT_RESULT_RE = re.compile(r"datatableRepasses|Nenhum repasse consolidado foi encontrado", re.IGNORECASE)
 
 
 def _now_iso() -> str:
@@ -376,6 +396,56 @@ def _extract_table_rows(page) -> List[Dict]:
     return _parse_table_rows(headers, row_payloads)
 
 
+def _lxml_cell_text(node) -> str:
+    return re.sub(r"\s+", " ", node.text_content() or "").strip()
+
+
+def _parse_report_html(raw_html: str) -> List[Dict]:
+    """Mesmo resultado de `_extract_table_rows`, a partir do HTML devolvido pelo replay HTTP."""
+    if _NO_DATA_RE.search(raw_html or ""):
+        return []
+    try:
+        doc = lxml.html.fromstring(raw_html or "<html></html>")
+    except Exception as exc:
+        raise ReplayMismatch(f"resposta do replay ilegivel: {exc}")
+
+    tables = doc.xpath("//table[@id='datatableRepasses']") or doc.xpath(
+        "//table[contains(@id, 'datatableRepasses') or contains(@id, 'datatable')]"
+    )
+    if not tables:
+        for candidate in doc.xpath("//table"):
+            norm = _normalize_text(" ".join(_lxml_cell_text(th) for th in candidate.xpath("./thead//th")))
+            if "DATA EXEC" in norm and "PACIENTE" in norm and "REPASSE" in norm:
+                tables = [candidate]
+                break
+    if not tables:
+        raise ReplayMismatch("tabela de repasses ausente na resposta do replay")
+    table = tables[0]
+
+    headers = [_lxml_cell_text(th) for th in table.xpath("./thead//th")]
+    row_payloads: List[Dict] = []
+    for tr in table.xpath("./tbody/tr"):
+        if tr.xpath("./td[contains(concat(' ', normalize-space(@class), ' '), ' dataTables_empty ')]"):
+            continue
+        tds = tr.xpath("./td")
+        if not tds:
+            continue
+        cells_html = [lxml.html.tostring(td, encoding="unicode") for td in tds]
+        row_payloads.append(
+            {
+                "cells": [_lxml_cell_text(td) for td in tds],
+                "cells_html": cells_html,
+                "row_html": " ".join(cells_html),
+            }
+        )
+    if not row_payloads:
+        return []
+    try:
+        return _parse_table_rows(headers, row_payloads)
+    except RuntimeError as exc:
+        raise ReplayMismatch(str(exc))
+
+
 def _ensure_repasse_tables(db: "DatabaseManager"):
     def _ensure_index(conn, table_name: str, index_name: str, columns_sql: str):
         if db.use_mysql:
@@ -478,6 +548,7 @@ def _ensure_repasse_tables(db: "DatabaseManager"):
         )
         _ensure_column(conn, "repasse_sync_jobs", "scope", "VARCHAR(20) NOT NULL DEFAULT 'all'")
         _ensure_column(conn, "repasse_sync_jobs", "professional_ids_json", "TEXT")
+        _ensure_column(conn, "repasse_sync_jobs", "shard_state_json", "TEXT")
         _ensure_index(conn, "repasse_sync_jobs", "idx_repasse_sync_jobs_period", "period_ref")
         _ensure_index(conn, "repasse_sync_jobs", "idx_repasse_sync_jobs_status", "status")
         _ensure_index(conn, "repasse_sync_jobs", "idx_repasse_sync_jobs_created", "created_at")
@@ -581,15 +652,17 @@ def _list_selected_active_professionals(db: "DatabaseManager", professional_ids:
 
 
 def _get_pending_job(db: "DatabaseManager") -> Optional[Dict]:
+    stale_before = datetime.fromtimestamp(time.time() - REPASSE_JOB_STALE_SEC).strftime("%Y-%m-%d %H:%M:%S")
     rows = db.execute_query(
         """
-        SELECT id, period_ref, scope, requested_by, professional_ids_json
+        SELECT id, period_ref, scope, requested_by, professional_ids_json, status
         FROM repasse_sync_jobs
         WHERE status = ?
+           OR (status = ? AND updated_at < ?)
         ORDER BY created_at ASC
         LIMIT 1
         """,
-        (STATUS_PENDING,),
+        (STATUS_PENDING, STATUS_RUNNING, stale_before),
     ) or []
     if not rows:
         return None
@@ -600,6 +673,7 @@ def _get_pending_job(db: "DatabaseManager") -> Optional[Dict]:
         "scope": str(_row_get(row, 2, "scope") or ""),
         "requested_by": str(_row_get(row, 3, "requested_by")),
         "professional_ids_json": _row_get(row, 4, "professional_ids_json"),
+        "resumed": str(_row_get(row, 5, "status") or "").upper() == STATUS_RUNNING,
     }
 
 
@@ -660,8 +734,15 @@ def enqueue_repasse_job(
     }
 
 
-def _mark_job_running(db: "DatabaseManager", job_id: str):
+def _mark_job_running(db: "DatabaseManager", job_id: str, resumed: bool = False):
     now = _now_iso()
+    if resumed:
+        # Retomada: preserva started_at e o checkpoint; so renova o updated_at para reivindicar o job.
+        db.execute_query(
+            "UPDATE repasse_sync_jobs SET status = ?, updated_at = ? WHERE id = ?",
+            (STATUS_RUNNING, now, job_id),
+        )
+        return
     db.execute_query(
         """
         UPDATE repasse_sync_jobs
@@ -684,6 +765,27 @@ def _mark_job_done(db: "DatabaseManager", job_id: str, status: str, error: str =
     )
 
 
+def _save_shard_checkpoint(db: "DatabaseManager", job_id: str, snapshot: Dict):
+    db.execute_query(
+        "UPDATE repasse_sync_jobs SET shard_state_json = ?, updated_at = ? WHERE id = ?",
+        (json.dumps(snapshot, ensure_ascii=False), _now_iso(), job_id),
+    )
+
+
+def _list_finished_professional_ids(db: "DatabaseManager", job_id: str) -> List[str]:
+    placeholders = ", ".join(["?"] * len(ITEM_FINISHED_STATUSES))
+    rows = db.execute_query(
+        f"""
+        SELECT professional_id
+        FROM repasse_sync_job_items
+        WHERE job_id = ?
+          AND status IN ({placeholders})
+        """,
+        (job_id, *ITEM_FINISHED_STATUSES),
+    ) or []
+    return [str(_row_get(row, 0, "professional_id")) for row in rows if _row_get(row, 0, "professional_id")]
+
+
 def _save_job_item(
     db: "DatabaseManager",
     job_id: str,
@@ -1315,9 +1417,20 @@ def _has_required_screen_elements(page) -> bool:
     return has_professional_filter
 
 
-def _recover_session_and_filters(page, date_from_br: str, date_to_br: str) -> Dict[str, str]:
+def _recover_session_and_filters(
+    page,
+    date_from_br: str,
+    date_to_br: str,
+    auth: Optional[SharedAuthState] = None,
+    shard: Optional[ShardSession] = None,
+) -> Dict[str, str]:
     _debug("tentando recuperar sessão do repasse...")
-    _login_feegow(page)
+    if auth is not None and shard is not None:
+        # Com shards o relogin e coordenado: um login novo derruba as sessoes dos outros shards.
+        action = auth.recover(page, shard)
+        _debug(f"shard {shard.shard_id + 1}: recuperacao via {action}")
+    else:
+        _login_feegow(page)
     _open_repasse_screen(page)
     _fill_filters(page, date_from_br, date_to_br)
     return _build_professional_option_map(page)
@@ -1381,6 +1494,330 @@ def _open_repasse_screen(page):
     _debug_dump_page(page, "open_screen")
 
 
+_DENY_NOTIFICATIONS_JS = """
+(() => {
+  try {
+    if (window.Notification) {
+      try {
+        Object.defineProperty(window.Notification, 'permission', {
+          configurable: true,
+          get: () => 'denied'
+        });
+      } catch (e) {}
+      try {
+        window.Notification.requestPermission = () => Promise.resolve('denied');
+      } catch (e) {}
+    }
+  } catch (e) {}
+})();
+"""
+
+
+def _new_repasse_page(context):
+    page = context.new_page()
+    page.add_init_script(_DENY_NOTIFICATIONS_JS)
+    return page
+
+
+def _persist_professional_result(
+    db: "DatabaseManager",
+    job_id: str,
+    period_ref: str,
+    professional_id: str,
+    display_name: str,
+    rows: List[Dict],
+    started: float,
+    label: str,
+) -> str:
+    total_value = sum((row.get("repasse_value") or Decimal("0")) for row in rows)
+    _upsert_professional_rows(
+        db=db,
+        job_id=job_id,
+        period_ref=period_ref,
+        professional_id=professional_id,
+        professional_name=display_name,
+        rows=rows,
+    )
+    status = ITEM_SUCCESS if rows else ITEM_NO_DATA
+    _save_job_item(
+        db,
+        job_id,
+        professional_id,
+        display_name,
+        status,
+        len(rows),
+        total_value,
+        "",
+        int((time.time() - started) * 1000),
+    )
+    if rows:
+        print(f"[{label}] OK {display_name}: linhas={len(rows)} total={float(total_value):.2f}")
+    else:
+        print(f"[{label}] NO_DATA {display_name}")
+    return status
+
+
+def _scrape_professional(
+    db: "DatabaseManager",
+    page,
+    job_id: str,
+    period_ref: str,
+    date_from_br: str,
+    date_to_br: str,
+    professional_id: str,
+    professional_name: str,
+    option_map: Dict,
+    label: str,
+    auth: Optional[SharedAuthState] = None,
+    shard: Optional[ShardSession] = None,
+    rows_sink: Optional[List[Dict]] = None,
+) -> Tuple[str, int, Dict]:
+    """Raspa um profissional com retentativas; grava linhas + item do job. Retorna (status, linhas, option_map).
+    Com `rows_sink`, as linhas extraidas tambem sao anexadas nela (conferencia do replay)."""
+    started = time.time()
+    display_name = professional_name.strip()
+    final_error = ""
+
+    for attempt in range(1, DEFAULT_RETRY_ATTEMPTS + 1):
+        try:
+            _ensure_ready_for_professional(page)
+            option_value = _resolve_professional_option_value(option_map, professional_id, display_name)
+            if not option_value:
+                option_map = _build_professional_option_map(page)
+                option_value = _resolve_professional_option_value(option_map, professional_id, display_name)
+
+            if not option_value:
+                raise RuntimeError("Profissional nao encontrado no filtro do Feegow.")
+
+            _select_professional(page, option_value)
+            _click_search(page)
+            rows = _extract_table_rows(page)
+            status = _persist_professional_result(
+                db, job_id, period_ref, professional_id, display_name, rows, started, label
+            )
+            if rows_sink is not None:
+                rows_sink.extend(rows)
+            return status, len(rows), option_map
+        except PlaywrightTimeoutError as e:
+            final_error = f"Timeout no scraping: {e}"
+        except Exception as e:
+            final_error = str(e)
+
+        if attempt < DEFAULT_RETRY_ATTEMPTS:
+            print(
+                f"[{label}] aviso {display_name}: tentativa {attempt}/{DEFAULT_RETRY_ATTEMPTS} falhou ({final_error}). Recuperando sessão..."
+            )
+            try:
+                option_map = _recover_session_and_filters(page, date_from_br, date_to_br, auth, shard)
+            except Exception as recover_error:
+                final_error = f"{final_error} | recovery_failed={recover_error}"
+                print(f"[{label}] aviso {display_name}: falha ao recuperar sessão ({recover_error}).")
+
+    _save_job_item(
+        db,
+        job_id,
+        professional_id,
+        display_name,
+        ITEM_ERROR,
+        0,
+        Decimal("0"),
+        final_error,
+        int((time.time() - started) * 1000),
+    )
+    if "timeout" in final_error.lower():
+        print(f"[{label}] ERRO {display_name}: timeout")
+    else:
+        print(f"[{label}] ERRO {display_name}: {final_error}")
+    return ITEM_ERROR, 0, option_map
+
+
+def _capture_report_template(
+    db: "DatabaseManager",
+    page,
+    lease,
+    job_id: str,
+    period_ref: str,
+    date_from_br: str,
+    date_to_br: str,
+    remaining: List[Tuple[str, str]],
+    option_map: Dict,
+    next_label,
+    record_status,
+) -> Tuple[Optional[RequestTemplate], Optional[ReplayClient], Dict]:
+    """Raspa os primeiros profissionais pelo navegador gravando a busca; o replay HTTP so vale
+    se devolver as mesmas linhas que o navegador (de preferencia para um profissional com linhas)."""
+    template: Optional[RequestTemplate] = None
+    client: Optional[ReplayClient] = None
+    for _ in range(min(REPASSE_REPLAY_VERIFY_MAX, len(remaining))):
+        professional_id, professional_name = remaining[0]
+        option_value = _resolve_professional_option_value(option_map, professional_id, professional_name.strip())
+        browser_rows: List[Dict] = []
+        with RequestRecorder(page) as recorder:
+            status, rows_count, option_map = _scrape_professional(
+                db,
+                page,
+                job_id,
+                period_ref,
+                date_from_br,
+                date_to_br,
+                professional_id,
+                professional_name,
+                option_map,
+                next_label(),
+                rows_sink=browser_rows,
+            )
+        remaining.pop(0)
+        record_status(status)
+        if status == ITEM_ERROR or not option_value:
+            continue
+
+        captured = recorder.find(
+            lambda req: bool(_REPORT_RESULT_RE.search(req.response_text or ""))
+            and option_value in unquote_plus(f"{req.body} {req.url}")
+        )
+        if captured is None:
+            raise ReplayMismatch("requisicao da busca nao identificada entre as capturadas")
+        template = RequestTemplate.from_capture(captured, option_value, prefer_field="AccountID")
+        if client is None:
+            client = ReplayClient(lease.context, REPASSE_HTTP_CONCURRENCY)
+        replayed = _parse_report_html(client.fetch(template, option_value))
+        divergence = compare_replayed_rows(browser_rows, replayed)
+        if divergence:
+            raise ReplayMismatch(divergence)
+        if rows_count > 0:
+            break
+    return template, client, option_map
+
+
+def _replay_pending_professionals(
+    db: "DatabaseManager",
+    job_id: str,
+    period_ref: str,
+    date_from_br: str,
+    date_to_br: str,
+    pending: List[Tuple[str, str]],
+    headless: bool,
+    launch_args: List[str],
+    next_label,
+    record_status,
+) -> List[Tuple[str, str]]:
+    """Busca os profissionais pelo replay HTTP da requisicao do relatorio, em paralelo.
+    Retorna os que precisam do navegador (replay indisponivel, layout/CSRF divergente ou falha)."""
+    remaining = list(pending)
+    template: Optional[RequestTemplate] = None
+    client: Optional[ReplayClient] = None
+    option_values: Dict[str, str] = {}
+    capture_error: Optional[Exception] = None
+    try:
+        with browser_lease(
+            headless=headless,
+            launch_args=launch_args,
+            storage_key=feegow_storage_key(os.getenv("FEEGOW_USER"), 0, scope="repasse"),
+        ) as lease:
+            page = _new_repasse_page(lease.context)
+            try:
+                with lease.timed("login"):
+                    _login_feegow(page)
+                _open_repasse_screen(page)
+                _fill_filters(page, date_from_br, date_to_br)
+                option_map = _build_professional_option_map(page)
+                # Divergencia na captura nao pode sair do lease: o broker descartaria a sessao salva.
+                try:
+                    template, client, option_map = _capture_report_template(
+                        db,
+                        page,
+                        lease,
+                        job_id,
+                        period_ref,
+                        date_from_br,
+                        date_to_br,
+                        remaining,
+                        option_map,
+                        next_label,
+                        record_status,
+                    )
+                except Exception as exc:
+                    capture_error = exc
+                    template = None
+                for professional_id, professional_name in remaining:
+                    value = _resolve_professional_option_value(option_map, professional_id, professional_name.strip())
+                    if value:
+                        option_values[professional_id] = value
+            finally:
+                try:
+                    page.close()
+                except Exception:
+                    pass
+    except Exception as exc:
+        print(f"⚠️ Replay HTTP do repasse indisponivel ({exc}); seguindo pelo navegador.")
+        if client is not None:
+            client.close()
+        return remaining
+
+    if template is None or client is None:
+        reason = capture_error or "sem busca valida para conferir"
+        print(f"⚠️ Replay HTTP do repasse indisponivel ({reason}); seguindo pelo navegador.")
+        if client is not None:
+            client.close()
+        return remaining
+
+    fallback = [item for item in remaining if item[0] not in option_values]
+    targets = [item for item in remaining if item[0] in option_values]
+    started_at: Dict[str, float] = {}
+    replay_started = time.time()
+    last_checkpoint = 0.0
+    done = 0
+    mismatch_logged = False
+
+    def _replay_one(item: Tuple[str, str]) -> List[Dict]:
+        started_at[item[0]] = time.time()
+        return _parse_report_html(client.fetch(template, option_values[item[0]]))
+
+    print(
+        f"🌐 Replay HTTP do repasse | campo={template.target_field} metodo={template.method} "
+        f"profissionais={len(targets)} concorrencia={client.concurrency} "
+        f"sessao_asp={'propria' if client.own_asp_session else 'navegador'}"
+    )
+    try:
+        for item, rows, error in replay_concurrently(client, targets, _replay_one):
+            professional_id, professional_name = item
+            if error is not None:
+                fallback.append(item)
+                if isinstance(error, ReplayMismatch) and not mismatch_logged:
+                    mismatch_logged = True
+                    print(f"⚠️ Replay HTTP divergente ({error}); restantes voltam para o navegador.")
+                continue
+            status = _persist_professional_result(
+                db,
+                job_id,
+                period_ref,
+                professional_id,
+                professional_name.strip(),
+                rows,
+                started_at.get(professional_id, time.time()),
+                next_label("http"),
+            )
+            record_status(status)
+            done += 1
+            if time.time() - last_checkpoint >= 2.0:
+                last_checkpoint = time.time()
+                _save_shard_checkpoint(
+                    db,
+                    job_id,
+                    {"mode": "http_replay", "done": done, "total": len(targets), "fallback": len(fallback)},
+                )
+    finally:
+        client.close()
+
+    elapsed = max(0.001, time.time() - replay_started)
+    print(
+        f"📊 [repasse {job_id[:8]}] replay http itens={done}/{len(targets)} "
+        f"ritmo={done * 60.0 / elapsed:.2f}/min requisicoes={client.requests_sent} "
+        f"navegador={len(fallback)}"
+    )
+    return fallback
+
+
 def _process_job(job: Dict):
     db = DatabaseManager()
     _ensure_repasse_tables(db)
@@ -1396,173 +1833,164 @@ def _process_job(job: Dict):
         db.update_heartbeat(SERVICE_NAME, "ERROR", "Nenhum profissional ativo para processar no escopo.")
         return
 
+    # Retomada apos queda: so os profissionais sem item concluido voltam para a fila.
+    finished_ids = set(_list_finished_professional_ids(db, job_id)) if job.get("resumed") else set()
+    pending = [(pid, name) for pid, name in professionals if pid not in finished_ids]
+    resumed_count = len(professionals) - len(pending)
+    shard_count = resolve_shard_count(len(pending), REPASSE_SHARDS, REPASSE_MIN_ITEMS_PER_SHARD)
+
     scope_label = "selecionados" if selected_professional_ids else "todos_ativos"
     print(
         f"--- Repasse Consolidado | job={job_id} | periodo={period_ref} | "
-        f"profissionais={len(professionals)} | scope={scope_label} ---"
+        f"profissionais={len(professionals)} | scope={scope_label} | shards={shard_count}"
+        + (f" | retomados={resumed_count}" if resumed_count else "")
+        + " ---"
     )
     db.update_heartbeat(
         SERVICE_NAME,
         "RUNNING",
-        f"job={job_id} periodo={period_ref} profissionais={len(professionals)} scope={scope_label}",
+        f"job={job_id} periodo={period_ref} profissionais={len(professionals)} scope={scope_label} shards={shard_count}",
     )
 
-    any_error = False
-    any_success = False
-
     headless = str(os.getenv("PLAYWRIGHT_HEADLESS", "1")).strip().lower() in ("1", "true", "yes")
-    with chromium_session(
-        headless=headless,
-        launch_args=["--disable-notifications"],
-    ) as browser:
-        context = browser.new_context()
-        page = context.new_page()
-        page.add_init_script(
-            """
-            (() => {
-              try {
-                if (window.Notification) {
-                  try {
-                    Object.defineProperty(window.Notification, 'permission', {
-                      configurable: true,
-                      get: () => 'denied'
-                    });
-                  } catch (e) {}
-                  try {
-                    window.Notification.requestPermission = () => Promise.resolve('denied');
-                  } catch (e) {}
-                }
-              } catch (e) {}
-            })();
-            """
+    launch_args = ["--disable-notifications"]
+    auth = SharedAuthState(_login_feegow)
+    counters_lock = threading.Lock()
+    counters = {"seen": resumed_count, "error": False, "success": resumed_count > 0}
+
+    def _next_label(suffix: str = "") -> str:
+        with counters_lock:
+            counters["seen"] += 1
+            label = f"{counters['seen']}/{len(professionals)}"
+        return f"{label} {suffix}" if suffix else label
+
+    def _record_status(status: str):
+        with counters_lock:
+            if status == ITEM_ERROR:
+                counters["error"] = True
+            else:
+                counters["success"] = True
+
+    if REPASSE_HTTP_REPLAY and len(pending) > 1:
+        pending = _replay_pending_professionals(
+            db,
+            job_id,
+            period_ref,
+            date_from_br,
+            date_to_br,
+            pending,
+            headless,
+            launch_args,
+            _next_label,
+            _record_status,
         )
+        shard_count = resolve_shard_count(len(pending), REPASSE_SHARDS, REPASSE_MIN_ITEMS_PER_SHARD)
+
+    def _run_shard(shard_id: int, items, progress):
+        shard = ShardSession(shard_id)
+        leader = shard_id == 0
+        if leader:
+            lease_cm = browser_lease(
+                headless=headless,
+                launch_args=launch_args,
+                storage_key=feegow_storage_key(os.getenv("FEEGOW_USER"), 0, scope="repasse"),
+            )
+        else:
+            auth.wait_ready()
+            lease_cm = browser_lease(
+                headless=headless,
+                launch_args=launch_args,
+                startup_label="repasse_shard",
+                context_options=auth.context_options(shard),
+                session_slot=False,
+                keep_warm=False,
+            )
 
         try:
-            _login_feegow(page)
-            _open_repasse_screen(page)
-            _fill_filters(page, date_from_br, date_to_br)
-            pause_sec = int(os.getenv("REPASSE_DEBUG_PAUSE_SEC", "0") or "0")
-            if _is_debug_enabled() and pause_sec > 0:
-                _debug(f"pausa de debug apos filtros: {pause_sec}s")
-                time.sleep(pause_sec)
-            option_map = _build_professional_option_map(page)
-
-            for idx, (professional_id, professional_name) in enumerate(professionals, start=1):
-                started = time.time()
-                display_name = professional_name.strip()
-                normalized_name = _normalize_professional_label(display_name)
-                final_error = ""
-                succeeded = False
-
-                for attempt in range(1, DEFAULT_RETRY_ATTEMPTS + 1):
+            with lease_cm as lease:
+                page = _new_repasse_page(lease.context)
+                try:
+                    if leader:
+                        with lease.timed("login"):
+                            _login_feegow(page)
+                        auth.publish(lease.context)
                     try:
-                        _ensure_ready_for_professional(page)
-                        option_value = _resolve_professional_option_value(
-                            option_map, professional_id, display_name
-                        )
-                        if not option_value:
-                            option_map = _build_professional_option_map(page)
-                            option_value = _resolve_professional_option_value(
-                                option_map, professional_id, display_name
-                            )
-
-                        if not option_value:
-                            raise RuntimeError("Profissional nao encontrado no filtro do Feegow.")
-
-                        _select_professional(page, option_value)
-                        _click_search(page)
-                        rows = _extract_table_rows(page)
-                        total_value = sum((row.get("repasse_value") or Decimal("0")) for row in rows)
-
-                        if rows:
-                            _upsert_professional_rows(
-                                db=db,
-                                job_id=job_id,
-                                period_ref=period_ref,
-                                professional_id=professional_id,
-                                professional_name=display_name,
-                                rows=rows,
-                            )
-                            _save_job_item(
-                                db,
-                                job_id,
-                                professional_id,
-                                display_name,
-                                ITEM_SUCCESS,
-                                len(rows),
-                                total_value,
-                                "",
-                                int((time.time() - started) * 1000),
-                            )
-                            any_success = True
-                            print(f"[{idx}/{len(professionals)}] OK {display_name}: linhas={len(rows)} total={float(total_value):.2f}")
-                        else:
-                            _upsert_professional_rows(
-                                db=db,
-                                job_id=job_id,
-                                period_ref=period_ref,
-                                professional_id=professional_id,
-                                professional_name=display_name,
-                                rows=[],
-                            )
-                            _save_job_item(
-                                db,
-                                job_id,
-                                professional_id,
-                                display_name,
-                                ITEM_NO_DATA,
-                                0,
-                                Decimal("0"),
-                                "",
-                                int((time.time() - started) * 1000),
-                            )
-                            any_success = True
-                            print(f"[{idx}/{len(professionals)}] NO_DATA {display_name}")
-
-                        succeeded = True
-                        break
-                    except PlaywrightTimeoutError as e:
-                        final_error = f"Timeout no scraping: {e}"
-                    except Exception as e:
-                        final_error = str(e)
-
-                    if attempt < DEFAULT_RETRY_ATTEMPTS:
-                        print(
-                            f"[{idx}/{len(professionals)}] aviso {display_name}: tentativa {attempt}/{DEFAULT_RETRY_ATTEMPTS} falhou ({final_error}). Recuperando sessão..."
-                        )
-                        try:
-                            option_map = _recover_session_and_filters(page, date_from_br, date_to_br)
-                        except Exception as recover_error:
-                            final_error = f"{final_error} | recovery_failed={recover_error}"
-                            print(
-                                f"[{idx}/{len(professionals)}] aviso {display_name}: falha ao recuperar sessão ({recover_error})."
-                            )
-                    else:
-                        _save_job_item(
+                        _open_repasse_screen(page)
+                        _fill_filters(page, date_from_br, date_to_br)
+                        option_map = _build_professional_option_map(page)
+                    except Exception:
+                        if leader:
+                            raise
+                        option_map = _recover_session_and_filters(page, date_from_br, date_to_br, auth, shard)
+                    pause_sec = int(os.getenv("REPASSE_DEBUG_PAUSE_SEC", "0") or "0")
+                    if leader and _is_debug_enabled() and pause_sec > 0:
+                        _debug(f"pausa de debug apos filtros: {pause_sec}s")
+                        time.sleep(pause_sec)
+
+                    for professional_id, professional_name in items:
+                        label = _next_label(f"s{shard_id + 1}" if shard_count > 1 else "")
+                        status, rows_count, option_map = _scrape_professional(
                             db,
+                            page,
                             job_id,
+                            period_ref,
+                            date_from_br,
+                            date_to_br,
                             professional_id,
-                            display_name,
-                            ITEM_ERROR,
-                            0,
-                            Decimal("0"),
-                            final_error,
-                            int((time.time() - started) * 1000),
+                            professional_name,
+                            option_map,
+                            label,
+                            auth if shard_count > 1 else None,
+                            shard,
                         )
-                        any_error = True
-                        if "timeout" in final_error.lower():
-                            print(f"[{idx}/{len(professionals)}] ERRO {display_name}: timeout")
-                        else:
-                            print(f"[{idx}/{len(professionals)}] ERRO {display_name}: {final_error}")
-
-                if not succeeded:
-                    continue
-
-        finally:
-            try:
-                context.close()
-            except Exception:
-                pass
+                        _record_status(status)
+                        progress.record(professional_id, status, rows_count)
+                finally:
+                    # O contexto e fechado pelo broker; a pagina sai antes para liberar memoria do navegador quente.
+                    try:
+                        page.close()
+                    except Exception:
+                        pass
+        except Exception as e:
+            if leader:
+                # Falha do lider antes de publicar (abrir navegador/slot ou login): libera os
+                # seguidores na hora em vez de deixa-los esperando o timeout de wait_ready.
+                auth.fail(e)
+            raise
+
+    leftovers: List[Tuple[str, str]] = []
+    aborted: List[str] = []
+    if pending:
+        coordinator = ShardCoordinator(
+            pending,
+            shard_count,
+            _run_shard,
+            checkpoint_fn=lambda snapshot: _save_shard_checkpoint(db, job_id, snapshot),
+            label=f"repasse {job_id[:8]}",
+            resumed_items=resumed_count,
+        )
+        summary = coordinator.run()
+        # Itens nao concluidos (nenhum shard pegou, ou derrubaram o shard que os processava) ficam
+        # registrados como erro e o job termina PARTIAL/FAILED; nao ha retomada automatica deles.
+        aborted = [item["error"] for item in summary["shards"] if item["error"]]
+        leftovers = coordinator.remaining()
+        if aborted and len(leftovers) == len(pending):
+            # Nenhum shard chegou a processar (ex.: login do lider falhou): falha o job como antes.
+            raise RuntimeError(aborted[0])
+    for professional_id, professional_name in leftovers:
+        _save_job_item(
+            db,
+            job_id,
+            professional_id,
+            professional_name.strip(),
+            ITEM_ERROR,
+            0,
+            Decimal("0"),
+            f"shard abortado: {aborted[0] if aborted else 'sem shard disponivel'}",
+            0,
+        )
+    any_error = counters["error"] or bool(leftovers)
+    any_success = counters["success"]
 
     if any_error and any_success:
         final_status = STATUS_PARTIAL
@@ -1617,7 +2045,9 @@ def process_pending_repasse_jobs_once(
         return False
 
     if not preclaimed_job:
-        _mark_job_running(db, job["id"])
+        _mark_job_running(db, job["id"], resumed=bool(job.get("resumed")))
+        if job.get("resumed"):
+            print(f"🔁 Retomando job de repasse interrompido | id={job['id']} | periodo={job['period_ref']}")
     try:
         _process_job(job)
     except Exception as e:
@@ -5,14 +5,28 @@ import html as html_lib
 import json
 import os
 import re
+import string
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import requests
 
+try:
+    from http_fanout import ThreadLocalSessions, TokenBucket
+except ImportError:
+    from .http_fanout import ThreadLocalSessions, TokenBucket
+
+try:
+    import libsql_client
+except ImportError:
+    libsql_client = None
+
 try:
     from database_manager import DatabaseManager
 except ImportError:
@@ -26,13 +40,20 @@ except ImportError:
 
 SERVICE_NAME = "repasse_email"
 PROVIDER = (os.getenv("REPASSE_EMAIL_PROVIDER", "sendpulse").strip().lower() or "sendpulse")
-SENDPULSE_API_BASE_URL = "https://api.sendpulse.com"
+SENDPULSE_API_BASE_URL = (os.getenv("SENDPULSE_API_BASE_URL") or "https://api.sendpulse.com").strip().rstrip("/")
 STATUS_PENDING = "PENDING"
 STATUS_RUNNING = "RUNNING"
 STATUS_COMPLETED = "COMPLETED"
 STATUS_PARTIAL = "PARTIAL"
 STATUS_FAILED = "FAILED"
+# Pipeline de envio: PDFs baixados em paralelo, ate N envios em voo sob o token bucket e
+# transicoes de estado gravadas em lotes.
+SEND_CONCURRENCY = max(1, int(os.getenv("REPASSE_EMAIL_SEND_CONCURRENCY", "3") or "3"))
+PDF_PREFETCH_WORKERS = max(1, int(os.getenv("REPASSE_EMAIL_PDF_PREFETCH_WORKERS", "4") or "4"))
+STATE_COMMIT_BATCH = max(1, int(os.getenv("REPASSE_EMAIL_STATE_COMMIT_BATCH", "10") or "10"))
 _SENDPULSE_TOKEN_CACHE: Dict[str, object] = {"token": "", "expires_at": 0.0}
+_SENDPULSE_TOKEN_LOCK = threading.Lock()
+_SENDPULSE_SESSIONS = ThreadLocalSessions(requests.Session)
 CONSULTARE_LOGO_WHITE_BASE64 = (
     "iVBORw0KGgoAAAANSUhEUgAAAZAAAABkCAYAAACoy2Z3AAAAGXRFWHRTb2Z0d2FyZQBBZG9i"
     "ZSBJbWFnZVJlYWR5ccllPAAAFa5JREFUeNrsXe1127gSpX3yf9XB41YQpoLQFUSpIHQFkSuI"
@@ -205,9 +226,11 @@ def _is_dry_run() -> bool:
     return _clean(os.getenv("REPASSE_EMAIL_DRY_RUN", "1")).lower() in ("1", "true", "yes", "on")
 
 
-def _rate_limit_sleep():
+def _build_rate_limiter() -> TokenBucket:
+    """Token bucket do envio: REPASSE_EMAIL_RATE_LIMIT_PER_MIN com rajada REPASSE_EMAIL_RATE_BURST."""
     per_min = max(1, int(os.getenv("REPASSE_EMAIL_RATE_LIMIT_PER_MIN", "10") or "10"))
-    time.sleep(max(0.0, 60.0 / float(per_min)))
+    burst = max(1, int(os.getenv("REPASSE_EMAIL_RATE_BURST", "1") or "1"))
+    return TokenBucket(per_min / 60.0, burst=burst)
 
 
 def _format_brl(value) -> str:
@@ -264,12 +287,18 @@ def _resolve_logo_src() -> str:
 
 
 def _load_logo_attachment() -> Optional[Dict]:
-    logo_base64 = _clean(os.getenv("REPASSE_EMAIL_LOGO_BASE64"))
+    cached = _read_logo_attachment(_clean(os.getenv("REPASSE_EMAIL_LOGO_BASE64")), str(_resolve_logo_path()))
+    return dict(cached) if cached else None
+
+
+@lru_cache(maxsize=4)
+def _read_logo_attachment(logo_base64: str, logo_path: str) -> Optional[Dict]:
+    # Memoizado por (env, caminho): o logo era relido e recodificado a cada mensagem.
     try:
         if logo_base64:
             logo_bytes = base64.b64decode(logo_base64)
         else:
-            logo_bytes = _resolve_logo_path().read_bytes()
+            logo_bytes = Path(logo_path).read_bytes()
     except Exception as exc:
         print(f"repasse_email: usando fallback embutido do logo: {exc}")
         logo_base64 = CONSULTARE_LOGO_WHITE_BASE64
@@ -458,6 +487,31 @@ def _execute(db: "DatabaseManager", sql: str, params: Tuple = ()):
         conn.close()
 
 
+def _execute_many(db: "DatabaseManager", statements: List[Tuple[str, Tuple]]):
+    """Varios statements numa unica transacao (Turso: um `batch` atomico)."""
+    if not statements:
+        return
+    conn = db.get_connection()
+    try:
+        if db.use_turso:
+            if libsql_client is None:
+                raise RuntimeError("libsql_client nao disponivel para batch Turso")
+            conn.batch([libsql_client.Statement(sql, params) for sql, params in statements])
+            return
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+    finally:
+        conn.close()
+
+
 def _query(db: "DatabaseManager", sql: str, params: Tuple = ()):
     return db.execute_query(sql, params) or []
 
@@ -638,110 +692,60 @@ def _s3_get_pdf(bucket: str, key: str) -> bytes:
     return pdf_bytes
 
 
-def _build_email_payload(recipient, pdf_bytes: Optional[bytes]) -> Tuple[Dict, Dict]:
-    professional_name = _clean(_row_get(recipient, 4, "professional_name"))
-    professional_display_name = _professional_display_name(professional_name)
-    to_email = _clean(_row_get(recipient, 5, "recipient_email"))
-    amount_value = _row_get(recipient, 6, "amount_value")
-    due_date_nf = _clean(_row_get(recipient, 7, "due_date_nf"))
-    file_name = _clean(_row_get(recipient, 14, "file_name")) or "repasse.pdf"
-    observations = _clean(_row_get(recipient, 21, "observations"))
-    period_ref = _clean(_row_get(recipient, 2, "period_ref"))
-    from_email = _env_first("REPASSE_EMAIL_FROM_EMAIL", "SENDPULSE_FROM_EMAIL", "MAILERSEND_FROM_EMAIL")
-    from_name = _env_first(
-        "REPASSE_EMAIL_FROM_NAME",
-        "SENDPULSE_FROM_NAME",
-        "MAILERSEND_FROM_NAME",
-        default="Financeiro Consultare",
-    )
-    reply_to = _env_first("REPASSE_EMAIL_REPLY_TO_EMAIL", "SENDPULSE_REPLY_TO_EMAIL", "MAILERSEND_REPLY_TO_EMAIL")
-    if not from_email:
-        raise RuntimeError("Remetente do e-mail de repasse nao configurado.")
-
-    period_text = _format_period_br(period_ref)
-    due_date_text = _format_date_br(due_date_nf)
-    subject = f"Fechamento Mensal {period_text} - CONSULTARE"
-    amount_text = _format_brl(amount_value)
-    has_attachment = bool(pdf_bytes)
-    escaped_professional_name = html_lib.escape(professional_display_name)
-    escaped_period_ref = html_lib.escape(period_text)
-    escaped_due_date_nf = html_lib.escape(due_date_text)
-    escaped_amount_text = html_lib.escape(amount_text)
-    escaped_subject = html_lib.escape(subject)
-    escaped_logo_src = html_lib.escape(_resolve_logo_src())
-    observations_html = _build_observations_html(observations)
-    attachment_text = (
-        "O relatório detalhado está anexado a este e-mail em formato PDF para sua conferência."
-        if has_attachment
-        else ""
-    )
-    attachment_html = (
-        "<p>O relatório detalhado está anexado a este e-mail em formato PDF para sua conferência.</p>"
-        if has_attachment
-        else ""
-    )
-    text = (
-        f"Ola, {professional_display_name}.\n\n"
-        f"Esperamos que esteja bem. Segue o demonstrativo de atendimentos realizados no mes de {period_text} na Clinica Consultare.\n"
-        f"Valor final: {amount_text}.\n"
-        + (f"Observacoes: {observations}.\n" if observations else "")
-        + (f"{attachment_text}\n" if attachment_text else "")
-        + f"Solicitamos o envio da NF ate o dia {due_date_text} para processamento do pagamento no ciclo atual.\n\n"
-        "Atenciosamente,\nFinanceiro Consultare"
-    )
-    html_body = f"""<!DOCTYPE html>
+_EMAIL_HTML_TEMPLATE = string.Template(
+    """<!DOCTYPE html>
 <html lang="pt-br">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{escaped_subject}</title>
+    <title>${subject}</title>
     <style>
-        body {{ margin: 0; padding: 0; background-color: #f4f7f9; font-family: 'Segoe UI', Tahoma, sans-serif; }}
-        table {{ border-spacing: 0; }}
-        td {{ padding: 0; }}
-        img {{ border: 0; }}
-        .wrapper {{ width: 100%; table-layout: fixed; background-color: #f4f7f9; padding: 32px 0 40px; }}
-        .main {{ background-color: #ffffff; margin: 0 auto; width: 100%; max-width: 600px; border-spacing: 0; border-radius: 8px; overflow: hidden; box-shadow: 0 4px 10px rgba(0,0,0,0.1); }}
-        .header {{ background-color: #053F74; padding: 36px 20px; text-align: center; }}
-        .logo {{ width: 280px; max-width: 80%; height: auto; }}
-        .content {{ padding: 40px 50px; color: #444444; font-size: 17px; line-height: 1.7; }}
-        h1 {{ color: #053F74; font-size: 24px; line-height: 1.25; margin-top: 0; }}
-        p {{ font-size: 17px; }}
-        .value-box {{ background-color: #f0f9f8; border: 1px solid #229A8A; border-radius: 6px; padding: 20px; text-align: center; margin: 25px 0; }}
-        .value-label {{ display: block; font-size: 15px; color: #666; text-transform: uppercase; letter-spacing: 1px; }}
-        .value-amount {{ display: block; font-size: 32px; color: #229A8A; font-weight: bold; margin-top: 5px; }}
-        .obs-box {{ background-color: #f0f4f8; border: 1px solid #053F74; border-radius: 6px; padding: 20px; text-align: left; margin: 25px 0; }}
-        .obs-label {{ display: block; font-size: 13px; color: #053F74; text-transform: uppercase; letter-spacing: 1px; font-weight: bold; margin-bottom: 10px; border-bottom: 1px solid #d1d9e0; padding-bottom: 5px; }}
-        .obs-content {{ display: block; font-size: 16px; color: #444; line-height: 1.55; white-space: pre-line; }}
-        .alert-section {{ border-left: 4px solid #3FBD80; background-color: #f9fdfb; padding: 15px 20px; margin-top: 25px; font-size: 16px; }}
-        .alert-title {{ color: #259D89; font-weight: bold; display: block; margin-bottom: 5px; }}
-        .footer {{ text-align: center; padding: 30px; font-size: 13px; color: #999999; }}
+        body { margin: 0; padding: 0; background-color: #f4f7f9; font-family: 'Segoe UI', Tahoma, sans-serif; }
+        table { border-spacing: 0; }
+        td { padding: 0; }
+        img { border: 0; }
+        .wrapper { width: 100%; table-layout: fixed; background-color: #f4f7f9; padding: 32px 0 40px; }
+        .main { background-color: #ffffff; margin: 0 auto; width: 100%; max-width: 600px; border-spacing: 0; border-radius: 8px; overflow: hidden; box-shadow: 0 4px 10px rgba(0,0,0,0.1); }
+        .header { background-color: #053F74; padding: 36px 20px; text-align: center; }
+        .logo { width: 280px; max-width: 80%; height: auto; }
+        .content { padding: 40px 50px; color: #444444; font-size: 17px; line-height: 1.7; }
+        h1 { color: #053F74; font-size: 24px; line-height: 1.25; margin-top: 0; }
+        p { font-size: 17px; }
+        .value-box { background-color: #f0f9f8; border: 1px solid #229A8A; border-radius: 6px; padding: 20px; text-align: center; margin: 25px 0; }
+        .value-label { display: block; font-size: 15px; color: #666; text-transform: uppercase; letter-spacing: 1px; }
+        .value-amount { display: block; font-size: 32px; color: #229A8A; font-weight: bold; margin-top: 5px; }
+        .obs-box { background-color: #f0f4f8; border: 1px solid #053F74; border-radius: 6px; padding: 20px; text-align: left; margin: 25px 0; }
+        .obs-label { display: block; font-size: 13px; color: #053F74; text-transform: uppercase; letter-spacing: 1px; font-weight: bold; margin-bottom: 10px; border-bottom: 1px solid #d1d9e0; padding-bottom: 5px; }
+        .obs-content { display: block; font-size: 16px; color: #444; line-height: 1.55; white-space: pre-line; }
+        .alert-section { border-left: 4px solid #3FBD80; background-color: #f9fdfb; padding: 15px 20px; margin-top: 25px; font-size: 16px; }
+        .alert-title { color: #259D89; font-weight: bold; display: block; margin-bottom: 5px; }
+        .footer { text-align: center; padding: 30px; font-size: 13px; color: #999999; }
     </style>
 </head>
 <body>
     <div style="display:none; max-height:0px; max-width:0px; opacity:0; overflow:hidden;">
-        Olá Dr(a). {escaped_professional_name}, o demonstrativo de atendimentos de {escaped_period_ref} está disponível para conferência.
+        Olá Dr(a). ${professional_name}, o demonstrativo de atendimentos de ${period_ref} está disponível para conferência.
     </div>
     <center class="wrapper">
         <table class="main" width="100%">
             <tr>
                 <td class="header">
-                    <img src="{escaped_logo_src}" alt="Consultare" class="logo">
+                    <img src="${logo_src}" alt="Consultare" class="logo">
                 </td>
             </tr>
             <tr>
                 <td class="content">
-                    <h1>Olá, Dr(a). {escaped_professional_name}!</h1>
-                    <p>Esperamos que esteja bem. Segue o demonstrativo de atendimentos realizados no mês de <strong>{escaped_period_ref}</strong> na Clínica Consultare.</p>
+                    <h1>Olá, Dr(a). ${professional_name}!</h1>
+                    <p>Esperamos que esteja bem. Segue o demonstrativo de atendimentos realizados no mês de <strong>${period_ref}</strong> na Clínica Consultare.</p>
                     <div class="value-box">
                         <span class="value-label">Valor Total a Receber</span>
-                        <span class="value-amount">{escaped_amount_text}</span>
+                        <span class="value-amount">${amount_text}</span>
                     </div>
-                    {observations_html}
-                    {attachment_html}
+                    ${observations_html}
+                    ${attachment_html}
                     <div class="alert-section">
                         <span class="alert-title">Prazo para Nota Fiscal</span>
-                        Solicitamos o envio da NF até o dia <strong>{escaped_due_date_nf}</strong> para processamento do pagamento no ciclo atual.
+                        Solicitamos o envio da NF até o dia <strong>${due_date_nf}</strong> para processamento do pagamento no ciclo atual.
                     </div>
                     <p style="font-size: 15px; color: #888; margin-top: 30px;">
                         Dúvidas sobre o fechamento? Responda a este e-mail e nossa equipe financeira entrará em contato.
@@ -764,27 +768,99 @@ def _build_email_payload(recipient, pdf_bytes: Optional[bytes]) -> Tuple[Dict, D
     </center>
 </body>
 </html>
-    """.strip()
+""".strip()
+)
+_ATTACHMENT_TEXT = "O relatório detalhado está anexado a este e-mail em formato PDF para sua conferência."
 
-    email_payload = {
-        "from": {"email": from_email, "name": from_name},
-        "to": [{"email": to_email, "name": professional_name}],
-        "subject": subject,
-        "text": text,
-        "html": base64.b64encode(html_body.encode("utf-8")).decode("ascii"),
-    }
-    attachments_binary: Dict[str, str] = {}
-    attachments_audit: List[Dict] = []
-    if PROVIDER == "mailersend" and _resolve_logo_src() == "cid:consultare_logo":
+
+def _build_render_context() -> Dict:
+    """Partes do e-mail que nao dependem do destinatario (remetente, logo, copias internas),
+    resolvidas uma vez por lote em vez de a cada mensagem."""
+    from_email = _env_first("REPASSE_EMAIL_FROM_EMAIL", "SENDPULSE_FROM_EMAIL", "MAILERSEND_FROM_EMAIL")
+    from_name = _env_first(
+        "REPASSE_EMAIL_FROM_NAME",
+        "SENDPULSE_FROM_NAME",
+        "MAILERSEND_FROM_NAME",
+        default="Financeiro Consultare",
+    )
+    if not from_email:
+        raise RuntimeError("Remetente do e-mail de repasse nao configurado.")
+    logo_src = _resolve_logo_src()
+    logo_audit: List[Dict] = []
+    if PROVIDER == "mailersend" and logo_src == "cid:consultare_logo":
         logo_attachment = _load_logo_attachment()
         if logo_attachment:
-            attachments_audit.append(
+            logo_audit.append(
                 {
                     "filename": logo_attachment["filename"],
                     "disposition": "inline",
                     "id": logo_attachment["id"],
                 }
             )
+    return {
+        "from_email": from_email,
+        "from_name": from_name,
+        "reply_to": _env_first("REPASSE_EMAIL_REPLY_TO_EMAIL", "SENDPULSE_REPLY_TO_EMAIL", "MAILERSEND_REPLY_TO_EMAIL"),
+        "bcc_emails": _parse_email_list(os.getenv("REPASSE_EMAIL_BCC") or os.getenv("SENDPULSE_BCC") or ""),
+        "logo_audit": logo_audit,
+        "html_template": string.Template(
+            _EMAIL_HTML_TEMPLATE.safe_substitute(logo_src=html_lib.escape(logo_src).replace("$", "$$"))
+        ),
+    }
+
+
+def _build_email_payload(
+    recipient,
+    pdf_bytes: Optional[bytes],
+    render_context: Optional[Dict] = None,
+) -> Tuple[Dict, Dict]:
+    context = render_context or _build_render_context()
+    professional_name = _clean(_row_get(recipient, 4, "professional_name"))
+    professional_display_name = _professional_display_name(professional_name)
+    to_email = _clean(_row_get(recipient, 5, "recipient_email"))
+    amount_value = _row_get(recipient, 6, "amount_value")
+    due_date_nf = _clean(_row_get(recipient, 7, "due_date_nf"))
+    file_name = _clean(_row_get(recipient, 14, "file_name")) or "repasse.pdf"
+    observations = _clean(_row_get(recipient, 21, "observations"))
+    period_ref = _clean(_row_get(recipient, 2, "period_ref"))
+    from_email = context["from_email"]
+    from_name = context["from_name"]
+    reply_to = context["reply_to"]
+
+    period_text = _format_period_br(period_ref)
+    due_date_text = _format_date_br(due_date_nf)
+    subject = f"Fechamento Mensal {period_text} - CONSULTARE"
+    amount_text = _format_brl(amount_value)
+    has_attachment = bool(pdf_bytes)
+    attachment_text = _ATTACHMENT_TEXT if has_attachment else ""
+    text = (
+        f"Ola, {professional_display_name}.\n\n"
+        f"Esperamos que esteja bem. Segue o demonstrativo de atendimentos realizados no mes de {period_text} na Clinica Consultare.\n"
+        f"Valor final: {amount_text}.\n"
+        + (f"Observacoes: {observations}.\n" if observations else "")
+        + (f"{attachment_text}\n" if attachment_text else "")
+        + f"Solicitamos o envio da NF ate o dia {due_date_text} para processamento do pagamento no ciclo atual.\n\n"
+        "Atenciosamente,\nFinanceiro Consultare"
+    )
+    html_body = context["html_template"].substitute(
+        subject=html_lib.escape(subject),
+        professional_name=html_lib.escape(professional_display_name),
+        period_ref=html_lib.escape(period_text),
+        amount_text=html_lib.escape(amount_text),
+        due_date_nf=html_lib.escape(due_date_text),
+        observations_html=_build_observations_html(observations),
+        attachment_html=f"<p>{_ATTACHMENT_TEXT}</p>" if has_attachment else "",
+    )
+
+    email_payload = {
+        "from": {"email": from_email, "name": from_name},
+        "to": [{"email": to_email, "name": professional_name}],
+        "subject": subject,
+        "text": text,
+        "html": base64.b64encode(html_body.encode("utf-8")).decode("ascii"),
+    }
+    attachments_binary: Dict[str, str] = {}
+    attachments_audit: List[Dict] = [dict(item) for item in context["logo_audit"]]
     if pdf_bytes:
         attachments_binary[file_name] = base64.b64encode(pdf_bytes).decode("ascii")
         attachments_audit.append({"filename": file_name, "disposition": "attachment", "size_bytes": len(pdf_bytes)})
@@ -792,8 +868,7 @@ def _build_email_payload(recipient, pdf_bytes: Optional[bytes]) -> Tuple[Dict, D
         email_payload["attachments_binary"] = attachments_binary
     if reply_to:
         email_payload["reply_to"] = {"email": reply_to, "name": from_name}
-    bcc_emails = _parse_email_list(os.getenv("REPASSE_EMAIL_BCC") or os.getenv("SENDPULSE_BCC") or "")
-    bcc_emails = [email for email in bcc_emails if email.lower() != to_email.lower()]
+    bcc_emails = [email for email in context["bcc_emails"] if email.lower() != to_email.lower()]
     internal_copy_to = [{"email": email, "name": from_name} for email in bcc_emails[:10]]
 
     payload = {"email": email_payload}
@@ -806,7 +881,7 @@ def _build_email_payload(recipient, pdf_bytes: Optional[bytes]) -> Tuple[Dict, D
     return payload, audit_payload
 
 
-def _insert_message(db: "DatabaseManager", recipient, job_id: str, subject: str, audit_payload: Dict) -> str:
+def _insert_message_statement(recipient, job_id: str, subject: str, audit_payload: Dict) -> Tuple[str, Tuple[str, Tuple]]:
     now = _now_iso()
     message_id = str(uuid.uuid4())
     attachments = audit_payload.get("attachments") or []
@@ -815,8 +890,7 @@ def _insert_message(db: "DatabaseManager", recipient, job_id: str, subject: str,
         if _clean(attachment.get("disposition")) == "attachment":
             attachment_file_name = _clean(attachment.get("filename")) or None
             break
-    _execute(
-        db,
+    return message_id, (
         """
         INSERT INTO repasse_email_messages (
           id, batch_id, recipient_id, job_id, message_id, provider, provider_message_id,
@@ -843,7 +917,6 @@ def _insert_message(db: "DatabaseManager", recipient, job_id: str, subject: str,
             now,
         ),
     )
-    return message_id
 
 
 def _get_sendpulse_bearer_token() -> str:
@@ -851,6 +924,12 @@ def _get_sendpulse_bearer_token() -> str:
     if static_token:
         return static_token
 
+    with _SENDPULSE_TOKEN_LOCK:
+        # Envios concorrentes: so a primeira thread renova o token, as demais reaproveitam.
+        return _refresh_sendpulse_bearer_token()
+
+
+def _refresh_sendpulse_bearer_token() -> str:
     now = time.time()
     cached_token = _clean(_SENDPULSE_TOKEN_CACHE.get("token"))
     cached_expires_at = float(_SENDPULSE_TOKEN_CACHE.get("expires_at") or 0)
@@ -864,7 +943,7 @@ def _get_sendpulse_bearer_token() -> str:
             "Credenciais do SendPulse nao configuradas. Defina SENDPULSE_API_TOKEN ou SENDPULSE_CLIENT_ID/SENDPULSE_CLIENT_SECRET."
         )
 
-    response = requests.post(
+    response = _SENDPULSE_SESSIONS.get().post(
         f"{SENDPULSE_API_BASE_URL}/oauth/access_token",
         headers={"Content-Type": "application/json"},
         json={
@@ -886,7 +965,7 @@ def _get_sendpulse_bearer_token() -> str:
 
 
 def _post_sendpulse_email(payload: Dict) -> Tuple[str, Dict]:
-    response = requests.post(
+    response = _SENDPULSE_SESSIONS.get().post(
         f"{SENDPULSE_API_BASE_URL}/smtp/emails",
         headers={
             "Authorization": f"Bearer {_get_sendpulse_bearer_token()}",
@@ -945,82 +1024,196 @@ def _send_sendpulse(payload: Dict, message_id: str) -> Tuple[str, Dict]:
     return provider_message_id, response_payload
 
 
-def _mark_message_result(
-    db: "DatabaseManager",
+def _message_result_statements(
     message_id: str,
     recipient_id: str,
     provider_message_id: Optional[str],
     status: str,
     response_payload: Optional[Dict] = None,
     error: Optional[str] = None,
-):
+) -> List[Tuple[str, Tuple]]:
     now = _now_iso()
-    _execute(
-        db,
-        """
-        UPDATE repasse_email_messages
-        SET provider_message_id = ?,
-            status = ?,
-            response_payload_json = ?,
-            error = ?,
-            updated_at = ?
-        WHERE id = ?
-        """,
+    return [
         (
-            provider_message_id,
-            status,
-            json.dumps(response_payload or {}, ensure_ascii=False),
-            error,
-            now,
-            message_id,
+            """
+            UPDATE repasse_email_messages
+            SET provider_message_id = ?,
+                status = ?,
+                response_payload_json = ?,
+                error = ?,
+                updated_at = ?
+            WHERE id = ?
+            """,
+            (
+                provider_message_id,
+                status,
+                json.dumps(response_payload or {}, ensure_ascii=False),
+                error,
+                now,
+                message_id,
+            ),
         ),
-    )
-    _execute(
-        db,
+        (
+            """
+            UPDATE repasse_email_recipients
+            SET send_status = ?,
+                last_message_id = ?,
+                last_provider_message_id = ?,
+                last_event_type = ?,
+                last_event_at = ?,
+                updated_at = ?
+            WHERE id = ?
+            """,
+            (status, message_id, provider_message_id, status.lower(), now, now, recipient_id),
+        ),
+    ]
+
+
+def _recipient_failed_statement(recipient_id: str) -> Tuple[str, Tuple]:
+    now = _now_iso()
+    return (
         """
         UPDATE repasse_email_recipients
-        SET send_status = ?,
-            last_message_id = ?,
-            last_provider_message_id = ?,
-            last_event_type = ?,
+        SET send_status = 'FAILED',
+            last_event_type = 'worker_failed',
             last_event_at = ?,
             updated_at = ?
         WHERE id = ?
         """,
-        (status, message_id, provider_message_id, status.lower(), now, now, recipient_id),
+        (now, now, recipient_id),
     )
 
 
-def _send_recipient(db: "DatabaseManager", job_id: str, recipient) -> bool:
-    recipient_id = _clean(_row_get(recipient, 0, "id"))
-    storage_bucket = _clean(_row_get(recipient, 10, "storage_bucket"))
-    storage_key = _clean(_row_get(recipient, 11, "storage_key"))
-    pdf_bytes = _s3_get_pdf(storage_bucket, storage_key) if storage_key else None
-    payload, audit_payload = _build_email_payload(recipient, pdf_bytes)
-    subject = _clean((payload.get("email") or {}).get("subject"))
-    message_id = _insert_message(db, recipient, job_id, subject, audit_payload)
+def _flush_state(db: "DatabaseManager", job_id: str, statements: List[Tuple[str, Tuple]]):
+    """Grava um lote de transicoes numa transacao; se o lote falhar, tenta statement a statement
+    para nao perder as transicoes que ainda cabem no banco."""
+    if not statements:
+        return
     try:
-        provider_message_id, response_payload = _send_sendpulse(payload, message_id)
-        _mark_message_result(
-            db,
-            message_id,
-            recipient_id,
-            provider_message_id,
-            "ACCEPTED_PROVIDER",
-            response_payload=response_payload,
-        )
-        return True
+        _execute_many(db, statements)
+        return
     except Exception as exc:
-        _mark_message_result(
-            db,
-            message_id,
-            recipient_id,
-            None,
-            "FAILED",
-            response_payload={},
-            error=str(exc),
-        )
-        return False
+        print(f"repasse_email job={job_id} falha ao gravar lote de estados ({len(statements)}): {exc}")
+    for sql, params in statements:
+        try:
+            _execute(db, sql, params)
+        except Exception as exc:
+            print(f"repasse_email job={job_id} falha ao gravar estado: {exc}")
+
+
+def _send_job_recipients(
+    db: "DatabaseManager",
+    job_id: str,
+    recipients: List,
+    limiter: Optional[TokenBucket] = None,
+    send_concurrency: int = SEND_CONCURRENCY,
+    prefetch_workers: int = PDF_PREFETCH_WORKERS,
+    commit_batch: int = STATE_COMMIT_BATCH,
+) -> Tuple[int, int]:
+    """Envia os destinatarios de um job em pipeline e retorna (aceitos, falhas).
+
+    1. PDFs baixados do S3 e payloads montados em paralelo, ate dois lotes a frente do envio;
+    2. o template e as partes fixas do e-mail sao resolvidos uma vez (`_build_render_context`);
+    3. as mensagens de cada lote sao gravadas como SENDING numa transacao antes do envio;
+    4. ate `send_concurrency` envios em voo, cada um pegando um token do `limiter`;
+    5. os resultados (mensagem + destinatario) do lote sao gravados numa unica transacao.
+    """
+    limiter = limiter or _build_rate_limiter()
+    commit_batch = max(1, int(commit_batch or 1))
+    render_context = _build_render_context()
+    sent = 0
+    failed = 0
+    started = time.time()
+    waited_before = limiter.waited_sec
+
+    def _prepare(recipient):
+        storage_bucket = _clean(_row_get(recipient, 10, "storage_bucket"))
+        storage_key = _clean(_row_get(recipient, 11, "storage_key"))
+        pdf_bytes = _s3_get_pdf(storage_bucket, storage_key) if storage_key else None
+        return _build_email_payload(recipient, pdf_bytes, render_context)
+
+    def _dispatch(payload: Dict, message_id: str):
+        limiter.acquire()
+        return _send_sendpulse(payload, message_id)
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, int(prefetch_workers or 1)), thread_name_prefix="repasse-email-pdf"
+    ) as prefetch_pool, ThreadPoolExecutor(
+        max_workers=max(1, int(send_concurrency or 1)), thread_name_prefix="repasse-email-send"
+    ) as send_pool:
+        prepared = []
+
+        def _prefetch_until(limit: int):
+            while len(prepared) < min(limit, len(recipients)):
+                prepared.append(prefetch_pool.submit(_prepare, recipients[len(prepared)]))
+
+        for start in range(0, len(recipients), commit_batch):
+            _prefetch_until(start + 2 * commit_batch)
+            transitions: List[Tuple[str, Tuple]] = []
+            inserts: List[Tuple[str, Tuple]] = []
+            ready = []
+            for offset, recipient in enumerate(recipients[start:start + commit_batch]):
+                recipient_id = _clean(_row_get(recipient, 0, "id"))
+                try:
+                    payload, audit_payload = prepared[start + offset].result()
+                    subject = _clean((payload.get("email") or {}).get("subject"))
+                    message_id, statement = _insert_message_statement(recipient, job_id, subject, audit_payload)
+                except Exception as exc:
+                    failed += 1
+                    transitions.append(_recipient_failed_statement(recipient_id))
+                    print(f"repasse_email job={job_id} recipient={recipient_id} erro={exc}")
+                    continue
+                inserts.append(statement)
+                ready.append((recipient_id, message_id, payload))
+            prepared[start:start + commit_batch] = [None] * len(recipients[start:start + commit_batch])
+
+            try:
+                _execute_many(db, inserts)
+            except Exception as exc:
+                # Sem a mensagem SENDING gravada nao ha trilha de auditoria: nao envia o lote.
+                for recipient_id, _, _ in ready:
+                    failed += 1
+                    transitions.append(_recipient_failed_statement(recipient_id))
+                    print(f"repasse_email job={job_id} recipient={recipient_id} erro={exc}")
+                ready = []
+
+            in_flight = [
+                (recipient_id, message_id, send_pool.submit(_dispatch, payload, message_id))
+                for recipient_id, message_id, payload in ready
+            ]
+            for recipient_id, message_id, future in in_flight:
+                try:
+                    provider_message_id, response_payload = future.result()
+                    transitions.extend(
+                        _message_result_statements(
+                            message_id,
+                            recipient_id,
+                            provider_message_id,
+                            "ACCEPTED_PROVIDER",
+                            response_payload=response_payload,
+                        )
+                    )
+                    sent += 1
+                except Exception as exc:
+                    transitions.extend(
+                        _message_result_statements(
+                            message_id,
+                            recipient_id,
+                            None,
+                            "FAILED",
+                            response_payload={},
+                            error=str(exc),
+                        )
+                    )
+                    failed += 1
+            _flush_state(db, job_id, transitions)
+
+    elapsed = max(0.001, time.time() - started)
+    print(
+        f"repasse_email job={job_id} aceitos={sent} falhas={failed} tempo={elapsed:.1f}s "
+        f"ritmo={(sent + failed) * 60.0 / elapsed:.1f}/min espera_rate_limit={limiter.waited_sec - waited_before:.1f}s"
+    )
+    return sent, failed
 
 
 def _recover_stale_running_jobs(db: "DatabaseManager") -> int:
@@ -1106,6 +1299,38 @@ def _recover_stale_running_jobs(db: "DatabaseManager") -> int:
     return recovered
 
 
+def _fail_job_with_error(db: "DatabaseManager", job_id: str, batch_id: str, recipients: List, error: str):
+    """Erro fora do tratamento por destinatario (ex.: remetente nao configurado): fecha job e lote
+    como FAILED com a mensagem e devolve os destinatarios ainda em QUEUED para FAILED, sem esperar
+    a recuperacao de jobs RUNNING expirados."""
+    now = _now_iso()
+    recipient_ids = [rid for rid in (_clean(_row_get(recipient, 0, "id")) for recipient in recipients) if rid]
+    if recipient_ids:
+        placeholders = ",".join(["?"] * len(recipient_ids))
+        _execute(
+            db,
+            f"""
+            UPDATE repasse_email_recipients
+            SET send_status = 'FAILED',
+                last_event_type = 'worker_failed',
+                last_event_at = ?,
+                updated_at = ?
+            WHERE batch_id = ?
+              AND send_status = 'QUEUED'
+              AND id IN ({placeholders})
+            """,
+            tuple([now, now, batch_id] + recipient_ids),
+        )
+    _mark_job_finished(db, job_id, STATUS_FAILED, error)
+    _execute(
+        db,
+        "UPDATE repasse_email_batches SET status = 'FAILED', error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+        (error, now, now, batch_id),
+    )
+    _heartbeat(db, STATUS_FAILED, f"job={job_id} erro={error}")
+    _update_batch_counters(db, batch_id)
+
+
 def process_pending_repasse_email_jobs_once(max_jobs: int = 1, requested_by: str = "system_status") -> bool:
     if DatabaseManager is None:
         raise RuntimeError("DatabaseManager indisponivel.")
@@ -1115,6 +1340,7 @@ def process_pending_repasse_email_jobs_once(max_jobs: int = 1, requested_by: str
     processed_any = False
     max_jobs = max(1, int(max_jobs or 1))
     max_recipients = max(1, int(os.getenv("REPASSE_EMAIL_MAX_PER_RUN", "90") or "90"))
+    limiter = _build_rate_limiter()
 
     for _ in range(max_jobs):
         job = _get_next_pending_job(db)
@@ -1153,32 +1379,12 @@ def process_pending_repasse_email_jobs_once(max_jobs: int = 1, requested_by: str
             _update_batch_counters(db, batch_id)
             continue
 
-        sent = 0
-        failed = 0
-        for recipient in recipients:
-            try:
-                ok = _send_recipient(db, job_id, recipient)
-                if ok:
-                    sent += 1
-                else:
-                    failed += 1
-            except Exception as exc:
-                failed += 1
-                recipient_id = _clean(_row_get(recipient, 0, "id"))
-                _execute(
-                    db,
-                    """
-                    UPDATE repasse_email_recipients
-                    SET send_status = 'FAILED',
-                        last_event_type = 'worker_failed',
-                        last_event_at = ?,
-                        updated_at = ?
-                    WHERE id = ?
-                    """,
-                    (_now_iso(), _now_iso(), recipient_id),
-                )
-                print(f"repasse_email job={job_id} recipient={recipient_id} erro={exc}")
-            _rate_limit_sleep()
+        try:
+            sent, failed = _send_job_recipients(db, job_id, recipients, limiter=limiter)
+        except Exception as exc:
+            print(f"repasse_email job={job_id} erro={exc}")
+            _fail_job_with_error(db, job_id, batch_id, recipients, str(exc))
+            continue
 
         if sent > 0 and failed == 0:
             _mark_job_finished(db, job_id, STATUS_COMPLETED, None)
@@ -1210,13 +1416,222 @@ def process_pending_repasse_email_jobs_once(max_jobs: int = 1, requested_by: str
     return processed_any
 
 
+def start_sendpulse_stub(latency_sec: float = 0.25, port: int = 0, fail_every: int = 0):
+    """SendPulse falso (oauth/access_token + smtp/emails) num servidor HTTP local, para testes de
+    vazao offline: aponte SENDPULSE_API_BASE_URL para `stub.base_url`. `fail_every` > 0 devolve
+    HTTP 500 a cada N envios."""
+    import itertools
+
+    from http_stub import FixtureStubServer
+
+    counter = itertools.count(1)
+    counter_lock = threading.Lock()
+
+    def _handler(method, path, params, raw_body, headers):
+        if path == "/oauth/access_token" and method == "POST":
+            return 200, {"access_token": "stub-token", "token_type": "Bearer", "expires_in": 3600}
+        if path == "/smtp/emails" and method == "POST":
+            if _clean(headers.get("Authorization")) != "Bearer stub-token":
+                return 401, {"result": False, "message": "invalid token"}
+            try:
+                email = (json.loads(raw_body or b"{}").get("email") or {})
+            except Exception:
+                email = {}
+            if not email.get("to") or not email.get("html"):
+                return 400, {"result": False, "message": "email.to/html obrigatorios"}
+            with counter_lock:
+                sequence = next(counter)
+            if fail_every and sequence % int(fail_every) == 0:
+                return 500, {"result": False, "message": "stub failure"}
+            return 200, {"result": True, "id": f"stub-{sequence}"}
+        return None
+
+    return FixtureStubServer(latency_sec=latency_sec, port=port, handler=_handler).start()
+
+
+def run_sendpulse_stub_benchmark(
+    recipients: int = 40,
+    latency_ms: float = 250.0,
+    s3_latency_ms: float = 150.0,
+    rate_per_min: int = 600,
+    send_concurrency: int = SEND_CONCURRENCY,
+    prefetch_workers: int = PDF_PREFETCH_WORKERS,
+    commit_batch: int = STATE_COMMIT_BATCH,
+) -> Dict:
+    """Vazao offline contra `start_sendpulse_stub` em SQLite temporario: envio serial (1 em voo,
+    sem prefetch, commit por destinatario, como o loop antigo) contra o pipeline. O download do S3
+    e simulado com `s3_latency_ms`; nada sai da maquina."""
+    global SENDPULSE_API_BASE_URL, download_s3_object_bytes
+    import shutil
+    import tempfile
+
+    import database_manager
+
+    tmp_dir = tempfile.mkdtemp(prefix="repasse_email_bench_")
+    env_overrides = {
+        "DB_PROVIDER": "sqlite",
+        "TURSO_URL": None,
+        "REPASSE_EMAIL_DRY_RUN": "0",
+        "SENDPULSE_API_TOKEN": None,
+        "SENDPULSE_CLIENT_ID": "stub",
+        "SENDPULSE_CLIENT_SECRET": "stub",
+        "REPASSE_EMAIL_FROM_EMAIL": "financeiro@example.com",
+        "REPASSE_EMAIL_BCC": None,
+        "SENDPULSE_BCC": None,
+    }
+    original_env = {name: os.environ.get(name) for name in env_overrides}
+    original_path = database_manager.LOCAL_DB_PATH
+    original_base_url = SENDPULSE_API_BASE_URL
+    original_download = download_s3_object_bytes
+    pdf_bytes = b"%PDF-1.4 " + os.urandom(48 * 1024)
+
+    def _fake_download(key, bucket=None):
+        time.sleep(max(0.0, s3_latency_ms / 1000.0))
+        return pdf_bytes
+
+    results: Dict[str, Dict] = {}
+    stub = start_sendpulse_stub(latency_sec=latency_ms / 1000.0)
+    try:
+        for name, value in env_overrides.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        database_manager.LOCAL_DB_PATH = os.path.join(tmp_dir, "bench.db")
+        SENDPULSE_API_BASE_URL = stub.base_url
+        download_s3_object_bytes = _fake_download
+        _SENDPULSE_TOKEN_CACHE.update({"token": "", "expires_at": 0.0})
+
+        db = DatabaseManager()
+        _ensure_tables(db)
+        now = _now_iso()
+        for label, concurrency, prefetch, batch in (
+            ("serial", 1, 1, 1),
+            ("pipeline", send_concurrency, prefetch_workers, commit_batch),
+        ):
+            batch_id = f"bench-{label}"
+            _execute(
+                db,
+                "INSERT INTO repasse_email_batches (id, period_ref, due_date_nf, status, created_at, updated_at) "
+                "VALUES (?, '2026-01', '2026-02-10', 'SENDING', ?, ?)",
+                (batch_id, now, now),
+            )
+            _execute_many(
+                db,
+                [
+                    (
+                        """
+                        INSERT INTO repasse_email_recipients (
+                          id, batch_id, period_ref, professional_id, professional_name, recipient_email,
+                          amount_value, due_date_nf, storage_bucket, storage_key, file_name,
+                          validation_status, send_status, created_at, updated_at
+                        ) VALUES (?, ?, '2026-01', ?, ?, ?, ?, '2026-02-10', 'bench', ?, ?, 'OK', 'QUEUED', ?, ?)
+                        """,
+                        (
+                            f"{batch_id}-{i}",
+                            batch_id,
+                            str(i),
+                            f"Profissional Bench {i}",
+                            f"prof{i}@example.com",
+                            1000 + i,
+                            f"repasse/{i}.pdf",
+                            f"repasse_{i}.pdf",
+                            now,
+                            now,
+                        ),
+                    )
+                    for i in range(int(recipients))
+                ],
+            )
+            job = {"id": f"job-{label}", "batch_id": batch_id, "recipient_ids_json": json.dumps(
+                [f"{batch_id}-{i}" for i in range(int(recipients))]
+            )}
+            rows = _load_job_recipients(db, job)
+            served_before = stub.requests_served
+            started = time.perf_counter()
+            sent, failed = _send_job_recipients(
+                db,
+                job["id"],
+                rows,
+                limiter=TokenBucket(rate_per_min / 60.0, burst=1),
+                send_concurrency=concurrency,
+                prefetch_workers=prefetch,
+                commit_batch=batch,
+            )
+            elapsed = time.perf_counter() - started
+            accepted = _query(
+                db,
+                "SELECT COUNT(*) FROM repasse_email_recipients WHERE batch_id = ? AND send_status = 'ACCEPTED_PROVIDER'",
+                (batch_id,),
+            )
+            results[label] = {
+                "sent": sent,
+                "failed": failed,
+                "accepted_rows": int(_row_get(accepted[0], 0, "count") or 0) if accepted else 0,
+                "requests": stub.requests_served - served_before,
+                "elapsed_sec": round(elapsed, 3),
+                "per_min": round(len(rows) * 60.0 / max(0.001, elapsed), 1),
+            }
+        peak = stub.max_in_flight
+    finally:
+        stub.stop()
+        SENDPULSE_API_BASE_URL = original_base_url
+        download_s3_object_bytes = original_download
+        _SENDPULSE_TOKEN_CACHE.update({"token": "", "expires_at": 0.0})
+        database_manager.LOCAL_DB_PATH = original_path
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    summary = {
+        "recipients": int(recipients),
+        "latency_ms": latency_ms,
+        "s3_latency_ms": s3_latency_ms,
+        "rate_per_min": rate_per_min,
+        "peak_in_flight": peak,
+        "serial": results["serial"],
+        "pipeline": results["pipeline"],
+        "speedup": round(results["serial"]["elapsed_sec"] / results["pipeline"]["elapsed_sec"], 2)
+        if results["pipeline"]["elapsed_sec"]
+        else None,
+    }
+    print(f"repasse_email benchmark {json.dumps(summary, ensure_ascii=False)}")
+    return summary
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--once", action="store_true")
     parser.add_argument("--ensure", action="store_true")
     parser.add_argument("--max-jobs", type=int, default=1)
+    parser.add_argument("--sendpulse-stub", action="store_true", help="sobe o SendPulse falso local e fica servindo")
+    parser.add_argument("--stub-port", type=int, default=8025)
+    parser.add_argument("--benchmark", action="store_true", help="vazao serial x pipeline contra o SendPulse falso")
+    parser.add_argument("--recipients", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=250.0)
+    parser.add_argument("--rate-per-min", type=int, default=600)
     args = parser.parse_args()
 
+    if args.sendpulse_stub:
+        stub = start_sendpulse_stub(latency_sec=args.latency_ms / 1000.0, port=args.stub_port)
+        print(f"SendPulse stub em {stub.base_url} (use SENDPULSE_API_BASE_URL={stub.base_url})")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            stub.stop()
+        return
+    if args.benchmark:
+        run_sendpulse_stub_benchmark(
+            recipients=args.recipients,
+            latency_ms=args.latency_ms,
+            rate_per_min=args.rate_per_min,
+        )
+        return
+
     if DatabaseManager is None:
         raise RuntimeError("DatabaseManager indisponivel.")
     db = DatabaseManager()